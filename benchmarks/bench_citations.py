@@ -0,0 +1,117 @@
+"""Micro-benchmark: citation assembly in AgentsForAmazonBedrock.invoke().
+
+Compares the original _make_fully_cited_answer (three re.sub passes plus string
+concatenation, reproduced below as the baseline) against CitationAssembler on
+synthetic knowledge base answers with many citations, delivered either as one
+chunk or split over several chunk events.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_citations [--citations 1000 5000 20000] [--chunks 8]
+"""
+
+import argparse
+import re
+import time
+
+from utils.agent_citations import CitationAssembler
+from benchmarks.streams import cited_answer_chunk
+
+
+def legacy_make_fully_cited_answer(orig_agent_answer, event):
+    """_make_fully_cited_answer before CitationAssembler, without its trace output."""
+    _citations = event.get("chunk", {}).get("attribution", {}).get("citations", [])
+    if not _citations:
+        return orig_agent_answer
+
+    _pattern = r"\n\n<sources>\n\d+\n</sources>\n\n"
+    _cleaned_text = re.sub(_pattern, "", orig_agent_answer)
+    _pattern = "<sources><REDACTED></sources>"
+    _cleaned_text = re.sub(_pattern, "", _cleaned_text)
+    _pattern = "<sources></sources>"
+    _cleaned_text = re.sub(_pattern, "", _cleaned_text)
+
+    _fully_cited_answer = ""
+    _curr_citation_idx = 0
+
+    for _citation in _citations:
+        _start = _citation["generatedResponsePart"]["textResponsePart"]["span"]["start"] - (
+                _curr_citation_idx + 1
+        )
+        _end = (
+                _citation["generatedResponsePart"]["textResponsePart"]["span"]["end"]
+                - (_curr_citation_idx + 2)
+                + 4
+        )
+        _refs = _citation.get("retrievedReferences", [])
+        if len(_refs) > 0:
+            _ref_url = _refs[0].get("location", {}).get("s3Location", {}).get("uri", "")
+        else:
+            _fully_cited_answer = _cleaned_text
+            break
+
+        _fully_cited_answer += _cleaned_text[_start:_end] + " [" + _ref_url + "] "
+
+        if _curr_citation_idx == 0:
+            _answer_prefix = _cleaned_text[:_start]
+            _fully_cited_answer = _answer_prefix + _fully_cited_answer
+
+        _curr_citation_idx += 1
+
+    return _fully_cited_answer
+
+
+def _split_chunks(num_citations: int, num_chunks: int):
+    """Builds an answer of num_citations citations spread evenly over num_chunks chunk events."""
+    _per_chunk = max(1, num_citations // num_chunks)
+    _chunks = []
+    _remaining = num_citations
+    while _remaining > 0:
+        _n = min(_per_chunk, _remaining)
+        _chunks.append(cited_answer_chunk(_n))
+        _remaining -= _n
+    return [(_c["chunk"]["bytes"].decode("utf8"), _c) for _c in _chunks]
+
+
+def _best_seconds(fn, repeat: int = 5) -> float:
+    _best = float("inf")
+    for _ in range(repeat):
+        _start = time.perf_counter()
+        fn()
+        _best = min(_best, time.perf_counter() - _start)
+    return _best
+
+
+def _legacy(chunks):
+    return "".join(legacy_make_fully_cited_answer(_text, _event) for _text, _event in chunks)
+
+
+def _assembled(chunks):
+    _assembler = CitationAssembler()
+    for _text, _event in chunks:
+        _assembler.add(_text, _event["chunk"]["attribution"]["citations"])
+    return _assembler.answer()
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    _parser.add_argument("--citations", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    _parser.add_argument("--chunks", type=int, default=8, help="chunk events per answer in the split case")
+    _args = _parser.parse_args()
+
+    print(f"{'citations':>10} {'chunks':>7} {'legacy ms':>11} {'assembler ms':>13} {'speed-up':>9}")
+    for _num_citations in _args.citations:
+        for _num_chunks in (1, _args.chunks):
+            _chunks = _split_chunks(_num_citations, _num_chunks)
+            _answer = _assembled(_chunks)
+            # every sentence is cited once and only the 25 distinct documents are listed
+            assert _answer.count("premieres this fall.[") == _num_citations
+            assert _answer.count("\n[") == min(25, _num_citations)
+            _legacy_s = _best_seconds(lambda: _legacy(_chunks))
+            _new_s = _best_seconds(lambda: _assembled(_chunks))
+            print(f"{_num_citations:>10,} {len(_chunks):>7} {_legacy_s * 1e3:>11.2f} "
+                  f"{_new_s * 1e3:>13.2f} {_legacy_s / _new_s:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
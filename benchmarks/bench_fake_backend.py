@@ -0,0 +1,85 @@
+"""Load test: agent orchestration through AgentsForAmazonBedrock against the in-memory fake backend.
+
+Provisions collaborator agents and a supervisor, pushes invocations through
+invoke_many() and tears everything down again, all against FakeBedrockBackend,
+so the measured rates are the client-side cost of the helpers: caching, waits,
+teardown planning, AIMD concurrency control and stream parsing. Latency and
+throttling can be injected to see how the orchestration code behaves under them.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_fake_backend [--agents 20] [--invocations 5000] [--concurrency 16]
+        [--latency 0.0] [--throttle-rate 0.0] [--invoke-rate-limit 500] [--provisioning-delay 0.0]
+"""
+
+import argparse
+import time
+
+from utils.bedrock_agent_helper import AgentsForAmazonBedrock
+from utils.fake_bedrock import FakeBedrockBackend, FaultInjectingTransport, fake_clients
+
+MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+
+
+def _phase(name: str, transport: FaultInjectingTransport, fn):
+    _calls_before = sum(transport.calls.values())
+    _start = time.perf_counter()
+    _result = fn()
+    _elapsed = time.perf_counter() - _start
+    _calls = sum(transport.calls.values()) - _calls_before
+    print(f"{name:<12} {_elapsed:8.2f}s  {_calls:8,} API calls  {_calls / _elapsed:10,.0f} calls/s")
+    return _result
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    _parser.add_argument("--agents", type=int, default=20, help="number of collaborator agents")
+    _parser.add_argument("--invocations", type=int, default=5000, help="number of supervisor invocations")
+    _parser.add_argument("--concurrency", type=int, default=16, help="invoke_many() concurrency")
+    _parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    _parser.add_argument("--throttle-rate", type=float, default=0.0, help="probability that a call is throttled")
+    _parser.add_argument("--invoke-rate-limit", type=float, help="invoke_agent() calls per second before throttling")
+    _parser.add_argument("--provisioning-delay", type=float, default=0.0, help="seconds until a status settles")
+    _args = _parser.parse_args()
+
+    _backend = FakeBedrockBackend(provisioning_delay=_args.provisioning_delay, seed=0)
+    _transport = FaultInjectingTransport(
+        latency=_args.latency,
+        throttle_rate=_args.throttle_rate,
+        rate_limits={"invoke_agent": _args.invoke_rate_limit} if _args.invoke_rate_limit else None,
+        seed=0,
+    )
+    _agents = AgentsForAmazonBedrock(clients=fake_clients(_backend, _transport))
+
+    _specs = [
+        {"agent_name": f"bench_agent_{_i}", "agent_description": f"collaborator {_i}",
+         "agent_instructions": "Answer questions about your topic.", "model_ids": [MODEL_ID]}
+        for _i in range(_args.agents)
+    ]
+    _sub_agents = _phase("collaborators", _transport, lambda: _agents.create_sub_agents(_specs))
+
+    def _create_supervisor():
+        _supervisor_id, _, _, _ = _agents.create_agent(
+            "bench_supervisor", "supervisor", "Delegate to a collaborator.", [MODEL_ID],
+            agent_collaboration="SUPERVISOR_ROUTER",
+        )
+        _alias_id, _ = _agents.associate_sub_agents(_supervisor_id, _sub_agents)
+        return _supervisor_id, _alias_id
+
+    _supervisor_id, _alias_id = _phase("supervisor", _transport, _create_supervisor)
+
+    _results = _phase("invoke_many", _transport, lambda: list(_agents.invoke_many(
+        (f"question {_i}" for _i in range(_args.invocations)),
+        _supervisor_id, _alias_id, concurrency=_args.concurrency,
+    )))
+    _failed = sum(_r.error is not None for _r in _results)
+    _throttled = sum(_r.throttled for _r in _results)
+    print(f"{'':<12} {len(_results) - _failed:,} answers, {_failed:,} failed, {_throttled:,} throttled retries")
+
+    _names = ["bench_supervisor"] + [_spec["agent_name"] for _spec in _specs]
+    _phase("teardown", _transport, lambda: _agents.delete_agents(_names, verbose=False))
+    print(_transport.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark: import cost of each utils module, measured with python -X importtime.
+
+Every module is imported in a fresh interpreter, so shared dependencies are
+counted for each module, as they would be on a cold start. The report lists the
+cumulative import time of the module and its heaviest dependencies. Use --save
+to write the numbers to a JSON file, and --baseline to compare a later run
+against it.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_import_time [--headless] [--save import_times.json] [--baseline import_times.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+MODULES = [
+    "utils.bedrock_agent_helper",
+    "utils.agent_trace",
+    "utils.agent_files",
+    "utils.knowledge_base_operators",
+    "utils.knowledge_base_helper",
+    "utils.knowledge_base",
+]
+
+# "import time: self [us] | cumulative | imported package" lines written to stderr
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def measure(module: str, headless: bool = False, repeat: int = 3) -> dict:
+    """Imports module in fresh interpreters and returns its best cumulative import time.
+
+    Args:
+        module (str): dotted module name
+        headless (bool, optional): set AGENT_UTILS_HEADLESS=1 for the child. Defaults to False.
+        repeat (int, optional): number of fresh imports, the fastest is kept. Defaults to 3.
+
+    Returns:
+        dict: total_ms, the top-level dependencies with their cumulative ms, or error
+    """
+    _env = dict(os.environ)
+    if headless:
+        _env["AGENT_UTILS_HEADLESS"] = "1"
+    _best = None
+    for _ in range(repeat):
+        _proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, env=_env,
+        )
+        if _proc.returncode != 0:
+            return {"error": _proc.stderr.strip().splitlines()[-1]}
+        _lines = []
+        for _line in _proc.stderr.splitlines():
+            _match = _IMPORTTIME_LINE.match(_line)
+            if _match is not None:
+                _lines.append((len(_match.group(3)), _match.group(4), int(_match.group(2))))
+        # children are reported before their parent, one indent level deeper
+        _deps = {}
+        _total_us = 0
+        for _i, (_indent, _name, _cumulative) in enumerate(_lines):
+            if _name != module:
+                continue
+            _total_us = _cumulative
+            for _child_indent, _child, _child_us in reversed(_lines[:_i]):
+                if _child_indent <= _indent:
+                    break
+                if _child_indent == _indent + 2:
+                    _deps[_child] = _child_us
+        if _best is None or _total_us < _best["total_ms"] * 1000:
+            _best = {
+                "total_ms": _total_us / 1000,
+                "dependencies": {_n: _us / 1000 for _n, _us in sorted(_deps.items(), key=lambda _d: -_d[1])},
+            }
+    return _best
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    _parser.add_argument("modules", nargs="*", default=MODULES)
+    _parser.add_argument("--headless", action="store_true", help="import with AGENT_UTILS_HEADLESS=1")
+    _parser.add_argument("--top", type=int, default=5, help="heaviest dependencies to list per module")
+    _parser.add_argument("--save", help="write the results to this JSON file")
+    _parser.add_argument("--baseline", help="compare against results saved earlier with --save")
+    _args = _parser.parse_args()
+
+    _baseline = {}
+    if _args.baseline:
+        with open(_args.baseline) as f:
+            _baseline = json.load(f)
+
+    _results = {}
+    for _module in _args.modules:
+        _result = _results[_module] = measure(_module, _args.headless)
+        if "error" in _result:
+            print(f"{_module:<34} failed: {_result['error']}")
+            continue
+        _line = f"{_module:<34} {_result['total_ms']:>9.1f} ms"
+        _before = _baseline.get(_module, {}).get("total_ms")
+        if _before:
+            _line += f"  (baseline {_before:.1f} ms, {_result['total_ms'] - _before:+.1f} ms)"
+        print(_line)
+        for _name, _ms in list(_result["dependencies"].items())[:_args.top]:
+            print(f"    {_name:<30} {_ms:>9.1f} ms")
+
+    if _args.save:
+        with open(_args.save, "w") as f:
+            json.dump(_results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Load test: client-side parsing of invoke_agent() streams replayed from a recording.
+
+Replays recorded completion streams through AgentsForAmazonBedrock.invoke() with
+no network, so the measured rate is the client-side cost of event parsing,
+answer/citation assembly and trace handling. Without --recording a synthetic
+recording of multi-agent streams with cited answers is generated first.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_replay [--recording streams.ndjson.gz] [--streams 10000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from utils.bedrock_agent_helper import AgentsForAmazonBedrock
+from utils.agent_replay import RecordingRuntimeClient, ReplayRuntimeClient
+from utils.agent_trace import TraceHandlerRegistry, TraceTypeCounter
+from benchmarks.streams import SyntheticRuntimeClient, cited_answer_chunk, synthetic_multi_agent_stream
+
+
+def write_synthetic_recording(path: str, num_streams: int = 50) -> None:
+    """Records num_streams synthetic multi-agent streams, each ending in a cited answer."""
+    _streams = [
+        synthetic_multi_agent_stream(39) + [cited_answer_chunk(20 + _i)]
+        for _i in range(num_streams)
+    ]
+    _recorder = RecordingRuntimeClient(SyntheticRuntimeClient(_streams), path)
+    for _i in range(num_streams):
+        _response = _recorder.invoke_agent(inputText=f"question {_i}", agentId="BENCH", sessionId=str(_i))
+        for _ in _response["completion"]:
+            pass
+    _recorder.close()
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    _parser.add_argument("--recording", help="recording written by RecordingRuntimeClient")
+    _parser.add_argument("--streams", type=int, default=10_000, help="number of invocations to replay")
+    _args = _parser.parse_args()
+
+    _recording = _args.recording
+    if _recording is None:
+        _recording = os.path.join(tempfile.mkdtemp(), "synthetic.ndjson.gz")
+        write_synthetic_recording(_recording)
+
+    # only the runtime client is needed, so skip the constructor and its AWS calls
+    _agents = AgentsForAmazonBedrock.__new__(AgentsForAmazonBedrock)
+    _agents._bedrock_agent_runtime_client = ReplayRuntimeClient(_recording)
+
+    _registry = TraceHandlerRegistry()
+    _counter = _registry.register("*", TraceTypeCounter())
+
+    _start = time.perf_counter()
+    for _i in range(_args.streams):
+        _agents.invoke(f"question {_i}", "BENCH", session_id=str(_i), trace_handlers=_registry)
+    _elapsed = time.perf_counter() - _start
+
+    print(f"replayed {_args.streams:,} streams ({sum(_counter.counts.values()):,} trace events) "
+          f"in {_elapsed:,.2f}s: {_args.streams / _elapsed * 60:,.0f} streams/minute")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Micro-benchmark: trace event dispatch in AgentsForAmazonBedrock.invoke().
+
+Compares the original nested if/elif trace chain of invoke() (reproduced below
+as the baseline) against the console renderer fed raw traces, as invoke() does
+by default, and against TraceHandlerRegistry dispatch, both with the console
+renderer and with cheap production handlers. Console output is discarded so
+only parsing and dispatch are measured.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_trace_dispatch [--streams 5000] [--recording streams.ndjson.gz]
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import time
+
+from termcolor import colored
+from rich.console import Console
+from rich.markdown import Markdown
+
+from utils.agent_events import TraceStep, parse_event
+from utils.agent_replay import load_recordings
+from utils.agent_trace import (
+    ConsoleTraceRenderer,
+    TraceHandlerRegistry,
+    TraceTypeCounter,
+    LoggingFailureHandler,
+    console_trace_registry,
+    UNDECIDABLE_CLASSIFICATION,
+    TRACE_TRUNCATION_LENGTH,
+)
+from benchmarks.streams import synthetic_multi_agent_stream
+
+
+def legacy_trace_loop(events, trace_level="core", multi_agent_names={}, enable_trace=True):
+    """The trace branch of invoke() before the handler registry, kept as the baseline."""
+    _total_in_tokens = 0
+    _total_out_tokens = 0
+    _total_llm_calls = 0
+    _orch_step = 0
+    _sub_step = 0
+    _time_before_orchestration = datetime.datetime.now()
+    _sub_agent_name = "<collab-name-not-yet-provided>"
+    for _event in events:
+        _sub_agent_alias_id = None
+        if 'trace' in _event and enable_trace:
+            if trace_level == "all":
+                print('---')
+            else:
+                if 'callerChain' in _event['trace']:
+                    if len(_event['trace']['callerChain']) > 1:
+                        _sub_agent_alias_arn = _event['trace']['callerChain'][1]['agentAliasArn']
+                        # get sub agent id by grabbing all text following the second '/' character
+                        _sub_agent_alias_id = _sub_agent_alias_arn.split('/', 1)[1]
+                        try:
+                            _sub_agent_name = multi_agent_names[_sub_agent_alias_id]
+                        except:
+                            print("You haven't provided agents names. To do so provide a dictionary in the format {f'{agent_id}/{agent_alias_id}': f'{agent_name}'})")
+                            _sub_agent_name = "<not-yet-provided>"
+
+                # if 'collaboratorName' in _event['trace']:
+                #     _sub_agent_name = _event['trace']['collaboratorName'] 
+                # else:
+                #     _sub_agent_name = "<collab-name-not-yet-provided>"
+
+            if 'routingClassifierTrace' in _event['trace']['trace']:
+                _route = _event['trace']['trace']['routingClassifierTrace']
+
+                if 'modelInvocationInput' in _route:
+                    _orch_step +=1 
+                    print(colored(f"---- Step {_orch_step} ----", "green"))
+                    _time_before_routing = datetime.datetime.now()
+                    print(colored("Classifying request to immediately route to one collaborator if possible.", "blue"))
+
+                if 'modelInvocationOutput' in _route:
+                    _llm_usage = _route['modelInvocationOutput']['metadata']['usage']
+                    _in_tokens = 0
+                    if 'inputTokens' in _llm_usage:
+                        _in_tokens = _llm_usage['inputTokens']
+                        _total_in_tokens += _in_tokens 
+
+                    _out_tokens = _llm_usage['outputTokens']
+                    _total_out_tokens += _out_tokens
+
+                    _total_llm_calls += 1
+                    _route_duration = datetime.datetime.now() - _time_before_routing
+
+                    _raw_resp_str = _route['modelInvocationOutput']['rawResponse']['content']
+                    _classification = _raw_resp_str.replace('<a>', '').replace('</a>', '')
+
+                    if _classification == UNDECIDABLE_CLASSIFICATION:
+                        print(colored("Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.", "magenta"))
+                    elif _classification == 'keep_previous_agent':
+                        print(colored("Continuing conversation with previous collaborator.", "magenta"))
+                        # # since we replaced the typical orchestration step with a simple routing
+                        # # classification, bump the step count.
+                        # _orch_step += 1
+                    else:
+                        _sub_agent_name = _classification
+                        print(colored(f"Routing classifier chose collaborator: '{_classification}'", "magenta"))
+                        # # since we replaced the typical orchestration step with a simple routing
+                        # # classification, bump the step count.
+                        # _orch_step += 1
+                    print(colored(f"Routing classifier took {_route_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}).\n", "yellow"))
+
+            if 'failureTrace' in _event['trace']['trace']:
+                print(colored(f"Agent error: {_event['trace']['trace']['failureTrace']['failureReason']}", "red"))
+
+            if 'orchestrationTrace' in _event['trace']['trace']:
+                _orch = _event['trace']['trace']['orchestrationTrace']
+
+                if trace_level in ["core", "outline"]:
+                    if "rationale" in _orch:
+                        _rationale = _orch['rationale']
+                        print(colored(f"{_rationale['text']}", "blue"))
+
+                    if "invocationInput" in _orch:
+                        # NOTE: when agent determines invocations should happen in parallel
+                        # the trace objects for invocation input still come back one at a time.
+                        _input = _orch['invocationInput']
+
+                        if 'actionGroupInvocationInput' in _input:
+                            if trace_level == "outline":
+                                print(colored(f"Using tool: {_input['actionGroupInvocationInput']['function']}", "magenta"))
+                            else:
+                                print(colored(f"Using tool: {_input['actionGroupInvocationInput']['function']} with these inputs:", "magenta"))
+                                if (len(_input['actionGroupInvocationInput']['parameters']) == 1) and (_input['actionGroupInvocationInput']['parameters'][0]['name'] == 'input_text'):
+                                    print(colored(f"{_input['actionGroupInvocationInput']['parameters'][0]['value']}", "magenta"))
+                                else:
+                                    print(colored(f"{_input['actionGroupInvocationInput']['parameters']}\n", "magenta"))
+
+                        elif 'agentCollaboratorInvocationInput' in _input:
+                            _collab_name = _input['agentCollaboratorInvocationInput']['agentCollaboratorName']
+                            _sub_agent_name = _collab_name
+                            _collab_input_text = _input['agentCollaboratorInvocationInput']['input']['text']
+                            _collab_arn = _input['agentCollaboratorInvocationInput']['agentCollaboratorAliasArn']
+                            _collab_ids = _collab_arn.split('/', 1)[1]
+
+                            if trace_level == "outline":
+                                print(colored(f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]'", "magenta"))
+                            else:
+                                print(colored(f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]' passing input text:", "magenta"))
+                                print(colored(f"{_collab_input_text[0:TRACE_TRUNCATION_LENGTH]}\n", "magenta"))
+
+                        elif 'codeInterpreterInvocationInput' in _input:
+                            if trace_level == "outline":
+                                print(colored("Using code interpreter", "magenta"))
+                            else:
+                                console = Console()
+                                _gen_code = _input['codeInterpreterInvocationInput']['code']
+                                _code = f"```python\n{_gen_code}\n```"
+
+                                console.print(Markdown(f"**Generated code**\n{_code}"))
+
+                    if "observation" in _orch:
+                        if trace_level == "core":
+                            _output = _orch['observation']
+                            if 'actionGroupInvocationOutput' in _output:
+                                print(colored(f"--tool outputs:\n{_output['actionGroupInvocationOutput']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n", "magenta"))
+
+                            if 'agentCollaboratorInvocationOutput' in _output:
+                                _collab_name = _output['agentCollaboratorInvocationOutput']['agentCollaboratorName']
+                                _collab_output_text = _output['agentCollaboratorInvocationOutput']['output']['text'][0:TRACE_TRUNCATION_LENGTH]
+                                print(colored(f"\n----sub-agent {_collab_name} output text:\n{_collab_output_text}...\n", "magenta"))
+
+                            if 'finalResponse' in _output:
+                                print(colored(f"Final response:\n{_output['finalResponse']['text'][0:TRACE_TRUNCATION_LENGTH]}...", "cyan"))
+
+                # if 'modelInvocationInput' in _orch:
+                #     if _sub_agent_alias_id is not None:
+                #         _sub_step += 1
+                #         print(colored(f"---- Step {_orch_step}.{_sub_step} [using sub-agent name:{_sub_agent_name}, id:{_sub_agent_alias_id}] ----", "green"))
+                #     else:
+                #         _orch_step += 1
+                #         _sub_step = 0
+                #         print(colored(f"---- Step {_orch_step} ----", "green"))
+
+                if 'modelInvocationOutput' in _orch:
+                    if _sub_agent_alias_id is not None:
+                        _sub_step += 1
+                        print(colored(f"---- Step {_orch_step}.{_sub_step} [using sub-agent name:{_sub_agent_name}, id:{_sub_agent_alias_id}] ----", "green"))
+                    else:
+                        _orch_step += 1
+                        _sub_step = 0
+                        print(colored(f"---- Step {_orch_step} ----", "green"))
+
+                    _llm_usage = _orch['modelInvocationOutput']['metadata']['usage']
+                    _in_tokens = 0
+                    if 'inputTokens' in _llm_usage:
+                        _in_tokens = _llm_usage['inputTokens']
+                        _total_in_tokens += _in_tokens 
+
+                    _out_tokens = _llm_usage['outputTokens']
+                    _total_out_tokens += _out_tokens
+
+                    _total_llm_calls += 1
+                    _orch_duration = datetime.datetime.now() - _time_before_orchestration
+
+                    print(colored(f'Took {_orch_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}) to complete prior action, observe, orchestrate.', "yellow"))
+
+                    # restart the clock for next step/sub-step
+                    _time_before_orchestration = datetime.datetime.now()
+
+            elif 'preProcessingTrace' in _event['trace']['trace']:
+                _pre = _event['trace']['trace']['preProcessingTrace']
+                if 'modelInvocationOutput' in _pre:
+                    _llm_usage = _pre['modelInvocationOutput']['metadata']['usage']
+                    _in_tokens = 0
+                    if 'inputTokens' in _llm_usage:
+                        _in_tokens = _llm_usage['inputTokens']
+                        _total_in_tokens += _in_tokens 
+
+                    _out_tokens = _llm_usage['outputTokens']
+                    _total_out_tokens += _out_tokens
+
+                    _total_llm_calls += 1
+
+                    print(colored("Pre-processing trace, agent came up with an initial plan.", "yellow"))
+                    print(colored(f'Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}', "yellow"))
+
+            elif 'postProcessingTrace' in _event['trace']['trace']:
+                _post = _event['trace']['trace']['postProcessingTrace']
+                if 'modelInvocationOutput' in _post:
+                    _llm_usage = _post['modelInvocationOutput']['metadata']['usage']
+                    _in_tokens = 0
+                    if 'inputTokens' in _llm_usage:
+                        _in_tokens = _llm_usage['inputTokens']
+                        _total_in_tokens += _in_tokens 
+
+                    _out_tokens = _llm_usage['outputTokens']
+                    _total_out_tokens += _out_tokens
+
+                    _total_llm_calls += 1
+                    print(colored("Agent post-processing complete.", "yellow"))
+                    print(colored(f'Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}', "yellow"))
+
+            if trace_level == "all":
+                print(json.dumps(_event['trace'], indent=2, ensure_ascii=False, default=str))
+
+
+def console_trace_loop(events, renderer):
+    """The trace branch of invoke() with the default console output: raw traces go to the renderer."""
+    _render = renderer.render
+    for _event in events:
+        if len(_event) == 1 and 'trace' in _event:
+            _render(_event['trace'])
+
+
+def registry_trace_loop(events, registry):
+    """The trace branch of invoke() with the handler registry."""
+    for _event in events:
+        for _typed in parse_event(_event):
+            if isinstance(_typed, TraceStep):
+                registry.dispatch(_typed)
+
+
+def _events_per_second(loop, streams, repeat: int = 3) -> float:
+    """Runs loop(stream) over every stream and returns the best events/sec of repeat runs."""
+    _num_events = sum(len(_s) for _s in streams)
+    _best = float("inf")
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            _start = time.perf_counter()
+            for _stream in streams:
+                loop(_stream)
+            _best = min(_best, time.perf_counter() - _start)
+    return _num_events / _best
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    _parser.add_argument("--streams", type=int, default=5_000, help="number of invocations to replay")
+    _parser.add_argument("--events-per-stream", type=int, default=39, help="trace events per invocation")
+    _parser.add_argument("--recording", help="replay streams recorded by RecordingRuntimeClient instead")
+    _args = _parser.parse_args()
+
+    if _args.recording:
+        _recorded = [[_e for _e in _r.events if "trace" in _e] for _r in load_recordings(_args.recording)]
+        _streams = [_recorded[_i % len(_recorded)] for _i in range(_args.streams)]
+    else:
+        _streams = [synthetic_multi_agent_stream(_args.events_per_stream) for _ in range(_args.streams)]
+    # keep the recorded events out of the cyclic GC so only dispatch work is measured
+    gc.collect()
+    gc.freeze()
+
+    def _cheap_registry() -> TraceHandlerRegistry:
+        _registry = TraceHandlerRegistry()
+        _registry.register("failureTrace", LoggingFailureHandler())
+        _registry.register("*", TraceTypeCounter())
+        return _registry
+
+    # like invoke(), every stream gets a fresh set of handlers
+    _results = {
+        "legacy if/elif chain (console)": _events_per_second(legacy_trace_loop, _streams),
+        "console renderer (raw traces)": _events_per_second(
+            lambda _s: console_trace_loop(_s, ConsoleTraceRenderer("core")), _streams
+        ),
+        "registry (console renderer)": _events_per_second(
+            lambda _s: registry_trace_loop(_s, console_trace_registry("core")[0]), _streams
+        ),
+        "registry (production handlers)": _events_per_second(
+            lambda _s: registry_trace_loop(_s, _cheap_registry()), _streams
+        ),
+    }
+    for _name, _rate in _results.items():
+        print(f"{_name:<34} {_rate:>12,.0f} events/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Synthetic invoke_agent() completion streams shared by the benchmarks."""
+
+import itertools
+from typing import Dict, List
+
+SUPERVISOR_ALIAS_ARN = "arn:aws:bedrock:us-west-2:123456789012:agent-alias/SUPERVISOR/TSTALIASID"
+COLLABORATORS = {
+    "RESEARCH01/ALIAS00001": "research_agent",
+    "WRITER0001/ALIAS00002": "article_writer",
+    "REVIEWER01/ALIAS00003": "article_reviewer",
+}
+UNDECIDABLE = "undecidable"
+
+
+def _usage(in_tokens: int, out_tokens: int) -> Dict:
+    return {"metadata": {"usage": {"inputTokens": in_tokens, "outputTokens": out_tokens}}}
+
+
+def _trace(body: Dict, sub_agent: str = None) -> Dict:
+    _chain = [{"agentAliasArn": SUPERVISOR_ALIAS_ARN}]
+    _trace_part = {"agentId": "SUPERVISOR", "callerChain": _chain, "trace": body}
+    if sub_agent is not None:
+        _chain.append({"agentAliasArn": f"arn:aws:bedrock:us-west-2:123456789012:agent-alias/{sub_agent}"})
+        _trace_part["collaboratorName"] = COLLABORATORS[sub_agent]
+    return {"trace": _trace_part}
+
+
+def multi_agent_turn(sub_agent: str) -> List[Dict]:
+    """Returns the trace events of one supervisor turn that delegates to a collaborator."""
+    _arn = f"arn:aws:bedrock:us-west-2:123456789012:agent-alias/{sub_agent}"
+    return [
+        _trace({"routingClassifierTrace": {"modelInvocationInput": {"text": "route me"}}}),
+        _trace({"routingClassifierTrace": {"modelInvocationOutput": {
+            **_usage(812, 9), "rawResponse": {"content": f"<a>{UNDECIDABLE}</a>"}}}}),
+        _trace({"preProcessingTrace": {"modelInvocationOutput": _usage(1024, 96)}}),
+        _trace({"orchestrationTrace": {"modelInvocationInput": {"text": "orchestrate"}}}),
+        _trace({"orchestrationTrace": {"modelInvocationOutput": _usage(2048, 160)}}),
+        _trace({"orchestrationTrace": {"rationale": {"text": "I should ask a collaborator for help."}}}),
+        _trace({"orchestrationTrace": {"invocationInput": {"agentCollaboratorInvocationInput": {
+            "agentCollaboratorName": COLLABORATORS[sub_agent],
+            "agentCollaboratorAliasArn": _arn,
+            "input": {"text": "Please research the topic in depth. " * 8}}}}}),
+        _trace({"orchestrationTrace": {"modelInvocationOutput": _usage(1500, 300)}}, sub_agent),
+        _trace({"orchestrationTrace": {"invocationInput": {"actionGroupInvocationInput": {
+            "function": "search_titles", "parameters": [{"name": "title", "value": "Rogue Horizon"}]}}}},
+            sub_agent),
+        _trace({"orchestrationTrace": {"observation": {"actionGroupInvocationOutput": {
+            "text": "Found 3 titles. " * 30}}}}, sub_agent),
+        _trace({"orchestrationTrace": {"observation": {"agentCollaboratorInvocationOutput": {
+            "agentCollaboratorName": COLLABORATORS[sub_agent], "output": {"text": "Result text. " * 40}}}}}),
+        _trace({"orchestrationTrace": {"observation": {"finalResponse": {"text": "Final answer. " * 30}}}}),
+        _trace({"postProcessingTrace": {"modelInvocationOutput": _usage(600, 40)}}),
+    ]
+
+
+def synthetic_multi_agent_stream(num_events: int) -> List[Dict]:
+    """Returns num_events raw trace events cycling through multi-agent turns."""
+    _turns = itertools.cycle(COLLABORATORS)
+    _events = []
+    while len(_events) < num_events:
+        _events.extend(multi_agent_turn(next(_turns)))
+    return _events[:num_events]
+
+
+def cited_answer_chunk(num_citations: int, sentence: str = "Paper Wings premieres this fall.") -> Dict:
+    """Returns a 'chunk' event whose text has one citation per sentence.
+
+    Spans are positions in the returned text, and references cycle through a small
+    set of S3 documents so repeated URIs are common, as in real knowledge base answers.
+    """
+    _parts = []
+    _citations = []
+    _pos = 0
+    for _i in range(num_citations):
+        _text = f"{sentence} "
+        _parts.append(_text)
+        _citations.append({
+            "generatedResponsePart": {"textResponsePart": {
+                "text": _text, "span": {"start": _pos, "end": _pos + len(_text) - 2}}},
+            "retrievedReferences": [{
+                "content": {"text": "source passage"},
+                "location": {"type": "S3", "s3Location": {"uri": f"s3://press-releases/doc_{_i % 25}.md"}},
+            }],
+        })
+        _pos += len(_text)
+    return {"chunk": {"bytes": "".join(_parts).encode("utf8"), "attribution": {"citations": _citations}}}
+
+
+class SyntheticRuntimeClient:
+    """Minimal bedrock-agent-runtime stand-in that returns the given event lists in turn."""
+
+    def __init__(self, streams: List[List[Dict]]):
+        self._streams = itertools.cycle(streams)
+
+    def invoke_agent(self, **kwargs) -> Dict:
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200, "RequestId": "synthetic", "RetryAttempts": 0},
+            "sessionId": kwargs.get("sessionId"),
+            "completion": iter(next(self._streams)),
+        }
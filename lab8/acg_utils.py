@@ -1,11 +1,13 @@
 import boto3
-import json
-import time
 from boto3.session import Session
 import botocore
 import requests
 import os
-import time
+
+# lab8/utils.py shadows the repository's utils package, so its helpers are imported through repo_utils
+from repo_utils.iam_roles import role_provisioner
+from repo_utils.lambda_artifacts import LambdaArtifactCache, LambdaPackage
+from repo_utils.teardown import TeardownPlan, add_gateway_steps
 
 def setup_cognito_user_pool():
     boto_session = Session()
@@ -291,53 +293,17 @@ def create_agentcore_role(agent_name):
         ]
     }
 
-    assume_role_policy_document_json = json.dumps(
-        assume_role_policy_document
+    # an existing role is updated in place instead of deleted and created again, and a created
+    # or changed role is probed until IAM serves it instead of sleeping for a fixed time
+    print(f"ensuring role {agentcore_role_name}")
+    agentcore_iam_role = role_provisioner(iam_client).ensure_role(
+        agentcore_role_name,
+        assume_role_policy_document,
+        inline_policies={"AgentCorePolicy": role_policy},
+        exclusive=True,
     )
-    role_policy_document = json.dumps(role_policy)
-    # Create IAM Role for the Lambda function
-    try:
-        agentcore_iam_role = iam_client.create_role(
-            RoleName=agentcore_role_name,
-            AssumeRolePolicyDocument=assume_role_policy_document_json
-        )
 
-        # Pause to make sure role is created
-        time.sleep(10)
-    except iam_client.exceptions.EntityAlreadyExistsException:
-        print("Role already exists -- deleting and creating it again")
-        policies = iam_client.list_role_policies(
-            RoleName=agentcore_role_name,
-            MaxItems=100
-        )
-        print("policies:", policies)
-        for policy_name in policies['PolicyNames']:
-            iam_client.delete_role_policy(
-                RoleName=agentcore_role_name,
-                PolicyName=policy_name
-            )
-        print(f"deleting {agentcore_role_name}")
-        iam_client.delete_role(
-            RoleName=agentcore_role_name
-        )
-        print(f"recreating {agentcore_role_name}")
-        agentcore_iam_role = iam_client.create_role(
-            RoleName=agentcore_role_name,
-            AssumeRolePolicyDocument=assume_role_policy_document_json
-        )
-
-    # Attach the AWSLambdaBasicExecutionRole policy
-    print(f"attaching role policy {agentcore_role_name}")
-    try:
-        iam_client.put_role_policy(
-            PolicyDocument=role_policy_document,
-            PolicyName="AgentCorePolicy",
-            RoleName=agentcore_role_name
-        )
-    except Exception as e:
-        print(e)
-
-    return agentcore_iam_role
+    return {"Role": agentcore_iam_role}
 
 def create_agentcore_gateway_role(gateway_name):
     iam_client = boto3.client('iam')
@@ -377,54 +343,17 @@ def create_agentcore_gateway_role(gateway_name):
         ]
     }
 
-    assume_role_policy_document_json = json.dumps(
-        assume_role_policy_document
+    # an existing role is updated in place instead of deleted and created again, and a created
+    # or changed role is probed until IAM serves it instead of sleeping for a fixed time
+    print(f"ensuring role {agentcore_gateway_role_name}")
+    agentcore_iam_role = role_provisioner(iam_client).ensure_role(
+        agentcore_gateway_role_name,
+        assume_role_policy_document,
+        inline_policies={"AgentCorePolicy": role_policy},
+        exclusive=True,
     )
 
-    role_policy_document = json.dumps(role_policy)
-    # Create IAM Role for the Lambda function
-    try:
-        agentcore_iam_role = iam_client.create_role(
-            RoleName=agentcore_gateway_role_name,
-            AssumeRolePolicyDocument=assume_role_policy_document_json
-        )
-
-        # Pause to make sure role is created
-        time.sleep(10)
-    except iam_client.exceptions.EntityAlreadyExistsException:
-        print("Role already exists -- deleting and creating it again")
-        policies = iam_client.list_role_policies(
-            RoleName=agentcore_gateway_role_name,
-            MaxItems=100
-        )
-        print("policies:", policies)
-        for policy_name in policies['PolicyNames']:
-            iam_client.delete_role_policy(
-                RoleName=agentcore_gateway_role_name,
-                PolicyName=policy_name
-            )
-        print(f"deleting {agentcore_gateway_role_name}")
-        iam_client.delete_role(
-            RoleName=agentcore_gateway_role_name
-        )
-        print(f"recreating {agentcore_gateway_role_name}")
-        agentcore_iam_role = iam_client.create_role(
-            RoleName=agentcore_gateway_role_name,
-            AssumeRolePolicyDocument=assume_role_policy_document_json
-        )
-
-    # Attach the AWSLambdaBasicExecutionRole policy
-    print(f"attaching role policy {agentcore_gateway_role_name}")
-    try:
-        iam_client.put_role_policy(
-            PolicyDocument=role_policy_document,
-            PolicyName="AgentCorePolicy",
-            RoleName=agentcore_gateway_role_name
-        )
-    except Exception as e:
-        print(e)
-
-    return agentcore_iam_role
+    return {"Role": agentcore_iam_role}
 
 
 def create_agentcore_gateway_role_s3_smithy(gateway_name):
@@ -474,54 +403,17 @@ def create_agentcore_gateway_role_s3_smithy(gateway_name):
         ]
     }
 
-    assume_role_policy_document_json = json.dumps(
-        assume_role_policy_document
+    # an existing role is updated in place instead of deleted and created again, and a created
+    # or changed role is probed until IAM serves it instead of sleeping for a fixed time
+    print(f"ensuring role {agentcore_gateway_role_name}")
+    agentcore_iam_role = role_provisioner(iam_client).ensure_role(
+        agentcore_gateway_role_name,
+        assume_role_policy_document,
+        inline_policies={"AgentCorePolicy": role_policy},
+        exclusive=True,
     )
 
-    role_policy_document = json.dumps(role_policy)
-    # Create IAM Role for the Lambda function
-    try:
-        agentcore_iam_role = iam_client.create_role(
-            RoleName=agentcore_gateway_role_name,
-            AssumeRolePolicyDocument=assume_role_policy_document_json
-        )
-
-        # Pause to make sure role is created
-        time.sleep(10)
-    except iam_client.exceptions.EntityAlreadyExistsException:
-        print("Role already exists -- deleting and creating it again")
-        policies = iam_client.list_role_policies(
-            RoleName=agentcore_gateway_role_name,
-            MaxItems=100
-        )
-        print("policies:", policies)
-        for policy_name in policies['PolicyNames']:
-            iam_client.delete_role_policy(
-                RoleName=agentcore_gateway_role_name,
-                PolicyName=policy_name
-            )
-        print(f"deleting {agentcore_gateway_role_name}")
-        iam_client.delete_role(
-            RoleName=agentcore_gateway_role_name
-        )
-        print(f"recreating {agentcore_gateway_role_name}")
-        agentcore_iam_role = iam_client.create_role(
-            RoleName=agentcore_gateway_role_name,
-            AssumeRolePolicyDocument=assume_role_policy_document_json
-        )
-
-    # Attach the AWSLambdaBasicExecutionRole policy
-    print(f"attaching role policy {agentcore_gateway_role_name}")
-    try:
-        iam_client.put_role_policy(
-            PolicyDocument=role_policy_document,
-            PolicyName="AgentCorePolicy",
-            RoleName=agentcore_gateway_role_name
-        )
-    except Exception as e:
-        print(e)
-
-    return agentcore_iam_role
+    return {"Role": agentcore_iam_role}
 
 def create_gateway_lambda(lambda_function_code_path, lambda_function_name='gateway_lambda', envs=None) -> dict[str, int]:
     boto_session = Session()
@@ -536,16 +428,13 @@ def create_gateway_lambda(lambda_function_code_path, lambda_function_name='gatew
     role_name = 'gateway_lambda_iamrole'
     role_arn = ''
     
-    print("Reading code from zip file")
-    with open(lambda_function_code_path, 'rb') as f:
-        lambda_function_code = f.read()
-
     try:
-        print("Creating IAM role for lambda function")
+        print("Ensuring IAM role for lambda function")
 
-        response = iam_client.create_role(
-            RoleName=role_name,
-            AssumeRolePolicyDocument=json.dumps({
+        # no wait for the role to propagate: creating the function is retried until Lambda can assume it
+        role = role_provisioner(iam_client).ensure_role(
+            role_name,
+            {
                 "Version": "2012-10-17",
                 "Statement": [
                     {
@@ -556,90 +445,69 @@ def create_gateway_lambda(lambda_function_code_path, lambda_function_name='gatew
                         "Action": "sts:AssumeRole"
                     }
                 ]
-            }),
-            Description="IAM role to be assumed by lambda function"
-        )
-
-        role_arn = response['Role']['Arn']
-
-        print("Attaching policy to the IAM role")
-
-        response = iam_client.attach_role_policy(
-            RoleName=role_name,
-            PolicyArn='arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole'
-        )
-        response = iam_client.attach_role_policy(
-            RoleName=role_name,
-            PolicyArn='arn:aws:iam::aws:policy/AmazonBedrockFullAccess'
+            },
+            managed_policy_arns=[
+                'arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole',
+                'arn:aws:iam::aws:policy/AmazonBedrockFullAccess',
+            ],
+            description="IAM role to be assumed by lambda function",
+            wait=False,
         )
-
-        print(f"Role '{role_name}' created successfully: {role_arn}")
-        time.sleep(10)
+        role_arn = role['Arn']
+        print(f"Role '{role_name}' ready: {role_arn}")
     except botocore.exceptions.ClientError as error:
-        if error.response['Error']['Code'] == "EntityAlreadyExists":
-            response = iam_client.get_role(RoleName=role_name)
-            role_arn = response['Role']['Arn']
-            print(f"IAM role {role_name} already exists. Using the same ARN {role_arn}")
-        else:
-            error_message = error.response['Error']['Code'] + "-" + error.response['Error']['Message']
-            print(f"Error creating role: {error_message}")
-            return_resp['lambda_function_arn'] = error_message
+        error_message = error.response['Error']['Code'] + "-" + error.response['Error']['Message']
+        print(f"Error creating role: {error_message}")
+        return_resp['lambda_function_arn'] = error_message
 
     if role_arn != "":
-        print("Creating lambda function")
-        # Create lambda function    
+        print("Creating or updating lambda function")
+        # the code is only uploaded if it differs from the deployed function
         try:
-            lambda_response = lambda_client.create_function(
-                FunctionName=lambda_function_name,
-                Role=role_arn,
-                Runtime='python3.12',
-                Handler=f'{lambda_function_name}.lambda_handler',
-                Code = {'ZipFile': lambda_function_code},
-                Description='Lambda function example for Bedrock AgentCore Gateway',
-                PackageType='Zip',
-                Timeout=900,
-                Environment={ "Variables" : envs }
+            result = LambdaArtifactCache(lambda_client).deploy_function(
+                lambda_function_name,
+                LambdaPackage(lambda_function_code_path),
+                role_arn,
+                handler=f'{lambda_function_name}.lambda_handler',
+                runtime='python3.12',
+                timeout=900,
+                environment=envs or {},
+                description='Lambda function example for Bedrock AgentCore Gateway',
             )
+            if result.created:
+                print(f"AWS Lambda function {lambda_function_name} created")
+            elif result.changed:
+                print(f"AWS Lambda function {lambda_function_name} updated in place")
+            else:
+                print(f"AWS Lambda function {lambda_function_name} is up to date. Using the same ARN {result.function_arn}")
 
-            return_resp['lambda_function_arn'] = lambda_response['FunctionArn']
+            return_resp['lambda_function_arn'] = result.function_arn
             return_resp['exit_code'] = 0
         except botocore.exceptions.ClientError as error:
-            if error.response['Error']['Code'] == "ResourceConflictException":
-                response = lambda_client.get_function(FunctionName=lambda_function_name)
-                lambda_arn = response['Configuration']['FunctionArn']
-                print(f"AWS Lambda function {lambda_function_name} already exists. Using the same ARN {lambda_arn}")
-                return_resp['lambda_function_arn'] = lambda_arn
-            else:
-                error_message = error.response['Error']['Code'] + "-" + error.response['Error']['Message']
-                print(f"Error creating lambda function: {error_message}")
-                return_resp['lambda_function_arn'] = error_message
+            error_message = error.response['Error']['Code'] + "-" + error.response['Error']['Message']
+            print(f"Error creating lambda function: {error_message}")
+            return_resp['lambda_function_arn'] = error_message
 
     return return_resp
 
 def delete_gateway(gateway_client,gatewayId): 
-    print("Deleting all targets for gateway", gatewayId)
-    list_response = gateway_client.list_gateway_targets(
-            gatewayIdentifier = gatewayId,
-            maxResults=100
-    )
-    for item in list_response['items']:
-        targetId = item["targetId"]
-        print("Deleting target ", targetId)
-        gateway_client.delete_gateway_target(
-            gatewayIdentifier = gatewayId,
-            targetId = targetId
-        )
-    print("Deleting gateway ", gatewayId)
-    time.sleep(30)
-    gateway_client.delete_gateway(gatewayIdentifier = gatewayId)
+    # the targets are deleted in parallel and polled until gone, then the gateway is deleted
+    print("Deleting gateway", gatewayId, "and its targets")
+    plan = TeardownPlan()
+    add_gateway_steps(plan, gateway_client, gatewayId)
+    return plan.run()
 
 def delete_all_gateways(gateway_client):
     try:
-        list_response = gateway_client.list_gateways(
-            maxResults=100
-        )
-        for item in list_response['items']:
-            gatewayId= item["gatewayId"]
-            delete_gateway(gatewayId)
+        plan = TeardownPlan()
+        kwargs = {"maxResults": 100}
+        while True:
+            list_response = gateway_client.list_gateways(**kwargs)
+            for item in list_response['items']:
+                add_gateway_steps(plan, gateway_client, item["gatewayId"])
+            if not list_response.get("nextToken"):
+                break
+            kwargs["nextToken"] = list_response["nextToken"]
+        return plan.run()
     except Exception as e:
         print(e)
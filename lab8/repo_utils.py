@@ -0,0 +1,13 @@
+"""The repository's utils package, importable from lab8 as repo_utils.
+
+lab8/utils.py shadows the repository's utils package for the notebooks in this
+directory. Giving this module the package's directory as __path__ makes it
+stand in for the package, so its modules keep their relative imports and share
+one copy of each module, e.g. of the waiter statistics:
+
+    >>> from repo_utils.iam_roles import role_provisioner
+"""
+
+import os
+
+__path__ = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils")]
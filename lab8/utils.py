@@ -1,8 +1,9 @@
 import boto3
-import json
-import time
 from boto3.session import Session
 
+# this module shadows the repository's utils package, so its helpers are imported through repo_utils
+from repo_utils.iam_roles import role_provisioner
+
 def setup_cognito_user_pool():
     boto_session = Session()
     region = boto_session.region_name
@@ -224,50 +225,14 @@ def create_agentcore_role(agent_name):
         ]
     }
 
-    assume_role_policy_document_json = json.dumps(
-        assume_role_policy_document
+    # an existing role is updated in place instead of deleted and created again, and a created
+    # or changed role is probed until IAM serves it instead of sleeping for a fixed time
+    print(f"ensuring role {agentcore_role_name}")
+    agentcore_iam_role = role_provisioner(iam_client).ensure_role(
+        agentcore_role_name,
+        assume_role_policy_document,
+        inline_policies={"AgentCorePolicy": role_policy},
+        exclusive=True,
     )
-    role_policy_document = json.dumps(role_policy)
-    # Create IAM Role for the Lambda function
-    try:
-        agentcore_iam_role = iam_client.create_role(
-            RoleName=agentcore_role_name,
-            AssumeRolePolicyDocument=assume_role_policy_document_json
-        )
-
-        # Pause to make sure role is created
-        time.sleep(10)
-    except iam_client.exceptions.EntityAlreadyExistsException:
-        print("Role already exists -- deleting and creating it again")
-        policies = iam_client.list_role_policies(
-            RoleName=agentcore_role_name,
-            MaxItems=100
-        )
-        print("policies:", policies)
-        for policy_name in policies['PolicyNames']:
-            iam_client.delete_role_policy(
-                RoleName=agentcore_role_name,
-                PolicyName=policy_name
-            )
-        print(f"deleting {agentcore_role_name}")
-        iam_client.delete_role(
-            RoleName=agentcore_role_name
-        )
-        print(f"recreating {agentcore_role_name}")
-        agentcore_iam_role = iam_client.create_role(
-            RoleName=agentcore_role_name,
-            AssumeRolePolicyDocument=assume_role_policy_document_json
-        )
-
-    # Attach the AWSLambdaBasicExecutionRole policy
-    print(f"attaching role policy {agentcore_role_name}")
-    try:
-        iam_client.put_role_policy(
-            PolicyDocument=role_policy_document,
-            PolicyName="AgentCorePolicy",
-            RoleName=agentcore_role_name
-        )
-    except Exception as e:
-        print(e)
 
-    return agentcore_iam_role
\ No newline at end of file
+    return {"Role": agentcore_iam_role}
\ No newline at end of file
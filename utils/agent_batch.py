@@ -0,0 +1,120 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Support classes for AgentsForAmazonBedrock.invoke_many().
+
+invoke_many() pushes a large number of prompts through invoke_agent() from a
+bounded thread pool. The number of calls actually in flight is governed by an
+AIMDLimiter: every successful call grows the limit additively (roughly +1 per
+window of successes), and every ThrottlingException cuts it multiplicatively,
+so the batch settles just under the account's invoke quota instead of
+hammering it. Calls throttled in the same burst cut the limit only once: a
+throttle counts only if its call started after the last decrease.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+THROTTLING_ERROR_CODES = (
+    "ThrottlingException",
+    "throttlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+)
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """Returns True if the exception is a botocore throttling error, including
+    throttling exceptions delivered inside an event stream."""
+    _response = getattr(error, "response", None) or {}
+    return _response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+class AIMDLimiter:
+    """Additive-increase, multiplicative-decrease concurrency limiter.
+
+    Args:
+        max_limit (int): upper bound on concurrent calls, normally the thread pool size
+        initial_limit (int, optional): starting limit. Defaults to max_limit.
+        min_limit (int, optional): lower bound on the limit. Defaults to 1.
+        decrease_factor (float, optional): multiplier applied on throttling. Defaults to 0.5.
+    """
+
+    def __init__(
+            self,
+            max_limit: int,
+            initial_limit: int = None,
+            min_limit: int = 1,
+            decrease_factor: float = 0.5,
+    ):
+        self._max_limit = max_limit
+        self._min_limit = min_limit
+        self._decrease_factor = decrease_factor
+        self._limit = float(initial_limit or max_limit)
+        self._in_flight = 0
+        # number of decreases so far; a call throttled before the latest one does not decrease again
+        self._epoch = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """Current number of calls allowed in flight."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self) -> int:
+        """Blocks until a call may start.
+
+        Returns:
+            int: the decrease epoch the call started in, to be passed to release()
+        """
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+            return self._epoch
+
+    def release(self, throttled: bool = False, epoch: int = None) -> None:
+        """Marks a call as finished and adjusts the limit based on its outcome.
+
+        Args:
+            throttled (bool, optional): whether the call was throttled. Defaults to False.
+            epoch (int, optional): the value acquire() returned for the call. A throttled call
+                decreases the limit only if no other decrease happened since it started. Defaults
+                to None, which always decreases.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                if epoch is None or epoch == self._epoch:
+                    self._limit = max(self._min_limit, self._limit * self._decrease_factor)
+                    self._epoch += 1
+            else:
+                self._limit = min(self._max_limit, self._limit + 1.0 / max(self._limit, 1.0))
+            self._cond.notify_all()
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one item of an invoke_many() batch.
+
+    index is the position of the item in the input iterable, since results are
+    returned in completion order rather than input order.
+    """
+    index: int
+    request: Dict[str, Any]
+    answer: Optional[str] = None
+    error: Optional[Exception] = None
+    latency: float = 0.0
+    time_to_first_token: Optional[float] = None
+    attempts: int = 0
+    throttled: int = 0
+    session_id: Optional[str] = None
+    metrics: Optional[Any] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
@@ -0,0 +1,147 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Turns agent answers and their knowledge base citations into footnoted text.
+
+Each 'chunk' event of an invoke_agent() stream carries a piece of the answer and
+the citations for that piece. A citation span gives the first and last character
+(inclusive) of the cited text within its chunk. CitationAssembler sorts the spans
+of a chunk once, copies the text between them in a single pass, and inserts a
+numbered marker after each cited span. Reference URIs are deduplicated across
+all chunks, so a document cited twenty times appears once in the source list:
+
+    >>> assembler = CitationAssembler()
+    >>> for _event in agents.invoke_stream("When does Paper Wings premiere?", agent_id):
+    ...     if isinstance(_event, TextDelta):
+    ...         assembler.add(_event.text, _event.citations)
+    >>> print(assembler.answer())
+    Paper Wings premieres this fall.[1]
+
+    Sources:
+    [1] s3://press-releases/paper_wings.md
+"""
+
+import re
+from operator import itemgetter
+from typing import Any, Dict, List, Tuple
+
+# the model sometimes leaves empty or redacted <sources> tags behind in cited answers
+_SOURCES_TAG_PATTERN = re.compile(
+    r"\n\n<sources>\n\d+\n</sources>\n\n|<sources><REDACTED></sources>|<sources></sources>"
+)
+SOURCES_HEADER = "Sources:"
+
+
+def reference_uri(reference: Dict[str, Any]) -> str:
+    """Returns the URI of a retrieved reference, whatever its data source type.
+
+    Args:
+        reference (Dict): one entry of a citation's 'retrievedReferences'
+
+    Returns:
+        str: the S3 URI or web URL of the referenced document, or "" if it has none
+    """
+    _location = reference.get("location") or {}
+    _s3 = _location.get("s3Location")
+    if _s3 is not None:
+        return _s3.get("uri", "")
+    for _key, _value in _location.items():
+        if isinstance(_value, dict):
+            _uri = _value.get("uri") or _value.get("url")
+            if _uri:
+                return _uri
+    return ""
+
+
+def _strip_sources_tags(text: str, markers: List[Tuple[int, str]]) -> Tuple[str, List[Tuple[int, str]]]:
+    # spans index the text as returned, so marker positions move left by the length of the tags
+    # removed before them; a position inside a tag moves to where the tag was
+    _removed = [_m.span() for _m in _SOURCES_TAG_PATTERN.finditer(text)]
+    if not _removed:
+        return text, markers
+    _shifted = []
+    for _end, _marker in markers:
+        _offset = 0
+        for _start, _stop in _removed:
+            if _start >= _end:
+                break
+            _offset += min(_stop, _end) - _start
+        _shifted.append((_end - _offset, _marker))
+    return _SOURCES_TAG_PATTERN.sub("", text), _shifted
+
+
+class CitationAssembler:
+    """Accumulates answer chunks and renders them with numbered source footnotes."""
+
+    def __init__(self):
+        self._parts: List[str] = []
+        # reference URI -> its "[n]" marker; insertion order is footnote order
+        self._tags: Dict[str, str] = {}
+        self.num_citations = 0
+
+    def add(self, text: str, citations: List[Dict[str, Any]] = None) -> str:
+        """Adds one chunk of the answer.
+
+        Args:
+            text (str): chunk text as returned by the agent
+            citations (List[Dict], optional): the chunk's 'attribution.citations'. Defaults to None.
+
+        Returns:
+            str: the chunk with <sources> tags removed and footnote markers inserted
+        """
+        if not citations:
+            _cited = _SOURCES_TAG_PATTERN.sub("", text)
+            self._parts.append(_cited)
+            return _cited
+
+        _markers = []
+        _tags = self._tags
+        _length = len(text)
+        for _citation in citations:
+            try:
+                _end = _citation["generatedResponsePart"]["textResponsePart"]["span"]["end"] + 1
+            except (KeyError, TypeError):
+                continue
+            _marker = ""
+            for _reference in _citation.get("retrievedReferences", ()):
+                try:
+                    _uri = _reference["location"]["s3Location"]["uri"]
+                except KeyError:
+                    _uri = reference_uri(_reference)
+                _tag = _tags.get(_uri)
+                if _tag is None:
+                    if not _uri:
+                        continue
+                    _tag = _tags[_uri] = f"[{len(_tags) + 1}]"
+                if _tag not in _marker:
+                    _marker += _tag
+            if _marker:
+                _markers.append((_end if 0 <= _end <= _length else min(max(_end, 0), _length), _marker))
+        self.num_citations += len(citations)
+        _markers.sort(key=itemgetter(0))
+        if "<sources>" in text:
+            text, _markers = _strip_sources_tags(text, _markers)
+
+        _out = []
+        _pos = 0
+        for _end, _marker in _markers:
+            if _end > _pos:
+                _out.append(text[_pos:_end])
+                _pos = _end
+            _out.append(_marker)
+        _out.append(text[_pos:])
+        _cited = "".join(_out)
+        self._parts.append(_cited)
+        return _cited
+
+    @property
+    def sources(self) -> List[str]:
+        """Distinct reference URIs, in footnote order."""
+        return list(self._tags)
+
+    def answer(self) -> str:
+        """Returns the full answer followed by the numbered source list, if anything was cited."""
+        _answer = "".join(self._parts)
+        if not self._tags:
+            return _answer
+        _lines = [f"{_tag} {_uri}" for _uri, _tag in self._tags.items()]
+        return f"{_answer}\n\n{SOURCES_HEADER}\n" + "\n".join(_lines)
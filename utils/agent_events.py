@@ -0,0 +1,134 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Typed events yielded by AgentsForAmazonBedrock.invoke_stream().
+
+Each event from the invoke_agent() completion stream is wrapped in one of the
+classes below as soon as it arrives, so callers can forward text to a client
+before the agent has finished. Every event records `elapsed`, the number of
+seconds since the invoke_agent() call was issued, which makes time-to-first-token
+directly observable:
+
+    >>> for _event in agents.invoke_stream("hello", agent_id):
+    ...     if isinstance(_event, TextDelta):
+    ...         print(f"{_event.elapsed:.2f}s: {_event.text}")
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass(slots=True)
+class StreamStart:
+    """First event of every stream, emitted once the invoke_agent() call returns."""
+    request_id: str
+    session_id: str
+    status_code: int
+    response_metadata: Dict[str, Any]
+    elapsed: float = 0.0
+
+
+@dataclass(slots=True)
+class TextDelta:
+    """A 'chunk' event: the next piece of the agent answer plus its citations."""
+    text: str
+    citations: List[Dict[str, Any]] = field(default_factory=list)
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+    elapsed: float = 0.0
+
+
+@dataclass(slots=True)
+class TraceStep:
+    """A 'trace' event. trace_type is the single key of the inner trace object,
+    for example 'orchestrationTrace' or 'routingClassifierTrace', and body is the
+    payload under that key."""
+    trace_type: Optional[str]
+    trace: Dict[str, Any]
+    body: Dict[str, Any] = field(default_factory=dict)
+    caller_chain: List[Dict[str, Any]] = field(default_factory=list)
+    collaborator_name: Optional[str] = None
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+    elapsed: float = 0.0
+
+
+@dataclass(slots=True)
+class FileOutput:
+    """One file from a 'files' event, e.g. a chart produced by code interpreter."""
+    name: str
+    type: str
+    bytes: bytes = field(repr=False)
+    elapsed: float = 0.0
+
+
+@dataclass(slots=True)
+class ReturnControl:
+    """A 'returnControl' event asking the caller to run one or more functions."""
+    invocation_id: str
+    invocation_inputs: List[Dict[str, Any]]
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+    elapsed: float = 0.0
+
+
+def parse_event(event: Dict[str, Any], elapsed: float = 0.0) -> List[Any]:
+    """Converts one raw completion stream event into a list of typed events.
+
+    A 'files' event can carry several files, so a list is always returned. Unknown
+    event types (for example the various exception events) produce an empty list.
+
+    Args:
+        event (Dict): raw event from the invoke_agent() 'completion' stream
+        elapsed (float, optional): seconds since the invoke_agent() call. Defaults to 0.0.
+
+    Returns:
+        List: typed events, in the order they appear in the raw event
+    """
+    _trace_part = event.get('trace')
+    if _trace_part is not None and len(event) == 1:
+        # fast path: the vast majority of events carry a single trace
+        _trace = _trace_part.get('trace') or {}
+        for _trace_type in _trace:
+            return [TraceStep(
+                _trace_type, _trace, _trace[_trace_type], _trace_part.get('callerChain') or [],
+                _trace_part.get('collaboratorName'), event, elapsed,
+            )]
+
+    _events = []
+    if 'chunk' in event:
+        _chunk = event['chunk']
+        _events.append(TextDelta(
+            text=_chunk.get('bytes', b'').decode('utf8'),
+            citations=_chunk.get('attribution', {}).get('citations', []),
+            raw=event,
+            elapsed=elapsed,
+        ))
+    if _trace_part is not None:
+        _events.append(_make_trace_step(event, _trace_part, elapsed))
+    if 'files' in event:
+        for _file in event['files'].get('files', []):
+            _events.append(FileOutput(
+                name=_file['name'], type=_file['type'], bytes=_file['bytes'], elapsed=elapsed
+            ))
+    if 'returnControl' in event:
+        _roc = event['returnControl']
+        _events.append(ReturnControl(
+            invocation_id=_roc.get('invocationId'),
+            invocation_inputs=_roc.get('invocationInputs', []),
+            raw=event,
+            elapsed=elapsed,
+        ))
+    return _events
+
+
+def _make_trace_step(event: Dict[str, Any], trace_part: Dict[str, Any], elapsed: float) -> TraceStep:
+    _trace = trace_part.get('trace') or {}
+    _trace_type = None
+    for _trace_type in _trace:
+        break
+    return TraceStep(
+        _trace_type,
+        _trace,
+        _trace[_trace_type] if _trace_type is not None else {},
+        trace_part.get('callerChain') or [],
+        trace_part.get('collaboratorName'),
+        event,
+        elapsed,
+    )
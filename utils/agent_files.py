@@ -0,0 +1,261 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Destinations for the files an agent returns in 'files' events.
+
+Code interpreter can return charts, CSVs and other files in the middle of a
+stream. AgentsForAmazonBedrock.invoke() hands each FileOutput to a FileSink,
+which only hashes the bytes and queues them, so the event loop never waits on
+disk or network I/O. A file returned again with the same name and content is
+stored once per sink.
+
+    LocalFileSink     writes files to a directory from a background thread
+    InMemoryFileSink  keeps the bytes in a dict, e.g. for Lambda or tests
+    S3FileSink        uploads to S3 from a background thread, with multipart
+                      uploads for large files
+
+Subscribers are called with a StoredFile for every stored file. They run in the
+thread that calls flush(), which invoke() does once the stream is consumed, so
+rendering in a notebook is an opt-in subscriber:
+
+    >>> sink = LocalFileSink("output", subscribers=[NotebookFileRenderer()])
+    >>> agents.invoke("plot the ratings", agent_id, file_sink=sink)
+    >>> sink.close()
+
+close() stops the worker thread of a background sink; a sink that invoke()
+creates itself is closed before invoke() returns.
+"""
+
+import hashlib
+import logging
+import os
+import queue
+import threading
+from io import BytesIO
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from .agent_events import FileOutput
+from .aws_clients import get_clients
+from .rendering import is_headless, lazy_module
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = ("image/png", "image/jpeg")
+DEFAULT_S3_PART_SIZE = 8 * 1024 * 1024
+
+
+@dataclass
+class StoredFile:
+    """A file accepted by a sink. location is a path, an s3:// URI or an in-memory key."""
+    name: str
+    type: str
+    sha256: str
+    size: int
+    location: str
+    data: bytes = field(default=b"", repr=False)
+    error: Optional[Exception] = None
+
+
+class FileSink:
+    """Base class for file sinks.
+
+    Subclasses implement _store(file), which runs on the sink's background thread
+    (or inline for synchronous sinks) and returns the location of the stored file.
+
+    Args:
+        subscribers (List[Callable], optional): called with each StoredFile on flush(). Defaults to None.
+        background (bool, optional): store files from a daemon worker thread. Defaults to True.
+    """
+
+    def __init__(self, subscribers: List[Callable[[StoredFile], None]] = None, background: bool = True):
+        self._subscribers = list(subscribers or [])
+        self._background = background
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._stored = queue.SimpleQueue()
+        self._worker = None
+
+    def subscribe(self, callback: Callable[[StoredFile], None]) -> None:
+        """Adds a callback that receives each StoredFile when flush() is called."""
+        self._subscribers.append(callback)
+
+    def submit(self, file: FileOutput) -> Optional[StoredFile]:
+        """Queues a file for storage without waiting for it to be written.
+
+        Args:
+            file (FileOutput): file event from invoke_stream()
+
+        Returns:
+            StoredFile: the pending record, or None if a file with the same name and content was already submitted
+        """
+        _digest = hashlib.sha256(file.bytes).hexdigest()
+        # files with different names but the same bytes are distinct outputs, so both are kept
+        _key = (file.name, _digest)
+        with self._lock:
+            if _key in self._seen:
+                return None
+            self._seen.add(_key)
+        _stored = StoredFile(file.name, file.type, _digest, len(file.bytes), "", file.bytes)
+        if not self._background:
+            self._run(_stored)
+            return _stored
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._work, name=type(self).__name__, daemon=True)
+                    self._worker.start()
+        self._queue.put(_stored)
+        return _stored
+
+    def _run(self, stored: StoredFile) -> None:
+        try:
+            stored.location = self._store(stored)
+        except Exception as e:
+            logger.warning("Could not store file %s: %s", stored.name, e)
+            stored.error = e
+        self._stored.put(stored)
+
+    def _work(self) -> None:
+        while True:
+            _stored = self._queue.get()
+            try:
+                if _stored is None:
+                    return
+                self._run(_stored)
+            finally:
+                self._queue.task_done()
+
+    def close(self) -> None:
+        """Stops the worker thread once the queued files are stored. Files stored but not yet
+        flushed stay available to flush(), and a later submit() starts a new worker."""
+        with self._lock:
+            _worker, self._worker = self._worker, None
+        if _worker is not None:
+            self._queue.put(None)
+            _worker.join()
+
+    def _store(self, stored: StoredFile) -> str:
+        raise NotImplementedError
+
+    def flush(self) -> List[StoredFile]:
+        """Waits for queued files to be stored, then notifies subscribers in the calling thread.
+
+        Returns:
+            List[StoredFile]: the files stored since the previous flush()
+        """
+        self._queue.join()
+        _done = []
+        while not self._stored.empty():
+            _done.append(self._stored.get())
+        for _stored in _done:
+            for _subscriber in self._subscribers:
+                _subscriber(_stored)
+        return _done
+
+
+class LocalFileSink(FileSink):
+    """Writes files into a local directory, 'output' by default, like invoke() always did.
+
+    Args:
+        directory (str, optional): target directory, created on first write. Defaults to "output".
+    """
+
+    def __init__(self, directory: str = "output", subscribers: List[Callable] = None, background: bool = True):
+        super().__init__(subscribers, background)
+        self.directory = directory
+
+    def _store(self, stored: StoredFile) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        _path = os.path.join(self.directory, stored.name)
+        with open(_path, "wb") as f:
+            f.write(stored.data)
+        return _path
+
+
+class InMemoryFileSink(FileSink):
+    """Keeps file contents in memory, keyed by file name. Stores synchronously since no I/O is involved."""
+
+    def __init__(self, subscribers: List[Callable] = None):
+        super().__init__(subscribers, background=False)
+        self.files: Dict[str, bytes] = {}
+
+    def _store(self, stored: StoredFile) -> str:
+        self.files[stored.name] = stored.data
+        return stored.name
+
+
+class S3FileSink(FileSink):
+    """Uploads files to S3, using a multipart upload for files larger than part_size.
+
+    Args:
+        bucket (str): target bucket
+        prefix (str, optional): key prefix, e.g. "agent-output/". Defaults to "".
+        s3_client (optional): boto3 S3 client. Defaults to the shared client of get_clients().
+        part_size (int, optional): multipart threshold and part size in bytes (minimum 5 MiB). Defaults to 8 MiB.
+    """
+
+    def __init__(
+            self,
+            bucket: str,
+            prefix: str = "",
+            s3_client=None,
+            part_size: int = DEFAULT_S3_PART_SIZE,
+            subscribers: List[Callable] = None,
+            background: bool = True,
+    ):
+        super().__init__(subscribers, background)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self._s3_client = s3_client or get_clients().client("s3")
+
+    def _store(self, stored: StoredFile) -> str:
+        _key = f"{self.prefix}{stored.name}"
+        if stored.size <= self.part_size:
+            self._s3_client.put_object(Bucket=self.bucket, Key=_key, Body=stored.data, ContentType=stored.type)
+            return f"s3://{self.bucket}/{_key}"
+
+        _upload_id = self._s3_client.create_multipart_upload(
+            Bucket=self.bucket, Key=_key, ContentType=stored.type
+        )["UploadId"]
+        try:
+            _parts = []
+            _view = memoryview(stored.data)
+            for _number, _offset in enumerate(range(0, stored.size, self.part_size), start=1):
+                _resp = self._s3_client.upload_part(
+                    Bucket=self.bucket,
+                    Key=_key,
+                    UploadId=_upload_id,
+                    PartNumber=_number,
+                    Body=bytes(_view[_offset:_offset + self.part_size]),
+                )
+                _parts.append({"ETag": _resp["ETag"], "PartNumber": _number})
+            self._s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=_key, UploadId=_upload_id, MultipartUpload={"Parts": _parts}
+            )
+        except Exception:
+            self._s3_client.abort_multipart_upload(Bucket=self.bucket, Key=_key, UploadId=_upload_id)
+            raise
+        return f"s3://{self.bucket}/{_key}"
+
+
+class NotebookFileRenderer:
+    """Subscriber that lists stored files in a notebook and shows images inline."""
+
+    def __init__(self):
+        self._header_shown = False
+
+    def __call__(self, stored: StoredFile) -> None:
+        _ipython = lazy_module("IPython.display")
+        if not self._header_shown and _ipython is not None:
+            _ipython.display(_ipython.Markdown("### Files"))
+            self._header_shown = True
+        print(f"{stored.name} ({stored.type}) -> {stored.location or stored.error}")
+        if stored.type in IMAGE_TYPES and stored.error is None and not is_headless():
+            import matplotlib.pyplot as plt
+            import matplotlib.image as mpimg
+
+            _img = mpimg.imread(BytesIO(stored.data), format=stored.type.split("/")[1])
+            plt.imshow(_img)
+            plt.show()
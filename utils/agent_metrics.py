@@ -0,0 +1,288 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Structured metrics for agent invocations.
+
+A MetricsCollector observes the typed events produced by
+AgentsForAmazonBedrock.invoke_stream() and builds an InvocationMetrics record:
+per-step latency and token usage, routing classifier time, tokens per
+(sub-)agent, time-to-first-token and wall time. Records can be pushed to one
+or more sinks:
+
+    >>> sink = JsonlMetricsSink("metrics.jsonl")
+    >>> answer, metrics = agents.invoke("hi", agent_id, metrics_sink=sink, return_metrics=True)
+    >>> metrics.total_tokens
+
+Collection is opt-in. When neither a sink nor return_metrics is requested,
+invoke() skips the collector entirely and only pays a None check per event.
+"""
+
+import json
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+
+from .agent_events import StreamStart, TextDelta, TraceStep
+
+ROOT_AGENT_LABEL = "supervisor"
+_USAGE_TRACE_TYPES = (
+    "orchestrationTrace",
+    "routingClassifierTrace",
+    "preProcessingTrace",
+    "postProcessingTrace",
+)
+
+
+@dataclass
+class StepMetrics:
+    """One model invocation made while serving a request."""
+    trace_type: str
+    agent: str
+    started_at: float
+    duration: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+@dataclass
+class InvocationMetrics:
+    """Summary of a single invoke_agent() call. Times are in seconds."""
+    agent_id: str = None
+    agent_alias_id: str = None
+    session_id: str = None
+    request_id: str = None
+    wall_time: float = 0.0
+    time_to_first_token: Optional[float] = None
+    routing_classifier_time: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    llm_calls: int = 0
+    steps: List[StepMetrics] = field(default_factory=list)
+    tokens_by_agent: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class MetricsCollector:
+    """Builds an InvocationMetrics record from invoke_stream() events.
+
+    Args:
+        agent_id (str): ID of the agent being invoked
+        agent_alias_id (str): alias ID of the agent being invoked
+        session_id (str): session ID of the invocation
+    """
+
+    def __init__(self, agent_id: str = None, agent_alias_id: str = None, session_id: str = None):
+        self.metrics = InvocationMetrics(
+            agent_id=agent_id, agent_alias_id=agent_alias_id, session_id=session_id
+        )
+        self._step_started_at = 0.0
+        self._routing_started_at = None
+
+    def observe(self, event: Any) -> None:
+        """Updates the metrics with one typed stream event."""
+        if isinstance(event, TraceStep):
+            if event.trace_type in _USAGE_TRACE_TYPES:
+                self._observe_model_trace(event)
+        elif isinstance(event, TextDelta):
+            if self.metrics.time_to_first_token is None:
+                self.metrics.time_to_first_token = event.elapsed
+        elif isinstance(event, StreamStart):
+            self.metrics.request_id = event.request_id
+            self._step_started_at = event.elapsed
+
+    def _observe_model_trace(self, event: TraceStep) -> None:
+        _body = event.body
+        if event.trace_type == "routingClassifierTrace" and "modelInvocationInput" in _body:
+            self._routing_started_at = event.elapsed
+        if "modelInvocationOutput" not in _body:
+            return
+
+        _usage = _body["modelInvocationOutput"].get("metadata", {}).get("usage", {})
+        _in_tokens = _usage.get("inputTokens", 0)
+        _out_tokens = _usage.get("outputTokens", 0)
+        _agent = self._agent_label(event)
+
+        _metrics = self.metrics
+        _metrics.input_tokens += _in_tokens
+        _metrics.output_tokens += _out_tokens
+        _metrics.llm_calls += 1
+        _agent_tokens = _metrics.tokens_by_agent.setdefault(_agent, {"input": 0, "output": 0})
+        _agent_tokens["input"] += _in_tokens
+        _agent_tokens["output"] += _out_tokens
+
+        if event.trace_type == "routingClassifierTrace" and self._routing_started_at is not None:
+            _started_at = self._routing_started_at
+            _metrics.routing_classifier_time += event.elapsed - _started_at
+            self._routing_started_at = None
+        else:
+            _started_at = self._step_started_at
+        _metrics.steps.append(StepMetrics(
+            trace_type=event.trace_type,
+            agent=_agent,
+            started_at=_started_at,
+            duration=event.elapsed - _started_at,
+            input_tokens=_in_tokens,
+            output_tokens=_out_tokens,
+        ))
+        # restart the clock for the next step/sub-step
+        self._step_started_at = event.elapsed
+
+    @staticmethod
+    def _agent_label(event: TraceStep) -> str:
+        if event.collaborator_name:
+            return event.collaborator_name
+        if len(event.caller_chain) > 1:
+            return event.caller_chain[-1].get("agentAliasArn", "").split("/", 1)[-1]
+        return ROOT_AGENT_LABEL
+
+    def finish(self, wall_time: float, error: Exception = None) -> InvocationMetrics:
+        """Stamps the wall time (and error, if any) and returns the finished record."""
+        self.metrics.wall_time = wall_time
+        if error is not None:
+            self.metrics.error = repr(error)
+        return self.metrics
+
+
+class MetricsSink:
+    """Base class for destinations of InvocationMetrics records."""
+
+    def emit(self, metrics: InvocationMetrics) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonlMetricsSink(MetricsSink):
+    """Appends one JSON document per invocation to a file.
+
+    Args:
+        path (str): path of the JSONL file to append to
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def emit(self, metrics: InvocationMetrics) -> None:
+        _line = json.dumps(metrics.to_dict(), ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self._path, "a") as f:
+                f.write(_line)
+
+
+def _escape_label_value(value) -> str:
+    # the exposition format requires backslash, double quote and line feed to be escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusTextSink(MetricsSink):
+    """Aggregates invocations into Prometheus text exposition format.
+
+    Counts are exposed as counters, and durations as summaries with a _sum and a _count
+    per agent. Call render() to get the current exposition, e.g. from an HTTP handler, or
+    pass a path to rewrite a node_exporter textfile-collector file on every emit.
+
+    Args:
+        path (str, optional): file to rewrite after every emit. Defaults to None.
+        prefix (str, optional): metric name prefix. Defaults to "bedrock_agent".
+    """
+
+    def __init__(self, path: str = None, prefix: str = "bedrock_agent"):
+        self._path = path
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._summaries = {}
+
+    def emit(self, metrics: InvocationMetrics) -> None:
+        _agent = (("agent_id", metrics.agent_id),)
+        with self._lock:
+            self._inc("invocations_total", _agent, 1)
+            if metrics.error is not None:
+                self._inc("invocation_errors_total", _agent, 1)
+            self._inc("llm_calls_total", _agent, metrics.llm_calls)
+            self._observe("wall_time_seconds", _agent, metrics.wall_time)
+            self._observe("routing_classifier_seconds", _agent, metrics.routing_classifier_time)
+            if metrics.time_to_first_token is not None:
+                self._observe("time_to_first_token_seconds", _agent, metrics.time_to_first_token)
+            for _sub_agent, _tokens in metrics.tokens_by_agent.items():
+                for _direction, _count in _tokens.items():
+                    _labels = _agent + (("sub_agent", _sub_agent), ("direction", _direction))
+                    self._inc("tokens_total", _labels, _count)
+            _text = self._render_locked()
+        if self._path is not None:
+            with open(self._path, "w") as f:
+                f.write(_text)
+
+    def _inc(self, name: str, labels: tuple, value: float) -> None:
+        _key = (name, labels)
+        self._counters[_key] = self._counters.get(_key, 0) + value
+
+    def _observe(self, name: str, labels: tuple, value: float) -> None:
+        _sum, _count = self._summaries.get((name, labels), (0.0, 0))
+        self._summaries[(name, labels)] = (_sum + value, _count + 1)
+
+    def render(self) -> str:
+        """Returns all aggregated metrics in Prometheus text format."""
+        with self._lock:
+            return self._render_locked()
+
+    def _render_locked(self) -> str:
+        _samples = []
+        for (_name, _labels), _value in self._counters.items():
+            _samples.append((_name, "counter", "", _labels, _value))
+        for (_name, _labels), (_sum, _count) in self._summaries.items():
+            _samples.append((_name, "summary", "_sum", _labels, _sum))
+            _samples.append((_name, "summary", "_count", _labels, _count))
+
+        _lines = []
+        _seen_names = set()
+        # every sample of a family must follow its TYPE line
+        for _name, _type, _suffix, _labels, _value in sorted(_samples, key=lambda _s: _s[0]):
+            _full_name = f"{self._prefix}_{_name}"
+            if _name not in _seen_names:
+                _lines.append(f"# TYPE {_full_name} {_type}")
+                _seen_names.add(_name)
+            _label_str = ",".join(f'{_k}="{_escape_label_value(_v)}"' for _k, _v in _labels)
+            _lines.append(f"{_full_name}{_suffix}{{{_label_str}}} {_value}")
+        return "\n".join(_lines) + "\n"
+
+
+class OpenTelemetryMetricsSink(MetricsSink):
+    """Records invocations with the OpenTelemetry metrics API.
+
+    Requires the opentelemetry-api package; the meter provider (and exporter) is
+    whatever the application has configured globally.
+
+    Args:
+        meter_name (str, optional): name of the meter to create. Defaults to "bedrock_agent".
+    """
+
+    def __init__(self, meter_name: str = "bedrock_agent"):
+        from opentelemetry import metrics as otel_metrics
+
+        _meter = otel_metrics.get_meter(meter_name)
+        self._invocations = _meter.create_counter("bedrock_agent.invocations")
+        self._tokens = _meter.create_counter("bedrock_agent.tokens")
+        self._wall_time = _meter.create_histogram("bedrock_agent.wall_time", unit="s")
+        self._ttft = _meter.create_histogram("bedrock_agent.time_to_first_token", unit="s")
+        self._step_time = _meter.create_histogram("bedrock_agent.step_duration", unit="s")
+
+    def emit(self, metrics: InvocationMetrics) -> None:
+        _attrs = {"agent_id": metrics.agent_id or "", "error": metrics.error is not None}
+        self._invocations.add(1, _attrs)
+        self._wall_time.record(metrics.wall_time, _attrs)
+        if metrics.time_to_first_token is not None:
+            self._ttft.record(metrics.time_to_first_token, _attrs)
+        for _sub_agent, _tokens in metrics.tokens_by_agent.items():
+            for _direction, _count in _tokens.items():
+                self._tokens.add(_count, {**_attrs, "sub_agent": _sub_agent, "direction": _direction})
+        for _step in metrics.steps:
+            self._step_time.record(_step.duration, {**_attrs, "trace_type": _step.trace_type, "sub_agent": _step.agent})
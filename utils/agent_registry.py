@@ -0,0 +1,186 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Cached agent name -> ID lookups and agent descriptors for AgentsForAmazonBedrock.
+
+Most helper methods take an agent name, and used to resolve it with a single
+list_agents(maxResults=100) call every time, which both repeated the call for
+every lookup and missed any agent beyond the first page. AgentRegistry pages
+through the full listing once, serves lookups from a dictionary until the TTL
+expires, and is updated in place when the helper creates or deletes an agent.
+A name that is not in the listing triggers one more listing, at most every few
+seconds, so agents created by another process or in the console are found.
+
+Reading an agent's configuration (instructions, prompt override configurations,
+role, ...) used to cost a get_agent call per operation, so a script tuning every
+prompt type of an agent fetched it once per prompt type. AgentDescriptorCache
+keeps the full get_agent payload per agent. Since list_agents summaries carry
+updatedAt too, one listing revalidates every cached descriptor at once, and only
+agents that changed since are fetched again.
+"""
+
+import copy
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_AGENT_REGISTRY_TTL = 300
+DEFAULT_AGENT_REGISTRY_MISS_REFRESH = 2
+DEFAULT_DESCRIPTOR_REVALIDATE_AFTER = 30
+
+
+class AgentRegistry:
+    """Name-indexed cache of the account's agent summaries.
+
+    Args:
+        bedrock_agent_client: boto3 bedrock-agent client
+        ttl (float, optional): seconds before the listing is fetched again. Defaults to 300.
+        page_size (int, optional): maxResults per list_agents() page. Defaults to 100.
+        miss_refresh (float, optional): minimum seconds between listings caused by names that were
+            not found. Defaults to 2.
+    """
+
+    def __init__(
+            self,
+            bedrock_agent_client,
+            ttl: float = DEFAULT_AGENT_REGISTRY_TTL,
+            page_size: int = 100,
+            miss_refresh: float = DEFAULT_AGENT_REGISTRY_MISS_REFRESH,
+    ):
+        self._client = bedrock_agent_client
+        self.ttl = ttl
+        self.page_size = page_size
+        self.miss_refresh = miss_refresh
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._expires_at = 0.0
+        self._listed_at = float("-inf")
+        self._lock = threading.Lock()
+        self.list_calls = 0
+
+    def _list_all(self) -> Dict[str, Dict[str, Any]]:
+        _by_name = {}
+        _kwargs = {"maxResults": self.page_size}
+        while True:
+            _resp = self._client.list_agents(**_kwargs)
+            self.list_calls += 1
+            for _summary in _resp.get("agentSummaries", []):
+                _by_name[_summary["agentName"]] = _summary
+            _next_token = _resp.get("nextToken")
+            if not _next_token:
+                return _by_name
+            _kwargs["nextToken"] = _next_token
+
+    def _current(self) -> Dict[str, Dict[str, Any]]:
+        if time.monotonic() >= self._expires_at:
+            with self._lock:
+                if time.monotonic() >= self._expires_at:
+                    self._by_name = self._list_all()
+                    self._listed_at = time.monotonic()
+                    self._expires_at = self._listed_at + self.ttl
+        return self._by_name
+
+    def get(self, agent_name: str) -> Optional[Dict[str, Any]]:
+        """Returns the list_agents() summary of the named agent, or None if there is no such agent.
+
+        A name missing from a listing older than miss_refresh seconds is looked up in a new listing,
+        in case the agent was created by another process since.
+        """
+        _summary = self._current().get(agent_name)
+        if _summary is None and time.monotonic() - self._listed_at >= self.miss_refresh:
+            with self._lock:
+                # another thread may have listed the agents while this one waited for the lock
+                if time.monotonic() - self._listed_at >= self.miss_refresh:
+                    self._expires_at = 0.0
+            _summary = self._current().get(agent_name)
+        return _summary
+
+    def agent_id(self, agent_name: str) -> Optional[str]:
+        """Returns the ID of the named agent, or None if there is no such agent."""
+        _summary = self.get(agent_name)
+        return None if _summary is None else _summary["agentId"]
+
+    def names(self) -> List[str]:
+        return list(self._current())
+
+    def summaries(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        """Returns the list_agents() summaries of all agents, listing them again first if refresh is set."""
+        if refresh:
+            self.invalidate()
+        return list(self._current().values())
+
+    def put(self, agent: Dict[str, Any]) -> None:
+        """Records an agent created by this process, e.g. the 'agent' of a create_agent() response."""
+        with self._lock:
+            self._by_name[agent["agentName"]] = agent
+
+    def remove(self, agent_name: str) -> None:
+        """Forgets an agent deleted by this process."""
+        with self._lock:
+            self._by_name.pop(agent_name, None)
+
+    def invalidate(self) -> None:
+        """Forces the next lookup to list the agents again."""
+        with self._lock:
+            self._expires_at = 0.0
+
+
+class AgentDescriptorCache:
+    """Read-through cache of get_agent() payloads, revalidated by comparing updatedAt.
+
+    A descriptor is served from the cache for revalidate_after seconds after the last
+    revalidation. After that, the next lookup lists the agents again and drops every cached
+    descriptor whose updatedAt differs from the listing. Changes made by this process should
+    be reported with invalidate(), so they are visible immediately.
+
+    Args:
+        bedrock_agent_client: boto3 bedrock-agent client
+        registry (AgentRegistry): registry whose listing is used for revalidation
+        revalidate_after (float, optional): seconds before cached descriptors are checked again. Defaults to 30.
+    """
+
+    def __init__(self, bedrock_agent_client, registry: AgentRegistry,
+                 revalidate_after: float = DEFAULT_DESCRIPTOR_REVALIDATE_AFTER):
+        self._client = bedrock_agent_client
+        self._registry = registry
+        self.revalidate_after = revalidate_after
+        self._descriptors: Dict[str, Dict[str, Any]] = {}
+        self._validated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.get_calls = 0
+
+    def _revalidate(self) -> None:
+        _updated_at = {_summary["agentId"]: _summary.get("updatedAt") for _summary in self._registry.summaries(refresh=True)}
+        with self._lock:
+            for _agent_id, _agent in list(self._descriptors.items()):
+                if _updated_at.get(_agent_id) != _agent.get("updatedAt"):
+                    del self._descriptors[_agent_id]
+            self._validated_at = time.monotonic()
+
+    def get(self, agent_id: str, refresh: bool = False) -> Dict[str, Any]:
+        """Returns the 'agent' of get_agent(), from the cache when it is still current.
+
+        Args:
+            agent_id (str): ID of the agent
+            refresh (bool, optional): fetch the descriptor even if it is cached. Defaults to False.
+
+        Returns:
+            Dict[str, Any]: a copy of the descriptor, which the caller may modify
+        """
+        if refresh:
+            self.invalidate(agent_id)
+        elif agent_id in self._descriptors and time.monotonic() - self._validated_at >= self.revalidate_after:
+            self._revalidate()
+        _agent = self._descriptors.get(agent_id)
+        if _agent is None:
+            _agent = self._client.get_agent(agentId=agent_id)["agent"]
+            with self._lock:
+                self.get_calls += 1
+                self._descriptors[agent_id] = _agent
+        return copy.deepcopy(_agent)
+
+    def invalidate(self, agent_id: str = None) -> None:
+        """Forgets the descriptor of an agent this process changed, or of every agent if agent_id is None."""
+        with self._lock:
+            if agent_id is None:
+                self._descriptors.clear()
+            else:
+                self._descriptors.pop(agent_id, None)
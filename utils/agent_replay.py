@@ -0,0 +1,214 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Record and replay invoke_agent() responses without calling Amazon Bedrock.
+
+RecordingRuntimeClient wraps a real bedrock-agent-runtime client and writes
+every invoke_agent() response, including the full completion event stream
+(chunk bytes, traces, files, citations and returnControl events), to a gzip
+compressed NDJSON file. ReplayRuntimeClient reads such a file and serves the
+recorded responses back, optionally reproducing the original gaps between
+events. Either one can be dropped in for the runtime client of an
+AgentsForAmazonBedrock instance:
+
+    >>> agents._bedrock_agent_runtime_client = RecordingRuntimeClient(
+    ...     agents._bedrock_agent_runtime_client, "streams.ndjson.gz")
+    >>> agents.invoke("hello", agent_id)   # recorded
+    >>> agents._bedrock_agent_runtime_client = ReplayRuntimeClient("streams.ndjson.gz")
+    >>> agents.invoke("hello", agent_id)   # replayed, no network
+
+File format: one JSON document per line. An "invocation" line holds the request
+arguments and response metadata of a stream, and is followed by "event" lines
+carrying the stream id, the offset in seconds since the call was issued, and the
+event itself. bytes and datetime values are tagged so they round-trip exactly.
+"""
+
+import base64
+import datetime
+import gzip
+import itertools
+import json
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+_BYTES_TAG = "__bytes__"
+_DATETIME_TAG = "__datetime__"
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {_k: _encode(_v) for _k, _v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(_v) for _v in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {_BYTES_TAG: base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, datetime.datetime):
+        return {_DATETIME_TAG: value.isoformat()}
+    return value
+
+
+def _decode_hook(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        if _BYTES_TAG in obj:
+            return base64.b64decode(obj[_BYTES_TAG])
+        if _DATETIME_TAG in obj:
+            return datetime.datetime.fromisoformat(obj[_DATETIME_TAG])
+    return obj
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class RecordedStream:
+    """One recorded invoke_agent() call: request, response metadata and timed events."""
+
+    def __init__(self, request: Dict[str, Any], response_metadata: Dict[str, Any]):
+        self.request = request
+        self.response_metadata = response_metadata
+        self.events: List[Dict[str, Any]] = []
+        self.offsets: List[float] = []
+
+
+def load_recordings(path: str) -> List[RecordedStream]:
+    """Reads every recorded stream from an NDJSON (optionally .gz) recording file.
+
+    Args:
+        path (str): path of the recording written by RecordingRuntimeClient
+
+    Returns:
+        List[RecordedStream]: recorded streams, in the order their calls were issued
+    """
+    _streams = {}
+    with _open(path, "r") as f:
+        for _line in f:
+            if not _line.strip():
+                continue
+            _record = json.loads(_line, object_hook=_decode_hook)
+            if _record["type"] == "invocation":
+                _streams[_record["stream"]] = RecordedStream(
+                    _record["request"], _record["response_metadata"]
+                )
+            else:
+                _stream = _streams[_record["stream"]]
+                _stream.events.append(_record["event"])
+                _stream.offsets.append(_record["t"])
+    return list(_streams.values())
+
+
+class RecordingRuntimeClient:
+    """Wraps a bedrock-agent-runtime client and records invoke_agent() responses.
+
+    Events are written as they are consumed, so a stream is only fully recorded once
+    the caller has read it to the end. Other client methods are passed through.
+
+    Args:
+        client: the real bedrock-agent-runtime boto3 client
+        path (str): recording file to append to; use a .gz suffix for compression
+    """
+
+    def __init__(self, client, path: str):
+        self._client = client
+        self._path = path
+        self._file = _open(path, "a")
+        self._lock = threading.Lock()
+        self._stream_ids = itertools.count()
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        _line = json.dumps(_encode(record), ensure_ascii=False)
+        with self._lock:
+            self._file.write(_line + "\n")
+
+    def invoke_agent(self, **kwargs) -> Dict[str, Any]:
+        _time_before_call = time.perf_counter()
+        _response = self._client.invoke_agent(**kwargs)
+        _stream_id = next(self._stream_ids)
+        self._write({
+            "type": "invocation",
+            "stream": _stream_id,
+            "request": kwargs,
+            "response_metadata": _response["ResponseMetadata"],
+        })
+
+        def _recording_stream() -> Iterator[Dict[str, Any]]:
+            for _event in _response["completion"]:
+                self._write({
+                    "type": "event",
+                    "stream": _stream_id,
+                    "t": time.perf_counter() - _time_before_call,
+                    "event": _event,
+                })
+                yield _event
+
+        return {**_response, "completion": _recording_stream()}
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class ReplayRuntimeClient:
+    """Serves recorded invoke_agent() responses in place of a bedrock-agent-runtime client.
+
+    Recordings are decoded once at construction, so replaying is limited only by the
+    consumer. Calls are answered round-robin across the recorded streams, or with the
+    stream recorded for the same inputText when match_input is True.
+
+    Args:
+        path_or_streams: recording file path, or a list of RecordedStream objects
+        timing (bool, optional): sleep to reproduce the recorded gaps between events. Defaults to False.
+        speed (float, optional): timing speed-up factor, e.g. 10.0 replays ten times faster. Defaults to 1.0.
+        match_input (bool, optional): pick the recording whose inputText matches the call. Defaults to False.
+    """
+
+    def __init__(self, path_or_streams, timing: bool = False, speed: float = 1.0, match_input: bool = False):
+        if isinstance(path_or_streams, str):
+            self._streams = load_recordings(path_or_streams)
+        else:
+            self._streams = list(path_or_streams)
+        if not self._streams:
+            raise ValueError("No recorded streams to replay")
+        self._timing = timing
+        self._speed = speed
+        self._by_input = {}
+        if match_input:
+            for _stream in self._streams:
+                self._by_input.setdefault(_stream.request.get("inputText"), _stream)
+        self._next_index = itertools.count()
+
+    def _pick(self, kwargs: Dict[str, Any]) -> RecordedStream:
+        if self._by_input:
+            _stream = self._by_input.get(kwargs.get("inputText"))
+            if _stream is None:
+                raise KeyError(f"No recorded stream for inputText: {kwargs.get('inputText')!r}")
+            return _stream
+        return self._streams[next(self._next_index) % len(self._streams)]
+
+    def invoke_agent(self, **kwargs) -> Dict[str, Any]:
+        _stream = self._pick(kwargs)
+        _metadata = dict(_stream.response_metadata)
+        _metadata["HTTPHeaders"] = {
+            **_metadata.get("HTTPHeaders", {}),
+            "x-amz-bedrock-agent-session-id": kwargs.get("sessionId", ""),
+        }
+        return {
+            "ResponseMetadata": _metadata,
+            "sessionId": kwargs.get("sessionId"),
+            "completion": self._replay(_stream),
+        }
+
+    def _replay(self, stream: RecordedStream) -> Iterator[Dict[str, Any]]:
+        if not self._timing:
+            yield from stream.events
+            return
+        _start = time.perf_counter()
+        for _offset, _event in zip(stream.offsets, stream.events):
+            _delay = _offset / self._speed - (time.perf_counter() - _start)
+            if _delay > 0:
+                time.sleep(_delay)
+            yield _event
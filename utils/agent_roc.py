@@ -0,0 +1,483 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Automatic execution of return-of-control (ROC) requests with local Python functions.
+
+An agent with a RETURN_CONTROL action group (see add_action_group_with_roc())
+does not call a Lambda. It ends its completion stream with a returnControl
+event listing one or more function calls, and waits for the caller to send the
+results back in the next invoke_agent() call. invoke_roc() leaves running the
+functions, and looping until the final answer, to the caller.
+
+RocRuntime runs the loop. Functions are registered per action group and
+function name, every invocationInput of a returnControl event runs concurrently
+in a thread pool, and all results go back in returnControlInvocationResults
+until the agent answers with a final chunk:
+
+    >>> functions = RocFunctionRegistry()
+    >>> @functions.function("weather", timeout=5)
+    ... def get_weather(city: str) -> str:
+    ...     return lookup_weather(city)
+    >>> runtime = RocRuntime(agents, functions)
+    >>> result = runtime.run("What's the weather in Paris and Rome?", agent_id)
+    >>> result.answer, [(_call.function, _call.elapsed) for _call in result.calls]
+
+Each call has a timeout. A function that fails, times out or is not registered
+is reported back to the agent as a FAILURE result, so the agent can recover,
+and every call is recorded with its latency in RocResult.calls and
+RocRuntime.stats.
+
+Agents often ask for the same lookup with the same parameters several times,
+within a session and across sessions. Functions whose results can be reused
+are memoized by registering them with a cache_ttl; repeat calls are then
+answered from an LRU cache, keyed by function name and canonicalized
+parameters, without reaching the thread pool:
+
+    >>> @functions.function("catalog", cache_ttl=300, cache_size=1024)
+    ... def get_title(title_id: int) -> dict:
+    ...     return query_titles(title_id)
+    >>> registration = functions.get("catalog", "get_title")
+    >>> registration.cache.hits, registration.cache.misses
+"""
+
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .agent_citations import CitationAssembler
+from .agent_events import ReturnControl, StreamStart, TextDelta, TraceStep
+from .ttl_cache import DEFAULT_CACHE_SIZE, TTLCache, canonical_key
+
+DEFAULT_ROC_FUNCTION_TIMEOUT = 30.0
+DEFAULT_MAX_ROC_ROUNDS = 10
+DEFAULT_ROC_CACHE_SIZE = DEFAULT_CACHE_SIZE
+
+
+def _convert(value: Any, value_type: str) -> Any:
+    # parameter values arrive as strings, typed by the function or API schema
+    if not isinstance(value, str):
+        return value
+    try:
+        if value_type == "integer":
+            return int(value)
+        if value_type == "number":
+            return float(value)
+        if value_type == "boolean":
+            return value.strip().lower() == "true"
+        if value_type in ("array", "object"):
+            return json.loads(value)
+    except ValueError:
+        pass
+    return value
+
+
+def invocation_call(invocation_input: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+    """Returns the action group, function name and keyword arguments of one returnControl invocationInput.
+
+    Calls to API schema action groups are named "<httpMethod> <apiPath>", e.g. "GET /titles", and
+    take both the parameters and the properties of the JSON request body as arguments.
+    """
+    _function_input = invocation_input.get("functionInvocationInput")
+    if _function_input is not None:
+        _parameters = _function_input.get("parameters", [])
+        _name = _function_input["function"]
+    else:
+        _function_input = invocation_input["apiInvocationInput"]
+        _parameters = list(_function_input.get("parameters", []))
+        _body = ((_function_input.get("requestBody") or {}).get("content") or {}).get("application/json") or {}
+        _parameters.extend(_body.get("properties", []))
+        _name = f"{_function_input['httpMethod']} {_function_input['apiPath']}"
+    _kwargs = {_p["name"]: _convert(_p.get("value"), _p.get("type", "string")) for _p in _parameters}
+    return _function_input["actionGroup"], _name, _kwargs
+
+
+def invocation_result(invocation_input: Dict[str, Any], body: Any, failed: bool = False) -> Dict[str, Any]:
+    """Returns the returnControlInvocationResults entry that answers one invocationInput.
+
+    Args:
+        invocation_input (Dict): the invocationInput from the returnControl event
+        body (Any): the result; anything but a string is sent as JSON
+        failed (bool, optional): report the call as failed. Defaults to False.
+
+    Returns:
+        Dict: a functionResult or apiResult
+    """
+    _body = body if isinstance(body, str) else json.dumps(body, default=str)
+    _function_input = invocation_input.get("functionInvocationInput")
+    if _function_input is not None:
+        _result = {
+            "actionGroup": _function_input["actionGroup"],
+            "function": _function_input["function"],
+            "responseBody": {"TEXT": {"body": _body}},
+        }
+        if failed:
+            _result["responseState"] = "FAILURE"
+        return {"functionResult": _result}
+    _api_input = invocation_input["apiInvocationInput"]
+    _result = {
+        "actionGroup": _api_input["actionGroup"],
+        "apiPath": _api_input["apiPath"],
+        "httpMethod": _api_input["httpMethod"],
+        "httpStatusCode": 500 if failed else 200,
+        "responseBody": {"application/json": {"body": _body}},
+    }
+    if failed:
+        _result["responseState"] = "FAILURE"
+    return {"apiResult": _result}
+
+
+class RocResultCache(TTLCache):
+    """LRU cache of the results of one memoized function, each kept for ttl seconds.
+
+    Cached results are shared between calls, so functions should not return objects that
+    are modified afterwards. Only results of calls that returned are cached, never errors.
+
+    Args:
+        ttl (float): seconds a result is reused, float("inf") to keep it until it is evicted
+        max_entries (int, optional): results kept before the least recently used is evicted. Defaults to 256.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = DEFAULT_ROC_CACHE_SIZE):
+        super().__init__(ttl, max_entries)
+
+    @staticmethod
+    def key(function: str, kwargs: Dict[str, Any]) -> str:
+        """Returns the cache key of a call: the function name and its parameters, independent of their order."""
+        return canonical_key(function, kwargs)
+
+
+@dataclass
+class RocFunction:
+    """A local function registered for one function of a ROC action group, memoized if it has a cache."""
+    action_group: str
+    function: str
+    fn: Callable[..., Any]
+    timeout: float = DEFAULT_ROC_FUNCTION_TIMEOUT
+    cache: Optional[RocResultCache] = None
+
+    def lookup(self, kwargs: Dict[str, Any]) -> Tuple[Optional[str], bool, Any]:
+        """Returns the cache key of a call, whether its result is cached, and the cached result.
+
+        The key is None if the function is not memoized.
+        """
+        if self.cache is None:
+            return None, False, None
+        _key = self.cache.key(self.function, kwargs)
+        _hit, _value = self.cache.get(_key)
+        return _key, _hit, _value
+
+    def store(self, key: Optional[str], value: Any) -> None:
+        if key is not None:
+            self.cache.put(key, value)
+
+    def call(self, kwargs: Dict[str, Any]) -> Any:
+        _key, _hit, _value = self.lookup(kwargs)
+        if _hit:
+            return _value
+        _value = self.fn(**kwargs)
+        self.store(_key, _value)
+        return _value
+
+
+class RocFunctionRegistry:
+    """Local functions by action group and function name."""
+
+    def __init__(self):
+        self._functions: Dict[Tuple[str, str], RocFunction] = {}
+
+    def register(
+            self,
+            action_group: str,
+            function: str,
+            fn: Callable[..., Any],
+            timeout: float = None,
+            cache_ttl: float = None,
+            cache_size: int = DEFAULT_ROC_CACHE_SIZE,
+    ) -> RocFunction:
+        """Registers fn to answer calls of one function of an action group.
+
+        Args:
+            action_group (str): name of the RETURN_CONTROL action group
+            function (str): function name, or "<httpMethod> <apiPath>" for API schema action groups
+            fn (Callable): called with the call's parameters as keyword arguments
+            timeout (float, optional): seconds before the call is reported as failed. Defaults to 30.
+            cache_ttl (float, optional): seconds results are reused for calls with the same parameters.
+                Defaults to None, which calls fn every time.
+            cache_size (int, optional): results kept when memoized. Defaults to 256.
+
+        Returns:
+            RocFunction: the registration
+        """
+        _registration = RocFunction(
+            action_group, function, fn, DEFAULT_ROC_FUNCTION_TIMEOUT if timeout is None else timeout,
+            RocResultCache(cache_ttl, cache_size) if cache_ttl is not None else None,
+        )
+        self._functions[(action_group, function)] = _registration
+        return _registration
+
+    def function(
+            self,
+            action_group: str,
+            name: str = None,
+            timeout: float = None,
+            cache_ttl: float = None,
+            cache_size: int = DEFAULT_ROC_CACHE_SIZE,
+    ) -> Callable:
+        """Decorator form of register(); the function name defaults to the Python function's name."""
+        def _decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+            self.register(action_group, name or fn.__name__, fn, timeout, cache_ttl, cache_size)
+            return fn
+        return _decorator
+
+    def get(self, action_group: str, function: str) -> Optional[RocFunction]:
+        return self._functions.get((action_group, function))
+
+    def __len__(self) -> int:
+        return len(self._functions)
+
+    def __iter__(self) -> Iterator[RocFunction]:
+        return iter(list(self._functions.values()))
+
+
+@dataclass
+class RocCall:
+    """One function call made for a returnControl event. status is "ok", "error", "timeout" or "missing";
+    cached is True if the result came from the function's cache."""
+    action_group: str
+    function: str
+    parameters: Dict[str, Any]
+    status: str
+    elapsed: float
+    result: Any = None
+    error: Optional[str] = None
+    cached: bool = False
+
+
+@dataclass
+class RocResult:
+    """Outcome of RocRuntime.run(): the final answer and every function call made to reach it."""
+    answer: str
+    session_id: str
+    rounds: int = 0
+    calls: List[RocCall] = field(default_factory=list)
+    elapsed: float = 0.0
+
+
+@dataclass
+class RocFunctionStats:
+    """Running totals of the calls of one function."""
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    cache_hits: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+class RocRuntime:
+    """Runs the return-of-control loop of agent invocations with local functions.
+
+    Args:
+        agents (AgentsForAmazonBedrock): helper used to invoke the agent
+        functions (RocFunctionRegistry): the local functions
+        max_workers (int, optional): function calls running at the same time. Defaults to 8.
+        max_rounds (int, optional): returnControl rounds per run before giving up. Defaults to 10.
+    """
+
+    def __init__(
+            self,
+            agents,
+            functions: RocFunctionRegistry,
+            max_workers: int = 8,
+            max_rounds: int = DEFAULT_MAX_ROC_ROUNDS,
+    ):
+        self._agents = agents
+        self.functions = functions
+        self.max_rounds = max_rounds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="roc")
+        self._lock = threading.Lock()
+        self.stats: Dict[Tuple[str, str], RocFunctionStats] = {}
+
+    def _record(self, call: RocCall) -> None:
+        with self._lock:
+            _stats = self.stats.setdefault((call.action_group, call.function), RocFunctionStats())
+            _stats.calls += 1
+            _stats.errors += call.status in ("error", "missing")
+            _stats.timeouts += call.status == "timeout"
+            _stats.cache_hits += call.cached
+            _stats.total_time += call.elapsed
+            _stats.max_time = max(_stats.max_time, call.elapsed)
+
+    @staticmethod
+    def _timed(
+            registration: RocFunction, kwargs: Dict[str, Any], cache_key: Optional[str]
+    ) -> Tuple[Any, Optional[Exception], float]:
+        # errors are returned rather than raised, so their latency is measured in the worker as well
+        _start = time.perf_counter()
+        try:
+            _value = registration.fn(**kwargs)
+        except Exception as e:
+            return None, e, time.perf_counter() - _start
+        registration.store(cache_key, _value)
+        return _value, None, time.perf_counter() - _start
+
+    def execute(self, invocation_inputs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[RocCall]]:
+        """Runs the calls of one returnControl event concurrently.
+
+        A call's timeout counts from when it is submitted, so it includes time spent waiting for a
+        free worker. A call that times out keeps its worker until the function returns. Calls of
+        memoized functions whose result is cached are answered directly, without a worker.
+
+        Args:
+            invocation_inputs (List[Dict]): the invocationInputs of the returnControl event
+
+        Returns:
+            Tuple[List[Dict], List[RocCall]]: the returnControlInvocationResults, in the order of the
+            inputs, and the record of each call
+        """
+        _pending = []
+        for _input in invocation_inputs:
+            _action_group, _function, _kwargs = invocation_call(_input)
+            _registration = self.functions.get(_action_group, _function)
+            _future = None
+            _cached = None
+            _submitted = time.perf_counter()
+            if _registration is not None:
+                _key, _hit, _value = _registration.lookup(_kwargs)
+                if _hit:
+                    _cached = RocCall(
+                        _action_group, _function, _kwargs, "ok", time.perf_counter() - _submitted, _value, cached=True
+                    )
+                else:
+                    _future = self._executor.submit(self._timed, _registration, _kwargs, _key)
+            _pending.append((_input, _action_group, _function, _kwargs, _registration, _future, _cached, _submitted))
+
+        _results = []
+        _calls = []
+        for _input, _action_group, _function, _kwargs, _registration, _future, _cached, _submitted in _pending:
+            _call = _cached or RocCall(_action_group, _function, _kwargs, "ok", 0.0)
+            if _registration is None:
+                _call.status = "missing"
+                _call.error = f"function {_function} of action group {_action_group} is not available"
+            elif _future is not None:
+                _remaining = _registration.timeout - (time.perf_counter() - _submitted)
+                try:
+                    _call.result, _error, _call.elapsed = _future.result(timeout=max(0.0, _remaining))
+                    if _error is not None:
+                        _call.status = "error"
+                        _call.error = f"{type(_error).__name__}: {_error}"
+                except FutureTimeoutError:
+                    _future.cancel()
+                    _call.status = "timeout"
+                    _call.elapsed = time.perf_counter() - _submitted
+                    _call.error = f"function {_function} did not return within {_registration.timeout:g}s"
+            if _call.status == "ok":
+                _results.append(invocation_result(_input, _call.result))
+            else:
+                _results.append(invocation_result(_input, _call.error, failed=True))
+            self._record(_call)
+            _calls.append(_call)
+        return _results, _calls
+
+    def _end_session(self, agent_id: str, agent_alias_id: str, session_id: str) -> None:
+        # a round that may still end in returnControl must not end the session, as the results
+        # could not be sent back, so the session is ended by a separate call after the final answer
+        for _ in self._agents.invoke_stream(
+                "", agent_id, agent_alias_id=agent_alias_id, session_id=session_id, end_session=True
+        ):
+            pass
+
+    def run(
+            self,
+            input_text: str,
+            agent_id: str,
+            agent_alias_id: str = "TSTALIASID",
+            session_id: str = None,
+            session_state: dict = None,
+            enable_trace: bool = False,
+            end_session: bool = False,
+            trace_handlers=None,
+    ) -> RocResult:
+        """Invokes an agent and answers its returnControl requests until it returns a final answer.
+
+        Args:
+            input_text (str): The text to be processed by the agent.
+            agent_id (str): The ID of the agent to invoke.
+            agent_alias_id (str, optional): The alias ID of the agent to invoke. Defaults to "TSTALIASID".
+            session_id (str, optional): The ID of the session. Defaults to a new UUID.
+            session_state (dict, optional): Session attributes, kept for every round. Defaults to None.
+            enable_trace (bool, optional): Whether to ask the service for trace events. Defaults to False.
+            end_session (bool, optional): Whether to end the session once the final answer arrived. Defaults to False.
+            trace_handlers (TraceHandlerRegistry, optional): Handlers for trace events. Defaults to None.
+
+        Returns:
+            RocResult: the answer, the number of returnControl rounds and every function call
+        """
+        _start = time.perf_counter()
+        _result = RocResult(answer="", session_id=session_id or str(uuid.uuid4()))
+        _session_state = dict(session_state or {})
+        while True:
+            _citations = CitationAssembler()
+            _return_control = None
+            for _event in self._agents.invoke_stream(
+                    input_text,
+                    agent_id,
+                    agent_alias_id=agent_alias_id,
+                    session_id=_result.session_id,
+                    session_state=_session_state,
+                    enable_trace=enable_trace or trace_handlers is not None,
+            ):
+                if isinstance(_event, StreamStart) and _event.status_code != 200:
+                    raise Exception(f"API Response was not 200: {_event.response_metadata}")
+                if isinstance(_event, TextDelta):
+                    _citations.add(_event.text, _event.citations)
+                elif isinstance(_event, ReturnControl):
+                    _return_control = _event
+                elif isinstance(_event, TraceStep) and trace_handlers is not None:
+                    trace_handlers.dispatch(_event)
+
+            if _return_control is None:
+                _result.answer = _citations.answer()
+                if end_session:
+                    self._end_session(agent_id, agent_alias_id, _result.session_id)
+                _result.elapsed = time.perf_counter() - _start
+                return _result
+
+            _result.rounds += 1
+            if _result.rounds > self.max_rounds:
+                raise RuntimeError(
+                    f"agent {agent_id} still returned control after {self.max_rounds} rounds"
+                )
+            _results, _calls = self.execute(_return_control.invocation_inputs)
+            _result.calls.extend(_calls)
+            _session_state = dict(
+                session_state or {},
+                invocationId=_return_control.invocation_id,
+                returnControlInvocationResults=_results,
+            )
+
+    def report(self) -> str:
+        """Returns one line per function with its call count, failures, cache hits and latency."""
+        with self._lock:
+            return "\n".join(
+                f"{_action_group}/{_function}: {_s.calls:,} calls, {_s.errors:,} errors, {_s.timeouts:,} timeouts, "
+                f"{_s.cache_hits:,} cached, mean {_s.mean_time * 1000:,.3f}ms, max {_s.max_time * 1000:,.1f}ms"
+                for (_action_group, _function), _s in sorted(self.stats.items())
+            )
+
+    def close(self) -> None:
+        """Releases the worker threads without waiting for calls that timed out."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self) -> "RocRuntime":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,217 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Per-conversation session management for AgentsForAmazonBedrock.
+
+A Bedrock agent session keeps the conversation history server-side, and every
+turn sends that history back through the model, so input tokens (and latency)
+grow with each turn. SessionPool gives every conversation its own session ID,
+tracks how long each session has been idle against the agent's
+idleSessionTTLInSeconds, ends stale sessions proactively with endSession, and
+records the input tokens of every turn so that context growth is visible:
+
+    >>> pool = SessionPool(agents, agent_id, agent_alias_id)
+    >>> pool.invoke("user-42", "Which titles premiere this fall?")
+    >>> pool.invoke("user-42", "And which of those are documentaries?")
+    >>> pool.stats()
+    [{'key': 'user-42', 'turns': 2, 'input_tokens_per_turn': [1830, 2412], ...}]
+"""
+
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+DEFAULT_IDLE_SESSION_TTL = 1800
+# end sessions a little before the service would expire them on its own
+DEFAULT_IDLE_MARGIN = 60
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AgentSession:
+    """One conversation with an agent, and its token usage per turn."""
+    key: str
+    session_id: str
+    agent_id: str
+    agent_alias_id: str
+    created_at: float
+    last_used: float
+    turns: int = 0
+    input_tokens_per_turn: List[int] = field(default_factory=list)
+    output_tokens_per_turn: List[int] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def idle_seconds(self, now: float = None) -> float:
+        return (now if now is not None else time.monotonic()) - self.last_used
+
+    @property
+    def token_growth(self) -> int:
+        """Increase in input tokens between the first and the latest turn."""
+        if len(self.input_tokens_per_turn) < 2:
+            return 0
+        return self.input_tokens_per_turn[-1] - self.input_tokens_per_turn[0]
+
+    def to_dict(self, now: float = None) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "session_id": self.session_id,
+            "agent_id": self.agent_id,
+            "turns": self.turns,
+            "idle_seconds": round(self.idle_seconds(now), 1),
+            "input_tokens": sum(self.input_tokens_per_turn),
+            "output_tokens": sum(self.output_tokens_per_turn),
+            "input_tokens_per_turn": list(self.input_tokens_per_turn),
+            "token_growth": self.token_growth,
+        }
+
+
+class SessionPool:
+    """Hands out one agent session per conversation key and retires idle sessions.
+
+    Args:
+        agents (AgentsForAmazonBedrock): helper used to invoke the agent
+        agent_id (str): agent to converse with
+        agent_alias_id (str, optional): alias to converse with. Defaults to "TSTALIASID".
+        idle_ttl (int, optional): the agent's idleSessionTTLInSeconds. Defaults to 1800.
+        idle_margin (int, optional): seconds before idle_ttl at which a session is ended. Defaults to 60.
+        track_tokens (bool, optional): request metrics on each turn to record token usage. Defaults to True.
+    """
+
+    def __init__(
+            self,
+            agents,
+            agent_id: str,
+            agent_alias_id: str = "TSTALIASID",
+            idle_ttl: int = DEFAULT_IDLE_SESSION_TTL,
+            idle_margin: int = DEFAULT_IDLE_MARGIN,
+            track_tokens: bool = True,
+    ):
+        self._agents = agents
+        self.agent_id = agent_id
+        self.agent_alias_id = agent_alias_id
+        self.idle_ttl = idle_ttl
+        self.idle_margin = min(idle_margin, idle_ttl)
+        self.track_tokens = track_tokens
+        self._sessions: Dict[str, AgentSession] = {}
+        self._lock = threading.Lock()
+        self._next_reap = 0.0
+
+    def _is_stale(self, session: AgentSession, now: float) -> bool:
+        return session.idle_seconds(now) >= self.idle_ttl - self.idle_margin
+
+    def session(self, key: str) -> AgentSession:
+        """Returns the live session for a conversation key, starting a new one if needed.
+
+        A session that has been idle for longer than idle_ttl - idle_margin is ended and
+        replaced, since the service is about to forget its context anyway.
+        """
+        _now = time.monotonic()
+        _stale = None
+        with self._lock:
+            _session = self._sessions.get(key)
+            if _session is not None and self._is_stale(_session, _now):
+                _stale = _session
+                _session = None
+            if _session is None:
+                _session = AgentSession(
+                    key, str(uuid.uuid4()), self.agent_id, self.agent_alias_id, _now, _now
+                )
+                self._sessions[key] = _session
+                self._next_reap = min(self._next_reap, _now + self.idle_ttl - self.idle_margin)
+        if _stale is not None:
+            self._end(_stale)
+        if _now >= self._next_reap:
+            self.reap(_now)
+        return _session
+
+    def invoke(self, key: str, input_text: str, **invoke_kwargs) -> str:
+        """Sends one turn of a conversation through AgentsForAmazonBedrock.invoke().
+
+        Turns of the same conversation are serialized, since a session accepts one
+        invocation at a time; different conversations can run concurrently.
+
+        Args:
+            key (str): conversation key, e.g. a user or chat ID
+            input_text (str): the user's message
+            **invoke_kwargs: further invoke() arguments, e.g. enable_trace
+
+        Returns:
+            str: the agent answer
+        """
+        _session = self.session(key)
+        with _session.lock:
+            if self.track_tokens:
+                _answer, _metrics = self._agents.invoke(
+                    input_text, self.agent_id, self.agent_alias_id,
+                    session_id=_session.session_id, return_metrics=True, **invoke_kwargs
+                )
+                _session.input_tokens_per_turn.append(_metrics.input_tokens)
+                _session.output_tokens_per_turn.append(_metrics.output_tokens)
+            else:
+                _answer = self._agents.invoke(
+                    input_text, self.agent_id, self.agent_alias_id,
+                    session_id=_session.session_id, **invoke_kwargs
+                )
+            _session.turns += 1
+            _session.last_used = time.monotonic()
+        return _answer
+
+    def _end(self, session: AgentSession) -> None:
+        with session.lock:
+            try:
+                for _ in self._agents.invoke_stream(
+                        "", session.agent_id, session.agent_alias_id,
+                        session_id=session.session_id, end_session=True,
+                ):
+                    pass
+            except Exception as e:
+                # the service may already have expired it; nothing else to clean up
+                logger.info("Could not end session %s: %s", session.session_id, e)
+
+    def end(self, key: str) -> Optional[AgentSession]:
+        """Ends the session of a conversation key, if there is one, and returns it."""
+        with self._lock:
+            _session = self._sessions.pop(key, None)
+        if _session is not None:
+            self._end(_session)
+        return _session
+
+    def reap(self, now: float = None) -> List[AgentSession]:
+        """Ends every session that is about to exceed its idle TTL.
+
+        Returns:
+            List[AgentSession]: the sessions that were ended
+        """
+        _now = now if now is not None else time.monotonic()
+        with self._lock:
+            _stale = [_s for _s in self._sessions.values() if self._is_stale(_s, _now)]
+            for _session in _stale:
+                del self._sessions[_session.key]
+            # last_used only moves forward, so no session can go stale before this
+            self._next_reap = min(
+                (_s.last_used + self.idle_ttl - self.idle_margin for _s in self._sessions.values()),
+                default=float("inf"),
+            )
+        for _session in _stale:
+            self._end(_session)
+        return _stale
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Returns per-session turns, idle time and token usage, including token growth across turns."""
+        _now = time.monotonic()
+        with self._lock:
+            return [_s.to_dict(_now) for _s in self._sessions.values()]
+
+    def close(self) -> None:
+        """Ends every open session."""
+        with self._lock:
+            _sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for _session in _sessions:
+            self._end(_session)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
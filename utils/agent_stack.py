@@ -0,0 +1,760 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Declarative agent stacks with a plan/apply workflow on top of AgentsForAmazonBedrock.
+
+Redeploying a multi-agent stack with the helper methods calls create_agent,
+add_action_group_with_lambda, associate_kb_with_agent and update_agent
+unconditionally, each followed by a prepare and a wait. AgentStack instead
+reads the live state of every agent in the spec, diffs it field by field
+against the spec, and issues only the calls needed for the differences. Agents
+are applied concurrently, each one after the collaborators it depends on, and
+every agent is prepared at most once. Redeploying an unchanged stack only reads
+its state.
+
+A stack spec is a dictionary, or a JSON or YAML file (YAML requires PyYAML):
+
+    agents:
+      - name: research_agent
+        description: Researches the entities of a news event
+        instructions: You are a research agent ...
+        model_ids: [us.anthropic.claude-3-5-sonnet-20241022-v2:0]
+        max_tokens: 4096
+        action_groups:
+          - name: web_search
+            description: Searches the web
+            lambda_function_name: research_agent_web_search
+            source_code_file: web_search_function.py
+            functions: [{name: web_search, description: ..., parameters: {...}}]
+        aliases: [v1]
+      - name: interface_supervisor_agent
+        collaboration: SUPERVISOR
+        ...
+        knowledge_bases: [{kb_id: ABCDEFGHIJ, description: News archive}]
+        collaborators:
+          - {agent: research_agent, alias: v1, name: researchAgent,
+             instruction: ..., relay_conversation_history: TO_COLLABORATOR}
+        aliases: [multi-agent]
+
+    >>> stack = AgentStack(agents, "news_stack.yaml")
+    >>> plan = stack.plan()
+    >>> print(plan)
+    ~ agent research_agent (instruction)
+    + alias interface_supervisor_agent/multi-agent
+    >>> outputs = stack.apply(plan)
+    >>> outputs["interface_supervisor_agent"]["aliases"]["multi-agent"]["id"]
+"""
+
+import importlib
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, fields
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from .agent_sessions import DEFAULT_IDLE_SESSION_TTL
+from .bedrock_agent_helper import DEFAULT_CI_ACTION_GROUP_NAME
+from .lambda_artifacts import LambdaPackage
+
+CODE_INTERPRETER_SIGNATURE = "AMAZON.CodeInterpreter"
+
+# changes to these resources edit the DRAFT version, which must be prepared afterwards
+_DRAFT_RESOURCES = ("agent", "action_group", "knowledge_base", "collaborator")
+_CHANGE_SYMBOLS = {"create": "+", "update": "~", "delete": "-", "prepare": "*"}
+# the UpdateAgent parameters that get_agent() also returns
+_UPDATE_AGENT_FIELDS = (
+    "agentId", "agentName", "agentResourceRoleArn", "instruction", "foundationModel", "description",
+    "idleSessionTTLInSeconds", "customerEncryptionKeyArn", "promptOverrideConfiguration",
+    "guardrailConfiguration", "memoryConfiguration", "agentCollaboration", "orchestrationType",
+    "customOrchestration",
+)
+
+
+def _from_dict(cls, data: Dict[str, Any], context: str):
+    _known = {_f.name for _f in fields(cls)}
+    _unknown = set(data) - _known
+    if _unknown:
+        raise ValueError(f"{context}: unknown keys {sorted(_unknown)}")
+    return cls(**data)
+
+
+@dataclass
+class ActionGroupSpec:
+    """An action group, backed by a Lambda function built from source_code_file, an existing
+    lambda_arn, return of control, or a built-in parent_signature such as the code interpreter."""
+    name: str
+    description: str = None
+    functions: List[Dict] = None
+    lambda_function_name: str = None
+    source_code_file: Union[str, List[str]] = None
+    lambda_arn: str = None
+    return_control: bool = False
+    parent_signature: str = None
+
+
+@dataclass
+class KnowledgeBaseSpec:
+    kb_id: str
+    description: str
+
+
+@dataclass
+class CollaboratorSpec:
+    """A collaborator of a supervisor agent: an alias of another agent of the stack, or an external alias_arn."""
+    name: str
+    instruction: str
+    agent: str = None
+    alias: str = None
+    alias_arn: str = None
+    relay_conversation_history: str = "DISABLED"
+
+
+@dataclass
+class AgentSpec:
+    name: str
+    description: str
+    instructions: str
+    model_ids: List[str]
+    collaboration: str = "DISABLED"
+    idle_session_ttl: int = DEFAULT_IDLE_SESSION_TTL
+    max_tokens: int = None
+    guardrail_id: str = None
+    code_interpretation: bool = False
+    action_groups: List[ActionGroupSpec] = field(default_factory=list)
+    knowledge_bases: List[KnowledgeBaseSpec] = field(default_factory=list)
+    collaborators: List[CollaboratorSpec] = field(default_factory=list)
+    aliases: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AgentSpec":
+        _data = dict(data)
+        _context = f"agent {_data.get('name')}"
+        _data["action_groups"] = [
+            _from_dict(ActionGroupSpec, _ag, _context) for _ag in _data.get("action_groups", [])
+        ]
+        _data["knowledge_bases"] = [
+            _from_dict(KnowledgeBaseSpec, _kb, _context) for _kb in _data.get("knowledge_bases", [])
+        ]
+        _data["collaborators"] = [
+            _from_dict(CollaboratorSpec, _c, _context) for _c in _data.get("collaborators", [])
+        ]
+        return _from_dict(cls, _data, _context)
+
+    @property
+    def all_action_groups(self) -> List[ActionGroupSpec]:
+        """The declared action groups, plus the code interpreter if code_interpretation is set."""
+        if not self.code_interpretation:
+            return list(self.action_groups)
+        return list(self.action_groups) + [
+            ActionGroupSpec(DEFAULT_CI_ACTION_GROUP_NAME, parent_signature=CODE_INTERPRETER_SIGNATURE)
+        ]
+
+    @property
+    def depends_on(self) -> List[str]:
+        """Agents of the stack that this agent uses as collaborators."""
+        return [_c.agent for _c in self.collaborators if _c.agent is not None]
+
+
+@dataclass
+class StackSpec:
+    agents: List[AgentSpec]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StackSpec":
+        _spec = cls([AgentSpec.from_dict(_agent) for _agent in data.get("agents", [])])
+        _spec.validate()
+        return _spec
+
+    def agent(self, name: str) -> AgentSpec:
+        return next(_agent for _agent in self.agents if _agent.name == name)
+
+    def validate(self) -> None:
+        """Raises ValueError for duplicate agents, unresolvable collaborators or dependency cycles."""
+        _by_name = {}
+        for _agent in self.agents:
+            if _agent.name in _by_name:
+                raise ValueError(f"agent {_agent.name} is defined twice")
+            _by_name[_agent.name] = _agent
+        for _agent in self.agents:
+            for _c in _agent.collaborators:
+                if (_c.agent is None) == (_c.alias_arn is None):
+                    raise ValueError(f"collaborator {_c.name} of {_agent.name} needs exactly one of agent or alias_arn")
+                if _c.agent is None:
+                    continue
+                if _c.agent not in _by_name:
+                    raise ValueError(f"collaborator {_c.name} of {_agent.name} refers to unknown agent {_c.agent}")
+                if _c.alias not in _by_name[_c.agent].aliases:
+                    raise ValueError(f"collaborator {_c.name} of {_agent.name} needs alias {_c.alias} of {_c.agent}")
+        _visiting, _visited = set(), set()
+
+        def _visit(name):
+            if name in _visited:
+                return
+            if name in _visiting:
+                raise ValueError(f"collaborators of {name} form a cycle")
+            _visiting.add(name)
+            for _dependency in _by_name[name].depends_on:
+                _visit(_dependency)
+            _visiting.discard(name)
+            _visited.add(name)
+
+        for _agent in self.agents:
+            _visit(_agent.name)
+
+
+def load_stack_spec(source) -> StackSpec:
+    """Loads a stack spec from a dictionary or from a .json, .yaml or .yml file.
+
+    Args:
+        source (dict | str): the spec, or the path of a spec file
+
+    Returns:
+        StackSpec: the validated spec
+    """
+    if isinstance(source, StackSpec):
+        return source
+    if isinstance(source, dict):
+        return StackSpec.from_dict(source)
+    with open(source) as f:
+        if source.endswith((".yaml", ".yml")):
+            try:
+                _yaml = importlib.import_module("yaml")
+            except ImportError as e:
+                raise ImportError("reading YAML stack specs requires PyYAML: pip install pyyaml") from e
+            return StackSpec.from_dict(_yaml.safe_load(f))
+        return StackSpec.from_dict(json.load(f))
+
+
+@dataclass
+class Change:
+    """One planned API change. action is "create", "update", "delete" or "prepare"."""
+    agent: str
+    resource: str
+    name: str
+    action: str
+    fields: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        _name = self.agent if self.resource == "agent" else f"{self.agent}/{self.name}"
+        _fields = f" ({', '.join(self.fields)})" if self.fields else ""
+        return f"{_CHANGE_SYMBOLS[self.action]} {self.resource} {_name}{_fields}"
+
+
+@dataclass
+class LiveAgent:
+    """The live state of one agent of the stack, as read by AgentStack.plan()."""
+    agent: Optional[Dict[str, Any]] = None
+    action_groups: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    knowledge_bases: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    collaborators: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    aliases: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # Lambda function name -> get_function() Configuration, or None if the function does not exist
+    functions: Dict[str, Optional[Dict[str, Any]]] = field(default_factory=dict)
+
+    def alias_arn(self, alias_name: str) -> Optional[str]:
+        _alias = self.aliases.get(alias_name)
+        if self.agent is None or _alias is None:
+            return None
+        return f"{self.agent['agentArn'].replace(':agent/', ':agent-alias/')}/{_alias['agentAliasId']}"
+
+
+@dataclass
+class StackPlan:
+    spec: StackSpec
+    changes: List[Change]
+    live: Dict[str, LiveAgent]
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.changes
+
+    def for_agent(self, agent_name: str) -> List[Change]:
+        return [_c for _c in self.changes if _c.agent == agent_name]
+
+    def __str__(self) -> str:
+        return "\n".join(str(_c) for _c in self.changes) if self.changes else "No changes."
+
+
+def _normalize_functions(functions: List[Dict]) -> List[Dict]:
+    # fill in the defaults the service adds, so that spec and live function schemas compare equal
+    return sorted(
+        (
+            {
+                "name": _f["name"],
+                "description": _f.get("description", ""),
+                "parameters": {
+                    _p: {
+                        "description": _d.get("description", ""),
+                        "type": _d["type"],
+                        "required": bool(_d.get("required", False)),
+                    }
+                    for _p, _d in (_f.get("parameters") or {}).items()
+                },
+                "requireConfirmation": _f.get("requireConfirmation", "DISABLED"),
+            }
+            for _f in functions or []
+        ),
+        key=lambda _f: _f["name"],
+    )
+
+
+def _orchestration_max_tokens(agent: Dict[str, Any]) -> Optional[int]:
+    for _config in (agent.get("promptOverrideConfiguration") or {}).get("promptConfigurations", []):
+        if _config["promptType"] == "ORCHESTRATION" and _config.get("promptCreationMode") == "OVERRIDDEN":
+            return (_config.get("inferenceConfiguration") or {}).get("maximumLength")
+    return None
+
+
+def _run_in_dependency_order(dependencies: Dict[str, List[str]], fn: Callable[[str], Any], max_workers: int) -> None:
+    # starts every node as soon as all of its dependencies have finished; stops starting nodes after an error
+    _pending = dict(dependencies)
+    _running = {}
+    _done = set()
+    _errors = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(_pending)))) as _executor:
+        while _pending or _running:
+            if not _errors:
+                for _name in [_n for _n, _deps in _pending.items() if all(_d in _done for _d in _deps)]:
+                    del _pending[_name]
+                    _running[_executor.submit(fn, _name)] = _name
+            if not _running:
+                break
+            _finished, _ = wait(_running, return_when=FIRST_COMPLETED)
+            for _future in _finished:
+                _name = _running.pop(_future)
+                if _future.exception() is not None:
+                    _errors.append(_future.exception())
+                else:
+                    _done.add(_name)
+    if _errors:
+        raise _errors[0]
+
+
+class AgentStack:
+    """Plans and applies a stack spec against the live agents of the account.
+
+    Args:
+        agents (AgentsForAmazonBedrock): helper whose clients and methods are used
+        spec (StackSpec | dict | str): the spec, or the path of a JSON or YAML spec file
+        max_workers (int, optional): agents read or applied concurrently. Defaults to 8.
+        verbose (bool, optional): print every change as it is applied. Defaults to True.
+    """
+
+    def __init__(self, agents, spec, max_workers: int = 8, verbose: bool = True):
+        self._agents = agents
+        self._client = agents._bedrock_agent_client
+        self._lambda_client = agents._lambda_client
+        self.spec = load_stack_spec(spec)
+        self.max_workers = max_workers
+        self.verbose = verbose
+
+    def _list_all(self, method: Callable, key: str, **kwargs) -> List[Dict[str, Any]]:
+        _items = []
+        _kwargs = dict(kwargs, maxResults=100)
+        while True:
+            _resp = method(**_kwargs)
+            _items.extend(_resp.get(key, []))
+            if not _resp.get("nextToken"):
+                return _items
+            _kwargs["nextToken"] = _resp["nextToken"]
+
+    def _read_function(self, function_name: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._lambda_client.get_function(FunctionName=function_name)["Configuration"]
+        except self._lambda_client.exceptions.ResourceNotFoundException:
+            return None
+
+    def _read_live(self, spec: AgentSpec) -> LiveAgent:
+        _live = LiveAgent()
+        for _ag in spec.action_groups:
+            if _ag.source_code_file is not None:
+                _live.functions[_ag.lambda_function_name] = self._read_function(_ag.lambda_function_name)
+
+        _agent_id = self._agents.get_agent_id_by_name(spec.name)
+        if _agent_id is None:
+            return _live
+        try:
+            _live.agent = self._agents.get_agent_descriptor(_agent_id)
+        except self._client.exceptions.ResourceNotFoundException:
+            return _live
+
+        for _summary in self._list_all(
+                self._client.list_agent_action_groups, "actionGroupSummaries", agentId=_agent_id, agentVersion="DRAFT"
+        ):
+            _live.action_groups[_summary["actionGroupName"]] = self._client.get_agent_action_group(
+                agentId=_agent_id, agentVersion="DRAFT", actionGroupId=_summary["actionGroupId"]
+            )["agentActionGroup"]
+        _live.knowledge_bases = {
+            _kb["knowledgeBaseId"]: _kb for _kb in self._list_all(
+                self._client.list_agent_knowledge_bases, "agentKnowledgeBaseSummaries",
+                agentId=_agent_id, agentVersion="DRAFT",
+            )
+        }
+        if spec.collaboration != "DISABLED" or _live.agent.get("agentCollaboration", "DISABLED") != "DISABLED":
+            _live.collaborators = {
+                _c["collaboratorName"]: _c for _c in self._list_all(
+                    self._client.list_agent_collaborators, "agentCollaboratorSummaries",
+                    agentId=_agent_id, agentVersion="DRAFT",
+                )
+            }
+        _live.aliases = {
+            _a["agentAliasName"]: _a for _a in self._list_all(
+                self._client.list_agent_aliases, "agentAliasSummaries", agentId=_agent_id
+            )
+        }
+        return _live
+
+    def _diff_agent(self, spec: AgentSpec, agent: Dict[str, Any]) -> List[str]:
+        _desired = {
+            "description": spec.description.replace("\n", ""),
+            "instruction": spec.instructions,
+            "foundationModel": spec.model_ids[0],
+            "agentCollaboration": spec.collaboration,
+            "idleSessionTTLInSeconds": spec.idle_session_ttl,
+        }
+        _fields = [_k for _k, _v in _desired.items() if agent.get(_k) != _v]
+        if (agent.get("guardrailConfiguration") or {}).get("guardrailIdentifier") != spec.guardrail_id:
+            _fields.append("guardrailConfiguration")
+        if spec.max_tokens is not None and _orchestration_max_tokens(agent) != spec.max_tokens:
+            _fields.append("maxTokens")
+        return _fields
+
+    def _desired_executor(self, spec: ActionGroupSpec, live: LiveAgent) -> Optional[Dict[str, str]]:
+        if spec.parent_signature is not None:
+            return None
+        if spec.return_control:
+            return {"customControl": "RETURN_CONTROL"}
+        if spec.lambda_arn is not None:
+            return {"lambda": spec.lambda_arn}
+        _function = live.functions.get(spec.lambda_function_name)
+        return {"lambda": _function["FunctionArn"]} if _function is not None else None
+
+    def _diff_action_group(self, spec: ActionGroupSpec, live_ag: Dict[str, Any], live: LiveAgent) -> List[str]:
+        _fields = []
+        if spec.description is not None and live_ag.get("description") != spec.description:
+            _fields.append("description")
+        if spec.parent_signature is not None:
+            if live_ag.get("parentActionSignature") != spec.parent_signature:
+                _fields.append("parentActionSignature")
+        else:
+            _executor = self._desired_executor(spec, live)
+            if _executor is None or live_ag.get("actionGroupExecutor") != _executor:
+                _fields.append("actionGroupExecutor")
+            _live_functions = (live_ag.get("functionSchema") or {}).get("functions")
+            if _normalize_functions(spec.functions) != _normalize_functions(_live_functions):
+                _fields.append("functionSchema")
+        if live_ag.get("actionGroupState", "ENABLED") != "ENABLED":
+            _fields.append("actionGroupState")
+        return _fields
+
+    def _collaborator_alias_arn(self, spec: CollaboratorSpec, live: Dict[str, LiveAgent]) -> Optional[str]:
+        if spec.alias_arn is not None:
+            return spec.alias_arn
+        return live[spec.agent].alias_arn(spec.alias)
+
+    def _plan_agent(self, spec: AgentSpec, live: Dict[str, LiveAgent], prune: bool) -> List[Change]:
+        _live = live[spec.name]
+        _changes = []
+
+        def _change(resource, name, action, changed_fields=()):
+            _changes.append(Change(spec.name, resource, name, action, list(changed_fields)))
+
+        if _live.agent is None:
+            _change("agent", spec.name, "create")
+        else:
+            _fields = self._diff_agent(spec, _live.agent)
+            if _fields:
+                _change("agent", spec.name, "update", _fields)
+
+        _action_groups = spec.all_action_groups
+        for _ag in _action_groups:
+            if _ag.source_code_file is not None:
+                _function = _live.functions.get(_ag.lambda_function_name)
+                if _function is None:
+                    _change("lambda", _ag.lambda_function_name, "create")
+                elif _function["CodeSha256"] != LambdaPackage(_ag.source_code_file).code_sha256:
+                    _change("lambda", _ag.lambda_function_name, "update", ["code"])
+            _live_ag = _live.action_groups.get(_ag.name)
+            if _live_ag is None:
+                _change("action_group", _ag.name, "create")
+            else:
+                _fields = self._diff_action_group(_ag, _live_ag, _live)
+                if _fields:
+                    _change("action_group", _ag.name, "update", _fields)
+
+        for _kb in spec.knowledge_bases:
+            _live_kb = _live.knowledge_bases.get(_kb.kb_id)
+            if _live_kb is None:
+                _change("knowledge_base", _kb.kb_id, "create")
+            else:
+                _fields = [
+                    _k for _k, _v in (("description", _kb.description), ("knowledgeBaseState", "ENABLED"))
+                    if _live_kb.get(_k) != _v
+                ]
+                if _fields:
+                    _change("knowledge_base", _kb.kb_id, "update", _fields)
+
+        for _c in spec.collaborators:
+            _live_c = _live.collaborators.get(_c.name)
+            if _live_c is None:
+                _change("collaborator", _c.name, "create")
+                continue
+            _fields = [
+                _k for _k, _v in (
+                    ("collaborationInstruction", _c.instruction),
+                    ("relayConversationHistory", _c.relay_conversation_history),
+                ) if _live_c.get(_k) != _v
+            ]
+            # an alias that is only created by this apply cannot be referenced yet
+            _alias_arn = self._collaborator_alias_arn(_c, live)
+            if _alias_arn is None or _live_c.get("agentDescriptor", {}).get("aliasArn") != _alias_arn:
+                _fields.insert(0, "aliasArn")
+            if _fields:
+                _change("collaborator", _c.name, "update", _fields)
+
+        if prune:
+            _names = {_ag.name for _ag in _action_groups}
+            for _name in _live.action_groups:
+                if _name not in _names:
+                    _change("action_group", _name, "delete")
+            _kb_ids = {_kb.kb_id for _kb in spec.knowledge_bases}
+            for _kb_id in _live.knowledge_bases:
+                if _kb_id not in _kb_ids:
+                    _change("knowledge_base", _kb_id, "delete")
+            _collaborator_names = {_c.name for _c in spec.collaborators}
+            for _name in _live.collaborators:
+                if _name not in _collaborator_names:
+                    _change("collaborator", _name, "delete")
+
+        _draft_changed = any(_c.resource in _DRAFT_RESOURCES for _c in _changes)
+        if not _draft_changed and _live.agent is not None and _live.agent["agentStatus"] == "NOT_PREPARED":
+            _change("agent", spec.name, "prepare")
+            _draft_changed = True
+
+        for _alias in spec.aliases:
+            if _alias not in _live.aliases:
+                _change("alias", _alias, "create")
+            elif _draft_changed:
+                # point the alias at a new version with the changes
+                _change("alias", _alias, "update", ["version"])
+        return _changes
+
+    def plan(self, prune: bool = False) -> StackPlan:
+        """Reads the live state of every agent of the spec concurrently and diffs it against the spec.
+
+        Args:
+            prune (bool, optional): also plan to remove action groups, knowledge bases and collaborators
+            that are not in the spec. Defaults to False.
+
+        Returns:
+            StackPlan: the changes apply() would make
+        """
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(self.spec.agents)))) as _executor:
+            _live = dict(zip(
+                [_agent.name for _agent in self.spec.agents],
+                _executor.map(self._read_live, self.spec.agents),
+            ))
+        _changes = []
+        for _agent in self.spec.agents:
+            _changes.extend(self._plan_agent(_agent, _live, prune))
+        return StackPlan(self.spec, _changes, _live)
+
+    def _update_agent(self, spec: AgentSpec, agent: Dict[str, Any]) -> None:
+        _details = {_k: agent[_k] for _k in _UPDATE_AGENT_FIELDS if _k in agent}
+        _details.update(
+            description=spec.description.replace("\n", ""),
+            instruction=spec.instructions,
+            foundationModel=spec.model_ids[0],
+            agentCollaboration=spec.collaboration,
+            idleSessionTTLInSeconds=spec.idle_session_ttl,
+        )
+        if spec.guardrail_id is not None:
+            _details["guardrailConfiguration"] = {"guardrailIdentifier": spec.guardrail_id, "guardrailVersion": "DRAFT"}
+        else:
+            _details.pop("guardrailConfiguration", None)
+
+        # keep only the overridden prompts, as update_agent() does
+        _prompts = [
+            _p for _p in (_details.get("promptOverrideConfiguration") or {}).get("promptConfigurations", [])
+            if _p.get("promptCreationMode") == "OVERRIDDEN"
+        ]
+        if spec.max_tokens is not None and _orchestration_max_tokens(agent) != spec.max_tokens:
+            _orchestration = next((_p for _p in _prompts if _p["promptType"] == "ORCHESTRATION"), None)
+            if _orchestration is None:
+                _orchestration = {
+                    "basePromptTemplate": self._agents.get_base_prompt_template("ORCHESTRATION", agent["agentId"]),
+                    "promptType": "ORCHESTRATION",
+                    "promptCreationMode": "OVERRIDDEN",
+                    "promptState": "ENABLED",
+                }
+                _prompts.append(_orchestration)
+            _orchestration["inferenceConfiguration"] = dict(
+                _orchestration.get("inferenceConfiguration") or {}, maximumLength=spec.max_tokens
+            )
+        if _prompts:
+            _details["promptOverrideConfiguration"] = dict(
+                _details.get("promptOverrideConfiguration") or {}, promptConfigurations=_prompts
+            )
+        else:
+            _details.pop("promptOverrideConfiguration", None)
+        self._client.update_agent(**_details)
+        self._agents.invalidate_agent_descriptor(agent["agentId"])
+
+    def _apply_lambda(self, agent_name: str, spec: ActionGroupSpec) -> None:
+        # creates the function, or uploads the changed code of an existing one
+        self._agents.create_lambda(agent_name, spec.lambda_function_name, spec.source_code_file)
+
+    def _apply_action_group(self, agent_id: str, spec: Optional[ActionGroupSpec], live_ag: Optional[Dict[str, Any]],
+                            action: str, live: LiveAgent) -> None:
+        if action == "delete":
+            self._client.delete_agent_action_group(
+                agentId=agent_id, agentVersion="DRAFT", actionGroupId=live_ag["actionGroupId"],
+                skipResourceInUseCheck=True,
+            )
+            return
+        _kwargs = {
+            "agentId": agent_id,
+            "agentVersion": "DRAFT",
+            "actionGroupName": spec.name,
+            "actionGroupState": "ENABLED",
+        }
+        if spec.description is not None:
+            _kwargs["description"] = spec.description
+        if spec.parent_signature is not None:
+            _kwargs["parentActionGroupSignature"] = spec.parent_signature
+        else:
+            _kwargs["actionGroupExecutor"] = self._desired_executor(spec, live)
+            _kwargs["functionSchema"] = {"functions": spec.functions or []}
+        if action == "create":
+            self._client.create_agent_action_group(**_kwargs)
+        else:
+            self._client.update_agent_action_group(actionGroupId=live_ag["actionGroupId"], **_kwargs)
+
+    def _apply_agent(self, spec: AgentSpec, plan: StackPlan, outputs: Dict[str, Dict[str, Any]]) -> None:
+        _live = plan.live[spec.name]
+        _changes = plan.for_agent(spec.name)
+
+        def _log(change):
+            if self.verbose:
+                print(change)
+
+        _agent = _live.agent
+        for _change in _changes:
+            if _change.resource != "agent" or _change.action == "prepare":
+                continue
+            _log(_change)
+            if _change.action == "create":
+                _agent_id = self._agents.create_agent(
+                    spec.name, spec.description, spec.instructions, spec.model_ids,
+                    agent_collaboration=spec.collaboration, guardrail_id=spec.guardrail_id,
+                )[0]
+                self._agents.wait_agent_status_update(_agent_id, verbose=False)
+                _agent = self._agents.get_agent_descriptor(_agent_id)
+                # create_agent() does not cover every field, e.g. max_tokens
+                if self._diff_agent(spec, _agent):
+                    self._update_agent(spec, _agent)
+            else:
+                self._update_agent(spec, _agent)
+            self._agents.wait_agent_status_update(_agent["agentId"], verbose=False)
+        _agent_id = _agent["agentId"]
+
+        # Lambda functions first, so that action groups can refer to their ARNs
+        _action_groups = {_ag.name: _ag for _ag in spec.all_action_groups}
+        _by_function = {_ag.lambda_function_name: _ag for _ag in _action_groups.values() if _ag.source_code_file}
+        for _change in _changes:
+            if _change.resource == "lambda":
+                _log(_change)
+                self._apply_lambda(spec.name, _by_function[_change.name])
+                _live.functions[_change.name] = self._read_function(_change.name)
+
+        _kbs = {_kb.kb_id: _kb for _kb in spec.knowledge_bases}
+        _collaborators = {_c.name: _c for _c in spec.collaborators}
+        for _change in _changes:
+            if _change.resource == "action_group":
+                _log(_change)
+                self._apply_action_group(
+                    _agent_id, _action_groups.get(_change.name), _live.action_groups.get(_change.name),
+                    _change.action, _live,
+                )
+            elif _change.resource == "knowledge_base":
+                _log(_change)
+                if _change.action == "delete":
+                    self._client.disassociate_agent_knowledge_base(
+                        agentId=_agent_id, agentVersion="DRAFT", knowledgeBaseId=_change.name
+                    )
+                    continue
+                _method = (self._client.associate_agent_knowledge_base if _change.action == "create"
+                           else self._client.update_agent_knowledge_base)
+                _method(
+                    agentId=_agent_id, agentVersion="DRAFT", knowledgeBaseId=_change.name,
+                    description=_kbs[_change.name].description, knowledgeBaseState="ENABLED",
+                )
+            elif _change.resource == "collaborator":
+                _log(_change)
+                _live_c = _live.collaborators.get(_change.name)
+                if _change.action == "delete":
+                    self._client.disassociate_agent_collaborator(
+                        agentId=_agent_id, agentVersion="DRAFT", collaboratorId=_live_c["collaboratorId"]
+                    )
+                    continue
+                _c = _collaborators[_change.name]
+                _kwargs = {
+                    "agentId": _agent_id,
+                    "agentVersion": "DRAFT",
+                    "agentDescriptor": {
+                        "aliasArn": _c.alias_arn or outputs[_c.agent]["aliases"][_c.alias]["arn"]
+                    },
+                    "collaboratorName": _c.name,
+                    "collaborationInstruction": _c.instruction,
+                    "relayConversationHistory": _c.relay_conversation_history,
+                }
+                if _change.action == "create":
+                    self._client.associate_agent_collaborator(**_kwargs)
+                else:
+                    self._client.update_agent_collaborator(collaboratorId=_live_c["collaboratorId"], **_kwargs)
+
+        # a single prepare covers every change to the DRAFT version
+        if any(_c.resource in _DRAFT_RESOURCES for _c in _changes):
+            for _change in _changes:
+                if _change.action == "prepare":
+                    _log(_change)
+            self._agents.wait_agent_status_update(_agent_id, verbose=False)
+            self._client.prepare_agent(agentId=_agent_id)
+            self._agents.invalidate_agent_descriptor(_agent_id)
+            self._agents.wait_agent_status_update(_agent_id, verbose=False)
+
+        _aliases = {}
+        for _name, _summary in _live.aliases.items():
+            _aliases[_name] = {"id": _summary["agentAliasId"], "arn": _live.alias_arn(_name)}
+        for _change in _changes:
+            if _change.resource != "alias":
+                continue
+            _log(_change)
+            if _change.action == "create":
+                _alias_id, _alias_arn = self._agents.create_agent_alias(_agent_id, _change.name)
+                _aliases[_change.name] = {"id": _alias_id, "arn": _alias_arn}
+            else:
+                # without a routing configuration, the alias gets a new version of the prepared DRAFT
+                self._client.update_agent_alias(
+                    agentId=_agent_id, agentAliasId=_aliases[_change.name]["id"], agentAliasName=_change.name
+                )
+                self._agents.invalidate_latest_alias_id(_agent_id)
+            self._agents.wait_agent_alias_status_update(_agent_id, _aliases[_change.name]["id"])
+
+        outputs[spec.name] = {"agent_id": _agent_id, "agent_arn": _agent["agentArn"], "aliases": _aliases}
+
+    def apply(self, plan: StackPlan = None) -> Dict[str, Dict[str, Any]]:
+        """Applies a plan. Agents are applied concurrently, each after the agents it uses as collaborators.
+
+        Args:
+            plan (StackPlan, optional): a plan from plan(). Defaults to a new plan.
+
+        Returns:
+            Dict[str, dict]: per agent name, its agent_id, agent_arn and aliases ({name: {"id", "arn"}})
+        """
+        _plan = plan if plan is not None else self.plan()
+        _outputs = {}
+        _run_in_dependency_order(
+            {_agent.name: _agent.depends_on for _agent in _plan.spec.agents},
+            lambda name: self._apply_agent(_plan.spec.agent(name), _plan, _outputs),
+            self.max_workers,
+        )
+        return _outputs
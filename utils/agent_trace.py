@@ -0,0 +1,346 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Pluggable handlers for the trace events of an agent invocation.
+
+A TraceHandlerRegistry maps trace types (routingClassifierTrace,
+orchestrationTrace, preProcessingTrace, postProcessingTrace, failureTrace, ...)
+to handler objects. Dispatching a TraceStep costs a single dictionary lookup,
+after which only the handlers registered for that type (plus any catch-all
+handlers) run, in registration order.
+
+ConsoleTraceRenderer reproduces the colored notebook output of
+AgentsForAmazonBedrock.invoke(enable_trace=True). For production, register
+cheap handlers instead, for example:
+
+    >>> registry = TraceHandlerRegistry()
+    >>> registry.register("failureTrace", LoggingFailureHandler())
+    >>> agents.invoke("hi", agent_id, trace_handlers=registry)
+"""
+
+import datetime
+import json
+import logging
+from typing import Any, Dict
+
+from .agent_events import TraceStep
+from .rendering import colorizer, print_markdown
+
+ANY_TRACE = "*"
+UNDECIDABLE_CLASSIFICATION = "undecidable"
+TRACE_TRUNCATION_LENGTH = 300
+
+logger = logging.getLogger(__name__)
+
+
+class TraceHandler:
+    """Base class for trace handlers. Subclasses implement handle()."""
+
+    def handle(self, step: TraceStep) -> None:
+        raise NotImplementedError
+
+
+class TraceHandlerRegistry:
+    """Maps trace types to the handlers that process them."""
+
+    def __init__(self):
+        self._registrations = []
+        self._dispatch_table = {}
+        self._catch_all = ()
+
+    def register(self, trace_type: str, handler: TraceHandler) -> TraceHandler:
+        """Registers a handler for a trace type, or for every trace if trace_type is ANY_TRACE.
+
+        Args:
+            trace_type (str): key of the inner trace object, e.g. 'orchestrationTrace', or ANY_TRACE
+            handler (TraceHandler): object whose handle(step) method is called for matching traces
+
+        Returns:
+            TraceHandler: the handler, so it can be kept for a later unregister()
+        """
+        self._registrations.append((trace_type, handler))
+        self._dispatch_table = None
+        return handler
+
+    def unregister(self, handler: TraceHandler) -> None:
+        """Removes a handler from every trace type it was registered for."""
+        self._registrations = [(_t, _h) for _t, _h in self._registrations if _h is not handler]
+        self._dispatch_table = None
+
+    def _rebuild(self) -> None:
+        # precompute, per trace type, the ordered handler tuple so dispatch is one lookup
+        _types = {_t for _t, _ in self._registrations if _t != ANY_TRACE}
+        self._dispatch_table = {
+            _type: tuple(_h.handle for _t, _h in self._registrations if _t in (_type, ANY_TRACE))
+            for _type in _types
+        }
+        self._catch_all = tuple(_h.handle for _t, _h in self._registrations if _t == ANY_TRACE)
+
+    def dispatch(self, step: TraceStep) -> None:
+        """Runs every handler registered for the trace type of this step."""
+        if self._dispatch_table is None:
+            self._rebuild()
+        for _handle in self._dispatch_table.get(step.trace_type, self._catch_all):
+            _handle(step)
+
+    def __len__(self) -> int:
+        return len(self._registrations)
+
+
+class LoggingFailureHandler(TraceHandler):
+    """Cheap production handler that logs failureTrace reasons."""
+
+    def __init__(self, log: logging.Logger = None):
+        self._log = log or logger
+
+    def handle(self, step: TraceStep) -> None:
+        self._log.error("Agent error: %s", step.body.get("failureReason"))
+
+
+class TraceTypeCounter(TraceHandler):
+    """Cheap production handler that counts traces per type."""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+
+    def handle(self, step: TraceStep) -> None:
+        self.counts[step.trace_type] = self.counts.get(step.trace_type, 0) + 1
+
+
+class ConsoleTraceRenderer:
+    """Prints a human-readable, colored account of an invocation to the console.
+
+    Holds the state shared by its per-trace-type renderers (step counters, token totals,
+    current sub-agent and step timers). invoke() calls render() with each raw trace, which
+    picks the renderer of its type with one dictionary lookup and builds no TraceStep;
+    register() attaches the same renderers to a registry as handlers instead.
+
+    Args:
+        trace_level (str, optional): "core", "outline" or "all". Defaults to "core".
+        multi_agent_names (dict, optional): maps '{agent_id}/{agent_alias_id}' to sub-agent names
+    """
+
+    def __init__(self, trace_level: str = "core", multi_agent_names: dict = None):
+        self.trace_level = trace_level
+        self._raw_output = trace_level == "all"
+        self.multi_agent_names = multi_agent_names or {}
+        self.total_in_tokens = 0
+        self.total_out_tokens = 0
+        self.total_llm_calls = 0
+        self._orch_step = 0
+        self._sub_step = 0
+        self._sub_agent_name = "<collab-name-not-yet-provided>"
+        self._time_before_orchestration = datetime.datetime.now()
+        self._time_before_routing = None
+        self._colored = colorizer()
+
+    def render(self, trace_part: Dict[str, Any]) -> None:
+        """Prints one trace as it arrives on the completion stream.
+
+        Args:
+            trace_part (Dict): the 'trace' member of a raw completion stream event
+        """
+        if self._raw_output:
+            print('---')
+        for _trace_type, _body in (trace_part.get('trace') or {}).items():
+            _render = self._RENDERERS.get(_trace_type)
+            if _render is not None:
+                _render(self, _body, trace_part)
+        if self._raw_output:
+            print(json.dumps(trace_part, indent=2, ensure_ascii=False, default=str))
+
+    def register(self, registry: TraceHandlerRegistry) -> TraceHandlerRegistry:
+        """Registers all console renderers on the registry and returns it."""
+        if self.trace_level == "all":
+            registry.register(ANY_TRACE, _SeparatorRenderer())
+        for _trace_type, _render in self._RENDERERS.items():
+            registry.register(_trace_type, _ConsoleHandler(self, _render))
+        if self.trace_level == "all":
+            registry.register(ANY_TRACE, _RawTraceRenderer())
+        return registry
+
+    def _count_usage(self, model_output: Dict[str, Any]) -> tuple:
+        _llm_usage = model_output['metadata']['usage']
+        _in_tokens = _llm_usage.get('inputTokens', 0)
+        _out_tokens = _llm_usage['outputTokens']
+        self.total_in_tokens += _in_tokens
+        self.total_out_tokens += _out_tokens
+        self.total_llm_calls += 1
+        return _in_tokens, _out_tokens
+
+    def print_summary(self, duration: datetime.timedelta) -> None:
+        """Prints the totals for the whole invocation."""
+        if self.trace_level in ["core", "outline"]:
+            print(self._colored(f"Agent made a total of {self.total_llm_calls} LLM calls, " +\
+                          f"using {self.total_in_tokens+self.total_out_tokens} tokens " +\
+                          f"(in: {self.total_in_tokens}, out: {self.total_out_tokens})" +\
+                          f", and took {duration.total_seconds():,.1f} total seconds", "yellow"))
+
+    def _render_routing_classifier(self, _route: Dict[str, Any], trace_part: Dict[str, Any]) -> None:
+        if 'modelInvocationInput' in _route:
+            self._orch_step += 1
+            print(self._colored(f"---- Step {self._orch_step} ----", "green"))
+            self._time_before_routing = datetime.datetime.now()
+            print(self._colored("Classifying request to immediately route to one collaborator if possible.", "blue"))
+
+        if 'modelInvocationOutput' in _route:
+            _in_tokens, _out_tokens = self._count_usage(_route['modelInvocationOutput'])
+            _route_duration = datetime.datetime.now() - (self._time_before_routing or datetime.datetime.now())
+
+            _raw_resp_str = _route['modelInvocationOutput']['rawResponse']['content']
+            _classification = _raw_resp_str.replace('<a>', '').replace('</a>', '')
+
+            if _classification == UNDECIDABLE_CLASSIFICATION:
+                print(self._colored("Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.", "magenta"))
+            elif _classification == 'keep_previous_agent':
+                print(self._colored("Continuing conversation with previous collaborator.", "magenta"))
+            else:
+                self._sub_agent_name = _classification
+                print(self._colored(f"Routing classifier chose collaborator: '{_classification}'", "magenta"))
+            print(self._colored(f"Routing classifier took {_route_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}).\n", "yellow"))
+
+    def _render_failure(self, _failure: Dict[str, Any], trace_part: Dict[str, Any]) -> None:
+        print(self._colored(f"Agent error: {_failure['failureReason']}", "red"))
+
+    def _render_orchestration(self, _orch: Dict[str, Any], trace_part: Dict[str, Any]) -> None:
+        _trace_level = self.trace_level
+
+        # the sub-agent (if any) that produced this step is the second entry of the caller chain
+        _sub_agent_alias_id = None
+        _caller_chain = trace_part.get('callerChain')
+        if _caller_chain and len(_caller_chain) > 1 and _trace_level != "all":
+            _sub_agent_alias_arn = _caller_chain[1]['agentAliasArn']
+            # get sub agent id by grabbing all text following the second '/' character
+            _sub_agent_alias_id = _sub_agent_alias_arn.split('/', 1)[1]
+            try:
+                self._sub_agent_name = self.multi_agent_names[_sub_agent_alias_id]
+            except KeyError:
+                print("You haven't provided agents names. To do so provide a dictionary in the format {f'{agent_id}/{agent_alias_id}': f'{agent_name}'})")
+                self._sub_agent_name = "<not-yet-provided>"
+
+        if _trace_level in ["core", "outline"]:
+            if "rationale" in _orch:
+                print(self._colored(f"{_orch['rationale']['text']}", "blue"))
+
+            if "invocationInput" in _orch:
+                # NOTE: when agent determines invocations should happen in parallel
+                # the trace objects for invocation input still come back one at a time.
+                self._render_invocation_input(_orch['invocationInput'], _trace_level)
+
+            if "observation" in _orch and _trace_level == "core":
+                self._render_observation(_orch['observation'])
+
+        if 'modelInvocationOutput' in _orch:
+            if _sub_agent_alias_id is not None:
+                self._sub_step += 1
+                print(self._colored(f"---- Step {self._orch_step}.{self._sub_step} [using sub-agent name:{self._sub_agent_name}, id:{_sub_agent_alias_id}] ----", "green"))
+            else:
+                self._orch_step += 1
+                self._sub_step = 0
+                print(self._colored(f"---- Step {self._orch_step} ----", "green"))
+
+            _in_tokens, _out_tokens = self._count_usage(_orch['modelInvocationOutput'])
+            _orch_duration = datetime.datetime.now() - self._time_before_orchestration
+
+            print(self._colored(f'Took {_orch_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}) to complete prior action, observe, orchestrate.', "yellow"))
+
+            # restart the clock for next step/sub-step
+            self._time_before_orchestration = datetime.datetime.now()
+
+    def _render_invocation_input(self, _input: Dict[str, Any], trace_level: str) -> None:
+        if 'actionGroupInvocationInput' in _input:
+            _ag_input = _input['actionGroupInvocationInput']
+            if trace_level == "outline":
+                print(self._colored(f"Using tool: {_ag_input['function']}", "magenta"))
+            else:
+                print(self._colored(f"Using tool: {_ag_input['function']} with these inputs:", "magenta"))
+                _params = _ag_input['parameters']
+                if (len(_params) == 1) and (_params[0]['name'] == 'input_text'):
+                    print(self._colored(f"{_params[0]['value']}", "magenta"))
+                else:
+                    print(self._colored(f"{_params}\n", "magenta"))
+
+        elif 'agentCollaboratorInvocationInput' in _input:
+            _collab_input = _input['agentCollaboratorInvocationInput']
+            _collab_name = _collab_input['agentCollaboratorName']
+            self._sub_agent_name = _collab_name
+            _collab_input_text = _collab_input['input']['text']
+            _collab_ids = _collab_input['agentCollaboratorAliasArn'].split('/', 1)[1]
+
+            if trace_level == "outline":
+                print(self._colored(f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]'", "magenta"))
+            else:
+                print(self._colored(f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]' passing input text:", "magenta"))
+                print(self._colored(f"{_collab_input_text[0:TRACE_TRUNCATION_LENGTH]}\n", "magenta"))
+
+        elif 'codeInterpreterInvocationInput' in _input:
+            if trace_level == "outline":
+                print(self._colored("Using code interpreter", "magenta"))
+            else:
+                _gen_code = _input['codeInterpreterInvocationInput']['code']
+                _code = f"```python\n{_gen_code}\n```"
+                print_markdown(f"**Generated code**\n{_code}")
+
+    def _render_observation(self, _output: Dict[str, Any]) -> None:
+        if 'actionGroupInvocationOutput' in _output:
+            print(self._colored(f"--tool outputs:\n{_output['actionGroupInvocationOutput']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n", "magenta"))
+
+        if 'agentCollaboratorInvocationOutput' in _output:
+            _collab_output = _output['agentCollaboratorInvocationOutput']
+            _collab_name = _collab_output['agentCollaboratorName']
+            _collab_output_text = _collab_output['output']['text'][0:TRACE_TRUNCATION_LENGTH]
+            print(self._colored(f"\n----sub-agent {_collab_name} output text:\n{_collab_output_text}...\n", "magenta"))
+
+        if 'finalResponse' in _output:
+            print(self._colored(f"Final response:\n{_output['finalResponse']['text'][0:TRACE_TRUNCATION_LENGTH]}...", "cyan"))
+
+    def _render_pre_processing(self, _pre: Dict[str, Any], trace_part: Dict[str, Any]) -> None:
+        if 'modelInvocationOutput' in _pre:
+            _in_tokens, _out_tokens = self._count_usage(_pre['modelInvocationOutput'])
+            print(self._colored("Pre-processing trace, agent came up with an initial plan.", "yellow"))
+            print(self._colored(f'Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}', "yellow"))
+
+    def _render_post_processing(self, _post: Dict[str, Any], trace_part: Dict[str, Any]) -> None:
+        if 'modelInvocationOutput' in _post:
+            _in_tokens, _out_tokens = self._count_usage(_post['modelInvocationOutput'])
+            print(self._colored("Agent post-processing complete.", "yellow"))
+            print(self._colored(f'Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}', "yellow"))
+
+    # renderer of each trace type, looked up once per trace; a class attribute so that
+    # the renderer created for every invocation does not build it again
+    _RENDERERS = {
+        "routingClassifierTrace": _render_routing_classifier,
+        "failureTrace": _render_failure,
+        "orchestrationTrace": _render_orchestration,
+        "preProcessingTrace": _render_pre_processing,
+        "postProcessingTrace": _render_post_processing,
+    }
+
+
+class _ConsoleHandler(TraceHandler):
+    # adapts one of the ConsoleTraceRenderer._RENDERERS to the registry
+    def __init__(self, renderer: ConsoleTraceRenderer, render):
+        self._renderer = renderer
+        self._render = render
+
+    def handle(self, step: TraceStep) -> None:
+        self._render(self._renderer, step.body, step.raw.get('trace') or {'callerChain': step.caller_chain})
+
+
+class _SeparatorRenderer(TraceHandler):
+    def handle(self, step: TraceStep) -> None:
+        print('---')
+
+
+class _RawTraceRenderer(TraceHandler):
+    def handle(self, step: TraceStep) -> None:
+        print(json.dumps(step.raw['trace'], indent=2, ensure_ascii=False, default=str))
+
+
+def console_trace_registry(trace_level: str = "core", multi_agent_names: dict = None) -> tuple:
+    """Builds a registry wired to a fresh ConsoleTraceRenderer.
+
+    Returns:
+        tuple: (TraceHandlerRegistry, ConsoleTraceRenderer)
+    """
+    _renderer = ConsoleTraceRenderer(trace_level, multi_agent_names)
+    return _renderer.register(TraceHandlerRegistry()), _renderer
@@ -0,0 +1,155 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Process-wide boto3 session and client registry shared by the utils helpers.
+
+Creating a boto3 client costs tens of milliseconds, and every client owns its
+own HTTP connection pool. ClientRegistry creates each client once per
+(service, region, config) and hands the same instance to every helper, so
+AgentsForAmazonBedrock, BedrockKnowledgeBase and KnowledgeBasesForAmazonBedrock
+are cheap to instantiate and concurrent invocations share connections. The
+caller identity (account ID and ARN) is fetched from STS once per registry.
+
+    >>> from utils.aws_clients import configure_clients
+    >>> configure_clients(max_pool_connections=64, retry_mode="adaptive")
+    >>> agents = AgentsForAmazonBedrock()   # uses the shared registry
+
+boto3 clients are thread-safe once created; creation itself is serialized here.
+"""
+
+import json
+import threading
+from typing import Any, Dict, Tuple
+
+import boto3
+from botocore.config import Config
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_RETRY_MODE = "standard"
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+class ClientRegistry:
+    """Creates boto3 clients and resources on first use and caches them.
+
+    Args:
+        session (boto3.session.Session, optional): session to create clients from. Defaults to a new session.
+        max_pool_connections (int, optional): HTTP connections per client. Defaults to 50.
+        retry_mode (str, optional): botocore retry mode, "legacy", "standard" or "adaptive". Defaults to "standard".
+        max_attempts (int, optional): total attempts per API call, including the first. Defaults to 5.
+    """
+
+    def __init__(
+            self,
+            session: boto3.session.Session = None,
+            max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+            retry_mode: str = DEFAULT_RETRY_MODE,
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self._session = session or boto3.session.Session()
+        self.max_pool_connections = max_pool_connections
+        self.retry_mode = retry_mode
+        self.max_attempts = max_attempts
+        self._clients: Dict[Tuple, Any] = {}
+        self._identity = None
+        self._lock = threading.RLock()
+
+    @property
+    def session(self) -> boto3.session.Session:
+        return self._session
+
+    @property
+    def region_name(self) -> str:
+        return self._session.region_name
+
+    def _config_kwargs(self, config_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        # overrides replace the registry defaults; a partial retries dict keeps the default retry settings
+        _retries = {"mode": self.retry_mode, "max_attempts": self.max_attempts}
+        _retries.update(config_kwargs.get("retries") or {})
+        _kwargs = {"max_pool_connections": self.max_pool_connections}
+        _kwargs.update(config_kwargs)
+        _kwargs["retries"] = _retries
+        return _kwargs
+
+    def _get(self, kind: str, service: str, region_name: str, config_kwargs: Dict[str, Any]):
+        _region = region_name or self.region_name
+        _config_kwargs = self._config_kwargs(config_kwargs)
+        # config values may be dicts (retries, s3, proxies), so the key is their canonical JSON form
+        _key = (kind, service, _region, json.dumps(_config_kwargs, sort_keys=True, default=str))
+        _client = self._clients.get(_key)
+        if _client is None:
+            with self._lock:
+                _client = self._clients.get(_key)
+                if _client is None:
+                    _factory = self._session.client if kind == "client" else self._session.resource
+                    _client = _factory(service, region_name=_region, config=Config(**_config_kwargs))
+                    self._clients[_key] = _client
+        return _client
+
+    def client(self, service: str, region_name: str = None, **config_kwargs):
+        """Returns the shared client for a service.
+
+        Args:
+            service (str): service name, e.g. "bedrock-agent-runtime"
+            region_name (str, optional): region, defaults to the session region
+            **config_kwargs: botocore Config arguments overriding the registry defaults, e.g.
+                read_timeout=3600 or retries={"max_attempts": 1}; each distinct combination gets its own client
+
+        Returns:
+            botocore.client.BaseClient: the cached client
+        """
+        return self._get("client", service, region_name, config_kwargs)
+
+    def resource(self, service: str, region_name: str = None, **config_kwargs):
+        """Returns the shared boto3 resource for a service, e.g. "dynamodb"."""
+        return self._get("resource", service, region_name, config_kwargs)
+
+    def caller_identity(self) -> Dict[str, str]:
+        """Returns the STS caller identity, calling get_caller_identity() only once."""
+        if self._identity is None:
+            with self._lock:
+                if self._identity is None:
+                    self._identity = self.client("sts").get_caller_identity()
+        return self._identity
+
+    @property
+    def account_id(self) -> str:
+        return self.caller_identity()["Account"]
+
+    @property
+    def identity_arn(self) -> str:
+        return self.caller_identity()["Arn"]
+
+    def credentials(self):
+        """Returns the credentials of the shared session, e.g. for SigV4 signing."""
+        return self._session.get_credentials()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_clients() -> ClientRegistry:
+    """Returns the process-wide ClientRegistry, creating it with default settings on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ClientRegistry()
+    return _registry
+
+
+def configure_clients(**kwargs) -> ClientRegistry:
+    """Replaces the process-wide ClientRegistry, e.g. to change the pool size or retry mode.
+
+    Helpers constructed afterwards use the new registry; existing instances keep their clients.
+
+    Args:
+        **kwargs: ClientRegistry arguments (session, max_pool_connections, retry_mode, max_attempts)
+
+    Returns:
+        ClientRegistry: the new registry
+    """
+    global _registry
+    with _registry_lock:
+        _registry = ClientRegistry(**kwargs)
+    return _registry
@@ -29,41 +29,41 @@ Here is a summary of the most important methods:
 - add_action_group_with_lambda: Creates a new Action Group for an Agent, backed by Lambda.
 """
 
-import boto3
 import json
 import time
 import uuid
-import zipfile
-from dateutil.tz import tzutc
+import functools
 import os
 import datetime
-from dateutil.relativedelta import relativedelta
 import random
-from io import BytesIO
-from typing import List, Dict, Tuple, Any
-import re
-from boto3.session import Session
-from botocore.config import Config
-from boto3.dynamodb.conditions import Key
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
-from IPython.display import display, Markdown
-
-# from IPython.display import display, Markdown
-# import matplotlib.pyplot as plt
-# import matplotlib.image as mpimg
-
-from termcolor import colored
-from rich.console import Console
-from rich.markdown import Markdown
+from typing import List, Dict, Tuple, Any, Callable, Iterator, Iterable, Union
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+from .agent_events import StreamStart, TextDelta, TraceStep, FileOutput, parse_event
+from .agent_citations import CitationAssembler, reference_uri
+from .agent_files import FileSink, LocalFileSink
+from .aws_clients import ClientRegistry, get_clients
+from .agent_sessions import DEFAULT_IDLE_SESSION_TTL
+from .agent_registry import AgentDescriptorCache, AgentRegistry
+from .lambda_artifacts import LambdaArtifactCache, LambdaPackage
+from .iam_roles import role_provisioner
+from .teardown import TeardownPlan, TeardownResult, add_role_steps, raise_for_failures
+from .waiters import (
+    is_agent_deletion_pending_error, is_role_propagation_error, record_skipped_sleep, retry_call, wait_all, wait_until
+)
+from .agent_batch import AIMDLimiter, BatchResult, is_throttling_error
+from .agent_metrics import InvocationMetrics, MetricsCollector, MetricsSink
+from .dynamodb_loader import DEFAULT_LOAD_WORKERS, BulkLoadResult, DynamoDBBulkLoader, iter_jsonl
+from .dynamodb_query import DEFAULT_QUERY_WORKERS, DynamoDBQuery
+from .synthetic_data import PowerReadingGenerator
+from .agent_roc import DEFAULT_MAX_ROC_ROUNDS, RocFunctionRegistry, RocResult, RocRuntime, invocation_result
+from .agent_trace import ConsoleTraceRenderer, TraceHandlerRegistry, console_trace_registry
 
 PYTHON_TIMEOUT = 180
 PYTHON_RUNTIME = "python3.12"
 DEFAULT_ALIAS = "TSTALIASID"
 DEFAULT_CI_ACTION_GROUP_NAME = "CodeInterpreterAction"
-UNDECIDABLE_CLASSIFICATION = "undecidable"
 ROUTER_MODEL = "us.anthropic.claude-3-haiku-20240307-v1:0"
-TRACE_TRUNCATION_LENGTH = 300
 
 # TODO: Take advantage of a default execution role so that we do not need to have lengthy
 # waiting times when creating a new Agent or new Lambda to give time for the IAM role to
@@ -159,25 +159,41 @@ class AgentsForAmazonBedrock:
     """Provides an easy to use wrapper for Agents for Amazon Bedrock.
     """
 
-    def __init__(self):
-        """Constructs an instance."""
-        self._boto_session = Session() 
-        self._region = self._boto_session.region_name
-        self._account_id = boto3.client("sts").get_caller_identity()["Account"]
+    def __init__(self, clients: ClientRegistry = None):
+        """Constructs an instance. Clients come from the process-wide ClientRegistry,
+        so creating more instances does not create new clients or call STS again.
 
-        self._bedrock_agent_client = boto3.client("bedrock-agent")
-
-        long_invoke_time_config = Config(read_timeout=3600)
-        self._bedrock_agent_runtime_client = boto3.client(
-            "bedrock-agent-runtime", config=long_invoke_time_config
+        Args:
+            clients (ClientRegistry, optional): registry to take boto3 clients from. Defaults to get_clients().
+        """
+        self._clients = clients or get_clients()
+        self._boto_session = self._clients.session
+        self._region = self._clients.region_name
+        self._account_id = self._clients.account_id
+
+        self._bedrock_agent_client = self._clients.client("bedrock-agent")
+        self._agent_registry = AgentRegistry(self._bedrock_agent_client)
+        self._agent_descriptors = AgentDescriptorCache(self._bedrock_agent_client, self._agent_registry)
+        self._latest_alias_ids: Dict[str, str] = {}
+
+        # long-running invocations need a longer read timeout than the other APIs
+        self._bedrock_agent_runtime_client = self._clients.client(
+            "bedrock-agent-runtime", read_timeout=3600
+        )
+        # invoke_many() retries throttled calls itself, so that its AIMD limiter sees every throttle
+        self._batch_runtime_client = self._clients.client(
+            "bedrock-agent-runtime", read_timeout=3600, retries={"max_attempts": 1}
         )
 
-        self._sts_client = boto3.client("sts")
-        self._iam_client = boto3.client("iam")
-        self._lambda_client = boto3.client("lambda")
-        self._s3_client = boto3.client("s3", region_name=self._region)
-        self._dynamodb_client = boto3.client('dynamodb', region_name=self._region)
-        self._dynamodb_resource = boto3.resource('dynamodb', region_name=self._region)
+        self._sts_client = self._clients.client("sts")
+        self._iam_client = self._clients.client("iam")
+        self._lambda_client = self._clients.client("lambda")
+        self._s3_client = self._clients.client("s3")
+        self._dynamodb_client = self._clients.client("dynamodb")
+        self._dynamodb_resource = self._clients.resource("dynamodb")
+        self._dynamodb_queries: Dict[str, DynamoDBQuery] = {}
+        self._lambda_artifacts = LambdaArtifactCache(self._lambda_client, self._s3_client)
+        self._roles = role_provisioner(self._iam_client)
 
         self._suffix = f"{self._region}-{self._account_id}"
 
@@ -208,39 +224,19 @@ class AgentsForAmazonBedrock:
         _lambda_function_role_name = f"{agent_name}-lambda-role-{self._suffix}"
         _dynamodb_access_policy_name = f"{agent_name}-dynamodb-policy"
 
-        # Create IAM Role for the Lambda function
-        try:
-            _assume_role_policy_document = {
-                "Version": "2012-10-17",
-                "Statement": [
-                    {
-                        "Effect": "Allow",
-                        "Action": "bedrock:InvokeModel",
-                        "Principal": {
-                            "Service": "lambda.amazonaws.com"
-                        },
-                        "Action": "sts:AssumeRole"
-                    }
-                ]
-            }
-
-            _assume_role_policy_document_json = json.dumps(_assume_role_policy_document)
-
-            _lambda_iam_role = self._iam_client.create_role(
-                RoleName=_lambda_function_role_name,
-                AssumeRolePolicyDocument=_assume_role_policy_document_json
-            )
-
-            # Pause to make sure role is created
-            time.sleep(10)
-        except:
-            _lambda_iam_role = self._iam_client.get_role(RoleName=_lambda_function_role_name)
-
-        # attach Lambda basic execution policy to the role
-        self._iam_client.attach_role_policy(
-            RoleName=_lambda_function_role_name,
-            PolicyArn='arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole'
-        )
+        _assume_role_policy_document = {
+            "Version": "2012-10-17",
+            "Statement": [
+                {
+                    "Effect": "Allow",
+                    "Principal": {
+                        "Service": "lambda.amazonaws.com"
+                    },
+                    "Action": "sts:AssumeRole"
+                }
+            ]
+        }
+        _inline_policies = {}
 
         # If an additional IAM policy has been provided, attach it to the role as well.
         if additional_function_iam_policy is not None:
@@ -248,11 +244,7 @@ class AgentsForAmazonBedrock:
                 print(
                     f"Attaching additional IAM policy to Lambda role:\n{additional_function_iam_policy}"
                 )
-            self._iam_client.put_role_policy(
-                PolicyDocument=additional_function_iam_policy,
-                PolicyName="additional_function_policy",
-                RoleName=_lambda_function_role_name,
-            )
+            _inline_policies["additional_function_policy"] = additional_function_iam_policy
 
         # create a policy to allow Lambda to invoke sub-agents and look up info about each sub-agent.
         # include the ability to invoke the agent based on its ID, and allow use of any Agent Alias.
@@ -261,7 +253,7 @@ class AgentsForAmazonBedrock:
                 _sub_agent_arn.replace(":agent/", ":agent*/") + "*"
                 for _sub_agent_arn in sub_agent_arns
             ]
-            _sub_agent_policy_document = {
+            _inline_policies["sub_agent_policy"] = {
                 "Version": "2012-10-17",
                 "Statement": [
                     {
@@ -278,17 +270,10 @@ class AgentsForAmazonBedrock:
                     }
                 ]
             }
-            # Attach the inline policy to the Lambda function's role
-            sub_agent_policy_json = json.dumps(_sub_agent_policy_document)
-            self._iam_client.put_role_policy(
-                PolicyDocument=sub_agent_policy_json,
-                PolicyName="sub_agent_policy",
-                RoleName=_lambda_function_role_name
-            )
 
         # Create a policy to grant access to the DynamoDB table
         if dynamodb_table_name:
-            _dynamodb_access_policy = {
+            _inline_policies[_dynamodb_access_policy_name] = {
                 "Version": "2012-10-17",
                 "Statement": [
                     {
@@ -307,51 +292,101 @@ class AgentsForAmazonBedrock:
                 ]
             }
 
-            # Attach the inline policy to the Lambda function's role
-            _dynamodb_access_policy_json = json.dumps(_dynamodb_access_policy)
-            self._iam_client.put_role_policy(
-                PolicyDocument=_dynamodb_access_policy_json,
-                PolicyName=_dynamodb_access_policy_name,
-                RoleName=_lambda_function_role_name
-            )
-        return _lambda_iam_role["Role"]["Arn"]
+        # only the parts of an existing role that differ are updated; no wait for propagation,
+        # create_lambda retries until Lambda can assume the role
+        _lambda_iam_role = self._roles.ensure_role(
+            _lambda_function_role_name,
+            _assume_role_policy_document,
+            inline_policies=_inline_policies,
+            managed_policy_arns=["arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"],
+            wait=False,
+        )
+        return _lambda_iam_role["Arn"]
 
-    def get_agent_latest_alias_id(self, agent_id: str, verbose: bool = False) -> str:
-        """Gets the latest alias ID for the specified Agent.
+    def get_agent_latest_alias_id(self, agent_id: str, verbose: bool = False, refresh: bool = False) -> str:
+        """Gets the latest alias ID for the specified Agent, waiting until that alias is ready.
+
+        The result is cached per agent until this instance creates or updates an alias of the agent.
 
         Args:
             agent_id (str): Id of the agent for which to get the latest alias ID
+            verbose (bool, optional): print the picked alias. Defaults to False.
+            refresh (bool, optional): ignore the cached result. Defaults to False.
 
         Returns:
-            str: Latest alias ID
+            str: Latest alias ID, or "" if the agent has no alias
         """
-        _agent_aliases = self._bedrock_agent_client.list_agent_aliases(
-            agentId=agent_id,
-            maxResults=100
-        )
+        if not refresh:
+            _cached = self._latest_alias_ids.get(agent_id)
+            if _cached is not None:
+                return _cached
+
+        # one pass over every page, remembering only the newest alias
+        _latest = None
+        _kwargs = {"agentId": agent_id, "maxResults": 100}
+        while True:
+            _agent_aliases = self._bedrock_agent_client.list_agent_aliases(**_kwargs)
+            for _summary in _agent_aliases['agentAliasSummaries']:
+                if _latest is None or _summary['updatedAt'] > _latest['updatedAt']:
+                    _latest = _summary
+            if not _agent_aliases.get('nextToken'):
+                break
+            _kwargs['nextToken'] = _agent_aliases['nextToken']
 
-        _latest_alias_id = ""
-        _latest_update = datetime.datetime(1970, 1, 1, 0, 0, 0, tzinfo=tzutc())
-
-        for _summary in _agent_aliases['agentAliasSummaries']:
-            # print(_summary)
-            _curr_update = _summary['updatedAt']
-            if _curr_update > _latest_update:
-                _latest_alias_id = _summary['agentAliasId']
-                self.wait_agent_alias_status_update(agent_id, _latest_alias_id, verbose=False)
-                _latest_update = _curr_update
-                _alias_name = _summary['agentAliasName']
-                # skip routing config since issue w/ version being blank
-                # print(f"agent id: {agent_id}, routing config: {_summary['routingConfiguration']}")
-                # _alias_version = _summary['routingConfiguration'][0]['agentVersion']
+        if _latest is None:
+            return ""
+        # skip routing config since issue w/ version being blank
+        _latest_alias_id = _latest['agentAliasId']
+        self.wait_agent_alias_status_update(agent_id, _latest_alias_id, verbose=False)
+        self._latest_alias_ids[agent_id] = _latest_alias_id
 
         if verbose:
             print(f"for id: {agent_id}, picked latest alias: {_latest_alias_id}")
-            print(f"  updated at: {_latest_update}")
-            print(f"  alias name: {_alias_name}\n") #, version: {_alias_version}\n")
+            print(f"  updated at: {_latest['updatedAt']}")
+            print(f"  alias name: {_latest['agentAliasName']}\n")
 
         return _latest_alias_id
 
+    def get_agents_latest_alias_ids(self, agent_ids: List[str], max_workers: int = 8) -> Dict[str, str]:
+        """Gets the latest alias IDs of several agents concurrently, see get_agent_latest_alias_id().
+
+        Returns:
+            Dict[str, str]: latest alias ID per agent ID
+        """
+        _agent_ids = list(agent_ids)
+        if not _agent_ids:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(_agent_ids))) as _executor:
+            return dict(zip(_agent_ids, _executor.map(self.get_agent_latest_alias_id, _agent_ids)))
+
+    def invalidate_latest_alias_id(self, agent_id: str = None) -> None:
+        """Forgets the cached latest alias of an agent, or of every agent if agent_id is None.
+        Needed after aliases are created or updated outside of this instance."""
+        if agent_id is None:
+            self._latest_alias_ids.clear()
+        else:
+            self._latest_alias_ids.pop(agent_id, None)
+
+    def get_agent_descriptor(self, agent_id: str, refresh: bool = False) -> Dict[str, Any]:
+        """Returns the 'agent' of get_agent(), including its prompt override configurations.
+
+        Descriptors are cached and revalidated against the updatedAt of the agent listing,
+        so repeated reads of the same agent cost no get_agent call.
+
+        Args:
+            agent_id (str): Id of the agent
+            refresh (bool, optional): bypass the cache. Defaults to False.
+
+        Returns:
+            Dict[str, Any]: a copy of the agent descriptor
+        """
+        return self._agent_descriptors.get(agent_id, refresh=refresh)
+
+    def invalidate_agent_descriptor(self, agent_id: str = None) -> None:
+        """Forgets the cached descriptor of an agent, or of every agent if agent_id is None.
+        Changes made through this instance invalidate it already."""
+        self._agent_descriptors.invalidate(agent_id)
+
     def get_agent_alias_arn(
             self, agent_id: str, agent_alias_id: str, verbose: bool = False
     ) -> str:
@@ -378,15 +413,7 @@ class AgentsForAmazonBedrock:
         Returns:
             str: Agent ID, or None if not found
         """
-        _get_agents_resp = self._bedrock_agent_client.list_agents(maxResults=100)
-        _agents_json = _get_agents_resp["agentSummaries"]
-        _target_agent = next(
-            (agent for agent in _agents_json if agent["agentName"] == agent_name), None
-        )
-        if _target_agent is None:
-            return None
-        else:
-            return _target_agent["agentId"]
+        return self._agent_registry.agent_id(agent_name)
 
     def associate_kb_with_agent(self, agent_id, description, kb_id):
         """Associates a Knowledge Base with an Agent, and prepares the agent.
@@ -407,6 +434,7 @@ class AgentsForAmazonBedrock:
         _resp = self._bedrock_agent_client.prepare_agent(
             agentId=agent_id
         )
+        self.invalidate_agent_descriptor(agent_id)
 
     def get_agent_arn_by_name(self, agent_name: str) -> str:
         """Gets the Agent ARN for the specified Agent.
@@ -420,8 +448,7 @@ class AgentsForAmazonBedrock:
         _agent_id = self.get_agent_id_by_name(agent_name)
         if _agent_id is None:
             raise ValueError(f"Agent {agent_name} not found")
-        _get_agent_resp = self._bedrock_agent_client.get_agent(agentId=_agent_id)
-        return _get_agent_resp["agent"]["agentArn"]
+        return self.get_agent_descriptor(_agent_id)["agentArn"]
 
     def get_agent_instructions_by_name(self, agent_name: str) -> str:
         """Gets the current Agent Instructions that are used by the specified Agent.
@@ -435,10 +462,8 @@ class AgentsForAmazonBedrock:
         _agent_id = self.get_agent_id_by_name(agent_name)
         if _agent_id is None:
             raise ValueError(f"Agent {agent_name} not found")
-        _get_agent_resp = self._bedrock_agent_client.get_agent(agentId=_agent_id)
-
-        # extract the instructions from the response
-        _instructions = _get_agent_resp["agent"]["instruction"]
+        # extract the instructions from the cached agent descriptor
+        _instructions = self.get_agent_descriptor(_agent_id)["instruction"]
         return _instructions
 
     def _allow_agent_lambda(self, agent_id: str, lambda_function_name: str) -> None:
@@ -449,13 +474,17 @@ class AgentsForAmazonBedrock:
             lambda_function_name (str): Name of the Lambda function
         """
         # Create allow invoke permission on lambda
-        _permission_resp = self._lambda_client.add_permission(
-            FunctionName=lambda_function_name,
-            StatementId=f"allow_bedrock_{agent_id}",
-            Action="lambda:InvokeFunction",
-            Principal="bedrock.amazonaws.com",
-            SourceArn=f"arn:aws:bedrock:{self._region}:{self._account_id}:agent/{agent_id}",
-        )
+        try:
+            _permission_resp = self._lambda_client.add_permission(
+                FunctionName=lambda_function_name,
+                StatementId=f"allow_bedrock_{agent_id}",
+                Action="lambda:InvokeFunction",
+                Principal="bedrock.amazonaws.com",
+                SourceArn=f"arn:aws:bedrock:{self._region}:{self._account_id}:agent/{agent_id}",
+            )
+        except self._lambda_client.exceptions.ResourceConflictException:
+            # the function was updated in place and already allows this agent
+            pass
 
     def _make_agent_string(self, agent_arns: List[str] = None) -> str:
         """Makes a comma separated string of agent ids from a list of agent ARNs.
@@ -475,53 +504,54 @@ class AgentsForAmazonBedrock:
             self,
             agent_name: str,
             lambda_function_name: str,
-            source_code_file: str,
+            source_code_file: Union[str, List[str]],
             additional_function_iam_policy: Dict = None,
             sub_agent_arns: List[str] = None,
-            dynamo_args: List[str] = None
+            dynamo_args: List[str] = None,
+            layers: List[str] = None,
+            handler: str = None,
     ) -> str:
-        """Creates a new Lambda function that implements a set of actions for an Agent Action Group.
+        """Creates a Lambda function that implements a set of actions for an Agent Action Group,
+        or updates it in place if it already exists. The code is only uploaded when it changed.
 
         Args:
             agent_name (str): Name of the existing Agent that this Lambda will support.
             lambda_function_name (str): Name of the Lambda function to create.
-            source_code_file (str): Name of the file containing the Lambda source code.
-            Must be a local file, and use underscores, not hyphens.
+            source_code_file (str | List[str]): Name of the file containing the Lambda source code, or a list of
+            files and directories to package, the first of which holds the handler.
+            Must be local files, and use underscores, not hyphens.
             additional_function_iam_policy (Dict, Optional): Additional IAM policy to attach to the Lambda function. Defaults to None.
             sub_agent_arns (List[str], Optional): List of ARNs of the sub-agents that this Lambda is allowed to invoke.
+            layers (List[str], Optional): Layer version ARNs, e.g. from LambdaArtifactCache.deploy_layer(). Defaults to None.
+            handler (str, Optional): Handler, defaults to lambda_handler in the first source file.
 
         Returns:
-            str: ARN of the new Lambda function
+            str: ARN of the Lambda function
         """
 
         _agent_id = self.get_agent_id_by_name(agent_name)
         if _agent_id is None:
             return "Agent not found"
 
-        _base_filename = source_code_file.split(".py")[0]
+        _package = LambdaPackage(source_code_file)
+        if handler is None:
+            _base_filename = _package.sources[0].split(".py")[0]
+            handler = f"{_base_filename}.lambda_handler"
 
-        # Package up the lambda function code
-        s = BytesIO()
-        z = zipfile.ZipFile(s, "w")
-        z.write(f"{source_code_file}")
-        z.close()
-        zip_content = s.getvalue()
         if sub_agent_arns:
             env_variables = {
-                "Variables": {
-                    'SUB_AGENT_IDS': self._make_agent_string(sub_agent_arns)
-                }
+                'SUB_AGENT_IDS': self._make_agent_string(sub_agent_arns)
             }
         else:
-            env_variables = {
-                "Variables": {
-                }
-            }
-            
+            env_variables = {}
+
         if dynamo_args:
             # add DynamoDB Table permissions to the Lambda Function
             lambda_role = self._create_lambda_iam_role(
-                agent_name, sub_agent_arns, dynamodb_table_name=dynamo_args[0]
+                agent_name,
+                additional_function_iam_policy=additional_function_iam_policy,
+                sub_agent_arns=sub_agent_arns,
+                dynamodb_table_name=dynamo_args[0],
             )
             # create DynamoDB Table to be used on Lambda Code
             self.create_dynamodb(
@@ -529,29 +559,31 @@ class AgentsForAmazonBedrock:
                 dynamo_args[1],
                 dynamo_args[2]
             )
-            env_variables['Variables']['dynamodb_table'] = dynamo_args[0]
-            env_variables['Variables']['dynamodb_pk'] = dynamo_args[1]
-            env_variables['Variables']['dynamodb_sk'] = dynamo_args[2]
+            env_variables['dynamodb_table'] = dynamo_args[0]
+            env_variables['dynamodb_pk'] = dynamo_args[1]
+            env_variables['dynamodb_sk'] = dynamo_args[2]
         else:
             lambda_role = self._create_lambda_iam_role(
-                agent_name, sub_agent_arns
+                agent_name,
+                additional_function_iam_policy=additional_function_iam_policy,
+                sub_agent_arns=sub_agent_arns,
             )
 
-        # Create Lambda Function
-        _lambda_function = self._lambda_client.create_function(
-            FunctionName=lambda_function_name,
-            Runtime=PYTHON_RUNTIME,
-            Timeout=PYTHON_TIMEOUT,
-            Role=lambda_role,
-            Code={"ZipFile": zip_content},
-            Handler=f"{_base_filename}.lambda_handler",
-            # TODO: make this an optional keyword arg. only supply it when sub-agent-arns are provided
-            Environment=env_variables
+        # Create or update the Lambda Function, retrying while a new role has not propagated yet
+        _result = self._lambda_artifacts.deploy_function(
+            lambda_function_name,
+            _package,
+            lambda_role,
+            handler=handler,
+            runtime=PYTHON_RUNTIME,
+            timeout=PYTHON_TIMEOUT,
+            environment=env_variables,
+            layers=layers,
         )
 
         self._allow_agent_lambda(_agent_id, lambda_function_name)
 
-        return _lambda_function["FunctionArn"]
+        return _result.function_arn
 
     def delete_lambda(
         self, 
@@ -569,39 +601,45 @@ class AgentsForAmazonBedrock:
             created for the Lambda function. Defaults to True.
         """
 
-        # Detach and delete the role
+        # the function and its role, and the table, are independent branches deleted in parallel
+        _plan = TeardownPlan(verbose=False)
+        self._add_lambda_teardown(_plan, lambda_function_name, delete_role_flag)
+        if dynamoDB_table:
+            _plan.add(
+                f"dynamodb-table:{dynamoDB_table}",
+                lambda: self._dynamodb_client.delete_table(TableName=dynamoDB_table),
+            )
+        for _result in _plan.run():
+            if _result.status == "failed" and _result.key.startswith("dynamodb-table:"):
+                #logger.warning(f"Ignored exception {e}")
+                print(f"Ignored exception {_result.error}")
+
+    def _add_lambda_teardown(
+            self, plan: TeardownPlan, lambda_function_name: str, delete_role_flag: bool = True, after: List[str] = ()
+    ) -> str:
+        """Adds the deletion of a Lambda function, followed by its role, to a teardown plan.
+
+        Returns:
+            str: key of the function step
+        """
+        _lambda = plan.add(
+            f"lambda:{lambda_function_name}",
+            lambda: self._lambda_client.delete_function(FunctionName=lambda_function_name),
+            after=after,
+        )
         if delete_role_flag:
             try:
-                _function_resp = self._lambda_client.get_function(
+                _role_arn = self._lambda_client.get_function(
                     FunctionName=lambda_function_name
-                )
-                _role_arn = _function_resp["Configuration"]["Role"]
-                _role_name = _role_arn.split("/")[1]
-                self._iam_client.detach_role_policy(
-                    RoleName=_role_name,
-                    PolicyArn="arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole",
-                )
-                self._iam_client.delete_role(RoleName=_role_name)
-            except:
-                pass
-
-        # Delete Lambda function
-        try:
-            self._lambda_client.delete_function(
-                FunctionName=lambda_function_name
-            )
-        except:
-            pass
-        
-        # Delete DynamoDB Table
-        if dynamoDB_table:
-            try:
-                self._dynamodb_client.delete_table(
-                    TableName=dynamoDB_table
-                )
-            except Exception as e:
-                #logger.warning(f"Ignored exception {e}")
-                print(f"Ignored exception {e}")
+                )["Configuration"]["Role"]
+            except Exception:
+                # no function, so no role to look up
+                return _lambda
+            _role_name = _role_arn.split("/")[-1]
+            if _role_name != DEFAULT_AGENT_IAM_ROLE_NAME:
+                self._roles.forget(_role_name)
+                add_role_steps(plan, self._iam_client, _role_name, after=[_lambda])
+        return _lambda
 
     def get_agent_role(self, agent_name: str) -> str:
         """Gets the ARN of the IAM role that is associated with the specified Agent.
@@ -612,120 +650,197 @@ class AgentsForAmazonBedrock:
         Returns:
             str: ARN of the IAM role, or None if not found
         """
-        _get_agents_resp = self._bedrock_agent_client.list_agents(maxResults=100)
-        _agents_json = _get_agents_resp["agentSummaries"]
-        _target_agent = next(
-            (agent for agent in _agents_json if agent["agentName"] == agent_name), None
-        )
+        _target_agent = self._agent_registry.get(agent_name)
         if _target_agent is not None:
             # pprint.pp(_target_agent)
             _agent_id = _target_agent["agentId"]
 
-            _get_agent_resp = self._bedrock_agent_client.get_agent(agentId=_agent_id)
-            return _get_agent_resp["agent"]["agentResourceRoleArn"]
+            return self.get_agent_descriptor(_agent_id)["agentResourceRoleArn"]
         else:
             return "Agent not found"
 
     def delete_agent(
             self, agent_name: str, delete_role_flag: bool = True, verbose: bool = False
-    ) -> None:
+    ) -> List[TeardownResult]:
         """Deletes an existing agent. Optionally, deletes the IAM role associated with the agent.
 
         Args:
             agent_name (str): Name of the agent to delete.
             delete_role_flag (bool, Optional): Flag indicating whether to delete the IAM role associated with the agent.
             Defaults to True.
-        """
-
-        # first find the agent ID from the agent Name
-        _get_agents_resp = self._bedrock_agent_client.list_agents(maxResults=100)
-        _agents_json = _get_agents_resp['agentSummaries']
-        _target_agent = next((agent for agent in _agents_json if agent["agentName"] == agent_name), None)
-
-        if _target_agent is None:
-            print(f"Agent {agent_name} not found")
-            return
-        
-        if _target_agent is not None and verbose:
-            print(f"Found target agent, name: {agent_name}, id: {_target_agent['agentId']}")
-
-        # Delete the agent aliases
-        if _target_agent is not None:
-            _agent_id = _target_agent["agentId"]
-
-            if verbose:
-                print(f"Deleting aliases for agent {_agent_id}...")
+            verbose (bool, optional): print every deletion. Defaults to False.
 
-            try:
-                _agent_aliases = self._bedrock_agent_client.list_agent_aliases(
-                    agentId=_agent_id,
-                    maxResults=100
-                )
-                for alias in _agent_aliases['agentAliasSummaries']:
-                    alias_id = alias['agentAliasId']
-                    print(f'Deleting alias {alias_id} from agent {_agent_id}')
-                    response = self._bedrock_agent_client.delete_agent_alias(
-                        agentAliasId=alias_id,
-                        agentId=_agent_id
-                    )
-            except Exception as e:
-                print(f"Error deleting aliases: {e}")
-                pass
-
-        # if the agent exists, delete the agent
-        if _target_agent is not None:
-            _agent_id = _target_agent['agentId']
-
-            if verbose:
-                print(f"Deleting agent: {_agent_id}...")
-            time.sleep(5)
-            self._bedrock_agent_client.delete_agent(
-                agentId=_agent_id
-                )
-            time.sleep(5)
-            
-        # TODO: add delete_lambda_flag parameter to optionall take care of
-        # deleting the lambda function associated with the agent.
+        Returns:
+            List[TeardownResult]: outcome of every step, empty if the agent does not exist
 
-        # delete Agent IAM role if desired
-        if delete_role_flag:
-            _agent_role_name = f'AmazonBedrockExecutionRoleForAgents_{agent_name}'
-            if verbose:
-                print(f"Deleting IAM role: {_agent_role_name}...")
+        Raises:
+            TeardownFailed: if the agent, one of its aliases or its role could not be deleted
+        """
 
-            try:
-                self._iam_client.delete_role_policy(
-                    PolicyName="bedrock_gr_allow_policy", 
-                    RoleName=_agent_role_name
+        if self._agent_registry.get(agent_name) is None:
+            print(f"Agent {agent_name} not found")
+            return []
+
+        return self.delete_agents([agent_name], delete_role_flag=delete_role_flag, verbose=verbose)
+
+    def _list_all(self, method, key: str, **kwargs) -> List[Dict[str, Any]]:
+        _items = []
+        _kwargs = dict(kwargs, maxResults=100)
+        while True:
+            _resp = method(**_kwargs)
+            _items.extend(_resp.get(key, []))
+            if not _resp.get("nextToken"):
+                return _items
+            _kwargs["nextToken"] = _resp["nextToken"]
+
+    def _read_agent_for_teardown(self, agent_name: str, delete_lambdas: bool) -> Dict[str, Any]:
+        # everything an agent's teardown steps need, read before any deletion starts
+        _agent_id = self._agent_registry.agent_id(agent_name)
+        _found = {"agent_name": agent_name, "agent_id": _agent_id, "aliases": [], "sub_agent_aliases": [], "lambdas": []}
+        if _agent_id is None:
+            return _found
+        _found["aliases"] = [
+            _alias["agentAliasId"] for _alias in self._list_all(
+                self._bedrock_agent_client.list_agent_aliases, "agentAliasSummaries", agentId=_agent_id
+            )
+        ]
+        try:
+            # aliases of sub-agents can only be deleted once no supervisor refers to them
+            _found["sub_agent_aliases"] = [
+                _collaborator["agentDescriptor"]["aliasArn"].split("/", 1)[1]
+                for _collaborator in self._list_all(
+                    self._bedrock_agent_client.list_agent_collaborators, "agentCollaboratorSummaries",
+                    agentId=_agent_id, agentVersion="DRAFT",
                 )
-            except Exception as e:
-                pass
+            ]
+        except Exception:
+            # agents without collaboration enabled
+            pass
+        if delete_lambdas:
+            for _summary in self._list_all(
+                    self._bedrock_agent_client.list_agent_action_groups, "actionGroupSummaries",
+                    agentId=_agent_id, agentVersion="DRAFT",
+            ):
+                _action_group = self._bedrock_agent_client.get_agent_action_group(
+                    agentId=_agent_id, agentVersion="DRAFT", actionGroupId=_summary["actionGroupId"]
+                )["agentActionGroup"]
+                _lambda_arn = (_action_group.get("actionGroupExecutor") or {}).get("lambda")
+                if _lambda_arn:
+                    _found["lambdas"].append(_lambda_arn.split(":function:")[1].split(":")[0])
+        return _found
+
+    def plan_agents_teardown(
+            self,
+            agent_names: List[str],
+            delete_role_flag: bool = True,
+            delete_lambdas: bool = False,
+            plan: TeardownPlan = None,
+            max_workers: int = 8,
+    ) -> TeardownPlan:
+        """Adds the deletion of agents and everything that depends on them to a teardown plan.
+
+        Aliases are deleted before their agent, a supervisor before the aliases of its
+        sub-agents, and each agent before its role and action group Lambdas. Agents that do
+        not depend on each other are deleted in parallel.
 
-            try:
-                self._iam_client.delete_role_policy(
-                    PolicyName="bedrock_allow_policy", 
-                    RoleName=_agent_role_name
-                )
-            except Exception as e:
-                pass
+        Args:
+            agent_names (List[str]): names of the agents to delete
+            delete_role_flag (bool, optional): also delete each agent's own IAM role. Defaults to True.
+            delete_lambdas (bool, optional): also delete the action group Lambdas and their roles. Defaults to False.
+            plan (TeardownPlan, optional): plan to add to, e.g. one that also deletes knowledge bases. Defaults to a new plan.
+            max_workers (int, optional): agents read concurrently while planning. Defaults to 8.
 
-            try:
-                self._iam_client.delete_role_policy(
-                    PolicyName="bedrock_kb_allow_policy", 
-                    RoleName=_agent_role_name
-                )
-            except Exception as e:
-                pass
+        Returns:
+            TeardownPlan: the plan, to run with plan.run()
+        """
+        _plan = plan if plan is not None else TeardownPlan()
+        _names = list(dict.fromkeys(agent_names))
+        if not _names:
+            return _plan
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(_names)))) as _executor:
+            _agents = list(_executor.map(lambda name: self._read_agent_for_teardown(name, delete_lambdas), _names))
+
+        _supervisors_of = {}
+        for _agent in _agents:
+            for _sub_agent_alias in _agent["sub_agent_aliases"]:
+                _supervisors_of.setdefault(_sub_agent_alias, []).append(f"agent:{_agent['agent_id']}")
+
+        for _agent in _agents:
+            _agent_id = _agent["agent_id"]
+            if _agent_id is None:
+                continue
+            _aliases = []
+            for _alias_id in _agent["aliases"]:
+                _aliases.append(_plan.add(
+                    f"alias:{_agent_id}/{_alias_id}",
+                    lambda _alias_id=_alias_id, _agent_id=_agent_id: self._bedrock_agent_client.delete_agent_alias(
+                        agentId=_agent_id, agentAliasId=_alias_id
+                    ),
+                    after=_supervisors_of.get(f"{_agent_id}/{_alias_id}", []),
+                    gone=lambda _alias_id=_alias_id, _agent_id=_agent_id: self._agent_alias_status(
+                        _agent_id, _alias_id
+                    ) == "DELETED",
+                ))
+
+            def _delete_agent(_agent_id=_agent_id, _agent_name=_agent["agent_name"]):
+                # an agent in a transitional status cannot be deleted yet
+                self.wait_agent_status_update(_agent_id, verbose=False, baseline=5)
+                self._bedrock_agent_client.delete_agent(agentId=_agent_id)
+                self._agent_registry.remove(_agent_name)
+                self.invalidate_latest_alias_id(_agent_id)
+                self.invalidate_agent_descriptor(_agent_id)
+
+            _agent_step = _plan.add(
+                f"agent:{_agent_id}",
+                _delete_agent,
+                after=_aliases,
+                gone=lambda _agent_id=_agent_id: self._agent_status(_agent_id) == "DELETED",
+            )
+            for _function_name in _agent["lambdas"]:
+                self._add_lambda_teardown(_plan, _function_name, delete_role_flag=True, after=[_agent_step])
+            if delete_role_flag:
+                _agent_role_name = f"AmazonBedrockExecutionRoleForAgents_{_agent['agent_name']}"
+                self._roles.forget(_agent_role_name)
+                add_role_steps(_plan, self._iam_client, _agent_role_name, after=[_agent_step])
+        return _plan
+
+    def delete_agents(
+            self,
+            agent_names: List[str],
+            delete_role_flag: bool = True,
+            delete_lambdas: bool = False,
+            max_workers: int = 8,
+            verbose: bool = False,
+            raise_on_failure: bool = True,
+    ) -> List[TeardownResult]:
+        """Deletes several agents, with independent deletions running in parallel. See plan_agents_teardown().
 
-            try:
-                self._iam_client.delete_role(
-                    RoleName=_agent_role_name
-                )
-            except Exception as e:
-                pass
+        Args:
+            agent_names (List[str]): names of the agents to delete
+            delete_role_flag (bool, optional): also delete each agent's own IAM role. Defaults to True.
+            delete_lambdas (bool, optional): also delete the action group Lambdas and their roles. Defaults to False.
+            max_workers (int, optional): maximum concurrent deletions. Defaults to 8.
+            verbose (bool, optional): print every deletion. Defaults to False.
+            raise_on_failure (bool, optional): raise TeardownFailed if a step failed, once every other
+                step has run. Defaults to True; with False, failures are printed and returned.
 
+        Returns:
+            List[TeardownResult]: outcome of every step
 
-        return
+        Raises:
+            TeardownFailed: if a step failed and raise_on_failure is True
+        """
+        _plan = self.plan_agents_teardown(
+            agent_names, delete_role_flag, delete_lambdas, plan=TeardownPlan(verbose=verbose), max_workers=max_workers
+        )
+        _results = _plan.run(max_workers=max_workers)
+        if raise_on_failure:
+            return raise_for_failures(_results)
+        if not verbose:
+            for _result in _results:
+                if _result.status == "failed":
+                    print(f"Failed to delete {_result.key}: {_result.error}")
+        return _results
 
     def _create_agent_role(
             self,
@@ -749,81 +864,27 @@ class AgentsForAmazonBedrock:
         if verbose:
             print(f"Creating IAM role for agent: {agent_name}")
 
+        # the roles are ensured rather than created: an existing role is reused and only the parts that
+        # differ are updated. There is no wait for propagation, create_agent retries until Bedrock accepts the role.
         if reuse_default:
-            _agent_role_name = DEFAULT_AGENT_IAM_ROLE_NAME
-
-            # try creating the default role, which may already exist
-            try:
-                # create the default role w/ the proper assume role policy
-                _assume_role_policy_document_json = DEFAULT_AGENT_IAM_ASSUME_ROLE_POLICY
-                _assume_role_policy_document = json.dumps(
-                    _assume_role_policy_document_json
-                )
-
-                _bedrock_agent_bedrock_allow_policy_document_json = (
-                    DEFAULT_AGENT_IAM_POLICY
-                )
-                _bedrock_agent_bedrock_allow_policy_document = json.dumps(
-                    _bedrock_agent_bedrock_allow_policy_document_json
-                )
-
-                _agent_role = self._iam_client.create_role(
-                    RoleName=_agent_role_name,
-                    AssumeRolePolicyDocument=_assume_role_policy_document,
-                )
-            except Exception as e:
-                if verbose:
-                    print(
-                        f"Caught exc when creating default role for role: {_agent_role_name}: {e}"
-                    )
-                    print(f"using assume role json: {_assume_role_policy_document}")
-            else:
-                self._iam_client.put_role_policy(
-                    PolicyDocument=_bedrock_agent_bedrock_allow_policy_document,
-                    PolicyName="bedrock_allow_policy",
-                    RoleName=_agent_role_name,
-                )
-
-            return f"arn:aws:iam::{self._account_id}:role/{DEFAULT_AGENT_IAM_ROLE_NAME}"
+            # every agent shares this role, so after the first agent it is served from the provisioner cache
+            _agent_role = self._roles.ensure_role(
+                DEFAULT_AGENT_IAM_ROLE_NAME,
+                DEFAULT_AGENT_IAM_ASSUME_ROLE_POLICY,
+                inline_policies={"bedrock_allow_policy": DEFAULT_AGENT_IAM_POLICY},
+                wait=False,
+            )
+            return _agent_role["Arn"]
 
         else:
             _agent_role_name = f"AmazonBedrockExecutionRoleForAgents_{agent_name}"
             # _tmp_resources = [f"arn:aws:bedrock:{self._region}::foundation-model/{_model}" for _model in agent_foundation_models]
 
-            # Create IAM policies for agent
-            _assume_role_policy_document = DEFAULT_AGENT_IAM_ASSUME_ROLE_POLICY
-            _assume_role_policy_document_json = json.dumps(_assume_role_policy_document)
-
-            _agent_role = self._iam_client.create_role(
-                RoleName=_agent_role_name,
-                AssumeRolePolicyDocument=_assume_role_policy_document_json,
-            )
-
-            # Pause to make sure role is created
-            time.sleep(10)
-
-            if verbose:
-                print(
-                    f"Role {_agent_role_name} created. ARN: {_agent_role['Role']['Arn']}"
-                )
-                print(
-                    f"Adding bedrock_allow_policy to role {_agent_role_name}\n{_bedrock_policy_json}..."
-                )
-
-            _bedrock_agent_bedrock_allow_policy_statement = DEFAULT_AGENT_IAM_POLICY
-            _bedrock_policy_json = json.dumps(
-                _bedrock_agent_bedrock_allow_policy_statement
-            )
-
-            self._iam_client.put_role_policy(
-                PolicyDocument=_bedrock_policy_json,
-                PolicyName="bedrock_allow_policy",
-                RoleName=_agent_role_name,
-            )
+            _inline_policies = {"bedrock_allow_policy": DEFAULT_AGENT_IAM_POLICY}
 
             # add Knowledge Base retrieve and retrieve and generate permissions if agent has KB attached to it
             if kb_arns is not None:
-                _kb_policy_doc = {
+                _inline_policies["bedrock_kb_allow_policy"] = {
                     "Version": "2012-10-17",
                     "Statement": [
                         {
@@ -837,15 +898,23 @@ class AgentsForAmazonBedrock:
                         }
                     ],
                 }
-                _kb_policy_json = json.dumps(_kb_policy_doc)
-                self._iam_client.put_role_policy(
-                    PolicyDocument=_kb_policy_json,
-                    PolicyName="bedrock_kb_allow_policy",
-                    RoleName=_agent_role_name,
+
+            if verbose:
+                print(
+                    f"Adding {', '.join(_inline_policies)} to role {_agent_role_name}..."
                 )
 
-                # Pause to make sure role is updated
-                time.sleep(10)
+            _agent_role = self._roles.ensure_role(
+                _agent_role_name,
+                DEFAULT_AGENT_IAM_ASSUME_ROLE_POLICY,
+                inline_policies=_inline_policies,
+                wait=False,
+            )
+
+            if verbose:
+                print(
+                    f"Role {_agent_role_name} ready. ARN: {_agent_role['Arn']}"
+                )
 
             # TODO: scope down GR access to a single GR passed as param
             # # Support Guardrail access
@@ -869,52 +938,102 @@ class AgentsForAmazonBedrock:
             #     RoleName=_agent_role_name
             # )
 
-            return _agent_role["Role"]["Arn"]
+            return _agent_role["Arn"]
 
-    def wait_agent_status_update(self, agent_id):
-        response = self._bedrock_agent_client.get_agent(agentId=agent_id)
-        agent_status = response["agent"]["agentStatus"]
-        _waited_at_least_once = False
-        while agent_status.endswith("ING"):
-            print(f"Waiting for agent status to change. Current status {agent_status}")
-            time.sleep(5)
-            _waited_at_least_once = True
-            try:
-                response = self._bedrock_agent_client.get_agent(agentId=agent_id)
-                agent_status = response["agent"]["agentStatus"]
-            except self._bedrock_agent_client.exceptions.ResourceNotFoundException:
-                agent_status = "DELETED"
-        if _waited_at_least_once:
-            print(f"Agent id {agent_id} current status: {agent_status}")
+    def _agent_status(self, agent_id: str) -> str:
+        try:
+            return self._bedrock_agent_client.get_agent(agentId=agent_id)["agent"]["agentStatus"]
+        except self._bedrock_agent_client.exceptions.ResourceNotFoundException:
+            return "DELETED"
+
+    def _agent_alias_status(self, agent_id: str, agent_alias_id: str) -> str:
+        try:
+            return self._bedrock_agent_client.get_agent_alias(
+                agentId=agent_id, agentAliasId=agent_alias_id
+            )["agentAlias"]["agentAliasStatus"]
+        except self._bedrock_agent_client.exceptions.ResourceNotFoundException:
+            return "DELETED"
+
+    def wait_agent_status_update(self, agent_id, verbose=True, baseline=None):
+        """Waits, with exponential backoff, until an agent is no longer in a transitional (*ING) status.
+
+        Args:
+            agent_id (str): Id of the agent
+            verbose (bool, optional): print status changes. Defaults to True.
+            baseline (float, optional): fixed sleep this wait replaces, for waiter_stats. Defaults to
+            the 5 second poll loop this method used to run.
+
+        Returns:
+            str: the agent status, or "DELETED" if the agent no longer exists
+        """
+        _last_status = [None]
+
+        def _on_poll(status):
+            if verbose and status != _last_status[0]:
+                print(f"Waiting for agent status to change. Current status {status}")
+                _last_status[0] = status
+
+        _result = wait_until(
+            lambda: self._agent_status(agent_id),
+            ready=lambda status: not status.endswith("ING"),
+            name=f"agent {agent_id}",
+            baseline=baseline,
+            poll_interval=None if baseline is not None else 5,
+            on_poll=_on_poll,
+        )
+        if verbose and _result.polls > 1:
+            print(f"Agent id {agent_id} current status: {_result.value}")
+        return _result.value
+
+    def wait_agents_status_update(self, agent_ids: List[str], max_workers: int = 8) -> Dict[str, str]:
+        """Waits for several agents concurrently, see wait_agent_status_update().
+
+        Returns:
+            Dict[str, str]: final status per agent ID
+        """
+        _results = wait_all(
+            [functools.partial(self.wait_agent_status_update, _agent_id, False) for _agent_id in agent_ids],
+            max_workers=max_workers,
+        )
+        return dict(zip(agent_ids, _results))
 
     def wait_agent_alias_status_update(self, agent_id, agent_alias_id, verbose=False):
-        response = self._bedrock_agent_client.get_agent_alias(
-            agentId=agent_id, agentAliasId=agent_alias_id
+        """Waits, with exponential backoff, until an agent alias is no longer in a transitional (*ING) status.
+
+        Returns:
+            str: the alias status, or "DELETED" if the alias no longer exists
+        """
+        _result = wait_until(
+            lambda: self._agent_alias_status(agent_id, agent_alias_id),
+            ready=lambda status: not status.endswith("ING"),
+            name=f"agent {agent_id} alias {agent_alias_id}",
+            poll_interval=5,
+            on_poll=(lambda status: print(f"Waiting for agent ALIAS status to change. Current status {status}"))
+            if verbose else None,
         )
-        agent_alias_status = response["agentAlias"]["agentAliasStatus"]
-        while agent_alias_status.endswith("ING"):
-            if verbose:
-                print(
-                    f"Waiting for agent ALIAS status to change. Current status {agent_alias_status}"
-                )
-            time.sleep(5)
-            try:
-                response = self._bedrock_agent_client.get_agent_alias(
-                    agentId=agent_id, agentAliasId=agent_alias_id
-                )
-                agent_alias_status = response["agentAlias"]["agentAliasStatus"]
-            except self._bedrock_agent_client.exceptions.ResourceNotFoundException:
-                agent_status = "DELETED"
         if verbose:
             print(
-                f"Agent id {agent_id}, Alias {agent_alias_id} current status: {agent_alias_status}"
+                f"Agent id {agent_id}, Alias {agent_alias_id} current status: {_result.value}"
             )
+        return _result.value
+
+    def associate_sub_agents(self, supervisor_agent_id, sub_agents_list, batched: bool = True):
+        """Associates collaborator agents with a supervisor agent, prepares the supervisor
+        and creates its "multi-agent" alias.
 
-    def associate_sub_agents(self, supervisor_agent_id, sub_agents_list):
+        Args:
+            supervisor_agent_id (str): id of the supervisor agent
+            sub_agents_list (List[dict]): collaborators, as returned by build_sub_agent_list() or create_sub_agents()
+            batched (bool, optional): associate every collaborator and then prepare the supervisor once,
+            instead of preparing it after each association. Defaults to True.
+
+        Returns:
+            Tuple[str, str]: alias id and alias ARN of the supervisor agent
+        """
+        self.wait_agent_status_update(
+            supervisor_agent_id
+        )  # Be sure agent is not still in CREATING state
         for sub_agent in sub_agents_list:
-            self.wait_agent_status_update(
-                supervisor_agent_id
-            )  # Be sure agent is not still in CREATING state
             association_response = (
                 self._bedrock_agent_client.associate_agent_collaborator(
                     agentId=supervisor_agent_id,
@@ -925,28 +1044,96 @@ class AgentsForAmazonBedrock:
                     relayConversationHistory=sub_agent["relay_conversation_history"],
                 )
             )
+            if not batched:
+                self.wait_agent_status_update(supervisor_agent_id)
+                self._bedrock_agent_client.prepare_agent(agentId=supervisor_agent_id)
+                self.wait_agent_status_update(supervisor_agent_id)
+
+        if batched:
+            # associations only change the DRAFT version, a single prepare picks all of them up
             self.wait_agent_status_update(supervisor_agent_id)
             self._bedrock_agent_client.prepare_agent(agentId=supervisor_agent_id)
             self.wait_agent_status_update(supervisor_agent_id)
 
+        self.invalidate_agent_descriptor(supervisor_agent_id)
         supervisor_agent_alias = self._bedrock_agent_client.create_agent_alias(
             agentAliasName="multi-agent", agentId=supervisor_agent_id
         )
+        self.invalidate_latest_alias_id(supervisor_agent_id)
         supervisor_agent_alias_id = supervisor_agent_alias["agentAlias"]["agentAliasId"]
         supervisor_agent_alias_arn = supervisor_agent_alias["agentAlias"][
             "agentAliasArn"
         ]
         return supervisor_agent_alias_id, supervisor_agent_alias_arn
 
+    def _create_sub_agent(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        _spec = dict(spec)
+        _alias_name = _spec.pop("alias_name", "v1")
+        _max_tokens = _spec.pop("max_tokens", None)
+        _association_name = _spec.pop("association_name", _spec["agent_name"])
+        _collaboration_instruction = _spec.pop("collaboration_instruction", _spec["agent_description"])
+        _relay_conversation_history = _spec.pop("relay_conversation_history", "DISABLED")
+
+        _agent_id, _, _, _role_arn = self.create_agent(**_spec)
+        if _max_tokens is not None:
+            self.wait_agent_status_update(_agent_id, verbose=False)
+            self.update_agent_max_tokens(_agent_id, max_tokens=_max_tokens)
+        self.wait_agent_status_update(_agent_id, verbose=False)
+        self._bedrock_agent_client.prepare_agent(agentId=_agent_id)
+        self.invalidate_agent_descriptor(_agent_id)
+        self.wait_agent_status_update(_agent_id, verbose=False)
+        _alias_id, _alias_arn = self.create_agent_alias(_agent_id, _alias_name)
+        self.wait_agent_alias_status_update(_agent_id, _alias_id)
+
+        return {
+            "agent_name": _spec["agent_name"],
+            "agent_id": _agent_id,
+            "agent_alias_id": _alias_id,
+            "agent_role_arn": _role_arn,
+            "sub_agent_alias_arn": _alias_arn,
+            "sub_agent_instruction": _collaboration_instruction,
+            "sub_agent_association_name": _association_name,
+            "relay_conversation_history": _relay_conversation_history,
+        }
+
+    def create_sub_agents(self, specs: List[Dict[str, Any]], max_workers: int = 8) -> List[Dict[str, Any]]:
+        """Creates, prepares and aliases several collaborator agents concurrently.
+
+        Each spec holds the create_agent() arguments of one agent, plus these optional keys:
+        alias_name (default "v1"), max_tokens (see update_agent_max_tokens()), association_name
+        (default the agent name), collaboration_instruction (default the agent description) and
+        relay_conversation_history (default "DISABLED").
+
+            >>> sub_agents = agents.create_sub_agents([
+            ...     {"agent_name": "research_agent", "agent_description": "...", "agent_instructions": "...",
+            ...      "model_ids": [model_id], "association_name": "researchAgent"},
+            ...     {"agent_name": "article_generation_agent", ..., "max_tokens": 4096},
+            ... ])
+            >>> agents.associate_sub_agents(supervisor_agent_id, sub_agents)
+
+        Args:
+            specs (List[dict]): one spec per agent
+            max_workers (int, optional): maximum agents created at the same time. Defaults to 8.
+
+        Returns:
+            List[dict]: per spec, in order, the agent id, alias id and role ARN, together with the
+            sub_agent_* keys associate_sub_agents() expects
+        """
+        if not specs:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(specs))) as _executor:
+            _futures = [_executor.submit(self._create_sub_agent, _spec) for _spec in specs]
+        _errors = [_f.exception() for _f in _futures if _f.exception() is not None]
+        if _errors:
+            raise _errors[0]
+        return [_f.result() for _f in _futures]
 
     def build_sub_agent_list(self, sub_agent_names: List[str]) -> List:
         _sub_agent_list = []
 
         for _agent_name in sub_agent_names:
             _agent_id = self.get_agent_id_by_name(_agent_name)
-            _agent_details = self._bedrock_agent_client.get_agent(agentId=_agent_id)[
-                "agent"
-            ]
+            _agent_details = self.get_agent_descriptor(_agent_id)
 
             _sub_agent_list.append(
                 {
@@ -1002,11 +1189,6 @@ class AgentsForAmazonBedrock:
             print(f"Created agent IAM role: {_role_arn}...")
             print(f"Creating agent: {agent_name} with model: {_model_id}...")
 
-        _num_tries = 0
-        _agent_created = False
-        _create_agent_response = None
-        _agent_id = None
-
         _kwargs = {}
 
         if routing_classifier_model is not None:
@@ -1024,42 +1206,38 @@ class AgentsForAmazonBedrock:
                 "guardrailIdentifier": guardrail_id,
                 "guardrailVersion": "DRAFT"}
             
-        while not _agent_created and _num_tries <= 2:
-            try:
-                if verbose:
-                    print(f"kwargs: {_kwargs}")
-                _create_agent_response = self._bedrock_agent_client.create_agent(
-                    agentName=agent_name,
-                    agentResourceRoleArn=_role_arn,
-                    description=agent_description.replace(
-                        "\n", ""
-                    ),  # console doesn't like newlines for subsequent editing
-                    idleSessionTTLInSeconds=1800,
-                    foundationModel=_model_id,
-                    instruction=agent_instructions,
-                    agentCollaboration=agent_collaboration,
-                    **_kwargs,
-                )
-                _agent_id = _create_agent_response["agent"]["agentId"]
-                if verbose:
-                    print(f"Created agent, resulting id: {_agent_id}")
-                    _get_resp = self._bedrock_agent_client.get_agent(agentId=_agent_id)
-                    print(_get_resp)
-                _agent_created = True
-
-            except Exception as e:
-                if verbose:
-                    print(
-                        f"Error creating agent: {e}\n. Retrying in case it was just waiting to be deleted."
-                    )
-                _num_tries += 1
-                if _num_tries <= 2:
-                    time.sleep(4)
-                    pass
-                else:
-                    if verbose:
-                        print(f"Giving up on agent creation after 2 tries.")
-                    raise e
+        def _create_agent():
+            if verbose:
+                print(f"kwargs: {_kwargs}")
+            return self._bedrock_agent_client.create_agent(
+                agentName=agent_name,
+                agentResourceRoleArn=_role_arn,
+                description=agent_description.replace(
+                    "\n", ""
+                ),  # console doesn't like newlines for subsequent editing
+                idleSessionTTLInSeconds=DEFAULT_IDLE_SESSION_TTL,
+                foundationModel=_model_id,
+                instruction=agent_instructions,
+                agentCollaboration=agent_collaboration,
+                **_kwargs,
+            )
+
+        def _retryable(e: Exception) -> bool:
+            # a new role may not have propagated yet, or an agent of the same name may still be deleting
+            _retry = is_role_propagation_error(e) or is_agent_deletion_pending_error(e)
+            if verbose and _retry:
+                print(f"Error creating agent: {e}\n. Retrying while the role or a deletion is still settling.")
+            return _retry
+
+        _create_agent_response = retry_call(
+            _create_agent, retry_if=_retryable, name=f"create agent {agent_name}", timeout=60, baseline=0.0
+        )
+        _agent_id = _create_agent_response["agent"]["agentId"]
+        self._agent_registry.put(_create_agent_response["agent"])
+        if verbose:
+            print(f"Created agent, resulting id: {_agent_id}")
+            _get_resp = self._bedrock_agent_client.get_agent(agentId=_agent_id)
+            print(_get_resp)
 
         if code_interpretation:
             # possible time.sleep(15) needed here
@@ -1080,7 +1258,9 @@ class AgentsForAmazonBedrock:
         _resp = self._bedrock_agent_client.prepare_agent(
                agentId=_agent_id
             )
-        time.sleep(5) # make sure agent is ready to be invoked as soon as we return
+        self.invalidate_agent_descriptor(_agent_id)
+        # make sure agent is ready to be invoked as soon as we return
+        self.wait_agent_status_update(_agent_id, verbose=False, baseline=5)
         return
     
     def create_agent_alias(self, agent_id: str, alias_name: str) -> Tuple[str, str]:
@@ -1094,6 +1274,7 @@ class AgentsForAmazonBedrock:
         agent_alias = self._bedrock_agent_client.create_agent_alias(
             agentAliasName=alias_name, agentId=agent_id
         )
+        self.invalidate_latest_alias_id(agent_id)
         agent_alias_id = agent_alias["agentAlias"]["agentAliasId"]
         agent_alias_arn = agent_alias["agentAlias"]["agentAliasArn"]
         return agent_alias_id, agent_alias_arn
@@ -1121,7 +1302,9 @@ class AgentsForAmazonBedrock:
         # check the response and if successful, prepare the agent
         if _agent_action_group_resp["ResponseMetadata"]["HTTPStatusCode"] == 200:
             _resp = self._bedrock_agent_client.prepare_agent(agentId=_agent_id)
-            time.sleep(5)  # make sure agent is ready to be invoked as soon as we return
+            self.invalidate_agent_descriptor(_agent_id)
+            # make sure agent is ready to be invoked as soon as we return
+            self.wait_agent_status_update(_agent_id, verbose=False, baseline=5)
         else:
             print(f"Error adding code interpreter to agent: {_agent_action_group_resp}")
         return
@@ -1188,7 +1371,9 @@ class AgentsForAmazonBedrock:
         # check the response and if successful, prepare the agent
         if _agent_action_group_resp["ResponseMetadata"]["HTTPStatusCode"] == 200:
             _resp = self._bedrock_agent_client.prepare_agent(agentId=_agent_id)
-            time.sleep(5)  # make sure agent is ready to be invoked as soon as we return
+            self.invalidate_agent_descriptor(_agent_id)
+            # make sure agent is ready to be invoked as soon as we return
+            self.wait_agent_status_update(_agent_id, verbose=False, baseline=5)
         else:
             print(f"Error adding code interpreter to agent: {_agent_action_group_resp}")
         return
@@ -1209,6 +1394,8 @@ class AgentsForAmazonBedrock:
             agent_action_group_name (str): name of the agent action group
             agent_action_group_description (str, Optional): description of the agent action group
         """
+        # an agent that is still being created cannot take action groups yet
+        self.wait_agent_status_update(agent_id, verbose=False)
 
         _agent_action_group_resp = self._bedrock_agent_client.create_agent_action_group(
             agentId=agent_id,
@@ -1219,7 +1406,9 @@ class AgentsForAmazonBedrock:
             description=agent_action_group_description,
         )
         _resp = self._bedrock_agent_client.prepare_agent(agentId=agent_id)
-        time.sleep(5)  # make sure agent is ready to be invoked as soon as we return
+        self.invalidate_agent_descriptor(agent_id)
+        # make sure agent is ready to be invoked as soon as we return
+        self.wait_agent_status_update(agent_id, verbose=False, baseline=5)
         return
 
     def get_function_defs(self, agent_name: str) -> List[dict]:
@@ -1292,9 +1481,7 @@ class AgentsForAmazonBedrock:
 
         for _agent_name in sub_agent_names:
             _agent_id = self.get_agent_id_by_name(_agent_name)
-            _agent_details = self._bedrock_agent_client.get_agent(agentId=_agent_id)[
-                "agent"
-            ]
+            _agent_details = self.get_agent_descriptor(_agent_id)
             _sub_agent_arns.append(_agent_details["agentArn"])
             if "instruction" in _agent_details:
                 _instruction = _agent_details["instruction"]
@@ -1337,15 +1524,16 @@ class AgentsForAmazonBedrock:
                 supervisor_agent_name, model_ids
             )
 
-        time.sleep(20)
+        # no pause for the role to propagate: create_agent is retried until Bedrock accepts it
+        record_skipped_sleep(f"supervisor role {supervisor_agent_name}", 20)
 
-        _response = self._bedrock_agent_client.create_agent(
+        _response = retry_call(lambda: self._bedrock_agent_client.create_agent(
             agentName=supervisor_agent_name,
             agentResourceRoleArn=_supervisor_role_arn,
             description=supervisor_description.replace(
                 "\n", ""
             ),  # console doesn't like newlines for subsequent editing
-            idleSessionTTLInSeconds=1800,
+            idleSessionTTLInSeconds=DEFAULT_IDLE_SESSION_TTL,
             foundationModel=model_ids[0],
             promptOverrideConfiguration={
                 "promptConfigurations": [
@@ -1359,10 +1547,11 @@ class AgentsForAmazonBedrock:
                 ]
             },
             instruction=supervisor_instructions,
-        )
+        ), retry_if=is_role_propagation_error, name=f"create agent {supervisor_agent_name}", baseline=0.0)
         _supervisor_agent_arn = _response["agent"]["agentArn"]
         _supervisor_agent_id = _response["agent"]["agentId"]
-        time.sleep(15)
+        self._agent_registry.put(_response["agent"])
+        self.wait_agent_status_update(_supervisor_agent_id, verbose=False, baseline=15)
 
         # Associate the KB with the supervisor agent
         if kb_arn is not None:
@@ -1383,411 +1572,382 @@ class AgentsForAmazonBedrock:
         return _function_defs, _supervisor_agent_arn
 
     def _make_fully_cited_answer(
-            self, orig_agent_answer, event, enable_trace=False, trace_level="none"
+            self, orig_agent_answer, event, enable_trace=False, trace_level="none", assembler=None
     ):
-        _citations = event.get("chunk", {}).get("attribution", {}).get("citations", [])
-        if _citations:
-            if enable_trace:
-                print(
-                    f"got {len(event['chunk']['attribution']['citations'])} citations \n"
-                )
-        else:
-            return orig_agent_answer
+        """Inserts numbered citation markers into one answer chunk.
 
-        # remove <sources> tags to work around a bug
-        _pattern = r"\n\n<sources>\n\d+\n</sources>\n\n"
-        _cleaned_text = re.sub(_pattern, "", orig_agent_answer)
-        _pattern = "<sources><REDACTED></sources>"
-        _cleaned_text = re.sub(_pattern, "", _cleaned_text)
-        _pattern = "<sources></sources>"
-        _cleaned_text = re.sub(_pattern, "", _cleaned_text)
-
-        _fully_cited_answer = ""
-        _curr_citation_idx = 0
+        Args:
+            orig_agent_answer (str): chunk text
+            event (Dict): raw 'chunk' event carrying the attribution citations
+            enable_trace (bool, optional): print citation details. Defaults to False.
+            trace_level (str, optional): "all" also prints every citation. Defaults to "none".
+            assembler (CitationAssembler, optional): assembler shared by the chunks of one answer;
+                when omitted, the returned text ends with its own source list. Defaults to None.
 
-        for _citation in _citations:
-            if enable_trace and trace_level == "all":
-                print(f"full citation: {_citation}")
-
-            _start = _citation["generatedResponsePart"]["textResponsePart"]["span"][
-                         "start"
-                     ] - (
-                             _curr_citation_idx + 1
-                     )  # +1
-            _end = (
-                    _citation["generatedResponsePart"]["textResponsePart"]["span"]["end"]
-                    - (_curr_citation_idx + 2)
-                    + 4
-            )  # +2
-            _refs = _citation.get("retrievedReferences", [])
-            if len(_refs) > 0:
-                _ref_url = (
-                    _refs[0].get("location", {}).get("s3Location", {}).get("uri", "")
-                )
-            else:
-                _ref_url = ""
-                _fully_cited_answer = _cleaned_text
-                break
+        Returns:
+            str: the cited chunk
+        """
+        _citations = event.get("chunk", {}).get("attribution", {}).get("citations", [])
+        if enable_trace and _citations:
+            print(f"got {len(_citations)} citations \n")
+            if trace_level == "all":
+                for _idx, _citation in enumerate(_citations):
+                    _span = _citation["generatedResponsePart"]["textResponsePart"]["span"]
+                    print(f"\n\ncitation {_idx + 1}:")
+                    print(f"full citation: {_citation}")
+                    print(f"citation span... start: {_span['start']}, end: {_span['end']}")
+                    print(f"citation based on span:====\n{orig_agent_answer[_span['start']:_span['end'] + 1]}\n====")
+                    print(f"citation urls: {[reference_uri(_r) for _r in _citation.get('retrievedReferences', [])]}\n============")
+
+        if assembler is not None:
+            return assembler.add(orig_agent_answer, _citations)
+        _assembler = CitationAssembler()
+        _assembler.add(orig_agent_answer, _citations)
+        _fully_cited_answer = _assembler.answer()
+        if enable_trace and trace_level == "all" and _citations:
+            print(
+                f"\nfully cited answer:*************\n{_fully_cited_answer}\n*************"
+            )
+        return _fully_cited_answer
 
-            _fully_cited_answer += _cleaned_text[_start:_end] + " [" + _ref_url + "] "
+    def invoke_stream(
+            self,
+            input_text: str,
+            agent_id: str,
+            agent_alias_id: str = DEFAULT_ALIAS,
+            session_id: str = None,
+            session_state: dict = {},
+            enable_trace: bool = False,
+            end_session: bool = False,
+    ) -> Iterator[Any]:
+        """Invokes an agent and yields typed events as they arrive on the completion stream,
+        rather than waiting for the whole answer. The first event is always a StreamStart
+        carrying the API response metadata; if the call was not successful the stream ends there.
 
-            if _curr_citation_idx == 0:
-                _answer_prefix = _cleaned_text[:_start]
-                _fully_cited_answer = _answer_prefix + _fully_cited_answer
+        Args:
+            input_text (str): The text to be processed by the agent.
+            agent_id (str): The ID of the agent to invoke.
+            agent_alias_id (str, optional): The alias ID of the agent to invoke. Defaults to DEFAULT_ALIAS.
+            session_id (str, optional): The ID of the session. Defaults to a new UUID for every call; use
+            SessionPool to manage multi-turn conversations.
+            session_state (dict, optional): The state of the session. Defaults to an empty dict.
+            enable_trace (bool, optional): Whether to ask the service for trace events. Defaults to False.
+            end_session (bool, optional): Whether to end the session. Defaults to False.
 
-            _curr_citation_idx += 1
+        Yields:
+            StreamStart, TextDelta, TraceStep, FileOutput or ReturnControl events (see agent_events.py).
+        """
+        return self._invoke_stream(
+            self._bedrock_agent_runtime_client, input_text, agent_id, agent_alias_id,
+            session_id, session_state, enable_trace, end_session,
+        )
 
-            if enable_trace and trace_level == "all":
-                print(f"\n\ncitation {_curr_citation_idx}:")
-                print(
-                    f"got {len(_citation['retrievedReferences'])} retrieved references for this citation\n"
-                )
-                print(f"citation span... start: {_start}, end: {_end}")
-                print(
-                    f"citation based on span:====\n{_cleaned_text[_start:_end]}\n===="
-                )
-                print(f"citation url: {_ref_url}\n============")
+    def _invoke_stream(
+            self,
+            runtime_client,
+            input_text: str,
+            agent_id: str,
+            agent_alias_id: str = DEFAULT_ALIAS,
+            session_id: str = None,
+            session_state: dict = {},
+            enable_trace: bool = False,
+            end_session: bool = False,
+            on_trace: Callable[[dict], None] = None,
+    ) -> Iterator[Any]:
+        # with on_trace, trace-only events are passed to it raw instead of being parsed into TraceSteps
+        session_id = session_id or str(uuid.uuid4())
+        _time_before_call = time.perf_counter()
 
-        if enable_trace and trace_level == "all":
-            print(
-                f"\nfullly cited answer:*************\n{_fully_cited_answer}\n*************"
-            )
+        _agent_resp = runtime_client.invoke_agent(
+            inputText=input_text,
+            agentId=agent_id,
+            agentAliasId=agent_alias_id,
+            sessionId=session_id,
+            sessionState=session_state,
+            enableTrace=enable_trace,
+            endSession=end_session,
+        )
+        _metadata = _agent_resp["ResponseMetadata"]
+        yield StreamStart(
+            request_id=_metadata.get("RequestId"),
+            session_id=session_id,
+            status_code=_metadata["HTTPStatusCode"],
+            response_metadata=_metadata,
+            elapsed=time.perf_counter() - _time_before_call,
+        )
+        if _metadata["HTTPStatusCode"] != 200:
+            return
 
-        return _fully_cited_answer
+        for _event in _agent_resp["completion"]:
+            if on_trace is not None and len(_event) == 1 and 'trace' in _event:
+                on_trace(_event['trace'])
+                continue
+            yield from parse_event(_event, time.perf_counter() - _time_before_call)
 
     def invoke(
             self,
             input_text: str,
             agent_id: str,
             agent_alias_id: str = "TSTALIASID",
-            session_id: str = str(uuid.uuid4()),
+            session_id: str = None,
             session_state: dict = {},
             enable_trace: bool = False,
             end_session: bool = False,
             trace_level: str = "core",
             multi_agent_names: dict = {},
+            metrics_sink: MetricsSink = None,
+            return_metrics: bool = False,
+            trace_handlers: TraceHandlerRegistry = None,
+            file_sink: FileSink = None,
     ):
         """Invokes an agent with a given input text, while optional parameters
         also let you leverage an agent session, or target a specific agent alias.
+        This is a blocking consumer of invoke_stream(); use that method directly to
+        process the answer as it is generated.
 
         Args:
             input_text (str): The text to be processed by the agent.
             agent_id (str): The ID of the agent to invoke.
             agent_alias_id (str, optional): The alias ID of the agent to invoke. Defaults to "TSTALIASID".
-            session_id (str, optional): The ID of the session. Defaults to a new UUID.
+            session_id (str, optional): The ID of the session. Defaults to a new UUID for every call; use
+            SessionPool to manage multi-turn conversations.
             session_state (dict, optional): The state of the session. Defaults to an empty dict.
             enable_trace (bool, optional): Whether to enable trace. Defaults to False.
             end_session (bool, optional): Whether to end the session. Defaults to False.
             trace_level (str, optional): The level of trace. Defaults to "none". Possible values are "none", "all", "core".
+            metrics_sink (MetricsSink, optional): Sink that receives the InvocationMetrics of this call. Defaults to None.
+            return_metrics (bool, optional): Whether to also return the InvocationMetrics. Defaults to False.
+            trace_handlers (TraceHandlerRegistry, optional): Handlers for trace events. Defaults to the
+            console renderer when enable_trace is True, and to no trace handling otherwise.
+            file_sink (FileSink, optional): Where files returned by the agent are stored, without blocking
+            the stream. Defaults to a background LocalFileSink writing to the 'output' directory, which is
+            closed before invoke() returns.
 
         Returns:
-            str: The answer from the agent.
+            str: The answer from the agent, or a tuple of (answer, InvocationMetrics) if return_metrics is True.
         """
 
+        session_id = session_id or str(uuid.uuid4())
         _time_before_call = datetime.datetime.now()
 
-        _agent_resp = self._bedrock_agent_runtime_client.invoke_agent(
-            inputText=input_text,
-            agentId=agent_id,
-            agentAliasId=agent_alias_id,
-            sessionId=session_id,
-            sessionState=session_state,
-            enableTrace=enable_trace,
-            endSession=end_session,
+        # metrics need the service traces, but do not turn on the console trace output
+        _collector = None
+        if metrics_sink is not None or return_metrics:
+            _collector = MetricsCollector(agent_id, agent_alias_id, session_id)
+
+        _trace_handlers = trace_handlers
+        _console = None
+        _on_trace = None
+        if _trace_handlers is None and enable_trace:
+            if _collector is None:
+                # the default notebook output renders the raw traces, without parsing them into TraceSteps
+                _console = ConsoleTraceRenderer(trace_level, multi_agent_names)
+                _on_trace = _console.render
+            else:
+                _trace_handlers, _console = console_trace_registry(trace_level, multi_agent_names)
+
+        _stream = self._invoke_stream(
+            self._bedrock_agent_runtime_client,
+            input_text,
+            agent_id,
+            agent_alias_id=agent_alias_id,
+            session_id=session_id,
+            session_state=session_state,
+            enable_trace=enable_trace or _trace_handlers is not None or _collector is not None,
+            end_session=end_session,
+            on_trace=_on_trace,
         )
+        _start = next(_stream)
+        if _collector is not None:
+            _collector.observe(_start)
 
         if enable_trace:
             if trace_level == "all":
-                print(f"invokeAgent API response object: {_agent_resp}")
+                print(f"invokeAgent API response metadata: {_start.response_metadata}")
             else:
-                print(
-                    f"invokeAgent API request ID: {_agent_resp['ResponseMetadata']['RequestId']}"
-                )
+                print(f"invokeAgent API request ID: {_start.request_id}")
                 print(f"invokeAgent API session ID: {session_id}")
 
         # Return error message if invoke was unsuccessful
-        if _agent_resp["ResponseMetadata"]["HTTPStatusCode"] != 200:
-            _error_message = f"API Response was not 200: {_agent_resp}"
+        if _start.status_code != 200:
+            _error_message = f"API Response was not 200: {_start.response_metadata}"
             if enable_trace and trace_level == "all":
                 print(_error_message)
+            if _collector is not None:
+                _metrics = self._finish_metrics(_collector, metrics_sink, _time_before_call, _error_message)
+                if return_metrics:
+                    return _error_message, _metrics
             return _error_message
 
-        _total_in_tokens = 0
-        _total_out_tokens = 0
-        _total_llm_calls = 0
-        _orch_step = 0
-        _sub_step = 0
-        _time_before_orchestration = datetime.datetime.now()
-        
-        _agent_answer = ""
-        _event_stream = _agent_resp['completion']
+        _citations = CitationAssembler()
+        _file_sink = file_sink
 
         try:
-            _sub_agent_name = "<collab-name-not-yet-provided>"
-            for _event in _event_stream: 
-                _sub_agent_alias_id = None 
-                if 'files' in _event:
-                    _files_event = _event['files']
-                    display(Markdown("### Files"))
-                    _files_list = _files_event['files']
-                    for _this_file in _files_list:
-                        print(f"{_this_file['name']} ({_this_file['type']})")
-                        _file_bytes = _this_file['bytes']
-                        # save bytes to file, given the name of file and the bytes 
-                        if not os.path.exists('output'):
-                            os.makedirs('output')
-                        _file_name = os.path.join('output', _this_file['name'])
-                        with open(_file_name, 'wb') as f:
-                            f.write(_file_bytes)
-                        if _this_file['type'] == 'image/png' or _this_file['type'] == 'image/jpeg':
-                            _img = mpimg.imread(_file_name)
-                            plt.imshow(_img)
-                            plt.show()
-                elif 'chunk' in _event:
-                    _data = _event['chunk']['bytes']
-                    _agent_answer = _data.decode('utf8')
-                    _agent_answer = self._make_fully_cited_answer(_agent_answer, _event, enable_trace, trace_level)
-
-                if 'trace' in _event and enable_trace:
-                    if trace_level == "all":
-                        print('---')
-                    else:
-                        if 'callerChain' in _event['trace']:
-                            if len(_event['trace']['callerChain']) > 1:
-                                _sub_agent_alias_arn = _event['trace']['callerChain'][1]['agentAliasArn']
-                                # get sub agent id by grabbing all text following the second '/' character
-                                _sub_agent_alias_id = _sub_agent_alias_arn.split('/', 1)[1]
-                                try:
-                                    _sub_agent_name = multi_agent_names[_sub_agent_alias_id]
-                                except:
-                                    print("You haven't provided agents names. To do so provide a dictionary in the format {f'{agent_id}/{agent_alias_id}': f'{agent_name}'})")
-                                    _sub_agent_name = "<not-yet-provided>"
-
-                        # if 'collaboratorName' in _event['trace']:
-                        #     _sub_agent_name = _event['trace']['collaboratorName'] 
-                        # else:
-                        #     _sub_agent_name = "<collab-name-not-yet-provided>"
-
-                    if 'routingClassifierTrace' in _event['trace']['trace']:
-                        _route = _event['trace']['trace']['routingClassifierTrace']
-
-                        if 'modelInvocationInput' in _route:
-                            _orch_step +=1 
-                            print(colored(f"---- Step {_orch_step} ----", "green"))
-                            _time_before_routing = datetime.datetime.now()
-                            print(colored("Classifying request to immediately route to one collaborator if possible.", "blue"))
-
-                        if 'modelInvocationOutput' in _route:
-                            _llm_usage = _route['modelInvocationOutput']['metadata']['usage']
-                            _in_tokens = 0
-                            if 'inputTokens' in _llm_usage:
-                                _in_tokens = _llm_usage['inputTokens']
-                                _total_in_tokens += _in_tokens 
-
-                            _out_tokens = _llm_usage['outputTokens']
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-                            _route_duration = datetime.datetime.now() - _time_before_routing
-
-                            _raw_resp_str = _route['modelInvocationOutput']['rawResponse']['content']
-                            _classification = _raw_resp_str.replace('<a>', '').replace('</a>', '')
-
-                            if _classification == UNDECIDABLE_CLASSIFICATION:
-                                print(colored(f"Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.", "magenta"))
-                            elif _classification == 'keep_previous_agent':
-                                print(colored(f"Continuing conversation with previous collaborator.", "magenta"))
-                                # # since we replaced the typical orchestration step with a simple routing
-                                # # classification, bump the step count.
-                                # _orch_step += 1
-                            else:
-                                _sub_agent_name = _classification
-                                print(colored(f"Routing classifier chose collaborator: '{_classification}'", "magenta"))
-                                # # since we replaced the typical orchestration step with a simple routing
-                                # # classification, bump the step count.
-                                # _orch_step += 1
-                            print(colored(f"Routing classifier took {_route_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}).\n", "yellow"))
-
-                    if 'failureTrace' in _event['trace']['trace']:
-                        print(colored(f"Agent error: {_event['trace']['trace']['failureTrace']['failureReason']}", "red"))
-
-                    if 'orchestrationTrace' in _event['trace']['trace']:
-                        _orch = _event['trace']['trace']['orchestrationTrace']
-
-                        if trace_level in ["core", "outline"]:
-                            if "rationale" in _orch:
-                                _rationale = _orch['rationale']
-                                print(colored(f"{_rationale['text']}", "blue"))
-
-                            if "invocationInput" in _orch:
-                                # NOTE: when agent determines invocations should happen in parallel
-                                # the trace objects for invocation input still come back one at a time.
-                                _input = _orch['invocationInput']
-
-                                if 'actionGroupInvocationInput' in _input:
-                                    if trace_level == "outline":
-                                        print(colored(f"Using tool: {_input['actionGroupInvocationInput']['function']}", "magenta"))
-                                    else:
-                                        print(colored(f"Using tool: {_input['actionGroupInvocationInput']['function']} with these inputs:", "magenta"))
-                                        if (len(_input['actionGroupInvocationInput']['parameters']) == 1) and (_input['actionGroupInvocationInput']['parameters'][0]['name'] == 'input_text'):
-                                            print(colored(f"{_input['actionGroupInvocationInput']['parameters'][0]['value']}", "magenta"))
-                                        else:
-                                            print(colored(f"{_input['actionGroupInvocationInput']['parameters']}\n", "magenta"))
-
-                                elif 'agentCollaboratorInvocationInput' in _input:
-                                    _collab_name = _input['agentCollaboratorInvocationInput']['agentCollaboratorName']
-                                    _sub_agent_name = _collab_name
-                                    _collab_input_text = _input['agentCollaboratorInvocationInput']['input']['text']
-                                    _collab_arn = _input['agentCollaboratorInvocationInput']['agentCollaboratorAliasArn']
-                                    _collab_ids = _collab_arn.split('/', 1)[1]
-
-                                    if trace_level == "outline":
-                                        print(colored(f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]'", "magenta"))
-                                    else:
-                                        print(colored(f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]' passing input text:", "magenta"))
-                                        print(colored(f"{_collab_input_text[0:TRACE_TRUNCATION_LENGTH]}\n", "magenta"))
-
-                                elif 'codeInterpreterInvocationInput' in _input:
-                                    if trace_level == "outline":
-                                        print(colored(f"Using code interpreter", "magenta"))
-                                    else:
-                                        console = Console()
-                                        _gen_code = _input['codeInterpreterInvocationInput']['code']
-                                        _code = f"```python\n{_gen_code}\n```"
-
-                                        console.print(Markdown(f"**Generated code**\n{_code}"))
-
-                            if "observation" in _orch:
-                                if trace_level == "core":
-                                    _output = _orch['observation']
-                                    if 'actionGroupInvocationOutput' in _output:
-                                        print(colored(f"--tool outputs:\n{_output['actionGroupInvocationOutput']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n", "magenta"))
-
-                                    if 'agentCollaboratorInvocationOutput' in _output:
-                                        _collab_name = _output['agentCollaboratorInvocationOutput']['agentCollaboratorName']
-                                        _collab_output_text = _output['agentCollaboratorInvocationOutput']['output']['text'][0:TRACE_TRUNCATION_LENGTH]
-                                        print(colored(f"\n----sub-agent {_collab_name} output text:\n{_collab_output_text}...\n", "magenta"))
-
-                                    if 'finalResponse' in _output:
-                                        print(colored(f"Final response:\n{_output['finalResponse']['text'][0:TRACE_TRUNCATION_LENGTH]}...", "cyan"))
-
-                        # if 'modelInvocationInput' in _orch:
-                        #     if _sub_agent_alias_id is not None:
-                        #         _sub_step += 1
-                        #         print(colored(f"---- Step {_orch_step}.{_sub_step} [using sub-agent name:{_sub_agent_name}, id:{_sub_agent_alias_id}] ----", "green"))
-                        #     else:
-                        #         _orch_step += 1
-                        #         _sub_step = 0
-                        #         print(colored(f"---- Step {_orch_step} ----", "green"))
-
-                        if 'modelInvocationOutput' in _orch:
-                            if _sub_agent_alias_id is not None:
-                                _sub_step += 1
-                                print(colored(f"---- Step {_orch_step}.{_sub_step} [using sub-agent name:{_sub_agent_name}, id:{_sub_agent_alias_id}] ----", "green"))
-                            else:
-                                _orch_step += 1
-                                _sub_step = 0
-                                print(colored(f"---- Step {_orch_step} ----", "green"))
-
-                            _llm_usage = _orch['modelInvocationOutput']['metadata']['usage']
-                            _in_tokens = 0
-                            if 'inputTokens' in _llm_usage:
-                                _in_tokens = _llm_usage['inputTokens']
-                                _total_in_tokens += _in_tokens 
-
-                            _out_tokens = _llm_usage['outputTokens']
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-                            _orch_duration = datetime.datetime.now() - _time_before_orchestration
-
-                            print(colored(f'Took {_orch_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}) to complete prior action, observe, orchestrate.', "yellow"))
-
-                            # restart the clock for next step/sub-step
-                            _time_before_orchestration = datetime.datetime.now()
-
-                    elif 'preProcessingTrace' in _event['trace']['trace']:
-                        _pre = _event['trace']['trace']['preProcessingTrace']
-                        if 'modelInvocationOutput' in _pre:
-                            _llm_usage = _pre['modelInvocationOutput']['metadata']['usage']
-                            _in_tokens = 0
-                            if 'inputTokens' in _llm_usage:
-                                _in_tokens = _llm_usage['inputTokens']
-                                _total_in_tokens += _in_tokens 
-
-                            _out_tokens = _llm_usage['outputTokens']
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-
-                            print(colored("Pre-processing trace, agent came up with an initial plan.", "yellow"))
-                            print(colored(f'Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}', "yellow"))
-
-                    elif 'postProcessingTrace' in _event['trace']['trace']:
-                        _post = _event['trace']['trace']['postProcessingTrace']
-                        if 'modelInvocationOutput' in _post:
-                            _llm_usage = _post['modelInvocationOutput']['metadata']['usage']
-                            _in_tokens = 0
-                            if 'inputTokens' in _llm_usage:
-                                _in_tokens = _llm_usage['inputTokens']
-                                _total_in_tokens += _in_tokens 
-
-                            _out_tokens = _llm_usage['outputTokens']
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-                            print(colored("Agent post-processing complete.", "yellow"))
-                            print(colored(f'Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}', "yellow"))
-
-                    if trace_level == "all":
-                        print(json.dumps(_event['trace'], indent=2, ensure_ascii=False, default=str))
-
-                if 'files' in _event.keys() and enable_trace:
-                    console = Console()
-                    files_event = _event['files']
-                    console.print(Markdown("**Files**"))
-
-                    files_list = files_event['files']
-                    for this_file in files_list:
-                        print(f"{this_file['name']} ({this_file['type']})")
-                        file_bytes = this_file['bytes']
-
-                        # save bytes to file, given the name of file and the bytes 
-                        file_name = os.path.join('output', this_file['name'])
-                        with open(file_name, 'wb') as f:
-                            f.write(file_bytes)
-                        # if this_file['type'] == 'image/png' or this_file['type'] == 'image/jpeg':
-                        #     img = mpimg.imread(file_name)
-                        #     # plt.imshow(img)
-                        #     # plt.show()
+            for _event in _stream:
+                if _collector is not None:
+                    _collector.observe(_event)
+                if isinstance(_event, TraceStep):
+                    if _trace_handlers is not None:
+                        _trace_handlers.dispatch(_event)
+                elif isinstance(_event, TextDelta):
+                    # an answer can arrive over several chunks; footnotes are numbered across all of them
+                    self._make_fully_cited_answer(_event.text, _event.raw, enable_trace, trace_level, _citations)
+                elif isinstance(_event, FileOutput):
+                    if _file_sink is None:
+                        _file_sink = LocalFileSink("output")
+                    _file_sink.submit(_event)
+
+            _agent_answer = _citations.answer()
+            if _file_sink is not None:
+                # files land (and subscribers run) before the answer is returned
+                _file_sink.flush()
 
             if enable_trace:
-                duration = datetime.datetime.now() - _time_before_call
-
-                if trace_level in ["core", "outline"]:
-                    print(colored(f"Agent made a total of {_total_llm_calls} LLM calls, " +\
-                                  f"using {_total_in_tokens+_total_out_tokens} tokens " +\
-                                  f"(in: {_total_in_tokens}, out: {_total_out_tokens})" +\
-                                  f", and took {duration.total_seconds():,.1f} total seconds", "yellow"))
+                if _console is not None:
+                    _console.print_summary(datetime.datetime.now() - _time_before_call)
 
                 if trace_level == "all":
                     print(f"Returning agent answer as: {_agent_answer}")
 
+            if _collector is not None:
+                _metrics = self._finish_metrics(_collector, metrics_sink, _time_before_call)
+                if return_metrics:
+                    return _agent_answer, _metrics
             return _agent_answer
         
         except Exception as e:
             print(f"Caught exception while processing input to invokeAgent:\n")
             print(f"  for input text:\n{input_text}\n")
             print(f"  on agent: {agent_id}, alias: {agent_alias_id}")
-            print(f"  request ID: {_agent_resp['ResponseMetadata']['RequestId']}, retries: {_agent_resp['ResponseMetadata']['RetryAttempts']}\n")
+            print(f"  request ID: {_start.request_id}, retries: {_start.response_metadata.get('RetryAttempts')}\n")
             print(f"Error: {e}")
+            if _collector is not None:
+                self._finish_metrics(_collector, metrics_sink, _time_before_call, e)
             raise Exception("Unexpected exception: ", e)
+        finally:
+            # a sink created here would otherwise keep its worker thread for the life of the process
+            if _file_sink is not None and _file_sink is not file_sink:
+                _file_sink.close()
+
+    def _finish_metrics(
+            self,
+            collector: MetricsCollector,
+            metrics_sink: MetricsSink,
+            time_before_call: datetime.datetime,
+            error: Any = None,
+    ) -> InvocationMetrics:
+        """Completes the metrics of an invocation and hands them to the sink, if any."""
+        _wall_time = (datetime.datetime.now() - time_before_call).total_seconds()
+        _metrics = collector.finish(_wall_time, error)
+        if metrics_sink is not None:
+            metrics_sink.emit(_metrics)
+        return _metrics
         
+    def invoke_many(
+            self,
+            inputs: Iterable,
+            agent_id: str,
+            agent_alias_id: str = DEFAULT_ALIAS,
+            concurrency: int = 8,
+            max_attempts: int = 4,
+            end_session: bool = False,
+            metrics_sink: MetricsSink = None,
+    ) -> Iterator[BatchResult]:
+        """Invokes an agent for many inputs concurrently, yielding results in completion order.
+
+        Concurrency is adapted with AIMD: the number of calls in flight grows slowly while
+        invoke_agent() succeeds and is halved, once per burst, when it returns a ThrottlingException.
+        Throttled items are not retried by botocore but here, with jittered exponential backoff, so
+        the limiter sees every throttle. Every item gets its own session unless a session_id is
+        supplied for it.
+
+        Args:
+            inputs (Iterable): input texts, or dicts of invoke_stream() keyword arguments
+            (e.g. {"input_text": ..., "session_id": ...}). May be a lazy iterable.
+            agent_id (str): The ID of the agent to invoke.
+            agent_alias_id (str, optional): The alias ID of the agent to invoke. Defaults to DEFAULT_ALIAS.
+            concurrency (int, optional): Maximum number of calls in flight. Defaults to 8.
+            max_attempts (int, optional): Attempts per item when throttled. Defaults to 4.
+            end_session (bool, optional): Whether to end each session after its call. Defaults to False.
+            metrics_sink (MetricsSink, optional): Sink that receives the InvocationMetrics of every
+            successful call; the metrics are also attached to each BatchResult. Defaults to None.
+
+        Yields:
+            BatchResult: answer or error for one item, with latency and time-to-first-token.
+        """
+        _limiter = AIMDLimiter(max_limit=concurrency)
+
+        def _make_request(_item) -> dict:
+            _request = {"input_text": _item} if isinstance(_item, str) else dict(_item)
+            _request.setdefault("agent_id", agent_id)
+            _request.setdefault("agent_alias_id", agent_alias_id)
+            _request.setdefault("session_id", str(uuid.uuid4()))
+            _request.setdefault("end_session", end_session)
+            if metrics_sink is not None:
+                _request["enable_trace"] = True
+            return _request
+
+        def _run(_index: int, _request: dict) -> BatchResult:
+            _result = BatchResult(index=_index, request=_request, session_id=_request["session_id"])
+            _time_before_call = time.perf_counter()
+            while _result.attempts < max_attempts:
+                _result.attempts += 1
+                _throttled = False
+                _result.time_to_first_token = None
+                _epoch = _limiter.acquire()
+                try:
+                    _citations = CitationAssembler()
+                    _collector = None
+                    if metrics_sink is not None:
+                        _collector = MetricsCollector(
+                            _request["agent_id"], _request["agent_alias_id"], _request["session_id"]
+                        )
+                    for _event in self._invoke_stream(self._batch_runtime_client, **_request):
+                        if _collector is not None:
+                            _collector.observe(_event)
+                        if isinstance(_event, StreamStart) and _event.status_code != 200:
+                            raise Exception(f"API Response was not 200: {_event.response_metadata}")
+                        if isinstance(_event, TextDelta):
+                            if _result.time_to_first_token is None:
+                                _result.time_to_first_token = _event.elapsed
+                            _citations.add(_event.text, _event.citations)
+                    _result.answer = _citations.answer()
+                    _result.error = None
+                    if _collector is not None:
+                        _result.metrics = _collector.finish(time.perf_counter() - _time_before_call)
+                        metrics_sink.emit(_result.metrics)
+                except Exception as e:
+                    _result.error = e
+                    _throttled = is_throttling_error(e)
+                finally:
+                    _limiter.release(throttled=_throttled, epoch=_epoch)
+
+                if not _throttled:
+                    break
+                _result.throttled += 1
+                if _result.attempts < max_attempts:
+                    time.sleep(random.uniform(0, min(20.0, 0.5 * 2 ** _result.attempts)))
+
+            _result.latency = time.perf_counter() - _time_before_call
+            return _result
+
+        # keep a bounded number of items queued so a lazy iterable is never fully materialized
+        with ThreadPoolExecutor(max_workers=concurrency) as _pool:
+            _pending = set()
+            for _index, _item in enumerate(inputs):
+                _pending.add(_pool.submit(_run, _index, _make_request(_item)))
+                if len(_pending) >= 2 * concurrency:
+                    _done, _pending = wait(_pending, return_when=FIRST_COMPLETED)
+                    for _future in _done:
+                        yield _future.result()
+            for _future in as_completed(_pending):
+                yield _future.result()
+
     def invoke_roc(self,
                     input_text: str, 
                     agent_id: str, 
                     agent_alias_id: str=DEFAULT_ALIAS, 
-                    session_id: str=str(uuid.uuid4()), 
+                    session_id: str=None, 
                     function_call: str=None,
                     function_call_result: str=None,
                     enable_trace: bool=False, 
@@ -1799,16 +1959,33 @@ class AgentsForAmazonBedrock:
             input_text (str): The text to be processed by the agent.
             agent_id (str): The ID of the agent to invoke.
             agent_alias_id (str, optional): The alias ID of the agent to invoke. Defaults to DEFAULT_ALIAS.
-            session_id (str, optional): The ID of the session. Defaults to a new UUID.
+            session_id (str, optional): The ID of the session. Defaults to a new UUID for every call; use
+            SessionPool to manage multi-turn conversations.
             function_call (str, optional): The function call that was made previously. Defaults to None.
-            function_call_result (str, optional): The result of the function call that was made previously. Defaults to None.
+            function_call_result (str | List, optional): The result of the function call that was made previously,
+            or a list with one result per entry of its invocationInputs. Defaults to None.
             enable_trace (bool, optional): Whether to enable trace. Defaults to False.
             end_session (bool, optional): Whether to end the session. Defaults to False.
 
         Returns:
             str: The answer from the agent.
+
+        Raises:
+            ValueError: if function_call_result is a list whose length differs from the number of invocationInputs.
         """
+        session_id = session_id or str(uuid.uuid4())
         if function_call is not None:
+            # a single result answers the first requested call, a list answers each of them
+            _inputs = function_call["invocationInputs"]
+            if isinstance(function_call_result, list):
+                if len(function_call_result) != len(_inputs):
+                    raise ValueError(
+                        f"function_call_result has {len(function_call_result)} results "
+                        f"for {len(_inputs)} requested calls"
+                    )
+                _results = function_call_result
+            else:
+                _results = [function_call_result]
             _agent_resp = self._bedrock_agent_runtime_client.invoke_agent(
                 inputText=input_text,
                 agentId=agent_id,
@@ -1816,14 +1993,10 @@ class AgentsForAmazonBedrock:
                 sessionId=session_id,
                 sessionState={
                     'invocationId': function_call["invocationId"],
-                    'returnControlInvocationResults': [{
-                        'functionResult': {
-                            'actionGroup': function_call["invocationInputs"][0]["functionInvocationInput"]["actionGroup"],
-                            'function': function_call["invocationInputs"][0]["functionInvocationInput"]["function"],
-                            'responseBody': {
-                                "TEXT": {
-                                    'body': function_call_result
-                                }}}}]},
+                    'returnControlInvocationResults': [
+                        invocation_result(_input, _body)
+                        for _input, _body in zip(_inputs, _results)
+                    ]},
                 enableTrace=enable_trace, 
                 endSession= end_session
             )
@@ -1858,6 +2031,49 @@ class AgentsForAmazonBedrock:
         except Exception as e:
             raise Exception("unexpected event.", e)
         
+    def invoke_with_roc(
+            self,
+            input_text: str,
+            agent_id: str,
+            functions: RocFunctionRegistry,
+            agent_alias_id: str = DEFAULT_ALIAS,
+            session_id: str = None,
+            session_state: dict = None,
+            enable_trace: bool = False,
+            end_session: bool = False,
+            max_workers: int = 8,
+            max_rounds: int = DEFAULT_MAX_ROC_ROUNDS,
+    ) -> RocResult:
+        """Invokes an agent with ROC action groups and runs the functions it asks for locally,
+        until it returns a final answer. All calls of a returnControl event run concurrently.
+        To reuse the worker threads and latency statistics across calls, use RocRuntime directly.
+
+        Args:
+            input_text (str): The text to be processed by the agent.
+            agent_id (str): The ID of the agent to invoke.
+            functions (RocFunctionRegistry): The local functions, by action group and function name.
+            agent_alias_id (str, optional): The alias ID of the agent to invoke. Defaults to DEFAULT_ALIAS.
+            session_id (str, optional): The ID of the session. Defaults to a new UUID.
+            session_state (dict, optional): Session attributes, kept for every round. Defaults to None.
+            enable_trace (bool, optional): Whether to ask the service for trace events. Defaults to False.
+            end_session (bool, optional): Whether to end the session once the final answer arrived. Defaults to False.
+            max_workers (int, optional): Function calls running at the same time. Defaults to 8.
+            max_rounds (int, optional): returnControl rounds before giving up. Defaults to 10.
+
+        Returns:
+            RocResult: the answer and every function call made, with its latency
+        """
+        with RocRuntime(self, functions, max_workers=max_workers, max_rounds=max_rounds) as _runtime:
+            return _runtime.run(
+                input_text,
+                agent_id,
+                agent_alias_id=agent_alias_id,
+                session_id=session_id,
+                session_state=session_state,
+                enable_trace=enable_trace,
+                end_session=end_session,
+            )
+
     def update_agent(self,
                      agent_name: str,
                      new_model_id: str=None,
@@ -1877,10 +2093,7 @@ class AgentsForAmazonBedrock:
         _agent_id = self.get_agent_id_by_name(agent_name)
 
         # Get current agent details
-        _get_agent_response = self._bedrock_agent_client.get_agent(
-            agentId=_agent_id)
-
-        _agent_details = _get_agent_response.get('agent')
+        _agent_details = self.get_agent_descriptor(_agent_id)
 
         # Update model id.
         if new_model_id is not None:
@@ -1913,11 +2126,13 @@ class AgentsForAmazonBedrock:
         
         # Update the agent.
         _update_agent_response = self._bedrock_agent_client.update_agent(**_agent_details)
+        self.invalidate_agent_descriptor(_agent_id)
 
-        time.sleep(3)
+        self.wait_agent_status_update(_agent_id, verbose=False, baseline=3)
         
         #Prepare Agent
         self._bedrock_agent_client.prepare_agent(agentId=_agent_id)
+        self.invalidate_agent_descriptor(_agent_id)
 
         return _update_agent_response
 
@@ -1927,13 +2142,13 @@ class AgentsForAmazonBedrock:
 
     # This helps us grab the correct basePromptTemplate used for the orchestration step
     def get_base_prompt_template(self, promptType, agentId):
-        # get all the info in the agent at the current state
-        agent_info = self._bedrock_agent_client.get_agent(agentId=agentId)
+        # get all the info in the agent at the current state, from the descriptor cache
+        agent_info = self.get_agent_descriptor(agentId)
 
         # Go through the results to find the info we need for update agent
         # You can see the full response of get_agent here:
         # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/bedrock-agent/client/get_agent.html
-        prompt_orchestrations = agent_info['agent']['promptOverrideConfiguration']['promptConfigurations']
+        prompt_orchestrations = agent_info['promptOverrideConfiguration']['promptConfigurations']
         return self.find_by_key_value_next(prompt_orchestrations,
                                            'promptType',
                                            promptType)['basePromptTemplate']
@@ -1952,9 +2167,8 @@ class AgentsForAmazonBedrock:
         Returns:
             dict: UpdateAgent response.
         """
-        # Get current agent details
-        _get_agent_response = self._bedrock_agent_client.get_agent(agentId=agent_id)
-        _agent_details = _get_agent_response.get('agent')
+        # Get current agent details; the prompt template below comes from the same cached descriptor
+        _agent_details = self.get_agent_descriptor(agent_id)
 
         # Extract required parameters for update
         _agent_name = _agent_details['agentName']
@@ -1990,6 +2204,7 @@ class AgentsForAmazonBedrock:
 
         # Update the agent
         _update_agent_response = self._bedrock_agent_client.update_agent(**_update_config)
+        self.invalidate_agent_descriptor(agent_id)
 
         return _update_agent_response
 
@@ -2030,15 +2245,44 @@ class AgentsForAmazonBedrock:
     def load_dynamodb(
             self,
             table_name: str,
-            items: List
-    ):
-        try:
+            items: Union[Iterable[Dict], str, os.PathLike],
+            max_workers: int = DEFAULT_LOAD_WORKERS,
+            overwrite_by_pkeys: List[str] = None,
+            verbose: bool = False,
+    ) -> BulkLoadResult:
+        """Writes items to a DynamoDB table in parallel batches of 25.
 
-            table = self._dynamodb_resource.Table(table_name)
-            for item in items:
-                table.put_item(Item=item)
-        except self._dynamodb_client.exceptions.ResourceInUseException:
-            print(f'Error on loading process for table: {table_name}.')
+        Items are read lazily, so generators and large JSON Lines files can be loaded without
+        holding them in memory. Unprocessed items and throttled batches are retried with backoff.
+
+        Args:
+            table_name (str): name of the table
+            items (Union[Iterable[Dict], str, os.PathLike]): the items, or the path of a JSON Lines file
+            max_workers (int, optional): batches written at the same time. Defaults to 8.
+            overwrite_by_pkeys (List[str], optional): key attributes, to keep only the last write of a key
+                within a batch. Defaults to None.
+            verbose (bool, optional): print the items/s and consumed capacity. Defaults to False.
+
+        Returns:
+            BulkLoadResult: items written, batches, retries, consumed capacity and elapsed time
+        """
+        if isinstance(items, (str, os.PathLike)):
+            items = iter_jsonl(items)
+        _loader = DynamoDBBulkLoader(
+            self._dynamodb_client, table_name, max_workers=max_workers, overwrite_by_pkeys=overwrite_by_pkeys
+        )
+        _result = _loader.load(items)
+        if table_name in self._dynamodb_queries:
+            self._dynamodb_queries[table_name].cache.invalidate()
+        if verbose:
+            print(_result.report())
+        return _result
+
+    def _dynamodb_query(self, table_name: str) -> DynamoDBQuery:
+        _query = self._dynamodb_queries.get(table_name)
+        if _query is None:
+            _query = self._dynamodb_queries.setdefault(table_name, DynamoDBQuery(self._dynamodb_client, table_name))
+        return _query
 
     def query_dynamodb(
             self,
@@ -2046,21 +2290,78 @@ class AgentsForAmazonBedrock:
             pk_field: str,
             pk_value: str,
             sk_field: str = None,
-            sk_value: str = None
-    ):
-        try:
+            sk_value: str = None,
+            projection: List[str] = None,
+            cache_ttl: float = None,
+    ) -> List[Dict]:
+        """Returns every item of a partition, optionally only those whose sort key begins with sk_value.
 
-            table = self._dynamodb_resource.Table(table_name)
-            # Create expression
-            if sk_field:
-                key_expression = Key(pk_field).eq(pk_value) & Key(sk_field).begins_with(sk_value)
-            else:
-                key_expression = Key(pk_field).eq(pk_value)
+        All pages are read, not only the first 1 MB.
 
-            query_data = table.query(KeyConditionExpression=key_expression)
-            return query_data['Items']
-        except self._dynamodb_client.exceptions.ResourceInUseException:
-            print(f'Error querying table: {table_name}.')
+        Args:
+            table_name (str): name of the table
+            pk_field (str): partition key attribute
+            pk_value (str): partition key value
+            sk_field (str, optional): sort key attribute. Defaults to None.
+            sk_value (str, optional): prefix the sort key begins with. Defaults to None.
+            projection (List[str], optional): attributes to return. Defaults to None, all attributes.
+            cache_ttl (float, optional): seconds the result may be served from a read-through cache,
+                e.g. for agent tools that look up the same customer repeatedly. Defaults to None.
+
+        Returns:
+            List[Dict]: the items
+        """
+        return self._dynamodb_query(table_name).query(
+            pk_field, pk_value, sk_field, sk_value, projection, cache_ttl
+        )
+
+    def iter_dynamodb(
+            self,
+            table_name: str,
+            pk_field: str,
+            pk_value: str,
+            sk_field: str = None,
+            sk_value: str = None,
+            projection: List[str] = None,
+            page_size: int = None,
+    ) -> Iterator[Dict]:
+        """Yields the items of query_dynamodb() one at a time, fetching further pages as they are consumed.
+        See query_dynamodb() for the other arguments.
+
+        Args:
+            page_size (int, optional): maximum items per page. Defaults to None.
+
+        Returns:
+            Iterator[Dict]: the items
+        """
+        return self._dynamodb_query(table_name).items(
+            pk_field, pk_value, sk_field, sk_value, projection, page_size
+        )
+
+    def query_dynamodb_many(
+            self,
+            table_name: str,
+            pk_field: str,
+            pk_values: Iterable[str],
+            sk_field: str = None,
+            sk_value: str = None,
+            projection: List[str] = None,
+            cache_ttl: float = None,
+            max_workers: int = DEFAULT_QUERY_WORKERS,
+    ) -> Dict[str, List[Dict]]:
+        """Runs query_dynamodb() for several partition key values concurrently.
+        See query_dynamodb() for the other arguments.
+
+        Args:
+            pk_values (Iterable[str]): partition key values
+            max_workers (int, optional): queries running at the same time. Defaults to 8.
+
+        Returns:
+            Dict[str, List[Dict]]: the items of each partition key value
+        """
+        return self._dynamodb_query(table_name).query_many(
+            pk_field, pk_values, sk_field, sk_value, projection, cache_ttl, max_workers
+        )
 
     def fill_template(self, customer, day, power, kind):
         line_template = {"customer_id": "null", "day": "", "sumPowerReading": "null", "kind":"null"}
@@ -2071,26 +2372,43 @@ class AgentsForAmazonBedrock:
         return line_template
 
 
-    def generate_fake_data_dynamodb(self):
-        cur_date = datetime.datetime.now()
-        formated_cur_date = f"{cur_date.year}/{cur_date.month:02d}/01"
-        output = ""
-
-        for customer in range(1,6):
-            current = self.fill_template(customer, formated_cur_date, random.randrange(100, 201, 2), 'measured')
-            output += json.dumps(current, ensure_ascii=False) + '\n'
-            for measure in range(1,5):
-                last_month = cur_date - relativedelta(months=measure)
-                formated_last_m = f"{last_month.year}/{last_month.month:02d}/01"
-                future_month = cur_date + relativedelta(months=measure)
-                formated_next_m = f"{future_month.year}/{future_month.month:02d}/01"
-                past = self.fill_template(customer, formated_last_m, random.randrange(100, 201, 2), 'measured')
-                future = self.fill_template(customer, formated_next_m, random.randrange(100, 201, 2), 'forecasted')
-                output += json.dumps(past, ensure_ascii=False) + '\n'
-                output += json.dumps(future, ensure_ascii=False) + '\n'
-
-        with open("1_user_sample_data.json", "w") as f:
-            f.write(output)
+    def generate_fake_data_dynamodb(
+            self,
+            customers: int = 5,
+            months_back: int = 4,
+            months_ahead: int = 4,
+            distribution: str = "uniform",
+            seed: int = None,
+            output_file: str = "1_user_sample_data.json",
+            table_name: str = None,
+            max_workers: int = DEFAULT_LOAD_WORKERS,
+    ) -> Union[int, BulkLoadResult]:
+        """Generates measured and forecasted monthly power readings, around the current month,
+        for the energy agent's DynamoDB table. Readings are generated in chunks, so datasets of
+        millions of rows never have to fit in memory.
+
+        Args:
+            customers (int, optional): number of customers. Defaults to 5.
+            months_back (int, optional): measured months before the current month. Defaults to 4.
+            months_ahead (int, optional): forecasted months after the current month. Defaults to 4.
+            distribution (str, optional): "uniform", "normal" or "poisson"; see PowerReadingGenerator.
+                Defaults to "uniform".
+            seed (int, optional): seed for reproducible datasets. Defaults to None.
+            output_file (str, optional): JSON Lines file to write. Defaults to "1_user_sample_data.json".
+            table_name (str, optional): load the readings straight into this table instead of writing
+                output_file. Defaults to None.
+            max_workers (int, optional): parallel batch writes when loading a table. Defaults to 8.
+
+        Returns:
+            Union[int, BulkLoadResult]: the rows written to output_file, or the result of loading table_name
+        """
+        _generator = PowerReadingGenerator(
+            customers=customers, months_back=months_back, months_ahead=months_ahead,
+            distribution=distribution, seed=seed,
+        )
+        if table_name is not None:
+            return self.load_dynamodb(table_name, _generator.items(), max_workers=max_workers)
+        return _generator.write_jsonl(output_file)
 
 
 
@@ -0,0 +1,192 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Paginated, concurrent and cached queries of a DynamoDB table by key.
+
+query_dynamodb() used to return only the first page of Table.query(), at
+most 1 MB of items, and built a new Table resource on every call.
+DynamoDBQuery follows LastEvaluatedKey until the partition is exhausted,
+streaming items as a generator. It can project the attributes it returns,
+and runs the queries of several partitions concurrently. It calls the
+thread-safe client rather than a Table resource, which must not be shared
+between threads.
+
+Agent tools often query the same customer several times within a session,
+so query() and query_many() can serve results from a read-through cache,
+keyed by the key condition and projection:
+
+    >>> readings = DynamoDBQuery(dynamodb_client, "meter_readings")
+    >>> for item in readings.items("customer_id", "1", "day", "2024/", projection=["day", "sumPowerReading"]):
+    ...     print(item)
+    >>> by_customer = readings.query_many("customer_id", ["1", "2", "3"], cache_ttl=300)
+"""
+
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+
+from boto3.dynamodb.conditions import ConditionExpressionBuilder, Key
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from .ttl_cache import DEFAULT_CACHE_SIZE, TTLCache, canonical_key
+
+DEFAULT_QUERY_WORKERS = 8
+
+
+class DynamoDBQuery:
+    """Queries one DynamoDB table by partition key and, optionally, sort key prefix.
+
+    Args:
+        dynamodb_client: boto3 dynamodb client
+        table_name (str): name of the table
+        cache_size (int, optional): query results kept in the read-through cache. Defaults to 256.
+    """
+
+    def __init__(self, dynamodb_client, table_name: str, cache_size: int = DEFAULT_CACHE_SIZE):
+        self._client = dynamodb_client
+        self.table_name = table_name
+        self.cache = TTLCache(max_entries=cache_size)
+        self._serializer = TypeSerializer()
+        self._deserializer = TypeDeserializer()
+
+    def _request(
+            self,
+            pk_field: str,
+            pk_value: Any,
+            sk_field: str = None,
+            sk_value: Any = None,
+            projection: Sequence[str] = None,
+            page_size: int = None,
+    ) -> Dict[str, Any]:
+        if sk_field:
+            _condition = Key(pk_field).eq(pk_value) & Key(sk_field).begins_with(sk_value)
+        else:
+            _condition = Key(pk_field).eq(pk_value)
+        _built = ConditionExpressionBuilder().build_expression(_condition, is_key_condition=True)
+        _names = dict(_built.attribute_name_placeholders)
+        _request = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": _built.condition_expression,
+            "ExpressionAttributeNames": _names,
+            "ExpressionAttributeValues": {
+                _placeholder: self._serializer.serialize(_value)
+                for _placeholder, _value in _built.attribute_value_placeholders.items()
+            },
+        }
+        if projection:
+            # placeholders, because attribute names such as "day" are reserved words
+            _placeholders = [f"#p{_i}" for _i in range(len(projection))]
+            _names.update(zip(_placeholders, projection))
+            _request["ProjectionExpression"] = ", ".join(_placeholders)
+        if page_size:
+            _request["Limit"] = page_size
+        return _request
+
+    def pages(
+            self,
+            pk_field: str,
+            pk_value: Any,
+            sk_field: str = None,
+            sk_value: Any = None,
+            projection: Sequence[str] = None,
+            page_size: int = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Yields the items of a key condition one page at a time, following LastEvaluatedKey.
+
+        Args:
+            pk_field (str): partition key attribute
+            pk_value (Any): partition key value
+            sk_field (str, optional): sort key attribute. Defaults to None.
+            sk_value (Any, optional): prefix the sort key begins with. Defaults to None.
+            projection (Sequence[str], optional): top-level attributes to return. Defaults to None, all attributes.
+            page_size (int, optional): maximum items per page, besides the 1 MB limit. Defaults to None.
+
+        Returns:
+            Iterator[List[Dict]]: the pages of items
+        """
+        _request = self._request(pk_field, pk_value, sk_field, sk_value, projection, page_size)
+        while True:
+            _response = self._client.query(**_request)
+            yield [
+                {_k: self._deserializer.deserialize(_v) for _k, _v in _item.items()}
+                for _item in _response.get("Items", [])
+            ]
+            _last_key = _response.get("LastEvaluatedKey")
+            if not _last_key:
+                return
+            _request["ExclusiveStartKey"] = _last_key
+
+    def items(
+            self,
+            pk_field: str,
+            pk_value: Any,
+            sk_field: str = None,
+            sk_value: Any = None,
+            projection: Sequence[str] = None,
+            page_size: int = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Yields every item of a key condition, fetching pages as they are consumed. See pages()."""
+        for _page in self.pages(pk_field, pk_value, sk_field, sk_value, projection, page_size):
+            yield from _page
+
+    def query(
+            self,
+            pk_field: str,
+            pk_value: Any,
+            sk_field: str = None,
+            sk_value: Any = None,
+            projection: Sequence[str] = None,
+            cache_ttl: float = None,
+    ) -> List[Dict[str, Any]]:
+        """Returns every item of a key condition, from the cache if cache_ttl is given.
+
+        Args:
+            pk_field (str): partition key attribute
+            pk_value (Any): partition key value
+            sk_field (str, optional): sort key attribute. Defaults to None.
+            sk_value (Any, optional): prefix the sort key begins with. Defaults to None.
+            projection (Sequence[str], optional): top-level attributes to return. Defaults to None, all attributes.
+            cache_ttl (float, optional): seconds a result may be served from the cache. Defaults to None,
+                which always queries the table.
+
+        Returns:
+            List[Dict]: the items, which the caller may modify
+        """
+        if cache_ttl is None:
+            return list(self.items(pk_field, pk_value, sk_field, sk_value, projection))
+        _key = canonical_key(pk_field, pk_value, sk_field, sk_value, projection)
+        _hit, _items = self.cache.get(_key)
+        if not _hit:
+            _items = list(self.items(pk_field, pk_value, sk_field, sk_value, projection))
+            self.cache.put(_key, _items, cache_ttl)
+        return copy.deepcopy(_items)
+
+    def query_many(
+            self,
+            pk_field: str,
+            pk_values: Iterable[Any],
+            sk_field: str = None,
+            sk_value: Any = None,
+            projection: Sequence[str] = None,
+            cache_ttl: float = None,
+            max_workers: int = DEFAULT_QUERY_WORKERS,
+    ) -> Dict[Any, List[Dict[str, Any]]]:
+        """Queries several partitions concurrently. See query() for the arguments.
+
+        Args:
+            pk_values (Iterable[Any]): partition key values; duplicates are queried once
+            max_workers (int, optional): queries running at the same time. Defaults to 8.
+
+        Returns:
+            Dict[Any, List[Dict]]: the items of each partition key value, in the order of pk_values
+        """
+        _pk_values = list(dict.fromkeys(pk_values))
+        if not _pk_values:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(_pk_values))) as _executor:
+            _futures = {
+                _pk_value: _executor.submit(
+                    self.query, pk_field, _pk_value, sk_field, sk_value, projection, cache_ttl
+                )
+                for _pk_value in _pk_values
+            }
+        return {_pk_value: _future.result() for _pk_value, _future in _futures.items()}
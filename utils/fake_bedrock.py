@@ -0,0 +1,1381 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""In-process stand-in for Amazon Bedrock Agents, for offline load testing.
+
+Measuring the client-side cost of the helpers (caching, waits, teardown plans,
+invoke_many() concurrency control, stream parsing) against the real service is
+slow, costs money and is dominated by service latency. FakeBedrockBackend keeps
+agents, aliases, action groups, collaborators and knowledge base associations in
+memory, together with the IAM roles, Lambda functions and caller identity the
+helpers need around them, and answers invoke_agent() with synthetic completion
+streams that carry traces, citations and returnControl events.
+
+The backend is plugged in where boto3 would be: FakeSession replaces the boto3
+session of a ClientRegistry, so AgentsForAmazonBedrock runs unchanged:
+
+    >>> backend = FakeBedrockBackend()
+    >>> transport = FaultInjectingTransport(latency=0.02, jitter=0.5, rate_limits={"invoke_agent": 50})
+    >>> agents = AgentsForAmazonBedrock(clients=fake_clients(backend, transport))
+    >>> agent_id, alias_id, alias_arn, _ = agents.create_agent("news", "...", "...", [model_id])
+    >>> agents.prepare("news")
+    >>> results = list(agents.invoke_many(questions, agent_id, concurrency=32))
+    >>> print(transport.report())
+
+Every call goes through a Transport. The default one calls the backend directly;
+FaultInjectingTransport adds per-operation latency, random throttling and
+token-bucket rate limits, and paces completion stream events. Throttled calls are
+retried up to the max_attempts of the client config, like botocore does, and the
+remaining throttles surface as ClientErrors with the service's throttling code.
+
+Status transitions (CREATING, PREPARING, DELETING, ...) settle after
+provisioning_delay seconds, so waits can be exercised as well. Request parameters
+are not validated against the service models, and S3, DynamoDB and OpenSearch
+Serverless are not simulated: their clients raise NotImplementedError when used.
+"""
+
+import base64
+import copy
+import datetime
+import hashlib
+import json
+import random
+import string
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from botocore.exceptions import ClientError
+
+from .aws_clients import ClientRegistry
+
+DEFAULT_REGION = "us-east-1"
+DEFAULT_ACCOUNT_ID = "123456789012"
+TEST_ALIAS_ID = "TSTALIASID"
+
+# error codes of throttled calls, per service
+THROTTLING_CODES = {
+    "bedrock-agent": "ThrottlingException",
+    "bedrock-agent-runtime": "ThrottlingException",
+    "lambda": "TooManyRequestsException",
+    "iam": "Throttling",
+    "sts": "Throttling",
+}
+
+_HTTP_STATUS = {
+    "ResourceNotFoundException": 404,
+    "NoSuchEntity": 404,
+    "ConflictException": 409,
+    "ResourceConflictException": 409,
+    "EntityAlreadyExists": 409,
+    "DeleteConflict": 409,
+    "ThrottlingException": 429,
+    "TooManyRequestsException": 429,
+    "Throttling": 400,
+}
+
+_error_classes: Dict[str, type] = {}
+_error_classes_lock = threading.Lock()
+
+
+def _error_class(code: str) -> type:
+    with _error_classes_lock:
+        _cls = _error_classes.get(code)
+        if _cls is None:
+            _cls = type(code, (ClientError,), {})
+            _error_classes[code] = _cls
+        return _cls
+
+
+class _Exceptions:
+    """The client.exceptions namespace: one ClientError subclass per error code, shared by all fake clients."""
+
+    def __getattr__(self, code: str) -> type:
+        if code.startswith("_"):
+            raise AttributeError(code)
+        return _error_class(code)
+
+
+def service_error(code: str, message: str, operation: str) -> ClientError:
+    """Returns the ClientError a boto3 client raises for an error response, e.g. for client.exceptions lookups."""
+    return _error_class(code)(
+        {
+            "Error": {"Code": code, "Message": message},
+            "ResponseMetadata": {"HTTPStatusCode": _HTTP_STATUS.get(code, 400), "RetryAttempts": 0},
+        },
+        operation,
+    )
+
+
+class _Clock:
+    """UTC timestamps that strictly increase, so updatedAt orders changes even at thousands of ops/sec."""
+
+    def __init__(self):
+        self._last = None
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime.datetime:
+        with self._lock:
+            _now = datetime.datetime.now(datetime.timezone.utc)
+            if self._last is not None and _now <= self._last:
+                _now = self._last + datetime.timedelta(microseconds=1)
+            self._last = _now
+            return _now
+
+
+class _Resource:
+    """A stored resource whose status moves from a transitional to a final value after a delay."""
+
+    __slots__ = ("data", "status_key", "target", "settle_at")
+
+    def __init__(self, data: Dict[str, Any], status_key: str):
+        self.data = data
+        self.status_key = status_key
+        self.target = None
+        self.settle_at = 0.0
+
+    def begin(self, transitional: str, final: str, delay: float) -> None:
+        self.data[self.status_key] = transitional
+        self.target = final
+        self.settle_at = time.monotonic() + delay
+
+    def settle(self) -> str:
+        if self.target is not None and time.monotonic() >= self.settle_at:
+            self.data[self.status_key] = self.target
+            self.target = None
+        return self.data[self.status_key]
+
+
+def _json_document(document: Any) -> Any:
+    # IAM takes policy documents as JSON strings and boto3 returns them decoded
+    return json.loads(document) if isinstance(document, str) else copy.deepcopy(document)
+
+
+def _page(items: List[Dict[str, Any]], key: str, max_results: int = None, next_token: str = None) -> Dict[str, Any]:
+    _start = int(next_token) if next_token else 0
+    _end = _start + (max_results or 100)
+    _response = {key: items[_start:_end]}
+    if _end < len(items):
+        _response["nextToken"] = str(_end)
+    return _response
+
+
+_DEFAULT_PROMPT_TYPES = (
+    ("PRE_PROCESSING", "ENABLED"),
+    ("ORCHESTRATION", "ENABLED"),
+    ("KNOWLEDGE_BASE_RESPONSE_GENERATION", "ENABLED"),
+    ("POST_PROCESSING", "DISABLED"),
+)
+
+
+def _default_prompt_configurations() -> List[Dict[str, Any]]:
+    return [
+        {
+            "promptType": _prompt_type,
+            "promptCreationMode": "DEFAULT",
+            "promptState": _state,
+            "parserMode": "DEFAULT",
+            "basePromptTemplate": f"{{\"system\": \"default {_prompt_type.lower()} template\"}}",
+            "inferenceConfiguration": {
+                "maximumLength": 2048, "temperature": 0.0, "topP": 1.0, "topK": 250,
+                "stopSequences": ["</answer>"],
+            },
+        }
+        for _prompt_type, _state in _DEFAULT_PROMPT_TYPES
+    ]
+
+
+def _merge_prompt_configurations(current: List[Dict[str, Any]], overrides: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # prompt types that are not overridden keep their current configuration
+    _by_type = {_config["promptType"]: _config for _config in current}
+    for _override in overrides:
+        _merged = dict(_by_type.get(_override["promptType"], {}))
+        _merged.update(copy.deepcopy(_override))
+        _by_type[_override["promptType"]] = _merged
+    return list(_by_type.values())
+
+
+class _AgentsApi:
+    """The bedrock-agent operations; see FakeBedrockBackend."""
+
+    def __init__(self, backend: "FakeBedrockBackend"):
+        self._backend = backend
+        self._lock = backend.lock
+        self._agents: Dict[str, _Resource] = {}
+        self._aliases: Dict[str, Dict[str, _Resource]] = {}
+        self._action_groups: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._collaborators: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._knowledge_bases: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._versions: Dict[str, int] = {}
+        self._snapshots: Dict[tuple, tuple] = {}
+
+    def _agent(self, agent_id: str, operation: str) -> _Resource:
+        _agent = self._agents.get(agent_id)
+        if _agent is not None and _agent.settle() == "DELETED":
+            for _store in (self._agents, self._aliases, self._action_groups, self._collaborators,
+                           self._knowledge_bases, self._versions):
+                _store.pop(agent_id, None)
+            _agent = None
+        if _agent is None:
+            raise service_error("ResourceNotFoundException", f"Agent {agent_id} not found", operation)
+        return _agent
+
+    def _mutable_agent(self, agent_id: str, operation: str) -> _Resource:
+        _agent = self._agent(agent_id, operation)
+        _status = _agent.settle()
+        if _status.endswith("ING"):
+            raise service_error(
+                "ConflictException", f"Agent {agent_id} is in {_status} status and cannot be changed", operation
+            )
+        return _agent
+
+    def _draft_changed(self, agent: _Resource) -> None:
+        # any change to the DRAFT version has to be prepared again before it is invoked
+        if agent.data["agentStatus"] == "PREPARED":
+            agent.data["agentStatus"] = "NOT_PREPARED"
+        agent.data["updatedAt"] = self._backend.clock.now()
+
+    def _alias(self, agent_id: str, agent_alias_id: str, operation: str) -> _Resource:
+        _alias = self._aliases.get(agent_id, {}).get(agent_alias_id)
+        if _alias is not None and _alias.settle() == "DELETED":
+            del self._aliases[agent_id][agent_alias_id]
+            _alias = None
+        if _alias is None:
+            raise service_error(
+                "ResourceNotFoundException", f"Alias {agent_alias_id} of agent {agent_id} not found", operation
+            )
+        return _alias
+
+    def _child(self, store: Dict[str, Dict[str, Dict[str, Any]]], agent_id: str, child_id: str, kind: str,
+               operation: str) -> Dict[str, Any]:
+        _child = store.get(agent_id, {}).get(child_id)
+        if _child is None:
+            raise service_error("ResourceNotFoundException", f"{kind} {child_id} of agent {agent_id} not found", operation)
+        return _child
+
+    # agents
+
+    def create_agent(self, agentName: str, agentResourceRoleArn: str = None, foundationModel: str = None,
+                     instruction: str = None, description: str = None, idleSessionTTLInSeconds: int = 600,
+                     agentCollaboration: str = "DISABLED", promptOverrideConfiguration: Dict = None,
+                     **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            for _agent in list(self._agents.values()):
+                if _agent.data["agentName"] == agentName and _agent.settle() != "DELETED":
+                    raise service_error("ConflictException", f"Agent {agentName} already exists", "CreateAgent")
+            self._backend.check_role(agentResourceRoleArn, "CreateAgent")
+            _agent_id = self._backend.new_id()
+            _now = self._backend.clock.now()
+            _data = {
+                "agentId": _agent_id,
+                "agentName": agentName,
+                "agentArn": f"arn:aws:bedrock:{self._backend.region_name}:{self._backend.account_id}:agent/{_agent_id}",
+                "agentVersion": "DRAFT",
+                "agentResourceRoleArn": agentResourceRoleArn,
+                "foundationModel": foundationModel,
+                "instruction": instruction,
+                "description": description or "",
+                "idleSessionTTLInSeconds": idleSessionTTLInSeconds,
+                "agentCollaboration": agentCollaboration,
+                "orchestrationType": "DEFAULT",
+                "promptOverrideConfiguration": {"promptConfigurations": _merge_prompt_configurations(
+                    _default_prompt_configurations(),
+                    (promptOverrideConfiguration or {}).get("promptConfigurations", []),
+                )},
+                "createdAt": _now,
+                "updatedAt": _now,
+            }
+            _data.update(copy.deepcopy({_k: _v for _k, _v in kwargs.items() if _k != "clientToken"}))
+            _agent = _Resource(_data, "agentStatus")
+            _agent.begin("CREATING", "NOT_PREPARED", self._backend.provisioning_delay)
+            self._agents[_agent_id] = _agent
+            self._aliases[_agent_id] = {}
+            self._versions[_agent_id] = 0
+            # the test alias always routes to the DRAFT version; like the service, it is not listed
+            _test_alias = _Resource({
+                "agentAliasId": TEST_ALIAS_ID,
+                "agentAliasName": "AgentTestAlias",
+                "agentAliasArn": _data["agentArn"].replace(":agent/", ":agent-alias/") + f"/{TEST_ALIAS_ID}",
+                "agentId": _agent_id,
+                "agentAliasStatus": "PREPARED",
+                "routingConfiguration": [{"agentVersion": "DRAFT"}],
+                "createdAt": _now,
+                "updatedAt": _now,
+            }, "agentAliasStatus")
+            self._aliases[_agent_id][TEST_ALIAS_ID] = _test_alias
+            return {"agent": copy.deepcopy(_data)}
+
+    def get_agent(self, agentId: str) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._agent(agentId, "GetAgent")
+            return {"agent": copy.deepcopy(_agent.data)}
+
+    def list_agents(self, maxResults: int = None, nextToken: str = None) -> Dict[str, Any]:
+        with self._lock:
+            _summaries = []
+            for _agent_id in list(self._agents):
+                try:
+                    _data = self._agent(_agent_id, "ListAgents").data
+                except ClientError:
+                    continue
+                _summaries.append({
+                    "agentId": _data["agentId"],
+                    "agentName": _data["agentName"],
+                    "agentStatus": _data["agentStatus"],
+                    "description": _data["description"],
+                    "updatedAt": _data["updatedAt"],
+                    "latestAgentVersion": str(self._versions[_agent_id]) if self._versions[_agent_id] else "DRAFT",
+                })
+            return _page(_summaries, "agentSummaries", maxResults, nextToken)
+
+    def update_agent(self, agentId: str, promptOverrideConfiguration: Dict = None, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "UpdateAgent")
+            _data = _agent.data
+            for _key in ("agentName", "agentResourceRoleArn", "foundationModel", "instruction", "description",
+                         "idleSessionTTLInSeconds", "agentCollaboration", "memoryConfiguration", "orchestrationType"):
+                if _key in kwargs:
+                    _data[_key] = copy.deepcopy(kwargs[_key])
+            # like the service, a guardrail that is left out of the update is removed
+            if "guardrailConfiguration" in kwargs:
+                _data["guardrailConfiguration"] = copy.deepcopy(kwargs["guardrailConfiguration"])
+            else:
+                _data.pop("guardrailConfiguration", None)
+            if promptOverrideConfiguration is not None:
+                _data["promptOverrideConfiguration"]["promptConfigurations"] = _merge_prompt_configurations(
+                    _data["promptOverrideConfiguration"]["promptConfigurations"],
+                    promptOverrideConfiguration.get("promptConfigurations", []),
+                )
+            _data["updatedAt"] = self._backend.clock.now()
+            _agent.begin("UPDATING", "NOT_PREPARED", self._backend.provisioning_delay)
+            return {"agent": copy.deepcopy(_data)}
+
+    def prepare_agent(self, agentId: str) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "PrepareAgent")
+            _now = self._backend.clock.now()
+            _agent.data["preparedAt"] = _now
+            _agent.data["updatedAt"] = _now
+            _agent.begin("PREPARING", "PREPARED", self._backend.provisioning_delay)
+            return {"agentId": agentId, "agentStatus": "PREPARING", "agentVersion": "DRAFT", "preparedAt": _now}
+
+    def delete_agent(self, agentId: str, skipResourceInUseCheck: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._agent(agentId, "DeleteAgent")
+            if _agent.data["agentStatus"] == "DELETING":
+                raise service_error("ConflictException", f"Agent {agentId} is already being deleted", "DeleteAgent")
+            _agent.begin("DELETING", "DELETED", self._backend.provisioning_delay)
+            return {"agentId": agentId, "agentStatus": "DELETING"}
+
+    # aliases
+
+    def create_agent_alias(self, agentId: str, agentAliasName: str, description: str = None,
+                           routingConfiguration: List[Dict] = None, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "CreateAgentAlias")
+            if routingConfiguration:
+                _routing = copy.deepcopy(routingConfiguration)
+            else:
+                # without a routing configuration, a new version is created from the DRAFT
+                self._versions[agentId] += 1
+                _routing = [{"agentVersion": str(self._versions[agentId])}]
+            _alias_id = self._backend.new_id()
+            _now = self._backend.clock.now()
+            _data = {
+                "agentAliasId": _alias_id,
+                "agentAliasName": agentAliasName,
+                "agentAliasArn": _agent.data["agentArn"].replace(":agent/", ":agent-alias/") + f"/{_alias_id}",
+                "agentId": agentId,
+                "description": description or "",
+                "routingConfiguration": _routing,
+                "createdAt": _now,
+                "updatedAt": _now,
+            }
+            _alias = _Resource(_data, "agentAliasStatus")
+            _alias.begin("CREATING", "PREPARED", self._backend.provisioning_delay)
+            self._aliases[agentId][_alias_id] = _alias
+            return {"agentAlias": copy.deepcopy(_data)}
+
+    def get_agent_alias(self, agentId: str, agentAliasId: str) -> Dict[str, Any]:
+        with self._lock:
+            self._agent(agentId, "GetAgentAlias")
+            return {"agentAlias": copy.deepcopy(self._alias(agentId, agentAliasId, "GetAgentAlias").data)}
+
+    def list_agent_aliases(self, agentId: str, maxResults: int = None, nextToken: str = None) -> Dict[str, Any]:
+        with self._lock:
+            self._agent(agentId, "ListAgentAliases")
+            _summaries = []
+            for _alias_id in list(self._aliases[agentId]):
+                if _alias_id == TEST_ALIAS_ID:
+                    continue
+                try:
+                    _data = self._alias(agentId, _alias_id, "ListAgentAliases").data
+                except ClientError:
+                    continue
+                _summaries.append({
+                    _key: copy.deepcopy(_data[_key]) for _key in (
+                        "agentAliasId", "agentAliasName", "agentAliasStatus", "description",
+                        "routingConfiguration", "createdAt", "updatedAt",
+                    )
+                })
+            return _page(_summaries, "agentAliasSummaries", maxResults, nextToken)
+
+    def update_agent_alias(self, agentId: str, agentAliasId: str, agentAliasName: str, description: str = None,
+                           routingConfiguration: List[Dict] = None, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._agent(agentId, "UpdateAgentAlias")
+            _alias = self._alias(agentId, agentAliasId, "UpdateAgentAlias")
+            _alias.data["agentAliasName"] = agentAliasName
+            if description is not None:
+                _alias.data["description"] = description
+            if routingConfiguration:
+                _alias.data["routingConfiguration"] = copy.deepcopy(routingConfiguration)
+            _alias.data["updatedAt"] = self._backend.clock.now()
+            _alias.begin("UPDATING", "PREPARED", self._backend.provisioning_delay)
+            return {"agentAlias": copy.deepcopy(_alias.data)}
+
+    def delete_agent_alias(self, agentId: str, agentAliasId: str) -> Dict[str, Any]:
+        with self._lock:
+            self._agent(agentId, "DeleteAgentAlias")
+            _alias = self._alias(agentId, agentAliasId, "DeleteAgentAlias")
+            if agentAliasId == TEST_ALIAS_ID:
+                raise service_error("ValidationException", "The test alias cannot be deleted", "DeleteAgentAlias")
+            _alias.begin("DELETING", "DELETED", self._backend.provisioning_delay)
+            return {"agentId": agentId, "agentAliasId": agentAliasId, "agentAliasStatus": "DELETING"}
+
+    # action groups
+
+    def create_agent_action_group(self, agentId: str, agentVersion: str, actionGroupName: str,
+                                  actionGroupExecutor: Dict = None, functionSchema: Dict = None,
+                                  apiSchema: Dict = None, description: str = None,
+                                  parentActionGroupSignature: str = None, actionGroupState: str = "ENABLED",
+                                  **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "CreateAgentActionGroup")
+            _groups = self._action_groups.setdefault(agentId, {})
+            if any(_g["actionGroupName"] == actionGroupName for _g in _groups.values()):
+                raise service_error(
+                    "ConflictException", f"Action group {actionGroupName} already exists", "CreateAgentActionGroup"
+                )
+            _now = self._backend.clock.now()
+            _data = {
+                "actionGroupId": self._backend.new_id(),
+                "actionGroupName": actionGroupName,
+                "actionGroupState": actionGroupState,
+                "agentId": agentId,
+                "agentVersion": agentVersion,
+                "description": description or "",
+                "createdAt": _now,
+                "updatedAt": _now,
+            }
+            for _key, _value in (("actionGroupExecutor", actionGroupExecutor), ("functionSchema", functionSchema),
+                                 ("apiSchema", apiSchema), ("parentActionSignature", parentActionGroupSignature)):
+                if _value is not None:
+                    _data[_key] = copy.deepcopy(_value)
+            _groups[_data["actionGroupId"]] = _data
+            self._draft_changed(_agent)
+            return {"agentActionGroup": copy.deepcopy(_data)}
+
+    def get_agent_action_group(self, agentId: str, agentVersion: str, actionGroupId: str) -> Dict[str, Any]:
+        with self._lock:
+            self._agent(agentId, "GetAgentActionGroup")
+            return {"agentActionGroup": copy.deepcopy(
+                self._child(self._action_groups, agentId, actionGroupId, "Action group", "GetAgentActionGroup")
+            )}
+
+    def list_agent_action_groups(self, agentId: str, agentVersion: str, maxResults: int = None,
+                                 nextToken: str = None) -> Dict[str, Any]:
+        with self._lock:
+            self._agent(agentId, "ListAgentActionGroups")
+            _summaries = [
+                {_key: _g[_key] for _key in ("actionGroupId", "actionGroupName", "actionGroupState", "description",
+                                             "updatedAt")}
+                for _g in self._action_groups.get(agentId, {}).values()
+            ]
+            return _page(_summaries, "actionGroupSummaries", maxResults, nextToken)
+
+    def update_agent_action_group(self, agentId: str, agentVersion: str, actionGroupId: str, actionGroupName: str,
+                                  parentActionGroupSignature: str = None, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "UpdateAgentActionGroup")
+            _data = self._child(self._action_groups, agentId, actionGroupId, "Action group", "UpdateAgentActionGroup")
+            _data["actionGroupName"] = actionGroupName
+            for _key in ("actionGroupExecutor", "functionSchema", "apiSchema", "description", "actionGroupState"):
+                if _key in kwargs:
+                    _data[_key] = copy.deepcopy(kwargs[_key])
+            if parentActionGroupSignature is not None:
+                _data["parentActionSignature"] = parentActionGroupSignature
+            _data["updatedAt"] = self._backend.clock.now()
+            self._draft_changed(_agent)
+            return {"agentActionGroup": copy.deepcopy(_data)}
+
+    def delete_agent_action_group(self, agentId: str, agentVersion: str, actionGroupId: str,
+                                  skipResourceInUseCheck: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "DeleteAgentActionGroup")
+            self._child(self._action_groups, agentId, actionGroupId, "Action group", "DeleteAgentActionGroup")
+            del self._action_groups[agentId][actionGroupId]
+            self._draft_changed(_agent)
+            return {}
+
+    # collaborators
+
+    def _collaboration_enabled(self, agent: _Resource, operation: str) -> None:
+        if agent.data.get("agentCollaboration", "DISABLED") == "DISABLED":
+            raise service_error(
+                "ValidationException", f"Agent {agent.data['agentId']} does not have collaboration enabled", operation
+            )
+
+    def associate_agent_collaborator(self, agentId: str, agentVersion: str, agentDescriptor: Dict,
+                                     collaboratorName: str, collaborationInstruction: str,
+                                     relayConversationHistory: str = "DISABLED", **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "AssociateAgentCollaborator")
+            self._collaboration_enabled(_agent, "AssociateAgentCollaborator")
+            _collaborators = self._collaborators.setdefault(agentId, {})
+            if any(_c["collaboratorName"] == collaboratorName for _c in _collaborators.values()):
+                raise service_error(
+                    "ConflictException", f"Collaborator {collaboratorName} already exists", "AssociateAgentCollaborator"
+                )
+            _now = self._backend.clock.now()
+            _data = {
+                "agentId": agentId,
+                "agentVersion": agentVersion,
+                "collaboratorId": self._backend.new_id(),
+                "collaboratorName": collaboratorName,
+                "agentDescriptor": copy.deepcopy(agentDescriptor),
+                "collaborationInstruction": collaborationInstruction,
+                "relayConversationHistory": relayConversationHistory,
+                "createdAt": _now,
+                "lastUpdatedAt": _now,
+            }
+            _collaborators[_data["collaboratorId"]] = _data
+            self._draft_changed(_agent)
+            return {"agentCollaborator": copy.deepcopy(_data)}
+
+    def get_agent_collaborator(self, agentId: str, agentVersion: str, collaboratorId: str) -> Dict[str, Any]:
+        with self._lock:
+            self._agent(agentId, "GetAgentCollaborator")
+            return {"agentCollaborator": copy.deepcopy(
+                self._child(self._collaborators, agentId, collaboratorId, "Collaborator", "GetAgentCollaborator")
+            )}
+
+    def list_agent_collaborators(self, agentId: str, agentVersion: str, maxResults: int = None,
+                                 nextToken: str = None) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._agent(agentId, "ListAgentCollaborators")
+            self._collaboration_enabled(_agent, "ListAgentCollaborators")
+            _summaries = copy.deepcopy(list(self._collaborators.get(agentId, {}).values()))
+            return _page(_summaries, "agentCollaboratorSummaries", maxResults, nextToken)
+
+    def update_agent_collaborator(self, agentId: str, agentVersion: str, collaboratorId: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "UpdateAgentCollaborator")
+            _data = self._child(self._collaborators, agentId, collaboratorId, "Collaborator", "UpdateAgentCollaborator")
+            for _key in ("agentDescriptor", "collaboratorName", "collaborationInstruction", "relayConversationHistory"):
+                if _key in kwargs:
+                    _data[_key] = copy.deepcopy(kwargs[_key])
+            _data["lastUpdatedAt"] = self._backend.clock.now()
+            self._draft_changed(_agent)
+            return {"agentCollaborator": copy.deepcopy(_data)}
+
+    def disassociate_agent_collaborator(self, agentId: str, agentVersion: str, collaboratorId: str) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "DisassociateAgentCollaborator")
+            self._child(self._collaborators, agentId, collaboratorId, "Collaborator", "DisassociateAgentCollaborator")
+            del self._collaborators[agentId][collaboratorId]
+            self._draft_changed(_agent)
+            return {}
+
+    # knowledge bases
+
+    def associate_agent_knowledge_base(self, agentId: str, agentVersion: str, knowledgeBaseId: str,
+                                       description: str, knowledgeBaseState: str = "ENABLED") -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "AssociateAgentKnowledgeBase")
+            _knowledge_bases = self._knowledge_bases.setdefault(agentId, {})
+            if knowledgeBaseId in _knowledge_bases:
+                raise service_error(
+                    "ConflictException", f"Knowledge base {knowledgeBaseId} is already associated",
+                    "AssociateAgentKnowledgeBase",
+                )
+            _now = self._backend.clock.now()
+            _data = {
+                "agentId": agentId,
+                "agentVersion": agentVersion,
+                "knowledgeBaseId": knowledgeBaseId,
+                "description": description,
+                "knowledgeBaseState": knowledgeBaseState,
+                "createdAt": _now,
+                "updatedAt": _now,
+            }
+            _knowledge_bases[knowledgeBaseId] = _data
+            self._draft_changed(_agent)
+            return {"agentKnowledgeBase": copy.deepcopy(_data)}
+
+    def get_agent_knowledge_base(self, agentId: str, agentVersion: str, knowledgeBaseId: str) -> Dict[str, Any]:
+        with self._lock:
+            self._agent(agentId, "GetAgentKnowledgeBase")
+            return {"agentKnowledgeBase": copy.deepcopy(self._child(
+                self._knowledge_bases, agentId, knowledgeBaseId, "Knowledge base", "GetAgentKnowledgeBase"
+            ))}
+
+    def list_agent_knowledge_bases(self, agentId: str, agentVersion: str, maxResults: int = None,
+                                   nextToken: str = None) -> Dict[str, Any]:
+        with self._lock:
+            self._agent(agentId, "ListAgentKnowledgeBases")
+            _summaries = [
+                {_key: _kb[_key] for _key in ("knowledgeBaseId", "description", "knowledgeBaseState", "updatedAt")}
+                for _kb in self._knowledge_bases.get(agentId, {}).values()
+            ]
+            return _page(_summaries, "agentKnowledgeBaseSummaries", maxResults, nextToken)
+
+    def update_agent_knowledge_base(self, agentId: str, agentVersion: str, knowledgeBaseId: str,
+                                    **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "UpdateAgentKnowledgeBase")
+            _data = self._child(
+                self._knowledge_bases, agentId, knowledgeBaseId, "Knowledge base", "UpdateAgentKnowledgeBase"
+            )
+            for _key in ("description", "knowledgeBaseState"):
+                if _key in kwargs:
+                    _data[_key] = kwargs[_key]
+            _data["updatedAt"] = self._backend.clock.now()
+            self._draft_changed(_agent)
+            return {"agentKnowledgeBase": copy.deepcopy(_data)}
+
+    def disassociate_agent_knowledge_base(self, agentId: str, agentVersion: str,
+                                          knowledgeBaseId: str) -> Dict[str, Any]:
+        with self._lock:
+            _agent = self._mutable_agent(agentId, "DisassociateAgentKnowledgeBase")
+            self._child(
+                self._knowledge_bases, agentId, knowledgeBaseId, "Knowledge base", "DisassociateAgentKnowledgeBase"
+            )
+            del self._knowledge_bases[agentId][knowledgeBaseId]
+            self._draft_changed(_agent)
+            return {}
+
+    def snapshot(self, agent_id: str, agent_alias_id: str) -> Dict[str, Any]:
+        """Returns what an invocation of an agent alias sees, raising the errors invoke_agent() would.
+
+        Every change to an agent or alias moves its updatedAt, so the copy is reused until then;
+        responders must not modify it.
+        """
+        with self._lock:
+            _agent = self._agent(agent_id, "InvokeAgent")
+            _alias = self._alias(agent_id, agent_alias_id, "InvokeAgent")
+            if agent_alias_id == TEST_ALIAS_ID and "preparedAt" not in _agent.data:
+                raise service_error(
+                    "ValidationException", f"Agent {agent_id} has not been prepared", "InvokeAgent"
+                )
+            if _alias.settle() != "PREPARED":
+                raise service_error(
+                    "ConflictException",
+                    f"Alias {agent_alias_id} is in {_alias.data['agentAliasStatus']} status", "InvokeAgent",
+                )
+            _version = (_agent.data["updatedAt"], _alias.data["updatedAt"])
+            _cached = self._snapshots.get((agent_id, agent_alias_id))
+            if _cached is not None and _cached[0] == _version:
+                return _cached[1]
+            _snapshot = copy.deepcopy({
+                "agent": _agent.data,
+                "alias": _alias.data,
+                "action_groups": list(self._action_groups.get(agent_id, {}).values()),
+                "collaborators": list(self._collaborators.get(agent_id, {}).values()),
+                "knowledge_bases": list(self._knowledge_bases.get(agent_id, {}).values()),
+            })
+            self._snapshots[(agent_id, agent_alias_id)] = (_version, _snapshot)
+            return _snapshot
+
+
+def _usage(input_tokens: int, output_tokens: int) -> Dict[str, Any]:
+    return {"metadata": {"usage": {"inputTokens": input_tokens, "outputTokens": output_tokens}}}
+
+
+def synthetic_completion(request: Dict[str, Any], snapshot: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Builds the completion events of one invoke_agent() call from the state of the invoked agent.
+
+    With enableTrace, the stream starts with pre-processing, orchestration and
+    post-processing traces: a routing or collaborator hand-off for supervisors, a
+    call for each function of a Lambda action group, and a lookup for each associated
+    knowledge base, all with token usage. An agent with RETURN_CONTROL action groups
+    answers with one returnControl event requesting all of their functions, unless the
+    session state carries the results.
+    Otherwise the stream ends with one chunk, cited once per sentence if knowledge
+    bases are associated.
+
+    Args:
+        request (Dict): the invoke_agent() arguments
+        snapshot (Dict): the agent, alias, action groups, collaborators and knowledge bases
+
+    Returns:
+        List[Dict]: raw completion events
+    """
+    _agent = snapshot["agent"]
+    _alias_arn = snapshot["alias"]["agentAliasArn"]
+    _input_text = request.get("inputText") or ""
+    _session_state = request.get("sessionState") or {}
+    _trace_enabled = bool(request.get("enableTrace"))
+    _events = []
+
+    def _trace(body: Dict[str, Any], collaborator: Dict[str, Any] = None) -> None:
+        if not _trace_enabled:
+            return
+        _chain = [{"agentAliasArn": _alias_arn}]
+        _part = {
+            "agentId": _agent["agentId"], "agentAliasId": snapshot["alias"]["agentAliasId"],
+            "agentVersion": snapshot["alias"]["routingConfiguration"][0]["agentVersion"],
+            "sessionId": request.get("sessionId"), "callerChain": _chain, "trace": body,
+        }
+        if collaborator is not None:
+            _chain.append({"agentAliasArn": collaborator["agentDescriptor"]["aliasArn"]})
+            _part["collaboratorName"] = collaborator["collaboratorName"]
+        _events.append({"trace": _part})
+
+    _trace({"preProcessingTrace": {"modelInvocationOutput": _usage(400 + len(_input_text) // 4, 60)}})
+
+    _collaborators = snapshot["collaborators"]
+    if _collaborators:
+        # a stable choice of collaborator per input, so repeated runs produce the same streams
+        _collaborator = _collaborators[int(hashlib.md5(_input_text.encode()).hexdigest(), 16) % len(_collaborators)]
+        if _agent.get("agentCollaboration") == "SUPERVISOR_ROUTER":
+            _trace({"routingClassifierTrace": {"modelInvocationOutput": {
+                **_usage(800, 9), "rawResponse": {"content": f"<a>{_collaborator['collaboratorName']}</a>"}}}})
+        _trace({"orchestrationTrace": {"rationale": {"text": "A collaborator is best placed to answer this."}}})
+        _trace({"orchestrationTrace": {"invocationInput": {"agentCollaboratorInvocationInput": {
+            "agentCollaboratorName": _collaborator["collaboratorName"],
+            "agentCollaboratorAliasArn": _collaborator["agentDescriptor"]["aliasArn"],
+            "input": {"text": _input_text}}}}})
+        _trace({"orchestrationTrace": {"modelInvocationOutput": _usage(1500, 300)}}, _collaborator)
+        _trace({"orchestrationTrace": {"observation": {"agentCollaboratorInvocationOutput": {
+            "agentCollaboratorName": _collaborator["collaboratorName"],
+            "output": {"text": f"{_collaborator['collaboratorName']} answered."}}}}})
+
+    _answer_parts = []
+    _returned_results = _session_state.get("returnControlInvocationResults") or []
+    for _result in _returned_results:
+        _body = _result.get("functionResult", {}).get("responseBody", {}).get("TEXT", {}).get("body", "")
+        _answer_parts.append(f"The function returned: {_body}.")
+
+    _return_control_inputs = []
+    for _group in snapshot["action_groups"]:
+        if _group.get("actionGroupState") != "ENABLED":
+            continue
+        _executor = _group.get("actionGroupExecutor") or {}
+        for _function in (_group.get("functionSchema") or {}).get("functions") or []:
+            _parameters = [
+                {"name": _name, "type": _spec.get("type", "string"), "value": _input_text[:32]}
+                for _name, _spec in (_function.get("parameters") or {}).items()
+            ]
+            if _executor.get("customControl") == "RETURN_CONTROL":
+                _return_control_inputs.append({"functionInvocationInput": {
+                    "actionGroup": _group["actionGroupName"], "function": _function["name"],
+                    "actionInvocationType": "RESULT", "parameters": _parameters,
+                }})
+            elif "lambda" in _executor:
+                _trace({"orchestrationTrace": {"invocationInput": {"actionGroupInvocationInput": {
+                    "actionGroupName": _group["actionGroupName"], "function": _function["name"],
+                    "executionType": "LAMBDA", "parameters": _parameters}}}})
+                _trace({"orchestrationTrace": {"observation": {"actionGroupInvocationOutput": {
+                    "text": f"{_function['name']} completed."}}}})
+                _answer_parts.append(f"{_function['name']} was called.")
+
+    if _return_control_inputs and not _returned_results:
+        # every function of the RETURN_CONTROL action groups is requested at once, as parallel tool calls
+        _trace({"orchestrationTrace": {"modelInvocationOutput": _usage(1200, 80)}})
+        _events.append({"returnControl": {
+            "invocationId": str(uuid.uuid4()), "invocationInputs": _return_control_inputs,
+        }})
+        return _events
+
+    _knowledge_bases = [_kb for _kb in snapshot["knowledge_bases"] if _kb.get("knowledgeBaseState") == "ENABLED"]
+    for _kb in _knowledge_bases:
+        _trace({"orchestrationTrace": {"invocationInput": {"knowledgeBaseLookupInput": {
+            "knowledgeBaseId": _kb["knowledgeBaseId"], "text": _input_text}}}})
+        _trace({"orchestrationTrace": {"observation": {"knowledgeBaseLookupOutput": {"retrievedReferences": [
+            {"content": {"text": "source passage"},
+             "location": {"type": "S3", "s3Location": {"uri": f"s3://{_kb['knowledgeBaseId'].lower()}/doc_0.md"}}}
+        ]}}}})
+
+    _answer_parts.insert(0, f"{_agent['agentName']} received: {_input_text}.")
+    _trace({"orchestrationTrace": {"modelInvocationOutput": _usage(2000, 150)}})
+    _trace({"orchestrationTrace": {"observation": {"finalResponse": {"text": " ".join(_answer_parts)}}}})
+    _trace({"postProcessingTrace": {"modelInvocationOutput": _usage(600, 40)}})
+
+    _text = ""
+    _citations = []
+    for _i, _part in enumerate(_answer_parts):
+        _sentence = f"{_part} "
+        if _knowledge_bases:
+            _kb_id = _knowledge_bases[_i % len(_knowledge_bases)]["knowledgeBaseId"]
+            _citations.append({
+                "generatedResponsePart": {"textResponsePart": {
+                    "text": _sentence, "span": {"start": len(_text), "end": len(_text) + len(_sentence) - 2}}},
+                "retrievedReferences": [{
+                    "content": {"text": "source passage"},
+                    "location": {"type": "S3", "s3Location": {"uri": f"s3://{_kb_id.lower()}/doc_{_i}.md"}},
+                }],
+            })
+        _text += _sentence
+    _chunk = {"bytes": _text.strip().encode("utf8")}
+    if _citations:
+        _chunk["attribution"] = {"citations": _citations}
+    _events.append({"chunk": _chunk})
+    return _events
+
+
+class _AgentRuntimeApi:
+    """The bedrock-agent-runtime invoke_agent() operation; see FakeBedrockBackend."""
+
+    def __init__(self, backend: "FakeBedrockBackend"):
+        self._backend = backend
+
+    def invoke_agent(self, agentId: str, agentAliasId: str, sessionId: str, inputText: str = None,
+                     sessionState: Dict = None, enableTrace: bool = False, endSession: bool = False,
+                     **kwargs) -> Dict[str, Any]:
+        _request = dict(kwargs, agentId=agentId, agentAliasId=agentAliasId, sessionId=sessionId,
+                        inputText=inputText, sessionState=sessionState, enableTrace=enableTrace,
+                        endSession=endSession)
+        _snapshot = self._backend.agents.snapshot(agentId, agentAliasId)
+        return {
+            "contentType": "application/json",
+            "sessionId": sessionId,
+            "completion": self._backend.responder(_request, _snapshot),
+        }
+
+
+class _IamApi:
+    """The IAM role operations used by RoleProvisioner and the teardown helpers; see FakeBedrockBackend."""
+
+    def __init__(self, backend: "FakeBedrockBackend"):
+        self._backend = backend
+        self._lock = backend.lock
+        self.roles: Dict[str, Dict[str, Any]] = {}
+        self._inline: Dict[str, Dict[str, Any]] = {}
+        self._attached: Dict[str, List[str]] = {}
+
+    def _role(self, role_name: str, operation: str) -> Dict[str, Any]:
+        _role = self.roles.get(role_name)
+        if _role is None:
+            raise service_error("NoSuchEntity", f"The role with name {role_name} cannot be found.", operation)
+        return _role
+
+    def create_role(self, RoleName: str, AssumeRolePolicyDocument: str, Path: str = "/", Description: str = None,
+                    **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            if RoleName in self.roles:
+                raise service_error("EntityAlreadyExists", f"Role with name {RoleName} already exists.", "CreateRole")
+            _role = {
+                "Path": Path,
+                "RoleName": RoleName,
+                "RoleId": "AROA" + self._backend.new_id(17),
+                "Arn": f"arn:aws:iam::{self._backend.account_id}:role{Path}{RoleName}",
+                "CreateDate": self._backend.clock.now(),
+                "AssumeRolePolicyDocument": _json_document(AssumeRolePolicyDocument),
+            }
+            if Description:
+                _role["Description"] = Description
+            self.roles[RoleName] = _role
+            self._inline[RoleName] = {}
+            self._attached[RoleName] = []
+            self._backend.role_changed(_role["Arn"])
+            return {"Role": copy.deepcopy(_role)}
+
+    def get_role(self, RoleName: str) -> Dict[str, Any]:
+        with self._lock:
+            return {"Role": copy.deepcopy(self._role(RoleName, "GetRole"))}
+
+    def update_assume_role_policy(self, RoleName: str, PolicyDocument: str) -> Dict[str, Any]:
+        with self._lock:
+            _role = self._role(RoleName, "UpdateAssumeRolePolicy")
+            _role["AssumeRolePolicyDocument"] = _json_document(PolicyDocument)
+            self._backend.role_changed(_role["Arn"])
+            return {}
+
+    def delete_role(self, RoleName: str) -> Dict[str, Any]:
+        with self._lock:
+            self._role(RoleName, "DeleteRole")
+            if self._inline[RoleName] or self._attached[RoleName]:
+                raise service_error(
+                    "DeleteConflict", "Cannot delete entity, must delete policies first.", "DeleteRole"
+                )
+            del self.roles[RoleName], self._inline[RoleName], self._attached[RoleName]
+            return {}
+
+    def put_role_policy(self, RoleName: str, PolicyName: str, PolicyDocument: str) -> Dict[str, Any]:
+        with self._lock:
+            _role = self._role(RoleName, "PutRolePolicy")
+            self._inline[RoleName][PolicyName] = _json_document(PolicyDocument)
+            self._backend.role_changed(_role["Arn"])
+            return {}
+
+    def get_role_policy(self, RoleName: str, PolicyName: str) -> Dict[str, Any]:
+        with self._lock:
+            self._role(RoleName, "GetRolePolicy")
+            _document = self._inline[RoleName].get(PolicyName)
+            if _document is None:
+                raise service_error("NoSuchEntity", f"The role policy {PolicyName} cannot be found.", "GetRolePolicy")
+            return {"RoleName": RoleName, "PolicyName": PolicyName, "PolicyDocument": copy.deepcopy(_document)}
+
+    def delete_role_policy(self, RoleName: str, PolicyName: str) -> Dict[str, Any]:
+        with self._lock:
+            self._role(RoleName, "DeleteRolePolicy")
+            if self._inline[RoleName].pop(PolicyName, None) is None:
+                raise service_error(
+                    "NoSuchEntity", f"The role policy {PolicyName} cannot be found.", "DeleteRolePolicy"
+                )
+            return {}
+
+    def list_role_policies(self, RoleName: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._role(RoleName, "ListRolePolicies")
+            return {"PolicyNames": list(self._inline[RoleName]), "IsTruncated": False}
+
+    def attach_role_policy(self, RoleName: str, PolicyArn: str) -> Dict[str, Any]:
+        with self._lock:
+            _role = self._role(RoleName, "AttachRolePolicy")
+            if PolicyArn not in self._attached[RoleName]:
+                self._attached[RoleName].append(PolicyArn)
+            self._backend.role_changed(_role["Arn"])
+            return {}
+
+    def detach_role_policy(self, RoleName: str, PolicyArn: str) -> Dict[str, Any]:
+        with self._lock:
+            self._role(RoleName, "DetachRolePolicy")
+            if PolicyArn not in self._attached[RoleName]:
+                raise service_error("NoSuchEntity", f"Policy {PolicyArn} was not found.", "DetachRolePolicy")
+            self._attached[RoleName].remove(PolicyArn)
+            return {}
+
+    def list_attached_role_policies(self, RoleName: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._role(RoleName, "ListAttachedRolePolicies")
+            return {
+                "AttachedPolicies": [
+                    {"PolicyName": _arn.split("/")[-1], "PolicyArn": _arn} for _arn in self._attached[RoleName]
+                ],
+                "IsTruncated": False,
+            }
+
+    def delete_policy(self, PolicyArn: str) -> Dict[str, Any]:
+        # customer managed policies are not modelled, attachments are tracked by ARN only
+        return {}
+
+
+class _LambdaApi:
+    """The Lambda function, permission and layer operations used by the helpers; see FakeBedrockBackend."""
+
+    def __init__(self, backend: "FakeBedrockBackend"):
+        self._backend = backend
+        self._lock = backend.lock
+        self.functions: Dict[str, Dict[str, Any]] = {}
+        self._permissions: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._layers: Dict[str, List[Dict[str, Any]]] = {}
+
+    def _function(self, function_name: str, operation: str) -> Dict[str, Any]:
+        _config = self.functions.get(function_name.split(":")[-1])
+        if _config is None:
+            raise service_error("ResourceNotFoundException", f"Function not found: {function_name}", operation)
+        return _config
+
+    def _code_fields(self, code: Dict[str, Any]) -> Dict[str, Any]:
+        _content = code.get("ZipFile")
+        if _content is None:
+            # staged in S3, which is not simulated: digest the location instead of the content
+            _content = f"s3://{code.get('S3Bucket')}/{code.get('S3Key')}".encode()
+        return {"CodeSha256": base64.b64encode(hashlib.sha256(_content).digest()).decode(), "CodeSize": len(_content)}
+
+    def create_function(self, FunctionName: str, Role: str, Code: Dict, Runtime: str = None, Handler: str = None,
+                        Timeout: int = 3, MemorySize: int = 128, Environment: Dict = None, Layers: List[str] = None,
+                        Description: str = "", **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            if FunctionName in self.functions:
+                raise service_error(
+                    "ResourceConflictException", f"Function already exist: {FunctionName}", "CreateFunction"
+                )
+            self._backend.check_role(Role, "CreateFunction")
+            _config = {
+                "FunctionName": FunctionName,
+                "FunctionArn": f"arn:aws:lambda:{self._backend.region_name}:{self._backend.account_id}"
+                               f":function:{FunctionName}",
+                "Runtime": Runtime,
+                "Role": Role,
+                "Handler": Handler,
+                "Timeout": Timeout,
+                "MemorySize": MemorySize,
+                "Description": Description,
+                "Environment": {"Variables": dict((Environment or {}).get("Variables", {}))},
+                "Layers": [{"Arn": _arn} for _arn in Layers or []],
+                "LastModified": self._backend.clock.now().isoformat(),
+                "State": "Active",
+                "LastUpdateStatus": "Successful",
+                "PackageType": "Zip",
+                **self._code_fields(Code),
+            }
+            self.functions[FunctionName] = _config
+            self._permissions[FunctionName] = {}
+            return copy.deepcopy(_config)
+
+    def get_function_configuration(self, FunctionName: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            return copy.deepcopy(self._function(FunctionName, "GetFunctionConfiguration"))
+
+    def get_function(self, FunctionName: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _config = self._function(FunctionName, "GetFunction")
+            return {"Configuration": copy.deepcopy(_config), "Code": {"RepositoryType": "S3"}}
+
+    def update_function_code(self, FunctionName: str, **code) -> Dict[str, Any]:
+        with self._lock:
+            _config = self._function(FunctionName, "UpdateFunctionCode")
+            _config.update(self._code_fields(code))
+            _config["LastModified"] = self._backend.clock.now().isoformat()
+            return copy.deepcopy(_config)
+
+    def update_function_configuration(self, FunctionName: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _config = self._function(FunctionName, "UpdateFunctionConfiguration")
+            if "Role" in kwargs:
+                self._backend.check_role(kwargs["Role"], "UpdateFunctionConfiguration")
+            for _key, _value in kwargs.items():
+                if _key == "Layers":
+                    _config["Layers"] = [{"Arn": _arn} for _arn in _value]
+                else:
+                    _config[_key] = copy.deepcopy(_value)
+            _config["LastModified"] = self._backend.clock.now().isoformat()
+            return copy.deepcopy(_config)
+
+    def delete_function(self, FunctionName: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _config = self._function(FunctionName, "DeleteFunction")
+            del self.functions[_config["FunctionName"]], self._permissions[_config["FunctionName"]]
+            return {}
+
+    def add_permission(self, FunctionName: str, StatementId: str, Action: str, Principal: str,
+                       SourceArn: str = None, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _config = self._function(FunctionName, "AddPermission")
+            _statements = self._permissions[_config["FunctionName"]]
+            if StatementId in _statements:
+                raise service_error(
+                    "ResourceConflictException", f"The statement id ({StatementId}) provided already exists.",
+                    "AddPermission",
+                )
+            _statements[StatementId] = {"Sid": StatementId, "Action": Action, "Principal": Principal,
+                                        "SourceArn": SourceArn}
+            return {"Statement": str(_statements[StatementId])}
+
+    def list_layer_versions(self, LayerName: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            # newest version first, as the service returns them
+            return {"LayerVersions": copy.deepcopy(list(reversed(self._layers.get(LayerName, []))))}
+
+    def publish_layer_version(self, LayerName: str, Content: Dict, Description: str = "",
+                              CompatibleRuntimes: List[str] = None, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            _versions = self._layers.setdefault(LayerName, [])
+            _layer_arn = f"arn:aws:lambda:{self._backend.region_name}:{self._backend.account_id}:layer:{LayerName}"
+            _version = {
+                "LayerVersionArn": f"{_layer_arn}:{len(_versions) + 1}",
+                "Version": len(_versions) + 1,
+                "Description": Description,
+                "CreatedDate": self._backend.clock.now().isoformat(),
+                "CompatibleRuntimes": list(CompatibleRuntimes or []),
+            }
+            _versions.append(_version)
+            return dict(copy.deepcopy(_version), LayerArn=_layer_arn, Content=self._code_fields(Content))
+
+
+class _StsApi:
+    def __init__(self, backend: "FakeBedrockBackend"):
+        self._backend = backend
+
+    def get_caller_identity(self) -> Dict[str, Any]:
+        return {
+            "UserId": "AIDAFAKEBEDROCKBACKEND",
+            "Account": self._backend.account_id,
+            "Arn": f"arn:aws:iam::{self._backend.account_id}:user/fake-bedrock-backend",
+        }
+
+
+class FakeBedrockBackend:
+    """In-memory state of the simulated services, shared by all clients of one or more FakeSessions.
+
+    Args:
+        region_name (str, optional): region used in ARNs. Defaults to "us-east-1".
+        account_id (str, optional): account used in ARNs and returned by STS. Defaults to "123456789012".
+        provisioning_delay (float, optional): seconds before a transitional status such as CREATING or
+            PREPARING settles. Defaults to 0.0, so a status is final on the first read after the call.
+        role_propagation_delay (float, optional): seconds after a role is created or changed during which
+            Bedrock and Lambda reject it, as they do while IAM propagates. Defaults to 0.0.
+        responder (Callable, optional): builds the completion events of an invoke_agent() call from the
+            request and the agent snapshot. Defaults to synthetic_completion.
+        seed (int, optional): seed for the generated resource IDs. Defaults to None.
+    """
+
+    def __init__(
+            self,
+            region_name: str = DEFAULT_REGION,
+            account_id: str = DEFAULT_ACCOUNT_ID,
+            provisioning_delay: float = 0.0,
+            role_propagation_delay: float = 0.0,
+            responder: Callable[[Dict[str, Any], Dict[str, Any]], Iterable[Dict[str, Any]]] = synthetic_completion,
+            seed: int = None,
+    ):
+        self.region_name = region_name
+        self.account_id = account_id
+        self.provisioning_delay = provisioning_delay
+        self.role_propagation_delay = role_propagation_delay
+        self.responder = responder
+        self.clock = _Clock()
+        self.lock = threading.RLock()
+        self._random = random.Random(seed)
+        self._role_changed_at: Dict[str, float] = {}
+        self.agents = _AgentsApi(self)
+        self.runtime = _AgentRuntimeApi(self)
+        self.iam = _IamApi(self)
+        self.lambda_ = _LambdaApi(self)
+        self.sts = _StsApi(self)
+        self._apis = {
+            "bedrock-agent": self.agents,
+            "bedrock-agent-runtime": self.runtime,
+            "iam": self.iam,
+            "lambda": self.lambda_,
+            "sts": self.sts,
+        }
+
+    def api(self, service: str) -> Optional[Any]:
+        """Returns the object implementing a service's operations, or None if the service is not simulated."""
+        return self._apis.get(service)
+
+    def new_id(self, length: int = 10) -> str:
+        with self.lock:
+            return "".join(self._random.choices(string.ascii_uppercase + string.digits, k=length))
+
+    def role_changed(self, role_arn: str) -> None:
+        self._role_changed_at[role_arn] = time.monotonic()
+
+    def check_role(self, role_arn: str, operation: str) -> None:
+        """Rejects a role that does not exist or has not propagated yet, with the errors the services return."""
+        if role_arn is None:
+            return
+        _role_name = role_arn.split("/")[-1]
+        if _role_name not in self.iam.roles:
+            raise service_error("ValidationException", f"The role {role_arn} does not exist", operation)
+        _changed_at = self._role_changed_at.get(role_arn, 0.0)
+        if time.monotonic() - _changed_at < self.role_propagation_delay:
+            _code = "InvalidParameterValueException" if operation.endswith("Function") \
+                or operation == "UpdateFunctionConfiguration" else "ValidationException"
+            raise service_error(_code, f"The role {role_arn} cannot be assumed yet", operation)
+
+
+class Transport:
+    """Carries calls from the fake clients to the backend. Subclass it to add behaviour around every call."""
+
+    def send(self, service: str, operation: str, call: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Performs one API call and returns its response."""
+        return call()
+
+    def stream(self, service: str, operation: str, events: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Delivers the events of an event stream response, e.g. the invoke_agent() completion."""
+        return iter(events)
+
+
+class _TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        _now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (_now - self.updated) * self.rate)
+        self.updated = _now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class FaultInjectingTransport(Transport):
+    """A Transport that adds latency and throttling to calls, and paces stream events.
+
+    Args:
+        latency (float, optional): seconds added to every call. Defaults to 0.0.
+        operation_latency (Dict[str, float], optional): latency per operation name, e.g.
+            {"invoke_agent": 0.8}, overriding latency. Defaults to None.
+        jitter (float, optional): fraction of the latency that is randomized. Defaults to 0.0.
+        throttle_rate (float, optional): probability that a call is throttled. Defaults to 0.0.
+        rate_limits (Dict[str, float], optional): calls per second allowed per operation name, enforced
+            with a token bucket that holds one second of calls; calls over the limit are throttled.
+            Defaults to None.
+        event_interval (float, optional): seconds between stream events. Defaults to 0.0.
+        seed (int, optional): seed for jitter and random throttling. Defaults to None.
+    """
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            operation_latency: Dict[str, float] = None,
+            jitter: float = 0.0,
+            throttle_rate: float = 0.0,
+            rate_limits: Dict[str, float] = None,
+            event_interval: float = 0.0,
+            seed: int = None,
+    ):
+        self.latency = latency
+        self.operation_latency = dict(operation_latency or {})
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.event_interval = event_interval
+        self._buckets = {_operation: _TokenBucket(_rate) for _operation, _rate in (rate_limits or {}).items()}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.throttles = Counter()
+
+    def _throttled(self, operation: str) -> bool:
+        with self._lock:
+            self.calls[operation] += 1
+            _bucket = self._buckets.get(operation)
+            _throttled = (_bucket is not None and not _bucket.take()) \
+                or (self.throttle_rate > 0 and self._random.random() < self.throttle_rate)
+            if _throttled:
+                self.throttles[operation] += 1
+            return _throttled
+
+    def _delay(self, operation: str) -> float:
+        _latency = self.operation_latency.get(operation, self.latency)
+        if _latency <= 0:
+            return 0.0
+        with self._lock:
+            return _latency * (1.0 - self.jitter * self._random.random())
+
+    def send(self, service: str, operation: str, call: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        _delay = self._delay(operation)
+        if _delay:
+            time.sleep(_delay)
+        if self._throttled(operation):
+            raise service_error(THROTTLING_CODES.get(service, "ThrottlingException"), "Rate exceeded", operation)
+        return call()
+
+    def stream(self, service: str, operation: str, events: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for _i, _event in enumerate(events):
+            if _i and self.event_interval > 0:
+                time.sleep(self.event_interval)
+            yield _event
+
+    def report(self) -> str:
+        """Returns one line per operation with its call and throttle counts."""
+        with self._lock:
+            return "\n".join(
+                f"{_operation}: {_count:,} calls, {self.throttles[_operation]:,} throttled"
+                for _operation, _count in sorted(self.calls.items())
+            )
+
+
+class FakeClient:
+    """A boto3-style client whose operations are served by the backend through a Transport.
+
+    Operations take keyword arguments only and return dicts with ResponseMetadata, errors are
+    ClientErrors whose classes are also available as client.exceptions.<Code>, and throttled calls
+    are retried up to max_attempts times in total without delay.
+    """
+
+    def __init__(self, service_name: str, backend: FakeBedrockBackend, transport: Transport, max_attempts: int = 1):
+        self._service_name = service_name
+        self._api = backend.api(service_name)
+        self._transport = transport
+        self._max_attempts = max(1, max_attempts)
+        self.exceptions = _Exceptions()
+
+    def _call(self, operation: str, handler: Callable[..., Dict[str, Any]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        _throttling_code = THROTTLING_CODES.get(self._service_name, "ThrottlingException")
+        _attempt = 0
+        while True:
+            try:
+                _response = self._transport.send(self._service_name, operation, lambda: handler(**kwargs))
+                break
+            except ClientError as e:
+                _attempt += 1
+                if e.response["Error"]["Code"] != _throttling_code or _attempt >= self._max_attempts:
+                    e.response["ResponseMetadata"]["RetryAttempts"] = _attempt - 1
+                    raise
+        _response["ResponseMetadata"] = {
+            "RequestId": str(uuid.uuid4()), "HTTPStatusCode": 200, "HTTPHeaders": {}, "RetryAttempts": _attempt,
+        }
+        if "completion" in _response:
+            _response["completion"] = self._transport.stream(
+                self._service_name, operation, _response["completion"]
+            )
+        return _response
+
+    def __getattr__(self, operation: str):
+        _handler = None if operation.startswith("_") else getattr(self._api, operation, None)
+        if _handler is None or operation == "snapshot":
+            raise AttributeError(f"'{self._service_name}' client has no operation '{operation}'")
+
+        def _operation(*args, **kwargs):
+            if args:
+                raise TypeError(f"{operation}() only accepts keyword arguments.")
+            return self._call(operation, _handler, kwargs)
+
+        _operation.__name__ = operation
+        # later lookups find the bound operation directly
+        self.__dict__[operation] = _operation
+        return _operation
+
+
+class _UnsupportedClient:
+    """Client or resource of a service the backend does not simulate; every use raises NotImplementedError."""
+
+    def __init__(self, service_name: str):
+        self._service_name = service_name
+        self.exceptions = _Exceptions()
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        raise NotImplementedError(f"{self._service_name}.{name} is not simulated by FakeBedrockBackend")
+
+
+class FakeSession:
+    """Stand-in for a boto3 session whose clients are served by a FakeBedrockBackend.
+
+    Args:
+        backend (FakeBedrockBackend, optional): the simulated services. Defaults to a new backend.
+        transport (Transport, optional): carries every call. Defaults to a Transport without faults.
+    """
+
+    def __init__(self, backend: FakeBedrockBackend = None, transport: Transport = None):
+        self.backend = backend or FakeBedrockBackend()
+        self.transport = transport or Transport()
+        self.region_name = self.backend.region_name
+
+    def client(self, service_name: str, region_name: str = None, config: Any = None, **kwargs):
+        if self.backend.api(service_name) is None:
+            return _UnsupportedClient(service_name)
+        # botocore retries throttled calls up to the max_attempts of the client config
+        _max_attempts = (getattr(config, "retries", None) or {}).get("max_attempts", 1)
+        return FakeClient(service_name, self.backend, self.transport, max_attempts=_max_attempts)
+
+    def resource(self, service_name: str, region_name: str = None, config: Any = None, **kwargs):
+        return _UnsupportedClient(service_name)
+
+    def get_credentials(self):
+        return None
+
+
+def fake_clients(backend: FakeBedrockBackend = None, transport: Transport = None, **registry_kwargs) -> ClientRegistry:
+    """Returns a ClientRegistry whose clients are served by a fake backend, for AgentsForAmazonBedrock(clients=...).
+
+    Args:
+        backend (FakeBedrockBackend, optional): the simulated services. Defaults to a new backend.
+        transport (Transport, optional): carries every call, e.g. a FaultInjectingTransport. Defaults to None.
+        **registry_kwargs: other ClientRegistry arguments, e.g. max_attempts
+
+    Returns:
+        ClientRegistry: the registry
+    """
+    return ClientRegistry(session=FakeSession(backend, transport), **registry_kwargs)
@@ -0,0 +1,282 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Idempotent provisioning of IAM roles, with a cache and a propagation probe.
+
+Agent, Lambda and AgentCore roles used to be created one call at a time, followed
+by a fixed time.sleep(10) for IAM propagation. When the role already existed,
+the code either swallowed the error and fell back to get_role, or deleted the
+role and created it again, which started a new propagation wait. RoleProvisioner
+makes a role match a trust policy and a set of policies, calling IAM only for
+the parts that differ:
+
+    >>> roles = role_provisioner(iam_client)
+    >>> role = roles.ensure_role(
+    ...     "agentcore-news-role", trust_policy,
+    ...     inline_policies={"AgentCorePolicy": policy}, exclusive=True)
+
+Every provisioned role is cached under a hash of its name and policy documents.
+When the same role is ensured again with the same documents, the cached role is
+returned without any IAM call, so 20 agents that share the default agent role
+provision it only once. Callers that ensure the same role at the same time wait
+for the one provisioning that is running. A role is only waited for if this call
+created or changed it, and the wait is an active probe (wait_until on the role
+and its inline policies becoming readable) rather than a fixed sleep.
+"""
+
+import hashlib
+import json
+import threading
+import urllib.parse
+from typing import Any, Dict, Iterable, List, Union
+
+from .waiters import WaitResult, error_code, record_skipped_sleep, wait_all, wait_until
+
+# the fixed sleep that used to follow every role creation or policy change
+IAM_PROPAGATION_SLEEP = 10
+DEFAULT_PROPAGATION_TIMEOUT = 60
+
+PolicyDocument = Union[str, Dict[str, Any]]
+
+
+def _as_dict(document: PolicyDocument) -> Dict[str, Any]:
+    if isinstance(document, str):
+        # IAM returns documents URL-encoded unless the SDK decodes them
+        return json.loads(urllib.parse.unquote(document) if document.startswith("%") else document)
+    return document
+
+
+def _canonical(document: PolicyDocument) -> str:
+    return json.dumps(_as_dict(document), sort_keys=True, separators=(",", ":"))
+
+
+def policy_set_digest(
+        role_name: str,
+        assume_role_policy: PolicyDocument,
+        inline_policies: Dict[str, PolicyDocument] = None,
+        managed_policy_arns: Iterable[str] = (),
+        exclusive: bool = False,
+) -> str:
+    """Returns the SHA-256 of a role name and its policy documents, independent of key order."""
+    _spec = {
+        "role_name": role_name,
+        "assume_role_policy": _canonical(assume_role_policy),
+        "inline_policies": {_name: _canonical(_doc) for _name, _doc in (inline_policies or {}).items()},
+        "managed_policy_arns": sorted(managed_policy_arns),
+        "exclusive": exclusive,
+    }
+    return hashlib.sha256(json.dumps(_spec, sort_keys=True).encode()).hexdigest()
+
+
+class RoleProvisioner:
+    """Creates or updates IAM roles so that they match a policy set, caching what it provisioned.
+
+    Args:
+        iam_client: boto3 iam client
+        propagation_timeout (float, optional): seconds to probe for a changed role. Defaults to 60.
+    """
+
+    def __init__(self, iam_client, propagation_timeout: float = DEFAULT_PROPAGATION_TIMEOUT):
+        self._iam_client = iam_client
+        self.propagation_timeout = propagation_timeout
+        self._roles: Dict[str, Dict[str, Any]] = {}
+        self._digests_by_name: Dict[str, str] = {}
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.created = 0
+        self.updated = 0
+
+    def _key_lock(self, digest: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(digest, threading.Lock())
+
+    def _get_role(self, role_name: str) -> Dict[str, Any]:
+        try:
+            return self._iam_client.get_role(RoleName=role_name)["Role"]
+        except Exception as e:
+            if error_code(e) == "NoSuchEntity":
+                return None
+            raise
+
+    def _create_role(self, role_name: str, assume_role_policy: PolicyDocument, description: str) -> Dict[str, Any]:
+        _kwargs = {"RoleName": role_name, "AssumeRolePolicyDocument": _canonical(assume_role_policy)}
+        if description:
+            _kwargs["Description"] = description
+        try:
+            return self._iam_client.create_role(**_kwargs)["Role"]
+        except Exception as e:
+            # another process created it in the meantime; reconcile that role instead
+            if error_code(e) == "EntityAlreadyExists":
+                return self._get_role(role_name)
+            raise
+
+    def _inline_policy(self, role_name: str, policy_name: str) -> Dict[str, Any]:
+        try:
+            _document = self._iam_client.get_role_policy(RoleName=role_name, PolicyName=policy_name)["PolicyDocument"]
+        except Exception as e:
+            if error_code(e) == "NoSuchEntity":
+                return None
+            raise
+        return _as_dict(_document)
+
+    def _inline_policy_names(self, role_name: str) -> List[str]:
+        _names = []
+        _kwargs = {"RoleName": role_name}
+        while True:
+            _resp = self._iam_client.list_role_policies(**_kwargs)
+            _names.extend(_resp.get("PolicyNames", []))
+            if not _resp.get("IsTruncated"):
+                return _names
+            _kwargs["Marker"] = _resp["Marker"]
+
+    def _attached_policy_arns(self, role_name: str) -> List[str]:
+        _arns = []
+        _kwargs = {"RoleName": role_name}
+        while True:
+            _resp = self._iam_client.list_attached_role_policies(**_kwargs)
+            _arns.extend(_policy["PolicyArn"] for _policy in _resp.get("AttachedPolicies", []))
+            if not _resp.get("IsTruncated"):
+                return _arns
+            _kwargs["Marker"] = _resp["Marker"]
+
+    def ensure_role(
+            self,
+            role_name: str,
+            assume_role_policy: PolicyDocument,
+            inline_policies: Dict[str, PolicyDocument] = None,
+            managed_policy_arns: Iterable[str] = (),
+            description: str = None,
+            exclusive: bool = False,
+            wait: bool = True,
+    ) -> Dict[str, Any]:
+        """Makes sure a role exists with the given trust policy and policies.
+
+        The role is created if it does not exist. Otherwise only the trust policy, inline
+        policies and managed policy attachments that differ are updated, so the role keeps its
+        ARN and, if nothing differs, needs no propagation wait at all.
+
+        Args:
+            role_name (str): name of the role
+            assume_role_policy (str | dict): trust policy document
+            inline_policies (Dict[str, str | dict], optional): inline policy documents by policy name. Defaults to None.
+            managed_policy_arns (Iterable[str], optional): managed policies to attach. Defaults to ().
+            description (str, optional): description of a new role. Defaults to None.
+            exclusive (bool, optional): delete inline policies that are not in inline_policies. Defaults to False.
+            wait (bool, optional): probe until a created or changed role is visible. Pass False when the
+                consumer retries on propagation errors itself, e.g. retry_call(..., is_role_propagation_error).
+                Defaults to True.
+
+        Returns:
+            Dict[str, Any]: the 'Role' of get_role(), including its Arn
+        """
+        _inline_policies = {_name: _as_dict(_doc) for _name, _doc in (inline_policies or {}).items()}
+        _managed_policy_arns = sorted(set(managed_policy_arns))
+        _digest = policy_set_digest(role_name, assume_role_policy, _inline_policies, _managed_policy_arns, exclusive)
+        with self._key_lock(_digest):
+            _role = self._roles.get(_digest)
+            if _role is not None:
+                self.cache_hits += 1
+                return _role
+
+            _changed = False
+            _role = self._get_role(role_name)
+            if _role is None:
+                _role = self._create_role(role_name, assume_role_policy, description)
+                self.created += 1
+                _changed = True
+            elif _canonical(_role.get("AssumeRolePolicyDocument", {})) != _canonical(assume_role_policy):
+                self._iam_client.update_assume_role_policy(
+                    RoleName=role_name, PolicyDocument=_canonical(assume_role_policy)
+                )
+                _changed = True
+
+            for _policy_name, _document in _inline_policies.items():
+                _current = self._inline_policy(role_name, _policy_name)
+                if _current is None or _canonical(_current) != _canonical(_document):
+                    self._iam_client.put_role_policy(
+                        RoleName=role_name, PolicyName=_policy_name, PolicyDocument=_canonical(_document)
+                    )
+                    _changed = True
+            if exclusive:
+                for _policy_name in self._inline_policy_names(role_name):
+                    if _policy_name not in _inline_policies:
+                        self._iam_client.delete_role_policy(RoleName=role_name, PolicyName=_policy_name)
+                        _changed = True
+
+            if _managed_policy_arns:
+                _attached = set(self._attached_policy_arns(role_name))
+                for _policy_arn in _managed_policy_arns:
+                    if _policy_arn not in _attached:
+                        self._iam_client.attach_role_policy(RoleName=role_name, PolicyArn=_policy_arn)
+                        _changed = True
+
+            if _changed:
+                self.updated += 1
+                if wait:
+                    self.wait_propagated(role_name, list(_inline_policies))
+                else:
+                    record_skipped_sleep(f"iam role {role_name}", IAM_PROPAGATION_SLEEP)
+
+            with self._lock:
+                _previous = self._digests_by_name.get(role_name)
+                if _previous is not None and _previous != _digest:
+                    self._roles.pop(_previous, None)
+                self._digests_by_name[role_name] = _digest
+                self._roles[_digest] = _role
+            return _role
+
+    def wait_propagated(self, role_name: str, policy_names: Iterable[str] = ()) -> WaitResult:
+        """Probes until the role and its inline policies can be read back from IAM.
+
+        Roles trusted by a service principal cannot be assumed by the caller, so a dry-run
+        sts:AssumeRole is not available; reading the role back is the closest active check.
+
+        Args:
+            role_name (str): name of the role
+            policy_names (Iterable[str], optional): inline policies that must be readable. Defaults to ().
+
+        Returns:
+            WaitResult: the outcome of the wait
+        """
+        _policy_names = list(policy_names)
+
+        def _visible() -> bool:
+            if self._get_role(role_name) is None:
+                return False
+            return all(self._inline_policy(role_name, _name) is not None for _name in _policy_names)
+
+        return wait_until(
+            _visible,
+            name=f"iam role {role_name}",
+            timeout=self.propagation_timeout,
+            baseline=IAM_PROPAGATION_SLEEP,
+        )
+
+    def wait_all_propagated(self, role_names: Iterable[str], max_workers: int = 8) -> List[WaitResult]:
+        """Probes several roles concurrently, e.g. after ensure_role(..., wait=False) for a batch of agents."""
+        return wait_all(
+            [lambda _name=_name: self.wait_propagated(_name) for _name in role_names],
+            max_workers=max_workers,
+        )
+
+    def forget(self, role_name: str) -> None:
+        """Drops a role from the cache, e.g. after deleting it."""
+        with self._lock:
+            _digest = self._digests_by_name.pop(role_name, None)
+            if _digest is not None:
+                self._roles.pop(_digest, None)
+
+
+_provisioners: Dict[int, tuple] = {}
+_provisioners_lock = threading.Lock()
+
+
+def role_provisioner(iam_client) -> RoleProvisioner:
+    """Returns the process-wide RoleProvisioner of an IAM client, so every helper shares its cache."""
+    with _provisioners_lock:
+        # keep a reference to the client, so its id() cannot be reused by another client
+        _entry = _provisioners.get(id(iam_client))
+        if _entry is None:
+            _entry = (iam_client, RoleProvisioner(iam_client))
+            _provisioners[id(iam_client)] = _entry
+        return _entry[1]
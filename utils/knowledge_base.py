@@ -5,11 +5,12 @@ from botocore.exceptions import ClientError
 from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth, RequestError
 import pprint
 from retrying import retry
-import zipfile
-from io import BytesIO
+from .aws_clients import get_clients
+from .waiters import WaitFailed, WaitTimeout, is_kb_storage_not_ready_error, record_skipped_sleep, retry_call, wait_until
+from .lambda_artifacts import LambdaArtifactCache, LambdaPackage
+from .teardown import TeardownPlan, add_bucket_steps, add_collection_steps, add_role_steps
 import warnings
 import random
-from sagemaker import get_execution_role
 
 warnings.filterwarnings('ignore')
 
@@ -59,18 +60,17 @@ class BedrockKnowledgeBase:
             chunking_strategy="FIXED_SIZE",
             suffix=None,
     ):
-        boto3_session = boto3.session.Session()
-        self.region_name = boto3_session.region_name
-        self.iam_client = boto3_session.client('iam')
-        self.lambda_client = boto3.client('lambda')
-        self.account_number = boto3.client('sts').get_caller_identity().get('Account')
+        clients = get_clients()
+        self.region_name = clients.region_name
+        self.iam_client = clients.client('iam')
+        self.lambda_client = clients.client('lambda')
+        self.account_number = clients.account_id
         self.suffix = suffix or f'{self.region_name}-{self.account_number}'
-        self.identity = boto3.client('sts').get_caller_identity()['Arn']
-        self.aoss_client = boto3_session.client('opensearchserverless')
-        self.s3_client = boto3.client('s3')
-        self.bedrock_agent_client = boto3.client('bedrock-agent')
-        credentials = boto3.Session().get_credentials()
-        self.awsauth = AWSV4SignerAuth(credentials, self.region_name, 'aoss')
+        self.identity = clients.identity_arn
+        self.aoss_client = clients.client('opensearchserverless')
+        self.s3_client = clients.client('s3')
+        self.bedrock_agent_client = clients.client('bedrock-agent')
+        self.awsauth = AWSV4SignerAuth(clients.credentials(), self.region_name, 'aoss')
 
         self.kb_name = kb_name or f"default-knowledge-base-{self.suffix}"
         self.kb_description = kb_description or "Default Knowledge Base"
@@ -206,21 +206,16 @@ class BedrockKnowledgeBase:
         self.lambda_iam_role_name = lambda_iam_role['Role']['RoleName']
         self.roles.append(self.lambda_iam_role_name)
         
-        s = BytesIO()
-        z = zipfile.ZipFile(s, 'w')
-        z.write("lambda_function.py")
-        z.close()
-        zip_content = s.getvalue()
-
-        lambda_function = self.lambda_client.create_function(
-            FunctionName=self.lambda_function_name,
-            Runtime='python3.12',
-            Timeout=60,
-            Role=lambda_iam_role['Role']['Arn'],
-            Code={'ZipFile': zip_content},
-            Handler='lambda_function.lambda_handler'
+        # creates the function, or updates an existing one when its code changed
+        result = LambdaArtifactCache(self.lambda_client).deploy_function(
+            self.lambda_function_name,
+            LambdaPackage("lambda_function.py"),
+            lambda_iam_role['Role']['Arn'],
+            handler='lambda_function.lambda_handler',
+            runtime='python3.12',
+            timeout=60,
         )
-        return lambda_function
+        return {"FunctionArn": result.function_arn, "CodeSha256": result.code_sha256}
 
     def create_lambda_role(self):
         lambda_function_role = f'{self.kb_name}-lambda-role-{self.suffix}'
@@ -245,7 +240,7 @@ class BedrockKnowledgeBase:
                 AssumeRolePolicyDocument=json.dumps(assume_role_policy_document)
             )
 
-            time.sleep(10)
+            record_skipped_sleep(f"role {lambda_function_role}", 10)
         except self.iam_client.exceptions.EntityAlreadyExistsException:
             lambda_iam_role = self.iam_client.get_role(RoleName=lambda_function_role)
 
@@ -422,11 +417,12 @@ class BedrockKnowledgeBase:
         return bedrock_kb_execution_role
 
     def create_policies_in_oss(self):
-        # role_sm = get_execution_role()
         try:
-    # Try to get the SageMaker execution role
+            # Try to get the SageMaker execution role; outside SageMaker the SDK is
+            # missing or get_execution_role() raises ValueError
+            from sagemaker import get_execution_role
             role_sm = get_execution_role()
-        except :
+        except (ImportError, ValueError):
             # If running as a user instead of a role, create or use an execution role
             print("Running as IAM user, creating a SageMaker execution role...")
             
@@ -569,18 +565,19 @@ class BedrockKnowledgeBase:
         host = collection_id + '.' + self.region_name + '.aoss.amazonaws.com'
         print(host)
 
-        response = self.aoss_client.batch_get_collection(names=[self.vector_store_name])
-        while (response['collectionDetails'][0]['status']) == 'CREATING':
-            print('Creating collection...')
-            interactive_sleep(30)
-            response = self.aoss_client.batch_get_collection(names=[self.vector_store_name])
+        response = wait_until(
+            lambda: self.aoss_client.batch_get_collection(names=[self.vector_store_name]),
+            ready=lambda r: r['collectionDetails'][0]['status'] != 'CREATING',
+            name=f"collection {self.vector_store_name}", poll_interval=30,
+            on_poll=lambda r: print('Creating collection...'),
+        ).value
         print('\nCollection successfully created:')
         pp.pprint(response["collectionDetails"])
 
         try:
             self.create_oss_policy_attach_bedrock_execution_role(collection_id)
-            print("Sleeping for a minute to ensure data access rules have been enforced")
-            interactive_sleep(60)
+            # data access rules take up to a minute to be enforced; create_vector_index() retries until they are
+            record_skipped_sleep(f"data access policy {self.access_policy_name}", 60)
         except Exception as e:
             print("Policy already exists")
             pp.pprint(e)
@@ -648,10 +645,17 @@ class BedrockKnowledgeBase:
         }
 
         try:
-            response = self.oss_client.indices.create(index=self.index_name, body=json.dumps(body_json))
+            response = retry_call(
+                lambda: self.oss_client.indices.create(index=self.index_name, body=json.dumps(body_json)),
+                retry_if=lambda e: getattr(e, 'status_code', None) == 403,
+                name=f"create index {self.index_name}", timeout=120, baseline=0.0,
+            )
             print('\nCreating index:')
             pp.pprint(response)
-            interactive_sleep(60)
+            wait_until(
+                lambda: self.oss_client.indices.exists(index=self.index_name),
+                name=f"index {self.index_name}", timeout=120, baseline=60,
+            )
         except RequestError as e:
             print(f'Error while trying to create the index, with error {e.error}')
 
@@ -710,7 +714,9 @@ class BedrockKnowledgeBase:
         }
         return configs.get(strategy, configs["NONE"])
 
-    @retry(wait_random_min=1000, wait_random_max=2000, stop_max_attempt_number=7)
+    # retry only while the index or its access policy is not ready yet, not on errors in the request
+    @retry(wait_exponential_multiplier=500, wait_exponential_max=8000, stop_max_delay=120000,
+           retry_on_exception=is_kb_storage_not_ready_error)
     def create_knowledge_base(self, data_sources):
         opensearch_serverless_configuration = {
             "collectionArn": self.collection_arn,
@@ -978,10 +984,44 @@ class BedrockKnowledgeBase:
         return ds_list
         
 
+    def _indexed_chunks(self):
+        """Returns the number of searchable documents (chunks) in the vector index, or None if it cannot be counted."""
+        try:
+            return self.oss_client.count(index=self.index_name)["count"]
+        except Exception as e:
+            print(f"Could not count the documents of index {self.index_name}: {e}")
+            return None
+
+    def wait_for_indexed_chunks(self, job, chunks_before):
+        """Waits until the documents of a completed ingestion job are searchable.
+
+        OpenSearch Serverless makes new documents searchable only after a refresh, so a
+        retrieve() right after the job completes can return nothing. The index document
+        count is polled until it grows; when it cannot be counted, this sleeps for 40s.
+        """
+        _statistics = job.get("statistics", {})
+        if job["status"] != "COMPLETE" or not (
+                _statistics.get("numberOfNewDocumentsIndexed") or _statistics.get("numberOfModifiedDocumentsIndexed")
+        ):
+            return
+        if chunks_before is None or not _statistics.get("numberOfNewDocumentsIndexed"):
+            # modified documents do not change the count, so there is nothing to poll
+            interactive_sleep(40)
+            return
+        try:
+            wait_until(
+                self._indexed_chunks,
+                ready=lambda count: count is None or count > chunks_before,
+                name=f"documents of ingestion job {job['ingestionJobId']}", timeout=120, baseline=40,
+            )
+        except WaitTimeout as e:
+            print(f"{e}; retrieval may not return the new documents yet")
+
     def start_ingestion_job(self):
 
         for idx, ds in enumerate(self.data_sources):
             try:
+                _chunks_before = self._indexed_chunks()
                 start_job_response = self.bedrock_agent_client.start_ingestion_job(
                     knowledgeBaseId=self.knowledge_base['knowledgeBaseId'],
                     dataSourceId=self.data_source[idx]["dataSourceId"]
@@ -989,15 +1029,19 @@ class BedrockKnowledgeBase:
                 job = start_job_response["ingestionJob"]
                 print(f"job {idx+1} started successfully\n")
                 # pp.pprint(job)
-                while job['status'] not in ["COMPLETE", "FAILED", "STOPPED"]:
-                    get_job_response = self.bedrock_agent_client.get_ingestion_job(
-                        knowledgeBaseId=self.knowledge_base['knowledgeBaseId'],
-                        dataSourceId=self.data_source[idx]["dataSourceId"],
-                        ingestionJobId=job["ingestionJobId"]
-                    )
-                    job = get_job_response["ingestionJob"]
+                if job['status'] not in ["COMPLETE", "FAILED", "STOPPED"]:
+                    # backoff instead of calling get_ingestion_job in a tight loop
+                    job = wait_until(
+                        lambda: self.bedrock_agent_client.get_ingestion_job(
+                            knowledgeBaseId=self.knowledge_base['knowledgeBaseId'],
+                            dataSourceId=self.data_source[idx]["dataSourceId"],
+                            ingestionJobId=job["ingestionJobId"]
+                        )["ingestionJob"],
+                        ready=lambda j: j['status'] in ["COMPLETE", "FAILED", "STOPPED"],
+                        name=f"ingestion job {job['ingestionJobId']}", timeout=3600,
+                    ).value
                 pp.pprint(job)
-                interactive_sleep(40)
+                self.wait_for_indexed_chunks(job, _chunks_before)
 
             except Exception as e:
                 print(f"Couldn't start {idx} job.\n")
@@ -1015,62 +1059,89 @@ class BedrockKnowledgeBase:
     def delete_kb(self, delete_s3_bucket=False, delete_iam_roles_and_policies=True, delete_lambda_function=False):
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore")
-            
-            # delete data sources
-            ds_id_list = self.bedrock_agent_client.list_data_sources(
-                knowledgeBaseId=self.knowledge_base['knowledgeBaseId'],
-                maxResults=100
+            return self.plan_teardown(
+                delete_s3_bucket, delete_iam_roles_and_policies, delete_lambda_function
+            ).run()
+
+    def plan_teardown(self, delete_s3_bucket=False, delete_iam_roles_and_policies=True, delete_lambda_function=False,
+                      plan=None):
+        """Adds the deletion of the knowledge base and its resources to a teardown plan.
+
+        The data sources are deleted first, then the knowledge base. Once it is gone, the
+        collection and its policies, the roles, the Lambda function and the buckets are
+        deleted in parallel.
+
+        Args:
+            delete_s3_bucket (bool, optional): also empty and delete the data source buckets. Defaults to False.
+            delete_iam_roles_and_policies (bool, optional): also delete the roles and their policies. Defaults to True.
+            delete_lambda_function (bool, optional): also delete the intermediate Lambda function. Defaults to False.
+            plan (TeardownPlan, optional): plan to add to. Defaults to a new plan.
+
+        Returns:
+            TeardownPlan: the plan, to run with plan.run()
+        """
+        _plan = plan if plan is not None else TeardownPlan()
+        _kb_id = self.knowledge_base['knowledgeBaseId']
+
+        _data_sources = [
+            _plan.add(
+                f"data-source:{_kb_id}/{_ds['dataSourceId']}",
+                lambda _ds_id=_ds["dataSourceId"]: self.bedrock_agent_client.delete_data_source(
+                    dataSourceId=_ds_id, knowledgeBaseId=_kb_id
+                ),
+            )
+            for _ds in self.bedrock_agent_client.list_data_sources(
+                knowledgeBaseId=_kb_id, maxResults=100
             )['dataSourceSummaries']
+        ]
 
-            for idx, ds in enumerate(ds_id_list):
-                try:
-                    self.bedrock_agent_client.delete_data_source(
-                        dataSourceId=ds_id_list[idx]["dataSourceId"],
-                        knowledgeBaseId=self.knowledge_base['knowledgeBaseId']
-                    )
-                    print("======== Data source deleted =========")
-                except Exception as e:
-                    print(e)
-            
-            # delete KB
+        # the collection can only be deleted once the knowledge base is gone
+        def _kb_gone():
             try:
-                self.bedrock_agent_client.delete_knowledge_base(
-                    knowledgeBaseId=self.knowledge_base['knowledgeBaseId']
-                )
-                print("======== Knowledge base deleted =========")
-
-            except self.bedrock_agent_client.exceptions.ResourceNotFoundException as e:
-                print("Resource not found", e)
-            except Exception as e:
-                print(e)
+                _status = self.bedrock_agent_client.get_knowledge_base(
+                    knowledgeBaseId=_kb_id
+                )['knowledgeBase']['status']
+            except self.bedrock_agent_client.exceptions.ResourceNotFoundException:
+                return True
+            if _status == "DELETE_UNSUCCESSFUL":
+                raise WaitFailed(f"knowledge base {_kb_id} could not be deleted")
+            return False
+
+        _kb = _plan.add(
+            f"knowledge-base:{_kb_id}",
+            lambda: self.bedrock_agent_client.delete_knowledge_base(knowledgeBaseId=_kb_id),
+            after=_data_sources,
+            gone=_kb_gone,
+        )
+        add_collection_steps(
+            _plan, self.aoss_client, self.collection_id,
+            access_policy_name=self.access_policy_name,
+            network_policy_name=self.network_policy_name,
+            encryption_policy_name=self.encryption_policy_name,
+            after=[_kb],
+        )
 
-            time.sleep(20)
+        _lambda = None
+        if delete_lambda_function and self.lambda_function_name:
+            _lambda = _plan.add(
+                f"lambda:{self.lambda_function_name}",
+                lambda: self.lambda_client.delete_function(FunctionName=self.lambda_function_name),
+                after=[_kb],
+            )
 
-            # delete oss colletion and policies
-            try:
-                self.aoss_client.delete_collection(id=self.collection_id)
-                self.aoss_client.delete_access_policy(type="data", name=self.access_policy_name)
-                self.aoss_client.delete_security_policy(type="network", name=self.network_policy_name)
-                self.aoss_client.delete_security_policy(type="encryption", name=self.encryption_policy_name)
-                print("======== Vector Index, collection and associated policies deleted =========")
-            except Exception as e:
-                print(e)
-            
-            # delete role and policies
-            if delete_iam_roles_and_policies:
-                self.delete_iam_role_and_policies()
-
-            # delete lambda
-            if delete_lambda_function and self.lambda_function_name:
-                try:
-                    self.lambda_client.delete_function(FunctionName=self.lambda_function_name)
-                    print(f"Deleted Lambda function {self.lambda_function_name}")
-                except self.lambda_client.exceptions.ResourceNotFoundException:
-                    print(f"Lambda function {self.lambda_function_name} not found.")
-
-            # delete s3 bucket
-            if delete_s3_bucket:
-                self.delete_s3()
+        if delete_iam_roles_and_policies:
+            add_role_steps(_plan, self.iam_client, self.kb_execution_role_name, after=[_kb],
+                           delete_customer_policies=True)
+            # the intermediate Lambda role is only deleted together with its function
+            if _lambda is not None:
+                for _role_name in self.roles[1:]:
+                    add_role_steps(_plan, self.iam_client, _role_name, after=[_lambda],
+                                   delete_customer_policies=True)
+
+        if delete_s3_bucket:
+            for _bucket_name in self.bucket_names + ([self.intermediate_bucket_name] if self.intermediate_bucket_name else []):
+                add_bucket_steps(_plan, self.s3_client, _bucket_name, after=[_kb])
+        return _plan
 
     def delete_iam_role_and_policies(self):
         iam = boto3.resource('iam')
@@ -28,6 +28,9 @@ from botocore.exceptions import ClientError
 from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth, RequestError
 import pprint
 from retrying import retry
+from .aws_clients import get_clients
+from .waiters import is_kb_storage_not_ready_error, record_skipped_sleep, retry_call, wait_until
+from .teardown import TeardownPlan, add_bucket_steps, add_collection_steps, add_role_steps
 import random
 import os
 
@@ -64,21 +67,16 @@ class KnowledgeBasesForAmazonBedrock:
         """
         Class initializer
         """
-        boto3_session = boto3.session.Session()
-        self.region_name = boto3_session.region_name
-        self.iam_client = boto3_session.client('iam',region_name=self.region_name)
-        self.account_number = boto3.client('sts',region_name=self.region_name).get_caller_identity().get('Account')
+        clients = get_clients()
+        self.region_name = clients.region_name
+        self.iam_client = clients.client('iam')
+        self.account_number = clients.account_id
         self.suffix = random.randrange(200, 900)
-        self.identity = boto3.client('sts',region_name=self.region_name).get_caller_identity()['Arn']
-        self.aoss_client = boto3_session.client('opensearchserverless',region_name=self.region_name)
-        self.s3_client = boto3.client('s3',region_name=self.region_name)
-        self.bedrock_agent_client = boto3.client('bedrock-agent',region_name=self.region_name)
-        self.bedrock_agent_client = boto3.client(
-            'bedrock-agent',
-            region_name=self.region_name
-        )
-        credentials = boto3.Session().get_credentials()
-        self.awsauth = AWSV4SignerAuth(credentials, self.region_name, 'aoss')
+        self.identity = clients.identity_arn
+        self.aoss_client = clients.client('opensearchserverless')
+        self.s3_client = clients.client('s3')
+        self.bedrock_agent_client = clients.client('bedrock-agent')
+        self.awsauth = AWSV4SignerAuth(clients.credentials(), self.region_name, 'aoss')
         self.oss_client = None
 
     def create_or_retrieve_knowledge_base(
@@ -180,7 +178,7 @@ class KnowledgeBasesForAmazonBedrock:
                 collection_arn, index_name, data_bucket_name, embedding_model,
                 kb_name, kb_description, bedrock_kb_execution_role, bucket_prefix
             )
-            interactive_sleep(60)
+            self.wait_kb_active(knowledge_base['knowledgeBaseId'], baseline=60)
             print("========================================================================================")
             kb_id = knowledge_base['knowledgeBaseId']
             ds_id = data_source["dataSourceId"]
@@ -501,12 +499,13 @@ class KnowledgeBasesForAmazonBedrock:
         print(host)
         # wait for collection creation
         # This can take couple of minutes to finish
-        response = self.aoss_client.batch_get_collection(names=[vector_store_name])
         # Periodically check collection status
-        while (response['collectionDetails'][0]['status']) == 'CREATING':
-            print('Creating collection...')
-            interactive_sleep(30)
-            response = self.aoss_client.batch_get_collection(names=[vector_store_name])
+        response = wait_until(
+            lambda: self.aoss_client.batch_get_collection(names=[vector_store_name]),
+            ready=lambda r: r['collectionDetails'][0]['status'] != 'CREATING',
+            name=f"collection {vector_store_name}", poll_interval=30,
+            on_poll=lambda r: print('Creating collection...'),
+        ).value
         print('\nCollection successfully created:')
         pp.pprint(response["collectionDetails"])
         # create opensearch serverless access policy and attach it to Bedrock execution role
@@ -515,9 +514,9 @@ class KnowledgeBasesForAmazonBedrock:
                 collection_id, oss_policy_name, bedrock_kb_execution_role
             )
             if created:
-                # It can take up to a minute for data access rules to be enforced
-                print("Sleeping for a minute to ensure data access rules have been enforced")
-                interactive_sleep(60)
+                # It can take up to a minute for data access rules to be enforced; instead of sleeping,
+                # create_vector_index() retries while the collection still denies access
+                record_skipped_sleep(f"data access policy {oss_policy_name}", 60)
             return host, collection, collection_id, collection_arn
         except Exception as e:
             print("Policy already exists")
@@ -558,12 +557,19 @@ class KnowledgeBasesForAmazonBedrock:
 
         # Create index
         try:
-            response = self.oss_client.indices.create(index=index_name, body=json.dumps(body_json))
+            response = retry_call(
+                lambda: self.oss_client.indices.create(index=index_name, body=json.dumps(body_json)),
+                retry_if=lambda e: getattr(e, 'status_code', None) == 403,
+                name=f"create index {index_name}", timeout=120, baseline=0.0,
+            )
             print('\nCreating index:')
             pp.pprint(response)
 
             # index creation can take up to a minute
-            interactive_sleep(60)
+            wait_until(
+                lambda: self.oss_client.indices.exists(index=index_name),
+                name=f"index {index_name}", timeout=120, baseline=60,
+            )
         except RequestError as e:
             # you can delete the index if its already exists
             # oss_client.indices.delete(index=index_name)
@@ -571,7 +577,9 @@ class KnowledgeBasesForAmazonBedrock:
                 f'Error while trying to create the index, with error {e.error}\nyou may unmark the delete above to '
                 f'delete, and recreate the index')
 
-    @retry(wait_random_min=1000, wait_random_max=2000, stop_max_attempt_number=7)
+    # retry only while the index or its access policy is not ready yet, not on errors in the request
+    @retry(wait_exponential_multiplier=500, wait_exponential_max=8000, stop_max_delay=120000,
+           retry_on_exception=is_kb_storage_not_ready_error)
     def create_knowledge_base(
             self, collection_arn: str, index_name: str, bucket_name: str, embedding_model: str,
             kb_name: str, kb_description: str, bedrock_kb_execution_role: str, bucket_prefix: str
@@ -696,8 +704,11 @@ class KnowledgeBasesForAmazonBedrock:
         """
         # ensure that the kb is available
         i_status = ['CREATING', 'DELETING', 'UPDATING']
-        while self.bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)['knowledgeBase']['status'] in i_status:
-            time.sleep(10)
+        wait_until(
+            lambda: self.bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)['knowledgeBase']['status'],
+            ready=lambda status: status not in i_status,
+            name=f"knowledge base {kb_id}", poll_interval=10,
+        )
         # Start an ingestion job
         start_job_response = self.bedrock_agent_client.start_ingestion_job(
             knowledgeBaseId=kb_id,
@@ -706,17 +717,33 @@ class KnowledgeBasesForAmazonBedrock:
         job = start_job_response["ingestionJob"]
         pp.pprint(job)
         # Get job
-        while job['status'] != 'COMPLETE' and job['status'] != 'FAILED':
-            get_job_response = self.bedrock_agent_client.get_ingestion_job(
-                knowledgeBaseId=kb_id,
-                dataSourceId=ds_id,
-                ingestionJobId=job["ingestionJobId"]
-            )
-            job = get_job_response["ingestionJob"]
-            interactive_sleep(5)
+        if job['status'] not in ('COMPLETE', 'FAILED'):
+            job = wait_until(
+                lambda: self.bedrock_agent_client.get_ingestion_job(
+                    knowledgeBaseId=kb_id,
+                    dataSourceId=ds_id,
+                    ingestionJobId=job["ingestionJobId"]
+                )["ingestionJob"],
+                ready=lambda j: j['status'] in ('COMPLETE', 'FAILED'),
+                name=f"ingestion job {job['ingestionJobId']}", timeout=3600, poll_interval=5,
+            ).value
         pp.pprint(job)
         #interactive_sleep(40)
 
+    def wait_kb_active(self, kb_id: str, baseline: float = None):
+        """
+        Wait for a knowledge base to become ACTIVE
+        Args:
+            kb_id: knowledge base id
+            baseline: length of the fixed sleep this wait replaces, for waiter_stats
+        """
+        return wait_until(
+            lambda: self.bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)['knowledgeBase']['status'],
+            ready=lambda status: status == 'ACTIVE',
+            failed=lambda status: status == 'FAILED',
+            name=f"knowledge base {kb_id}", baseline=baseline,
+        )
+
     def get_kb(self, kb_id):
         """
         Get KB details
@@ -796,69 +823,51 @@ class KnowledgeBasesForAmazonBedrock:
         )
         bucket_name = ds_details['dataSource']['dataSourceConfiguration']['s3Configuration']['bucketArn'].replace(
             "arn:aws:s3:::", "")
-        try:
-            self.bedrock_agent_client.delete_data_source(
-                dataSourceId=ds_id,
-                knowledgeBaseId=kb_id
-            )
-            print("Data Source deleted successfully!")
-        except Exception as e:
-            print(e)
-        try:
-            self.bedrock_agent_client.delete_knowledge_base(
-                knowledgeBaseId=kb_id
-            )
-            print("Knowledge Base deleted successfully!")
-        except Exception as e:
-            print(e)
-        if delete_aoss:
-            try:
-                self.oss_client.indices.delete(index=index_name)
-                print("OpenSource Serveless Index deleted successfully!")
-            except Exception as e:
-                print(e)
-            try:
-                self.aoss_client.delete_collection(id=collection_id)
-                print("OpenSource Collection Index deleted successfully!")
-            except Exception as e:
-                print(e)
-            try:
-                self.aoss_client.delete_access_policy(
-                    type="data",
-                    name=access_policy_name
-                )
-                print("OpenSource Serveless access policy deleted successfully!")
-            except Exception as e:
-                print(e)
-            try:
-                self.aoss_client.delete_security_policy(
-                    type="network",
-                    name=network_policy_name
-                )
-                print("OpenSource Serveless network policy deleted successfully!")
-            except Exception as e:
-                print(e)
+        # the data source goes first and the knowledge base next; once the knowledge base is gone,
+        # the index and collection, the bucket and the role are independent and deleted in parallel
+        plan = TeardownPlan()
+        data_source = plan.add(
+            f"data-source:{kb_id}/{ds_id}",
+            lambda: self.bedrock_agent_client.delete_data_source(dataSourceId=ds_id, knowledgeBaseId=kb_id),
+        )
+
+        def kb_gone():
             try:
-                self.aoss_client.delete_security_policy(
-                    type="encryption",
-                    name=encryption_policy_name
-                )
-                print("OpenSource Serveless encryption policy deleted successfully!")
-            except Exception as e:
-                print(e)
+                self.bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)
+            except self.bedrock_agent_client.exceptions.ResourceNotFoundException:
+                return True
+            return False
+
+        kb = plan.add(
+            f"knowledge-base:{kb_id}",
+            lambda: self.bedrock_agent_client.delete_knowledge_base(knowledgeBaseId=kb_id),
+            after=[data_source],
+            gone=kb_gone,
+        )
+        if delete_aoss:
+            collection_after = [kb]
+            # without a client for the collection endpoint, the index goes with the collection
+            if self.oss_client is not None:
+                collection_after = [plan.add(
+                    f"index:{collection_id}/{index_name}",
+                    lambda: self.oss_client.indices.delete(index=index_name),
+                    after=[kb],
+                )]
+            add_collection_steps(
+                plan, self.aoss_client, collection_id,
+                access_policy_name=access_policy_name,
+                network_policy_name=network_policy_name,
+                encryption_policy_name=encryption_policy_name,
+                after=collection_after,
+            )
         if delete_s3_bucket:
-            try:
-                self.delete_s3(bucket_name)
-                print("Knowledge Base S3 bucket deleted successfully!")
-            except Exception as e:
-                print(e)
+            add_bucket_steps(plan, self.s3_client, bucket_name, after=[data_source])
         if delete_iam_roles_and_policies:
-            try:
-                self.delete_iam_roles_and_policies(kb_role)
-                print("Knowledge Base Roles and Policies deleted successfully!")
-            except Exception as e:
-                print(e)
-        print("Resources deleted successfully!")
+            add_role_steps(plan, self.iam_client, kb_role, after=[kb], delete_customer_policies=True)
+        results = plan.run()
+        if all(result.ok for result in results):
+            print("Resources deleted successfully!")
+        return results
 
     def delete_iam_roles_and_policies(self, kb_execution_role_name: str):
         """
@@ -1,4 +1,3 @@
-import boto3
 import re
 import random
 import time
@@ -7,25 +6,31 @@ import os
 import uuid
 import logging
 from botocore.exceptions import ClientError
-from IPython.display import HTML
 from base64 import b64encode
-from IPython.display import Audio, display
 import io
 import re
 import base64
-import io
-from PIL import Image
-import matplotlib.pyplot as plt
+# notebook display helpers are imported on first use; see rendering.py for headless mode
+from .rendering import display, html as HTML, audio as Audio
+from .aws_clients import get_clients
 
 suffix = random.randrange(200, 900)
-boto3_session = boto3.session.Session()
-region_name = boto3_session.region_name
-iam_client = boto3_session.client('iam')
-s3_client = boto3_session.client('s3')
-account_number = boto3.client('sts').get_caller_identity().get('Account')
-identity = boto3.client('sts').get_caller_identity()['Arn']
+_clients = get_clients()
+boto3_session = _clients.session
+region_name = _clients.region_name
+iam_client = _clients.client('iam')
+s3_client = _clients.client('s3')
+
+bedrock_agent_client = _clients.client('bedrock-agent')
+
 
-bedrock_agent_client = boto3.client('bedrock-agent')
+def __getattr__(name):
+    # account_number and identity need an STS call, so it is made on first access rather than at import
+    if name == 'account_number':
+        return _clients.account_id
+    if name == 'identity':
+        return _clients.identity_arn
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def interactive_sleep(seconds: int):
     dots = ''
@@ -155,7 +160,7 @@ def ingest_documents_dla(
     :param client_token: Optional unique token for request idempotency.
     :return: The API response.
     """
-    bedrock_agent_client = boto3.client('bedrock-agent')  
+    bedrock_agent_client = get_clients().client('bedrock-agent')
 
     request = {
         'knowledgeBaseId': knowledge_base_id,
@@ -307,10 +312,10 @@ def create_bucket(bucket_name, region=None):
     # Create bucket
     try:
         if region is None:
-            s3_client = boto3.client('s3')
+            s3_client = get_clients().client('s3')
             resp=s3_client.create_bucket(Bucket=bucket_name)
         else:
-            s3_client = boto3.client('s3', region_name=region)
+            s3_client = get_clients().client('s3', region_name=region)
             location = {'LocationConstraint': region}
             s3_client.create_bucket(Bucket=bucket_name,
                                     CreateBucketConfiguration=location)
@@ -419,7 +424,7 @@ def play_audio_segment(audio_s3_info, start_ms, end_ms=None):
     
     try:
         # 1. First get the JSON file from S3
-        s3_client = boto3.client('s3')
+        s3_client = get_clients().client('s3')
         json_response = s3_client.get_object(
             Bucket=audio_s3_info['bucket'],
             Key=audio_s3_info['key']
@@ -599,7 +604,7 @@ def parse_response_and_get_s3_info(response):
 def get_video_from_metadata(bucket, key):
     try:
         # Create S3 client
-        s3_client = boto3.client('s3')
+        s3_client = get_clients().client('s3')
         
         # First get the JSON file from S3
         json_response = s3_client.get_object(
@@ -656,7 +661,7 @@ def play_video_from_bedrock_response(bedrock_response):
         bool: True if video plays successfully, False otherwise
     """
     try:
-        s3_client = boto3.client('s3')
+        s3_client = get_clients().client('s3')
         
         # Extract JSON S3 URI from response
         pattern = r'\[?(s3://[^\s\]]+)\]?'
@@ -0,0 +1,281 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Content-addressed packaging and in-place deployment of Lambda functions and layers.
+
+Action-group and gateway Lambdas used to be re-zipped and created from scratch
+on every deploy, and changing their code meant deleting and recreating them.
+LambdaPackage builds a reproducible zip from one or more files, directories or
+a pre-built zip, so identical content always has the same SHA-256. That digest
+is also what Lambda reports as CodeSha256. LambdaArtifactCache compares the
+two, skips the upload when nothing changed, and otherwise updates the code
+and/or configuration of the existing function in place:
+
+    >>> artifacts = LambdaArtifactCache(lambda_client)
+    >>> deps = artifacts.deploy_layer("news-tools-deps", LambdaPackage(["build/python"], prefix="python"))
+    >>> result = artifacts.deploy_function(
+    ...     "news_tools", LambdaPackage(["news_tools.py", "news_helpers/"]), role_arn,
+    ...     handler="news_tools.lambda_handler", layers=[deps])
+    >>> result.code_updated, result.configuration_updated
+    (False, False)
+
+Packages larger than the 50 MB direct upload limit are uploaded to S3 under
+their digest, so an unchanged package is uploaded only once.
+"""
+
+import base64
+import hashlib
+import os
+import zipfile
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from .waiters import is_role_propagation_error, retry_call, wait_until
+
+DEFAULT_RUNTIME = "python3.12"
+# larger packages must be uploaded through S3
+DIRECT_UPLOAD_LIMIT = 50 * 1024 * 1024
+_EXCLUDED_DIRS = ("__pycache__", ".git", ".ipynb_checkpoints")
+_EXCLUDED_SUFFIXES = (".pyc",)
+# a fixed timestamp keeps the archive independent of file modification times
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def code_sha256(zip_content: bytes) -> str:
+    """Returns the digest of a package in the encoding Lambda uses for CodeSha256."""
+    return base64.b64encode(hashlib.sha256(zip_content).digest()).decode()
+
+
+class LambdaPackage:
+    """A reproducible zip of Lambda code or layer content.
+
+    Args:
+        sources (str | Iterable[str]): files and directories to include. Files keep the path they are
+            given with, directory contents are stored relative to the directory. A single .zip file
+            is used as is.
+        prefix (str, optional): directory to place everything under, e.g. "python" for a Python layer.
+            Defaults to "".
+    """
+
+    def __init__(self, sources: Union[str, Iterable[str]], prefix: str = ""):
+        self.sources = [sources] if isinstance(sources, str) else list(sources)
+        self.prefix = prefix.strip("/")
+        self._zip_content = None
+
+    def _entries(self) -> List[tuple]:
+        _entries = []
+        for _source in self.sources:
+            if os.path.isdir(_source):
+                for _dir, _subdirs, _files in os.walk(_source):
+                    _subdirs[:] = [_d for _d in _subdirs if _d not in _EXCLUDED_DIRS]
+                    for _file in _files:
+                        if not _file.endswith(_EXCLUDED_SUFFIXES):
+                            _path = os.path.join(_dir, _file)
+                            _entries.append((os.path.relpath(_path, _source), _path))
+            else:
+                _entries.append((os.path.normpath(_source).lstrip(os.sep), _source))
+        if self.prefix:
+            _entries = [(f"{self.prefix}/{_arcname}", _path) for _arcname, _path in _entries]
+        return sorted((_arcname.replace(os.sep, "/"), _path) for _arcname, _path in _entries)
+
+    @property
+    def zip_content(self) -> bytes:
+        """The zip archive, built on first use."""
+        if self._zip_content is None:
+            if len(self.sources) == 1 and self.sources[0].endswith(".zip") and not self.prefix:
+                with open(self.sources[0], "rb") as f:
+                    self._zip_content = f.read()
+            else:
+                _buffer = BytesIO()
+                with zipfile.ZipFile(_buffer, "w", zipfile.ZIP_DEFLATED) as _zip:
+                    for _arcname, _path in self._entries():
+                        _info = zipfile.ZipInfo(_arcname, date_time=_ZIP_DATE_TIME)
+                        _info.compress_type = zipfile.ZIP_DEFLATED
+                        # keep only the executable bit of the file mode
+                        _info.external_attr = (0o755 if os.access(_path, os.X_OK) else 0o644) << 16
+                        with open(_path, "rb") as f:
+                            _zip.writestr(_info, f.read())
+                self._zip_content = _buffer.getvalue()
+        return self._zip_content
+
+    @property
+    def code_sha256(self) -> str:
+        return code_sha256(self.zip_content)
+
+
+@dataclass
+class DeployResult:
+    """Outcome of LambdaArtifactCache.deploy_function()."""
+    function_arn: str
+    code_sha256: str
+    created: bool = False
+    code_updated: bool = False
+    configuration_updated: bool = False
+
+    @property
+    def changed(self) -> bool:
+        return self.created or self.code_updated or self.configuration_updated
+
+
+class LambdaArtifactCache:
+    """Creates or updates Lambda functions and layers, uploading only content that changed.
+
+    Args:
+        lambda_client: boto3 lambda client
+        s3_client (optional): boto3 s3 client, needed for packages over the direct upload limit
+        s3_bucket (str, optional): bucket to stage large packages in. Defaults to None.
+        s3_prefix (str, optional): key prefix of staged packages. Defaults to "lambda-artifacts/".
+    """
+
+    def __init__(self, lambda_client, s3_client=None, s3_bucket: str = None, s3_prefix: str = "lambda-artifacts/"):
+        self._lambda_client = lambda_client
+        self._s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix
+        self.uploads = 0
+
+    def _code(self, package: LambdaPackage) -> Dict[str, Any]:
+        _zip_content = package.zip_content
+        if len(_zip_content) <= DIRECT_UPLOAD_LIMIT:
+            self.uploads += 1
+            return {"ZipFile": _zip_content}
+        if self._s3_client is None or self.s3_bucket is None:
+            raise ValueError(
+                f"package of {len(_zip_content):,} bytes exceeds the direct upload limit, configure s3_client and s3_bucket"
+            )
+        # content-addressed keys: a package already in the bucket is not uploaded again
+        _key = f"{self.s3_prefix}{hashlib.sha256(_zip_content).hexdigest()}.zip"
+        try:
+            self._s3_client.head_object(Bucket=self.s3_bucket, Key=_key)
+        except Exception:
+            self._s3_client.put_object(Bucket=self.s3_bucket, Key=_key, Body=_zip_content)
+            self.uploads += 1
+        return {"S3Bucket": self.s3_bucket, "S3Key": _key}
+
+    def _get_configuration(self, function_name: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._lambda_client.get_function_configuration(FunctionName=function_name)
+        except self._lambda_client.exceptions.ResourceNotFoundException:
+            return None
+
+    def _wait_updated(self, function_name: str) -> Dict[str, Any]:
+        return wait_until(
+            lambda: self._lambda_client.get_function_configuration(FunctionName=function_name),
+            ready=lambda config: config.get("State", "Active") == "Active"
+            and config.get("LastUpdateStatus", "Successful") == "Successful",
+            failed=lambda config: "Failed" in (config.get("State"), config.get("LastUpdateStatus")),
+            name=f"lambda {function_name}",
+        ).value
+
+    def deploy_function(
+            self,
+            function_name: str,
+            package: LambdaPackage,
+            role_arn: str,
+            handler: str,
+            runtime: str = DEFAULT_RUNTIME,
+            timeout: int = None,
+            memory_size: int = None,
+            environment: Dict[str, str] = None,
+            layers: List[str] = None,
+            description: str = None,
+    ) -> DeployResult:
+        """Creates a function, or brings an existing one up to date with as few calls as possible.
+
+        The code is uploaded only when its digest differs from the function's CodeSha256, and
+        update_function_configuration is called only when one of the given settings differs.
+        Settings left as None are not managed.
+
+        Args:
+            function_name (str): name of the function
+            package (LambdaPackage): the function code
+            role_arn (str): execution role ARN
+            handler (str): handler, e.g. "my_function.lambda_handler"
+            runtime (str, optional): runtime. Defaults to "python3.12".
+            timeout (int, optional): timeout in seconds. Defaults to None.
+            memory_size (int, optional): memory in MB. Defaults to None.
+            environment (Dict[str, str], optional): environment variables. Defaults to None.
+            layers (List[str], optional): layer version ARNs. Defaults to None.
+            description (str, optional): function description. Defaults to None.
+
+        Returns:
+            DeployResult: function ARN, code digest and what was changed
+        """
+        _config = {"Role": role_arn, "Handler": handler, "Runtime": runtime}
+        if timeout is not None:
+            _config["Timeout"] = timeout
+        if memory_size is not None:
+            _config["MemorySize"] = memory_size
+        if environment is not None:
+            _config["Environment"] = {"Variables": dict(environment)}
+        if layers is not None:
+            _config["Layers"] = list(layers)
+        if description is not None:
+            _config["Description"] = description
+
+        _current = self._get_configuration(function_name)
+        if _current is None:
+            _function = retry_call(
+                lambda: self._lambda_client.create_function(
+                    FunctionName=function_name, Code=self._code(package), PackageType="Zip", **_config
+                ),
+                retry_if=is_role_propagation_error,
+                name=f"create lambda {function_name}",
+                baseline=0.0,
+            )
+            self._wait_updated(function_name)
+            return DeployResult(_function["FunctionArn"], package.code_sha256, created=True)
+
+        _result = DeployResult(_current["FunctionArn"], package.code_sha256)
+        if _current["CodeSha256"] != package.code_sha256:
+            self._lambda_client.update_function_code(FunctionName=function_name, **self._code(package))
+            self._wait_updated(function_name)
+            _result.code_updated = True
+
+        _live = dict(_current)
+        _live["Environment"] = {"Variables": (_current.get("Environment") or {}).get("Variables", {})}
+        _live["Layers"] = [_layer["Arn"] for _layer in _current.get("Layers", [])]
+        _changed = {_k: _v for _k, _v in _config.items() if _live.get(_k) != _v}
+        if _changed:
+            retry_call(
+                lambda: self._lambda_client.update_function_configuration(FunctionName=function_name, **_changed),
+                retry_if=is_role_propagation_error,
+                name=f"update lambda {function_name}",
+                baseline=0.0,
+            )
+            self._wait_updated(function_name)
+            _result.configuration_updated = True
+        return _result
+
+    def deploy_layer(
+            self,
+            layer_name: str,
+            package: LambdaPackage,
+            compatible_runtimes: List[str] = None,
+            description: str = "",
+    ) -> str:
+        """Publishes a layer version, unless the latest version already has the same content.
+
+        The digest of the content is kept in the version description, since list_layer_versions
+        does not return CodeSha256.
+
+        Args:
+            layer_name (str): name of the layer
+            package (LambdaPackage): the layer content, e.g. with prefix="python"
+            compatible_runtimes (List[str], optional): runtimes. Defaults to ["python3.12"].
+            description (str, optional): description, the digest is appended. Defaults to "".
+
+        Returns:
+            str: LayerVersionArn of the matching or newly published version
+        """
+        _tag = f"sha256:{package.code_sha256}"
+        _versions = self._lambda_client.list_layer_versions(LayerName=layer_name).get("LayerVersions", [])
+        if _versions and _versions[0].get("Description", "").endswith(_tag):
+            return _versions[0]["LayerVersionArn"]
+        _response = self._lambda_client.publish_layer_version(
+            LayerName=layer_name,
+            Description=f"{description} {_tag}".strip(),
+            Content=self._code(package),
+            CompatibleRuntimes=compatible_runtimes or [DEFAULT_RUNTIME],
+        )
+        return _response["LayerVersionArn"]
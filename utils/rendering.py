@@ -0,0 +1,116 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Lazily loaded display helpers shared by the utils modules.
+
+termcolor, rich and IPython.display are only needed to render output in a
+notebook, yet importing them costs hundreds of milliseconds and tens of MB on
+every Lambda or AgentCore cold start. The helpers below import them on first
+use instead of at module load.
+
+In headless mode nothing is imported at all: colored() returns the plain text,
+print_markdown() prints the raw markdown and display() logs the object's repr.
+Headless mode is enabled by setting the AGENT_UTILS_HEADLESS environment variable
+to 1/true, or by calling set_headless(True). It is also used automatically when a
+display library is not installed.
+
+Run benchmarks/bench_import_time.py to track the import cost of each module.
+"""
+
+import importlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+_headless = os.environ.get("AGENT_UTILS_HEADLESS", "").lower() in ("1", "true", "yes")
+_modules = {}
+
+
+def is_headless() -> bool:
+    """Returns True if display libraries must not be loaded."""
+    return _headless
+
+
+def set_headless(headless: bool = True) -> None:
+    """Turns headless mode on or off for the whole process."""
+    global _headless
+    _headless = headless
+
+
+def lazy_module(name: str):
+    """Imports a display module on first use.
+
+    Args:
+        name (str): module name, e.g. "IPython.display"
+
+    Returns:
+        module: the imported module, or None in headless mode or if it is not installed
+    """
+    if _headless:
+        return None
+    if name not in _modules:
+        try:
+            _modules[name] = importlib.import_module(name)
+        except ImportError:
+            logger.info("%s is not installed, rendering its output as plain text", name)
+            _modules[name] = None
+    return _modules[name]
+
+
+def colored(text: str, color: str = None) -> str:
+    """termcolor.colored(), or the plain text when headless."""
+    _termcolor = lazy_module("termcolor")
+    if _termcolor is None:
+        return text
+    return _termcolor.colored(text, color)
+
+
+def _plain(text: str, color: str = None) -> str:
+    return text
+
+
+def colorizer():
+    """Returns a colored() for loops that color many lines, e.g. the console trace output.
+
+    Whether to color is decided once, when colorizer() is called, so the returned function
+    should not outlive the output it colors.
+
+    Returns:
+        Callable[[str, str], str]: termcolor.colored, or a function returning the plain text
+        when headless or when termcolor would not color (no terminal, NO_COLOR, ...)
+    """
+    _termcolor = lazy_module("termcolor")
+    if _termcolor is None or _termcolor.colored("-", "red") == "-":
+        return _plain
+    return _termcolor.colored
+
+
+def print_markdown(text: str) -> None:
+    """Renders markdown with rich, or prints it as is when headless."""
+    _console = lazy_module("rich.console")
+    _markdown = lazy_module("rich.markdown")
+    if _console is None or _markdown is None:
+        print(text)
+        return
+    _console.Console().print(_markdown.Markdown(text))
+
+
+def display(obj) -> None:
+    """IPython.display.display(), or a log line when headless."""
+    _ipython = lazy_module("IPython.display")
+    if _ipython is None:
+        logger.info("Not displaying %r in headless mode", obj)
+        return
+    _ipython.display(obj)
+
+
+def html(data: str):
+    """Returns an IPython HTML object, or the raw HTML string when headless."""
+    _ipython = lazy_module("IPython.display")
+    return data if _ipython is None else _ipython.HTML(data)
+
+
+def audio(**kwargs):
+    """Returns an IPython Audio object, or None when headless."""
+    _ipython = lazy_module("IPython.display")
+    return None if _ipython is None else _ipython.Audio(**kwargs)
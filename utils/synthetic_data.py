@@ -0,0 +1,151 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Vectorized generation of synthetic monthly power readings for the energy agent.
+
+generate_fake_data_dynamodb() used to write readings for 5 hard-coded
+customers, concatenating the whole file into one string first. Load testing
+the agent's DynamoDB action group needs millions of rows, so
+PowerReadingGenerator draws the readings with NumPy, a chunk of customers at
+a time. It streams them to a JSON Lines file, or as items into the bulk
+loader, without holding more than one chunk in memory:
+
+    >>> generator = PowerReadingGenerator(customers=1_000_000, months_back=12, months_ahead=6, seed=0)
+    >>> generator.rows
+    19000000
+    >>> generator.write_jsonl("readings.jsonl")
+    >>> DynamoDBBulkLoader(dynamodb_client, "meter_readings", max_workers=32).load(generator.items())
+
+Every customer gets one reading per month from months_back months before the
+start month to months_ahead months after it. Readings up to the start month
+are "measured" and later ones "forecasted", in the item layout of the
+energy agent's table:
+
+    {"customer_id": "1", "day": "2024/05/01", "sumPowerReading": "154", "kind": "measured"}
+"""
+
+import datetime
+import importlib
+import itertools
+import os
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+DEFAULT_CHUNK_ROWS = 100_000
+POWER_DISTRIBUTIONS = ("uniform", "normal", "poisson")
+
+
+def _numpy():
+    try:
+        return importlib.import_module("numpy")
+    except ImportError as e:
+        raise ImportError("generating synthetic readings requires NumPy: pip install numpy") from e
+
+
+class PowerReadingGenerator:
+    """Monthly power readings of a range of customers, drawn from a distribution.
+
+    Args:
+        customers (int, optional): number of customers, with IDs "1" to str(customers). Defaults to 5.
+        months_back (int, optional): measured months before the start month. Defaults to 4.
+        months_ahead (int, optional): forecasted months after the start month. Defaults to 4.
+        start (datetime.date, optional): the current month. Defaults to today.
+        distribution (str, optional): "uniform", "normal" or "poisson". Defaults to "uniform".
+        low (int, optional): smallest uniform reading. Defaults to 100.
+        high (int, optional): largest uniform reading. Defaults to 200.
+        step (int, optional): spacing of uniform readings. Defaults to 2.
+        mean (float, optional): mean of normal and poisson readings. Defaults to 150.
+        std (float, optional): standard deviation of normal readings, clipped at 0. Defaults to 25.
+        seed (int, optional): seed for reproducible datasets. Defaults to None.
+        chunk_rows (int, optional): approximate rows generated at a time. Defaults to 100,000.
+    """
+
+    def __init__(
+            self,
+            customers: int = 5,
+            months_back: int = 4,
+            months_ahead: int = 4,
+            start: datetime.date = None,
+            distribution: str = "uniform",
+            low: int = 100,
+            high: int = 200,
+            step: int = 2,
+            mean: float = 150.0,
+            std: float = 25.0,
+            seed: int = None,
+            chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    ):
+        if distribution not in POWER_DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {POWER_DISTRIBUTIONS}, not {distribution!r}")
+        self.customers = customers
+        self.months_back = months_back
+        self.months_ahead = months_ahead
+        self.start = start or datetime.date.today()
+        self.distribution = distribution
+        self.low = low
+        self.high = high
+        self.step = step
+        self.mean = mean
+        self.std = std
+        self.seed = seed
+        self.chunk_rows = chunk_rows
+
+    def months(self) -> List[Tuple[str, str]]:
+        """Returns the (day, kind) of every month, oldest first."""
+        _start = self.start.year * 12 + self.start.month - 1
+        return [
+            (f"{_month // 12}/{_month % 12 + 1:02d}/01", "measured" if _month <= _start else "forecasted")
+            for _month in range(_start - self.months_back, _start + self.months_ahead + 1)
+        ]
+
+    @property
+    def rows(self) -> int:
+        return self.customers * (self.months_back + self.months_ahead + 1)
+
+    def _draw(self, rng, size: int):
+        if self.distribution == "uniform":
+            return self.low + self.step * rng.integers(0, (self.high - self.low) // self.step + 1, size)
+        if self.distribution == "normal":
+            return rng.normal(self.mean, self.std, size).round().clip(0).astype("int64")
+        return rng.poisson(self.mean, size)
+
+    def chunks(self) -> Iterator[Tuple[List[int], List[int]]]:
+        """Yields the readings a chunk of customers at a time, as (customer IDs, readings) with
+        len(months()) consecutive entries per customer, in the order of months()."""
+        _np = _numpy()
+        _rng = _np.random.default_rng(self.seed)
+        _months = self.months_back + self.months_ahead + 1
+        _customers_per_chunk = max(1, self.chunk_rows // _months)
+        for _first in range(1, self.customers + 1, _customers_per_chunk):
+            _ids = _np.arange(_first, min(self.customers + 1, _first + _customers_per_chunk))
+            yield _np.repeat(_ids, _months).tolist(), self._draw(_rng, len(_ids) * _months).tolist()
+
+    def items(self) -> Iterator[Dict[str, Any]]:
+        """Yields every reading as a table item, e.g. for DynamoDBBulkLoader.load()."""
+        _months = self.months()
+        for _ids, _readings in self.chunks():
+            for _customer, _reading, (_day, _kind) in zip(_ids, _readings, itertools.cycle(_months)):
+                yield {"customer_id": str(_customer), "day": _day, "sumPowerReading": str(_reading), "kind": _kind}
+
+    def write_jsonl(self, path: Union[str, os.PathLike]) -> int:
+        """Writes every reading to a JSON Lines file, one chunk at a time.
+
+        Lines are the json.dumps() of items(), formatted without building a dict per row.
+
+        Args:
+            path (Union[str, os.PathLike]): the file to write
+
+        Returns:
+            int: the number of rows written
+        """
+        _months = [
+            (f'", "day": "{_day}", "sumPowerReading": "', f'", "kind": "{_kind}"}}\n')
+            for _day, _kind in self.months()
+        ]
+        _rows = 0
+        with open(path, "w", encoding="utf-8") as _file:
+            for _ids, _readings in self.chunks():
+                _file.write("".join(
+                    f'{{"customer_id": "{_customer}{_middle}{_reading}{_end}'
+                    for _customer, _reading, (_middle, _end) in zip(_ids, _readings, itertools.cycle(_months))
+                ))
+                _rows += len(_ids)
+        return _rows
@@ -0,0 +1,400 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Dependency-ordered, parallel deletion of workshop resources.
+
+Cleanup used to delete one resource after the other: every alias of an agent,
+then the agent, then each policy of its role, and a fixed time.sleep(30) before
+deleting each AgentCore gateway, whose targets had been deleted just before.
+TeardownPlan holds the deletions as a DAG instead. A step starts as soon as every
+step it must follow has finished, so independent branches run concurrently.
+Where a deletion completes asynchronously, the step polls until the resource is
+gone before releasing the steps that depend on it:
+
+    >>> plan = TeardownPlan()
+    >>> plan.add("target:t1", lambda: client.delete_gateway_target(...), gone=lambda: target_gone("t1"))
+    >>> plan.add("gateway:g1", lambda: client.delete_gateway(...), after=["target:t1"])
+    >>> results = plan.run()
+
+A resource that does not exist (any more) counts as deleted. When a step fails,
+the steps that depend on it are skipped and every other branch carries on.
+The add_*_steps functions below add the steps for common resources: IAM roles
+with their policies, S3 buckets with their objects, OpenSearch Serverless
+collections with their policies, and AgentCore gateways with their targets.
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .waiters import error_code, wait_until
+
+DEFAULT_GONE_TIMEOUT = 600
+# error codes meaning the resource to delete does not exist
+MISSING_ERROR_CODES = (
+    "ResourceNotFoundException",
+    "NoSuchEntity",
+    "NoSuchBucket",
+    "NotFoundException",
+    "404",
+)
+
+
+def is_missing_error(error: Exception) -> bool:
+    """True for the errors AWS returns when the resource to delete does not exist."""
+    return error_code(error) in MISSING_ERROR_CODES or getattr(error, "status_code", None) == 404
+
+
+class TeardownFailed(RuntimeError):
+    """Raised by raise_for_failures() when a step failed. results holds the outcome of every step."""
+
+    def __init__(self, message: str, results: List["TeardownResult"]):
+        super().__init__(message)
+        self.results = results
+
+
+@dataclass
+class TeardownStep:
+    """One deletion. gone, if set, is polled after delete() until it returns true."""
+    key: str
+    delete: Callable[[], Any]
+    after: List[str] = field(default_factory=list)
+    gone: Optional[Callable[[], bool]] = None
+    gone_timeout: float = DEFAULT_GONE_TIMEOUT
+
+
+@dataclass
+class TeardownResult:
+    """Outcome of one step: "deleted", "missing", "failed" or "skipped"."""
+    key: str
+    status: str
+    elapsed: float = 0.0
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("deleted", "missing")
+
+
+class TeardownPlan:
+    """A DAG of deletions, run with as much parallelism as the dependencies allow.
+
+    Args:
+        verbose (bool, optional): print the outcome of every step. Defaults to True.
+    """
+
+    def __init__(self, verbose: bool = True):
+        self.verbose = verbose
+        self.steps: Dict[str, TeardownStep] = {}
+        self._print_lock = threading.Lock()
+
+    def add(
+            self,
+            key: str,
+            delete: Callable[[], Any],
+            after: Iterable[str] = (),
+            gone: Callable[[], bool] = None,
+            gone_timeout: float = DEFAULT_GONE_TIMEOUT,
+    ) -> str:
+        """Adds a deletion step, or more dependencies to an existing step with the same key.
+
+        Args:
+            key (str): unique name of the resource, e.g. "agent:ABC123" or "role:my-role"
+            delete (Callable): issues the deletion
+            after (Iterable[str], optional): keys of the steps that must finish first, i.e. the resources
+                that still reference this one. Keys without a step are ignored. Defaults to ().
+            gone (Callable, optional): returns True once the resource no longer exists. Defaults to None.
+            gone_timeout (float, optional): seconds to wait for gone(). Defaults to 600.
+
+        Returns:
+            str: the key, for use in the 'after' of other steps
+        """
+        _step = self.steps.get(key)
+        if _step is None:
+            self.steps[key] = TeardownStep(key, delete, list(after), gone, gone_timeout)
+        else:
+            # shared resources, e.g. one Lambda role used by several functions, are deleted once, after all users
+            _step.after.extend(_key for _key in after if _key not in _step.after)
+        return key
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.steps
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def _log(self, message: str) -> None:
+        if self.verbose:
+            with self._print_lock:
+                print(message)
+
+    def _run_step(self, step: TeardownStep) -> TeardownResult:
+        _start = time.monotonic()
+        try:
+            step.delete()
+            _status = "deleted"
+        except Exception as e:
+            if not is_missing_error(e):
+                return TeardownResult(step.key, "failed", time.monotonic() - _start, e)
+            _status = "missing"
+        if step.gone is not None and _status == "deleted":
+            try:
+                wait_until(step.gone, name=f"delete {step.key}", timeout=step.gone_timeout)
+            except Exception as e:
+                return TeardownResult(step.key, "failed", time.monotonic() - _start, e)
+        return TeardownResult(step.key, _status, time.monotonic() - _start)
+
+    def run(self, max_workers: int = 8) -> List[TeardownResult]:
+        """Runs every step once the steps it follows have finished.
+
+        Args:
+            max_workers (int, optional): maximum concurrent deletions. Defaults to 8.
+
+        Returns:
+            List[TeardownResult]: one result per step, in the order the steps finished
+        """
+        _pending = {
+            _key: [_dep for _dep in _step.after if _dep in self.steps and _dep != _key]
+            for _key, _step in self.steps.items()
+        }
+        _outcome: Dict[str, TeardownResult] = {}
+        _results = []
+        _running = {}
+        if not _pending:
+            return _results
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(_pending)))) as _executor:
+            while _pending or _running:
+                for _key, _deps in list(_pending.items()):
+                    if not all(_dep in _outcome for _dep in _deps):
+                        continue
+                    del _pending[_key]
+                    _blocking = [_dep for _dep in _deps if not _outcome[_dep].ok]
+                    if _blocking:
+                        _result = TeardownResult(_key, "skipped", error=_outcome[_blocking[0]].error)
+                        _outcome[_key] = _result
+                        _results.append(_result)
+                        self._log(f"Skipped {_key}: {_blocking[0]} was not deleted")
+                        continue
+                    _running[_executor.submit(self._run_step, self.steps[_key])] = _key
+                if not _running:
+                    if _pending:
+                        # only a dependency cycle leaves steps that can never start
+                        for _key in list(_pending):
+                            _result = TeardownResult(_key, "skipped", error=ValueError("dependency cycle"))
+                            _outcome[_key] = _result
+                            _results.append(_result)
+                            self._log(f"Skipped {_key}: dependency cycle")
+                        _pending.clear()
+                    break
+                _finished, _ = wait(_running, return_when=FIRST_COMPLETED)
+                for _future in _finished:
+                    _result = _future.result()
+                    del _running[_future]
+                    _outcome[_result.key] = _result
+                    _results.append(_result)
+                    if _result.status == "failed":
+                        self._log(f"Failed to delete {_result.key}: {_result.error}")
+                    else:
+                        self._log(f"Deleted {_result.key} ({_result.status}, {_result.elapsed:,.1f}s)")
+        return _results
+
+
+def raise_for_failures(results: List[TeardownResult]) -> List[TeardownResult]:
+    """Returns results, or raises TeardownFailed, from the first error, if any step failed.
+
+    Skipped steps are not failures on their own, but they are listed with the step that blocked them.
+    """
+    _failed = [_result for _result in results if _result.status == "failed"]
+    if not _failed:
+        return results
+    _skipped = [_result.key for _result in results if _result.status == "skipped"]
+    _message = "; ".join(f"{_result.key}: {_result.error}" for _result in _failed)
+    if _skipped:
+        _message += f" (skipped: {', '.join(_skipped)})"
+    raise TeardownFailed(f"teardown failed for {_message}", results) from _failed[0].error
+
+
+def _ignore_missing(fn: Callable[[], Any]) -> None:
+    try:
+        fn()
+    except Exception as e:
+        if not is_missing_error(e):
+            raise
+
+
+def delete_role(iam_client, role_name: str) -> None:
+    """Deletes an IAM role, after deleting its inline policies and detaching its managed policies."""
+    _kwargs = {"RoleName": role_name}
+    while True:
+        _resp = iam_client.list_role_policies(**_kwargs)
+        for _policy_name in _resp.get("PolicyNames", []):
+            _ignore_missing(lambda: iam_client.delete_role_policy(RoleName=role_name, PolicyName=_policy_name))
+        if not _resp.get("IsTruncated"):
+            break
+        _kwargs["Marker"] = _resp["Marker"]
+    _kwargs = {"RoleName": role_name}
+    while True:
+        _resp = iam_client.list_attached_role_policies(**_kwargs)
+        for _policy in _resp.get("AttachedPolicies", []):
+            _ignore_missing(lambda: iam_client.detach_role_policy(RoleName=role_name, PolicyArn=_policy["PolicyArn"]))
+        if not _resp.get("IsTruncated"):
+            break
+        _kwargs["Marker"] = _resp["Marker"]
+    iam_client.delete_role(RoleName=role_name)
+
+
+def add_role_steps(
+        plan: TeardownPlan,
+        iam_client,
+        role_name: str,
+        after: Iterable[str] = (),
+        delete_customer_policies: bool = False,
+) -> str:
+    """Adds the deletion of an IAM role and its policies.
+
+    Args:
+        plan (TeardownPlan): plan to add to
+        iam_client: boto3 iam client
+        role_name (str): name of the role
+        after (Iterable[str], optional): steps of the resources that use the role. Defaults to ().
+        delete_customer_policies (bool, optional): also delete the customer managed policies attached to
+            the role, which were created for it. AWS managed policies are only detached. Defaults to False.
+
+    Returns:
+        str: key of the role step
+    """
+    def _delete():
+        _attached = []
+        if delete_customer_policies:
+            _attached = [
+                _policy["PolicyArn"]
+                for _policy in iam_client.list_attached_role_policies(RoleName=role_name).get("AttachedPolicies", [])
+                if not _policy["PolicyArn"].startswith("arn:aws:iam::aws:policy/")
+            ]
+        delete_role(iam_client, role_name)
+        for _policy_arn in _attached:
+            _ignore_missing(lambda: iam_client.delete_policy(PolicyArn=_policy_arn))
+
+    return plan.add(f"role:{role_name}", _delete, after=after)
+
+
+def empty_bucket(s3_client, bucket_name: str) -> None:
+    """Deletes every object of a bucket, up to 1,000 objects per request."""
+    _kwargs = {"Bucket": bucket_name}
+    while True:
+        _resp = s3_client.list_objects_v2(**_kwargs)
+        _objects = [{"Key": _obj["Key"]} for _obj in _resp.get("Contents", [])]
+        if _objects:
+            s3_client.delete_objects(Bucket=bucket_name, Delete={"Objects": _objects, "Quiet": True})
+        if not _resp.get("IsTruncated"):
+            return
+        _kwargs["ContinuationToken"] = _resp["NextContinuationToken"]
+
+
+def add_bucket_steps(plan: TeardownPlan, s3_client, bucket_name: str, after: Iterable[str] = ()) -> str:
+    """Adds the deletion of an S3 bucket and its objects. Returns the key of the bucket step."""
+    def _delete():
+        empty_bucket(s3_client, bucket_name)
+        s3_client.delete_bucket(Bucket=bucket_name)
+
+    return plan.add(f"bucket:{bucket_name}", _delete, after=after)
+
+
+def add_collection_steps(
+        plan: TeardownPlan,
+        aoss_client,
+        collection_id: str,
+        access_policy_name: str = None,
+        network_policy_name: str = None,
+        encryption_policy_name: str = None,
+        after: Iterable[str] = (),
+) -> str:
+    """Adds the deletion of an OpenSearch Serverless collection, followed by its policies.
+
+    Args:
+        plan (TeardownPlan): plan to add to
+        aoss_client: boto3 opensearchserverless client
+        collection_id (str): ID of the collection
+        access_policy_name (str, optional): data access policy to delete. Defaults to None.
+        network_policy_name (str, optional): network policy to delete. Defaults to None.
+        encryption_policy_name (str, optional): encryption policy to delete. Defaults to None.
+        after (Iterable[str], optional): steps of the resources that use the collection. Defaults to ().
+
+    Returns:
+        str: key of the collection step
+    """
+    def _gone() -> bool:
+        return not aoss_client.batch_get_collection(ids=[collection_id]).get("collectionDetails")
+
+    _collection = plan.add(
+        f"collection:{collection_id}", lambda: aoss_client.delete_collection(id=collection_id), after=after, gone=_gone
+    )
+    # the encryption policy cannot be deleted while a collection uses it
+    if access_policy_name:
+        plan.add(
+            f"access-policy:{access_policy_name}",
+            lambda: aoss_client.delete_access_policy(type="data", name=access_policy_name),
+            after=[_collection],
+        )
+    if network_policy_name:
+        plan.add(
+            f"network-policy:{network_policy_name}",
+            lambda: aoss_client.delete_security_policy(type="network", name=network_policy_name),
+            after=[_collection],
+        )
+    if encryption_policy_name:
+        plan.add(
+            f"encryption-policy:{encryption_policy_name}",
+            lambda: aoss_client.delete_security_policy(type="encryption", name=encryption_policy_name),
+            after=[_collection],
+        )
+    return _collection
+
+
+def _list_gateway_targets(gateway_client, gateway_id: str) -> List[Dict[str, Any]]:
+    _items = []
+    _kwargs = {"gatewayIdentifier": gateway_id, "maxResults": 100}
+    while True:
+        _resp = gateway_client.list_gateway_targets(**_kwargs)
+        _items.extend(_resp.get("items", []))
+        if not _resp.get("nextToken"):
+            return _items
+        _kwargs["nextToken"] = _resp["nextToken"]
+
+
+def add_gateway_steps(plan: TeardownPlan, gateway_client, gateway_id: str, after: Iterable[str] = ()) -> str:
+    """Adds the deletion of an AgentCore gateway after all of its targets are gone.
+
+    Target deletion completes asynchronously and a gateway cannot be deleted while it has
+    targets, so every target step polls until the target is gone.
+
+    Returns:
+        str: key of the gateway step
+    """
+    _targets = []
+    for _item in _list_gateway_targets(gateway_client, gateway_id):
+        _target_id = _item["targetId"]
+
+        def _target_gone(_target_id=_target_id) -> bool:
+            try:
+                gateway_client.get_gateway_target(gatewayIdentifier=gateway_id, targetId=_target_id)
+            except Exception as e:
+                if is_missing_error(e):
+                    return True
+                raise
+            return False
+
+        _targets.append(plan.add(
+            f"gateway-target:{gateway_id}/{_target_id}",
+            lambda _target_id=_target_id: gateway_client.delete_gateway_target(
+                gatewayIdentifier=gateway_id, targetId=_target_id
+            ),
+            after=after,
+            gone=_target_gone,
+        ))
+    return plan.add(
+        f"gateway:{gateway_id}",
+        lambda: gateway_client.delete_gateway(gatewayIdentifier=gateway_id),
+        after=list(after) + _targets,
+    )
@@ -0,0 +1,86 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Thread-safe LRU cache whose entries expire after a time to live.
+
+Shared by the caches of tool results: memoized return-of-control functions
+(agent_roc) and DynamoDB queries (dynamodb_query). Keys are built with
+canonical_key(), so calls with the same arguments in a different order hit
+the same entry:
+
+    >>> cache = TTLCache(ttl=60, max_entries=1024)
+    >>> key = canonical_key("get_title", {"title_id": 42})
+    >>> hit, value = cache.get(key)
+    >>> if not hit:
+    ...     cache.put(key, lookup_title(42))
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+DEFAULT_CACHE_SIZE = 256
+
+
+def canonical_key(*parts: Any) -> str:
+    """Returns a cache key for the given values, independent of the order of dictionary keys."""
+    return json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class TTLCache:
+    """LRU cache of values, each kept for ttl seconds.
+
+    Cached values are shared between callers, so they should not be modified after they are stored.
+
+    Args:
+        ttl (float, optional): seconds a value is kept, unless put() is given another ttl. Defaults to
+            float("inf"), which keeps values until they are evicted.
+        max_entries (int, optional): values kept before the least recently used is evicted. Defaults to 256.
+    """
+
+    def __init__(self, ttl: float = float("inf"), max_entries: int = DEFAULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Returns (True, value) if a current value is cached for key, (False, None) otherwise."""
+        with self._lock:
+            _entry = self._entries.get(key)
+            if _entry is not None and _entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, _entry[1]
+            if _entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str = None) -> None:
+        """Forgets one cached value, or every value if key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    @property
+    def hit_rate(self) -> float:
+        _lookups = self.hits + self.misses
+        return self.hits / _lookups if _lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
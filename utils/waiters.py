@@ -0,0 +1,296 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+"""Backoff-based waiting for AWS resources, replacing fixed sleeps.
+
+Provisioning agents and knowledge bases used to sleep for fixed periods (5s
+polls on agent status, 10s after creating IAM roles, 60s after creating an
+OpenSearch index, ...). The functions below poll a readiness predicate with
+exponential backoff and jitter instead, so a wait ends soon after the resource
+is ready:
+
+    wait_until   polls probe() until ready(value) is true
+    retry_call   retries a call while it fails with an eventual-consistency error,
+                 e.g. a freshly created IAM role that cannot be assumed yet
+    wait_all     runs several waits concurrently
+
+Every wait records how long the fixed sleep or poll loop it replaces would have
+taken, and waiter_stats keeps the running total of time saved:
+
+    >>> print(waiter_stats.report())
+"""
+
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+DEFAULT_WAIT_TIMEOUT = 900
+
+
+class WaitTimeout(TimeoutError):
+    """Raised when a resource is not ready before the timeout."""
+
+
+class WaitFailed(RuntimeError):
+    """Raised when a resource reaches a terminal failure state while waiting."""
+
+
+class Backoff:
+    """Exponential backoff delays with jitter.
+
+    Args:
+        initial (float, optional): first delay in seconds. Defaults to 0.5.
+        maximum (float, optional): cap on any single delay. Defaults to 10.0.
+        multiplier (float, optional): growth factor between delays. Defaults to 2.0.
+        jitter (float, optional): fraction of each delay that is randomized. Defaults to 0.5.
+    """
+
+    def __init__(self, initial: float = 0.5, maximum: float = 10.0, multiplier: float = 2.0, jitter: float = 0.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def delays(self) -> Iterator[float]:
+        _delay = self.initial
+        while True:
+            yield _delay * (1.0 - self.jitter * random.random())
+            _delay = min(self.maximum, _delay * self.multiplier)
+
+
+DEFAULT_BACKOFF = Backoff()
+
+
+@dataclass
+class WaitResult:
+    """Outcome of one wait. baseline is how long the replaced fixed sleep or poll loop would have taken."""
+    name: str
+    value: Any
+    elapsed: float
+    polls: int
+    baseline: float
+
+    @property
+    def saved(self) -> float:
+        return self.baseline - self.elapsed
+
+
+class WaitStats:
+    """Thread-safe totals over all waits of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.waits = 0
+            self.polls = 0
+            self.elapsed = 0.0
+            self.baseline = 0.0
+
+    def record(self, result: WaitResult) -> None:
+        with self._lock:
+            self.waits += 1
+            self.polls += result.polls
+            self.elapsed += result.elapsed
+            self.baseline += result.baseline
+
+    @property
+    def saved(self) -> float:
+        return self.baseline - self.elapsed
+
+    def report(self) -> str:
+        return (
+            f"{self.waits} waits, {self.polls} polls: waited {self.elapsed:,.1f}s "
+            f"vs {self.baseline:,.1f}s with fixed sleeps, saved {self.saved:,.1f}s"
+        )
+
+
+waiter_stats = WaitStats()
+
+
+def _poll_loop_baseline(elapsed: float, polls: int, poll_interval: float) -> float:
+    # the old loops checked once, then slept poll_interval between checks
+    if polls <= 1:
+        return 0.0
+    return max(1, math.ceil(elapsed / poll_interval)) * poll_interval
+
+
+def wait_until(
+        probe: Callable[[], Any],
+        ready: Callable[[Any], bool] = bool,
+        name: str = "resource",
+        failed: Callable[[Any], bool] = None,
+        timeout: float = DEFAULT_WAIT_TIMEOUT,
+        backoff: Backoff = None,
+        baseline: float = None,
+        poll_interval: float = None,
+        on_poll: Callable[[Any], None] = None,
+) -> WaitResult:
+    """Polls probe() with backoff until ready(value) is true.
+
+    Args:
+        probe (Callable): returns the current state, e.g. an agent status
+        ready (Callable, optional): readiness predicate on the probed value. Defaults to bool.
+        name (str, optional): label for errors and reports. Defaults to "resource".
+        failed (Callable, optional): predicate for terminal failure states, raising WaitFailed. Defaults to None.
+        timeout (float, optional): seconds before WaitTimeout is raised. Defaults to 900.
+        backoff (Backoff, optional): delay schedule. Defaults to DEFAULT_BACKOFF.
+        baseline (float, optional): length of the fixed sleep this wait replaces. Defaults to None.
+        poll_interval (float, optional): period of the fixed poll loop this wait replaces. Defaults to None.
+        on_poll (Callable, optional): called with the value of every probe that is not ready. Defaults to None.
+
+    Returns:
+        WaitResult: the ready value, elapsed time, number of polls and baseline
+    """
+    _start = time.monotonic()
+    _delays = (backoff or DEFAULT_BACKOFF).delays()
+    _polls = 0
+    while True:
+        _value = probe()
+        _polls += 1
+        if ready(_value):
+            break
+        if failed is not None and failed(_value):
+            raise WaitFailed(f"{name} failed while waiting: {_value}")
+        _elapsed = time.monotonic() - _start
+        if _elapsed >= timeout:
+            raise WaitTimeout(f"{name} not ready after {_elapsed:,.0f}s: {_value}")
+        if on_poll is not None:
+            on_poll(_value)
+        time.sleep(min(next(_delays), max(0.0, timeout - _elapsed)))
+
+    _elapsed = time.monotonic() - _start
+    if poll_interval is not None:
+        _baseline = _poll_loop_baseline(_elapsed, _polls, poll_interval)
+    else:
+        _baseline = baseline if baseline is not None else _elapsed
+    _result = WaitResult(name, _value, _elapsed, _polls, _baseline)
+    waiter_stats.record(_result)
+    return _result
+
+
+def retry_call(
+        fn: Callable[[], Any],
+        retry_if: Callable[[Exception], bool],
+        name: str = "call",
+        timeout: float = 120,
+        backoff: Backoff = None,
+        baseline: float = None,
+) -> Any:
+    """Calls fn(), retrying with backoff while it raises an error accepted by retry_if.
+
+    Used where the readiness of a resource can only be observed by using it, such as
+    the propagation of a new IAM role.
+
+    Args:
+        fn (Callable): the call to make
+        retry_if (Callable): returns True for exceptions that mean "not ready yet"
+        name (str, optional): label for reports. Defaults to "call".
+        timeout (float, optional): seconds after which the last error is re-raised. Defaults to 120.
+        backoff (Backoff, optional): delay schedule. Defaults to DEFAULT_BACKOFF.
+        baseline (float, optional): length of the fixed sleep this retry replaces. Defaults to None.
+
+    Returns:
+        Any: the return value of fn()
+    """
+    _start = time.monotonic()
+    _delays = (backoff or DEFAULT_BACKOFF).delays()
+    _polls = 0
+    while True:
+        _polls += 1
+        try:
+            _value = fn()
+            break
+        except Exception as e:
+            if not retry_if(e) or time.monotonic() - _start >= timeout:
+                raise
+            time.sleep(next(_delays))
+    _elapsed = time.monotonic() - _start
+    waiter_stats.record(WaitResult(name, None, _elapsed, _polls, baseline if baseline is not None else _elapsed))
+    return _value
+
+
+def record_skipped_sleep(name: str, seconds: float) -> None:
+    """Records a fixed sleep that was removed outright because the resource is checked
+    where it is used, e.g. by a retry_call(..., baseline=0.0) around the consumer."""
+    waiter_stats.record(WaitResult(name, None, 0.0, 0, seconds))
+
+
+def wait_all(waits: Iterable[Callable[[], WaitResult]], max_workers: int = 8) -> List[WaitResult]:
+    """Runs several waits concurrently, e.g. functools.partial(wait_until, ...) objects.
+
+    Args:
+        waits (Iterable[Callable]): zero-argument callables that each perform one wait
+        max_workers (int, optional): maximum concurrent waits. Defaults to 8.
+
+    Returns:
+        List[WaitResult]: results in the order of waits; the first error is raised once all waits end
+    """
+    _waits = list(waits)
+    if not _waits:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(_waits))) as _executor:
+        _futures = [_executor.submit(_wait) for _wait in _waits]
+    _errors = [_f.exception() for _f in _futures if _f.exception() is not None]
+    if _errors:
+        raise _errors[0]
+    return [_f.result() for _f in _futures]
+
+
+def error_code(error: Exception) -> Optional[str]:
+    """Returns the botocore error code of an exception, or None."""
+    return (getattr(error, "response", None) or {}).get("Error", {}).get("Code")
+
+
+# messages of the errors returned while a new IAM role cannot be assumed yet, e.g. Lambda's
+# "The role defined for the function cannot be assumed by Lambda."
+ROLE_PROPAGATION_MESSAGES = (
+    "cannot be assumed",
+    "can't be assumed",
+    "unable to assume",
+    "could not assume",
+    "failed to assume",
+    "not authorized to perform: sts:assumerole",
+)
+# messages of the errors create_knowledge_base() returns while its OpenSearch Serverless index
+# does not exist yet, or the data access policy for the index is not enforced yet
+KB_STORAGE_NOT_READY_MESSAGES = (
+    "index_not_found_exception",
+    "no such index",
+    "security_exception",
+    "status code: 403",
+    "403 forbidden",
+)
+# messages of the ConflictException create_agent() returns while an agent of the same name is still deleting
+AGENT_DELETION_PENDING_MESSAGES = (
+    "deleting",
+    "being deleted",
+)
+
+
+def is_role_propagation_error(error: Exception) -> bool:
+    """True for the errors Lambda and Bedrock return while a new IAM role has not propagated yet."""
+    _message = str(error).lower()
+    return error_code(error) in ("InvalidParameterValueException", "ValidationException", "AccessDeniedException") \
+        and any(_m in _message for _m in ROLE_PROPAGATION_MESSAGES)
+
+
+def is_agent_deletion_pending_error(error: Exception) -> bool:
+    """True for the conflict create_agent() returns while the previous agent of that name is still being deleted."""
+    _message = str(error).lower()
+    return error_code(error) == "ConflictException" and any(_m in _message for _m in AGENT_DELETION_PENDING_MESSAGES)
+
+
+def is_kb_storage_not_ready_error(error: Exception) -> bool:
+    """True for the errors create_knowledge_base() returns while its vector index, the data access
+    policy of the index or its role is not usable yet, as opposed to errors in the request itself."""
+    _message = str(error).lower()
+    if error_code(error) in ("ValidationException", "AccessDeniedException") \
+            and any(_m in _message for _m in KB_STORAGE_NOT_READY_MESSAGES):
+        return True
+    return is_role_propagation_error(error)